@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.journalisation.ContexteRequeteMiddleware',  # Identifiant de requête des journaux
+    'myapp.instrumentation.InstrumentationMiddleware',  # En tête : mesure toute la chaîne
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -134,6 +136,36 @@ USE_I18N = True
 
 USE_TZ = True
 
+# Calendrier de travail (calcul des jours ouvrés et des taux de présence)
+# Jours de repos hebdomadaire : 0 = lundi … 6 = dimanche
+JOURS_WEEKEND = (5, 6)
+# Jours fériés mobiles (fêtes religieuses fixées chaque année par arrêté),
+# au format 'AAAA-MM-JJ', en plus des fêtes à date fixe de myapp/jours_ouvres.py
+JOURS_FERIES = []
+
+# File de tâches de fond (worker : python manage.py traiter_taches)
+# Tâches simultanées par type, tous workers confondus
+TACHES_CONCURRENCE = {'export_rapport': 2, 'rapport_annuel': 2, 'lancement_paie': 1, 'bulletins_paie': 1}
+# Conservation des résultats (fichiers sous MEDIA_ROOT/taches/)
+TACHES_RETENTION_HEURES = 72
+# Intervalle (secondes) du signe de vie des tâches en cours ; une tâche muette
+# depuis TACHES_DELAI_ORPHELINE_MINUTES (défaut 30) est remise en file
+TACHES_POULS_SECONDES = 60
+# Processus de rendu des bulletins de salaire PDF d'un lot (myapp/bulletins.py)
+BULLETINS_PROCESSUS = 4
+# Mise en cache (secondes) des totaux approximatifs de la pagination par clé (?count=true)
+PAGINATION_CACHE_COMPTE = 300
+
+# Instrumentation des requêtes (en-tête Server-Timing, métriques sur /api/metrics/)
+INSTRUMENTATION_ACTIVE = True
+# Journalisation (logger myapp.instrumentation) des requêtes plus lentes que ce seuil
+INSTRUMENTATION_SEUIL_LENT_MS = 1000
+# ... ou répétant au moins ce nombre de fois une même requête SQL (N+1)
+INSTRUMENTATION_SEUIL_DOUBLONS = 10
+# Accès à /api/metrics/ : IP du scraper Prometheus, ou jeton Bearer si défini
+METRIQUES_IPS_AUTORISEES = ['127.0.0.1', '::1']
+METRIQUES_JETON = os.environ.get('METRIQUES_JETON', '')
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
@@ -163,7 +195,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'myapp.permissions.IsAuthenticatedWithHierarchy',  # Notre permission personnalisée
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Pages numérotées, ou pagination par clé avec ?pagination=cursor (myapp/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'myapp.pagination.PaginationAdaptative',
     'PAGE_SIZE': 20,
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -172,6 +205,12 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Cache du scope hiérarchique entre les requêtes (secondes, 0 = désactivé),
+# lu aussi par la connexion et mes_permissions (myapp/droits.py).
+# N'activer qu'avec un cache partagé entre workers (Redis, Memcached) :
+# l'invalidation par version n'est visible que via le backend de cache.
+SCOPE_CACHE_TIMEOUT = 0
+
 # CORS configuration pour React (au lieu d'Angular)
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # React dev server
@@ -191,35 +230,49 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-request-id',
 ]
 
 # Logging configuration
+# Journalisation structurée (myapp.journalisation) : les enregistrements passent
+# par une file et sont écrits par un thread dédié, en JSON dans logs/mesrs.log
+# Proportion des messages DEBUG conservés (1 = tous)
+JOURNAL_ECHANTILLON_DEBUG = float(os.environ.get('JOURNAL_ECHANTILLON_DEBUG', '1' if DEBUG else '0.1'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'handlers': {
-        'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': BASE_DIR / 'logs' / 'mesrs.log',
+    'filters': {
+        'echantillonnage': {
+            '()': 'myapp.journalisation.EchantillonnageFilter',
+            'taux': JOURNAL_ECHANTILLON_DEBUG,
         },
-        'console': {
+        'contexte': {'()': 'myapp.journalisation.ContexteRequeteFilter'},
+        'masquage': {'()': 'myapp.journalisation.MasquageFilter'},
+    },
+    'handlers': {
+        'asynchrone': {
+            '()': 'myapp.journalisation.GestionnaireAsynchrone',
             'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
+            'filters': ['echantillonnage', 'contexte', 'masquage'],
+            'fichier': BASE_DIR / 'logs' / 'mesrs.log',
+            'niveau_fichier': 'INFO',
+            'console': True,
+            'niveau_console': 'DEBUG',
         },
     },
     'root': {
-        'handlers': ['console', 'file'],
+        'handlers': ['asynchrone'],
         'level': 'INFO',
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': ['asynchrone'],
             'level': 'INFO',
             'propagate': False,
         },
         'myapp': {
-            'handlers': ['console', 'file'],
+            'handlers': ['asynchrone'],
             'level': 'DEBUG',
             'propagate': False,
         },
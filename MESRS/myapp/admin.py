@@ -3,7 +3,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     User, Service, Structure, Personne, Enseignant, PersonnelPAT, Contractuel,
-    Recrutement, Candidat, Absence, Paie, Detachement, Document,
+    Recrutement, Candidat, Absence, HistoriqueAbsence, CompteurAbsences, Paie, LivrePaie, LancementPaie, Tache,
+    Detachement, Document,
     StatutOffre, TypeStructure, TypeContrat, TypeAbsence,
     StatutPaiement, StatutAbsence, TypeDocument, StatutCandidature
 )
@@ -142,6 +143,18 @@ class AbsenceAdmin(admin.ModelAdmin):
     date_hierarchy = 'date_debut'
     readonly_fields = ('date_demande_absence',)
 
+@admin.register(HistoriqueAbsence)
+class HistoriqueAbsenceAdmin(admin.ModelAdmin):
+    list_display = ('absence', 'statut_precedent', 'statut_nouveau', 'effectue_par', 'en_lot', 'date_action')
+    list_filter = ('statut_nouveau', 'en_lot')
+    date_hierarchy = 'date_action'
+
+@admin.register(CompteurAbsences)
+class CompteurAbsencesAdmin(admin.ModelAdmin):
+    list_display = ('service', 'jour', 'type_absence', 'statut', 'absences', 'debuts')
+    list_filter = ('service', 'type_absence', 'statut')
+    date_hierarchy = 'jour'
+
 @admin.register(Paie)
 class PaieAdmin(admin.ModelAdmin):
     list_display = ('personne', 'mois_annee', 'salaire_net', 'salaire_brut', 'statut_paiement', 'traite_par')
@@ -149,6 +162,24 @@ class PaieAdmin(admin.ModelAdmin):
     search_fields = ('personne__nom', 'personne__prenom')
     date_hierarchy = 'date_paiement'
 
+@admin.register(LivrePaie)
+class LivrePaieAdmin(admin.ModelAdmin):
+    list_display = ('mois_annee', 'service', 'type_employe', 'grade', 'statut_paiement', 'nombre', 'salaire_brut', 'salaire_net')
+    list_filter = ('mois_annee', 'type_employe', 'statut_paiement', 'service')
+
+@admin.register(LancementPaie)
+class LancementPaieAdmin(admin.ModelAdmin):
+    list_display = ('mois_annee', 'service', 'statut', 'nombre_total', 'nombre_traites', 'nombre_ignores',
+                    'nombre_sans_carriere', 'date_lancement')
+    list_filter = ('statut', 'mois_annee')
+    readonly_fields = ('dernier_personne_id', 'date_lancement', 'date_fin')
+
+@admin.register(Tache)
+class TacheAdmin(admin.ModelAdmin):
+    list_display = ('id', 'type_tache', 'statut', 'progression', 'cree_par', 'worker', 'date_creation', 'date_fin')
+    list_filter = ('statut', 'type_tache')
+    readonly_fields = ('date_creation', 'date_debut', 'date_maj', 'date_fin')
+
 @admin.register(Detachement)
 class DetachementAdmin(admin.ModelAdmin):
     list_display = ('personne', 'structure_origine', 'structure_detachement', 'date_debut_detachement', 'statut')
@@ -0,0 +1,192 @@
+# myapp/approbations.py
+"""
+Validation des demandes d'absence.
+
+La validation en lot s'exécute en un nombre constant de requêtes, quelle que
+soit la taille du lot : verrouillage des lignes (select_for_update), un seul
+UPDATE ... WHERE id IN (...) AND statut = 'EN_ATTENTE', puis le journal des
+décisions écrit par bulk_create et les compteurs journaliers mis à jour
+(compteurs.py). Chaque id demandé reçoit un résultat.
+
+La file de validation des chefs est lue en une requête : chaque demande en
+attente est annotée de son urgence et de l'id de son approbateur (chef du
+service), ce qui évite les accès personne → service → chef par ligne.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+from django.utils import timezone
+
+from .compteurs import changer_statut
+from .models import Absence, HistoriqueAbsence, Personne
+
+
+# Urgence d'une demande selon le délai avant son début (en jours)
+DELAI_URGENTE = 3
+DELAI_SEMAINE = 7
+URGENCES = ('urgente', 'semaine', 'future')
+
+DECISIONS = {
+    'approuver': 'APPROUVÉ',
+    'refuser': 'REFUSÉ',
+}
+
+# Résultats possibles par absence
+TRAITEE = 'traitee'
+INTROUVABLE = 'introuvable'
+HORS_PERIMETRE = 'hors_perimetre'
+DEJA_TRAITEE = 'deja_traitee'
+
+MESSAGES_RESULTAT = {
+    INTROUVABLE: 'Absence introuvable',
+    HORS_PERIMETRE: "Absence hors de votre périmètre",
+    DEJA_TRAITEE: 'Absence déjà traitée',
+}
+
+
+def journaliser(absence, statut_precedent, user, commentaire=''):
+    """Trace une décision unitaire (approbation/refus depuis la fiche d'absence)"""
+    return HistoriqueAbsence.objects.create(
+        absence=absence,
+        statut_precedent=statut_precedent,
+        statut_nouveau=absence.statut,
+        commentaire=commentaire,
+        effectue_par=user,
+    )
+
+
+def valider_absences_en_lot(absence_ids, decision, user, commentaire='', service=None):
+    """
+    Approuve ou refuse un lot de demandes d'absence.
+
+    - decision : 'approuver' ou 'refuser'
+    - service : service du chef (None pour l'admin RH : toutes les absences)
+
+    Retourne la liste des résultats [{absence_id, resultat, statut}] dans
+    l'ordre des ids demandés (doublons ignorés).
+    """
+    nouveau_statut = DECISIONS[decision]
+    ids = list(dict.fromkeys(absence_ids))
+
+    with transaction.atomic():
+        # Verrou sur les absences du lot : deux chefs ne décident pas en même temps
+        lignes = {
+            absence_id: (statut, personne_id, periode)
+            for absence_id, statut, personne_id, *periode in (
+                Absence.objects.select_for_update()
+                .filter(id__in=ids)
+                .values_list('id', 'statut', 'personne_id', 'type_absence', 'date_debut', 'date_fin')
+            )
+        }
+
+        # Service de chaque agent : périmètre du chef et compteurs d'absences
+        services = dict(
+            Personne.objects.filter(id__in={p for _, p, _ in lignes.values()})
+            .values_list('id', 'service_id')
+        )
+
+        resultats = []
+        a_traiter = []
+        for absence_id in ids:
+            if absence_id not in lignes:
+                resultat, statut = INTROUVABLE, None
+            else:
+                statut, personne_id, _ = lignes[absence_id]
+                if service is not None and services.get(personne_id) != service.pk:
+                    resultat, statut = HORS_PERIMETRE, None
+                elif statut != 'EN_ATTENTE':
+                    resultat = DEJA_TRAITEE
+                else:
+                    resultat, statut = TRAITEE, nouveau_statut
+                    a_traiter.append(absence_id)
+            resultats.append({'absence_id': absence_id, 'resultat': resultat, 'statut': statut})
+
+        if a_traiter:
+            champs = {'statut': nouveau_statut, 'approuve_par': user}
+            if decision == 'approuver':
+                champs['commentaire_approbateur'] = commentaire
+            else:
+                champs['motif_refus'] = commentaire
+            Absence.objects.filter(id__in=a_traiter, statut='EN_ATTENTE').update(**champs)
+
+            # L'UPDATE groupé ne déclenche pas les signaux : compteurs reportés ici
+            absences_compteurs = []
+            for absence_id in a_traiter:
+                _, personne_id, (type_absence, date_debut, date_fin) = lignes[absence_id]
+                absences_compteurs.append(
+                    (services.get(personne_id), type_absence, 'EN_ATTENTE', date_debut, date_fin)
+                )
+            changer_statut(absences_compteurs, nouveau_statut)
+
+            HistoriqueAbsence.objects.bulk_create([
+                HistoriqueAbsence(
+                    absence_id=absence_id,
+                    statut_precedent='EN_ATTENTE',
+                    statut_nouveau=nouveau_statut,
+                    commentaire=commentaire,
+                    effectue_par=user,
+                    en_lot=True,
+                )
+                for absence_id in a_traiter
+            ])
+
+    return resultats
+
+
+# ========================================
+# FILE DE VALIDATION
+# ========================================
+
+def _limites_urgence(aujourd_hui=None):
+    aujourd_hui = aujourd_hui or timezone.localdate()
+    return aujourd_hui + timedelta(days=DELAI_URGENTE), aujourd_hui + timedelta(days=DELAI_SEMAINE)
+
+
+def absences_a_valider(service=None):
+    """Demandes en attente du service (toutes pour l'admin RH : service=None)"""
+    absences = Absence.objects.filter(statut='EN_ATTENTE')
+    if service is not None:
+        absences = absences.filter(personne__service=service)
+    return absences
+
+
+def annoter_file(absences, aujourd_hui=None):
+    """
+    Demandes annotées de leur urgence (urgente/semaine/future) et de
+    approbateur_id, triées par date de début : l'ordre de la file est donc
+    aussi celui des urgences.
+    """
+    return (
+        absences.select_related('personne__service', 'approuve_par')
+        .annotate(
+            urgence=Case(
+                When(filtre_urgence('urgente', aujourd_hui), then=Value('urgente')),
+                When(filtre_urgence('semaine', aujourd_hui), then=Value('semaine')),
+                default=Value('future'),
+                output_field=CharField(),
+            ),
+            approbateur_id=F('personne__service__chef_service_id'),
+        )
+        .order_by('date_debut', 'id')
+    )
+
+
+def filtre_urgence(urgence, aujourd_hui=None):
+    """Q des demandes d'une urgence donnée (équivalent de l'annotation urgence)"""
+    limite_urgente, limite_semaine = _limites_urgence(aujourd_hui)
+    return {
+        'urgente': Q(date_debut__lte=limite_urgente),
+        'semaine': Q(date_debut__gt=limite_urgente, date_debut__lte=limite_semaine),
+        'future': Q(date_debut__gt=limite_semaine),
+    }[urgence]
+
+
+def compter_file(absences, aujourd_hui=None):
+    """Effectifs de la file par urgence (une agrégation conditionnelle)"""
+    return absences.aggregate(
+        total_en_attente=Count('id'),
+        urgentes=Count('id', filter=filtre_urgence('urgente', aujourd_hui)),
+        cette_semaine=Count('id', filter=filtre_urgence('semaine', aujourd_hui)),
+        futures=Count('id', filter=filtre_urgence('future', aujourd_hui)),
+    )
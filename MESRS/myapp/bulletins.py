@@ -0,0 +1,180 @@
+# myapp/bulletins.py
+"""
+Bulletins de salaire PDF.
+
+Chaque bulletin est stocké (stockage des médias) sous l'empreinte SHA-256 de
+ses données affichées et de la version du gabarit : bulletins/ab/ab…cd.pdf.
+Un bulletin déjà rendu est relu tel quel ; il n'est rendu à nouveau que si
+une donnée affichée change (montant, élément, grade, nom…) ou si le gabarit
+change (VERSION_GABARIT). Le statut de paiement n'est pas affiché : le passer
+à PAYÉ ne rend pas le bulletin à nouveau.
+
+Les lots (ZIP mensuel d'un service) rendent les bulletins manquants dans un
+pool de processus : pdf.rendre_bulletin ne reçoit que des données simples.
+"""
+import hashlib
+import json
+import logging
+import re
+import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .pdf import rendre_bulletin
+
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter à chaque modification de la mise en page (pdf.rendre_bulletin)
+VERSION_GABARIT = 1
+DOSSIER = 'bulletins'
+# En dessous de ce nombre de bulletins à rendre, le pool de processus coûte plus qu'il ne rapporte
+SEUIL_POOL = 20
+PROCESSUS_DEFAUT = 4
+
+
+def _texte(valeur):
+    return '' if valeur is None else str(valeur)
+
+
+def donnees_bulletin(paie):
+    """
+    Données affichées sur le bulletin (chaînes et entiers uniquement).
+    Lit paie.personne, paie.personne.service et paie.elements : à précharger
+    pour un lot (voir paies_du_lot).
+    """
+    personne = paie.personne
+    return {
+        'mois': paie.mois_annee,
+        'date_paiement': _texte(paie.date_paiement),
+        'agent': {
+            'nom': personne.nom,
+            'prenom': personne.prenom,
+            'numero_employe': personne.numero_employe,
+            'nni': personne.nni,
+            'fonction': personne.fonction,
+            'service': personne.service.nom if personne.service_id else '',
+        },
+        'grade': paie.grade,
+        'echelon': paie.echelon,
+        'indice': paie.indice,
+        'nb_enfants': paie.nb_enfants,
+        'mode_reglement': paie.mode_reglement,
+        'compte_bancaire': paie.compte_bancaire,
+        'salaire_brut': _texte(paie.salaire_brut),
+        'salaire_net': _texte(paie.salaire_net),
+        'deductions': _texte(paie.deductions),
+        'allocations_familiales': _texte(paie.allocations_familiales),
+        'montant_imposable_mensuel': _texte(paie.montant_imposable_mensuel),
+        'montant_imposable_progressif': _texte(paie.montant_imposable_progressif),
+        'elements': [
+            {
+                'code': element.code,
+                'libelle': element.libelle,
+                'type_element': element.type_element,
+                'taux': _texte(element.taux),
+                'montant': _texte(element.montant),
+            }
+            # paie.elements.all() respecte Meta.ordering et le préchargement
+            for element in paie.elements.all()
+        ],
+    }
+
+
+def empreinte(donnees):
+    """SHA-256 des données et de la version du gabarit"""
+    contenu = json.dumps([VERSION_GABARIT, donnees], sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+
+def chemin_bulletin(hachage):
+    return f"{DOSSIER}/{hachage[:2]}/{hachage}.pdf"
+
+
+def _enregistrer(chemin, contenu):
+    # Deux rendus simultanés d'un même bulletin produisent les mêmes octets
+    if not default_storage.exists(chemin):
+        default_storage.save(chemin, ContentFile(contenu))
+
+
+def bulletin_pdf(paie):
+    """
+    Bulletin d'une paie : (empreinte, chemin dans le stockage). Rendu
+    uniquement si aucun fichier n'existe pour cette empreinte.
+    """
+    donnees = donnees_bulletin(paie)
+    hachage = empreinte(donnees)
+    chemin = chemin_bulletin(hachage)
+    if not default_storage.exists(chemin):
+        _enregistrer(chemin, rendre_bulletin(donnees))
+    return hachage, chemin
+
+
+def paies_du_lot(queryset):
+    """Paies d'un lot avec agent, service et éléments préchargés"""
+    return (
+        queryset
+        .select_related('personne__service')
+        .prefetch_related('elements')
+        .order_by('personne__numero_employe')
+    )
+
+
+def generer_bulletins(paies, processus=None, progression=None):
+    """
+    Assure l'existence du PDF de chaque paie. Les bulletins manquants sont
+    rendus dans un pool de `processus` processus (settings.BULLETINS_PROCESSUS).
+    Retourne ([(paie, chemin)], nombre de bulletins rendus).
+    progression(fait, total) est appelée au fil des rendus.
+    """
+    processus = processus or getattr(settings, 'BULLETINS_PROCESSUS', PROCESSUS_DEFAUT)
+    chemins = []
+    a_rendre = {}
+    for paie in paies:
+        donnees = donnees_bulletin(paie)
+        chemin = chemin_bulletin(empreinte(donnees))
+        chemins.append((paie, chemin))
+        if chemin not in a_rendre and not default_storage.exists(chemin):
+            a_rendre[chemin] = donnees
+
+    total = len(a_rendre)
+    if total >= SEUIL_POOL and processus > 1:
+        with ProcessPoolExecutor(max_workers=processus) as pool:
+            rendus = pool.map(rendre_bulletin, a_rendre.values(), chunksize=max(1, total // (processus * 4)))
+            for fait, (chemin, contenu) in enumerate(zip(a_rendre, rendus), start=1):
+                _enregistrer(chemin, contenu)
+                if progression and fait % 100 == 0:
+                    progression(fait, total)
+    else:
+        for fait, (chemin, donnees) in enumerate(a_rendre.items(), start=1):
+            _enregistrer(chemin, rendre_bulletin(donnees))
+            if progression and fait % 100 == 0:
+                progression(fait, total)
+
+    if total:
+        logger.info("Bulletins rendus", extra={'rendus': total, 'bulletins': len(chemins)})
+    return chemins, total
+
+
+def nom_dans_archive(paie):
+    personne = paie.personne
+    nom = re.sub(r'[^\w\-]+', '_', f"{personne.nom}_{personne.prenom}").strip('_')
+    return f"{paie.mois_annee}/{personne.numero_employe}_{nom}.pdf"
+
+
+def ecrire_zip(paies, fichier, processus=None, progression=None):
+    """
+    Écrit dans `fichier` (binaire) le ZIP des bulletins des paies données.
+    Les PDF étant déjà compressés, ils sont archivés sans recompression.
+    Retourne {'nombre', 'rendus'}.
+    """
+    chemins, rendus = generer_bulletins(paies, processus, progression)
+    with zipfile.ZipFile(fichier, 'w', zipfile.ZIP_STORED) as archive:
+        for paie, chemin in chemins:
+            with default_storage.open(chemin, 'rb') as source, archive.open(nom_dans_archive(paie), 'w') as cible:
+                shutil.copyfileobj(source, cible)
+    return {'nombre': len(chemins), 'rendus': rendus}
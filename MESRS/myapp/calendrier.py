@@ -0,0 +1,123 @@
+# myapp/calendrier.py
+"""
+Moteur de calendrier des absences.
+
+Les absences sont des intervalles [date_debut, date_fin] ramenés à des indices
+de jour (ordinal - ordinal du premier jour de la période) :
+- le nombre d'absents par jour est obtenu par tableau de différences puis
+  somme préfixe, en O(absences + jours) ; vectorisé avec NumPy s'il est installé ;
+- les listes d'absents par jour sont remplies par indice, sans conversion de
+  date en chaîne à chaque itération.
+"""
+from datetime import timedelta
+
+from .jours_ouvres import get_weekend
+
+try:
+    import numpy as np
+except ImportError:  # NumPy est optionnel
+    np = None
+
+
+def _bornes(date_debut, date_fin, origine, nb_jours):
+    """Indices [i0, i1] de l'intervalle tronqué à la période (i0 > i1 si hors période)"""
+    i0 = max(date_debut.toordinal() - origine, 0)
+    i1 = min(date_fin.toordinal() - origine, nb_jours - 1)
+    return i0, i1
+
+
+def jours_periode(debut, fin):
+    """En-têtes des jours de la période (date, jour_semaine, numero_jour, est_weekend)"""
+    weekend = get_weekend()
+    jours = []
+    for i in range((fin - debut).days + 1):
+        jour = debut + timedelta(days=i)
+        jours.append({
+            'date': jour.isoformat(),
+            'jour_semaine': jour.strftime('%A'),
+            'numero_jour': jour.day,
+            'est_weekend': jour.weekday() in weekend,
+        })
+    return jours
+
+
+def compter_par_jour(intervalles, debut, fin):
+    """
+    Nombre d'intervalles (date_debut, date_fin) couvrant chaque jour de [debut, fin].
+    Retourne une liste d'entiers, un par jour.
+    """
+    origine = debut.toordinal()
+    nb_jours = (fin - debut).days + 1
+    if nb_jours <= 0:
+        return []
+
+    bornes = [_bornes(d, f, origine, nb_jours) for d, f in intervalles]
+    bornes = [(i0, i1) for i0, i1 in bornes if i0 <= i1]
+
+    if np is not None and bornes:
+        indices = np.array(bornes, dtype=np.int64)
+        diff = np.zeros(nb_jours + 1, dtype=np.int64)
+        np.add.at(diff, indices[:, 0], 1)
+        np.add.at(diff, indices[:, 1] + 1, -1)
+        return np.cumsum(diff[:nb_jours]).tolist()
+
+    diff = [0] * (nb_jours + 1)
+    for i0, i1 in bornes:
+        diff[i0] += 1
+        diff[i1 + 1] -= 1
+    comptes = []
+    courant = 0
+    for i in range(nb_jours):
+        courant += diff[i]
+        comptes.append(courant)
+    return comptes
+
+
+def repartir_par_jour(elements, debut, fin):
+    """
+    Répartit des éléments (date_debut, date_fin, valeur) sur les jours de [debut, fin].
+    Retourne une liste (une entrée par jour) des valeurs présentes ce jour-là,
+    dans l'ordre des éléments.
+    """
+    origine = debut.toordinal()
+    nb_jours = (fin - debut).days + 1
+    par_jour = [[] for _ in range(max(nb_jours, 0))]
+    for date_debut, date_fin, valeur in elements:
+        i0, i1 = _bornes(date_debut, date_fin, origine, nb_jours)
+        for i in range(i0, i1 + 1):
+            par_jour[i].append(valeur)
+    return par_jour
+
+
+def construire_planning(debut, fin, elements, cle_liste='absents', comptes_seuls=False, jours=None,
+                        comptes=None):
+    """
+    Planning {date ISO: {en-tête du jour, <cle_liste>, nombre_absents}}, où
+    nombre_absents est le nombre d'absences (éléments) du jour.
+
+    - elements : itérable de (date_debut, date_fin, valeur)
+    - comptes_seuls : n'inclut que nombre_absents (vues heatmap), sans les listes
+    - jours : en-têtes à utiliser à la place de jours_periode(debut, fin)
+    - comptes : nombres d'absences par jour déjà connus (compteurs journaliers),
+      utilisés à la place des elements avec comptes_seuls
+    """
+    jours = jours if jours is not None else jours_periode(debut, fin)
+    planning = {}
+    if comptes_seuls:
+        if comptes is None:
+            comptes = compter_par_jour(((d, f) for d, f, _ in elements), debut, fin)
+        for jour, nombre in zip(jours, comptes):
+            planning[jour['date']] = {**jour, 'nombre_absents': nombre}
+        return planning
+
+    par_jour = repartir_par_jour(elements, debut, fin)
+    for jour, valeurs in zip(jours, par_jour):
+        planning[jour['date']] = {**jour, cle_liste: valeurs, 'nombre_absents': len(valeurs)}
+    return planning
+
+
+def jour_max(planning):
+    """Jour du planning ayant le plus d'absents (le premier en cas d'égalité)"""
+    if not planning:
+        return None
+    return max(planning.values(), key=lambda x: x['nombre_absents'])
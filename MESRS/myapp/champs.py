@@ -0,0 +1,222 @@
+# myapp/champs.py
+"""
+Champs à la demande (sparse fieldsets) pour les lectures de l'API.
+
+- ?fields=a,b,personne.nom : seuls ces champs sont sérialisés (notation
+  pointée pour les sérialiseurs imbriqués ; « personne » seul garde tout
+  l'objet imbriqué) ;
+- ?omit=a,personne.chef_service_nom : champs retirés ;
+- ?compact=true : variante légère de la liste (serializer_liste_class).
+
+Les champs sont retirés de l'instance du sérialiseur : les classes de
+serializers.py n'ont rien à déclarer. Pour la liste et le détail, les
+jointures (select_related) et colonnes (only) du queryset sont ensuite
+réduites à celles des champs restants, déduites de leur `source`. Les
+SerializerMethodField doivent déclarer les chemins ORM qu'ils lisent dans
+l'attribut `dependances_champs` du sérialiseur ; à défaut, le queryset n'est
+pas modifié.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError as DRFValidationError
+
+
+def _arbre(valeur):
+    """'a,b.c,b.d' -> {'a': {}, 'b': {'c': {}, 'd': {}}}"""
+    arbre = {}
+    for chemin in valeur.split(','):
+        chemin = chemin.strip()
+        if not chemin:
+            continue
+        noeud = arbre
+        for nom in chemin.split('.'):
+            noeud = noeud.setdefault(nom.strip(), {})
+    return arbre
+
+
+def parse_champs(params):
+    """(arbre des champs retenus ou None, arbre des champs omis) d'après ?fields= et ?omit="""
+    champs = _arbre(params.get('fields', ''))
+    omis = _arbre(params.get('omit', ''))
+    return champs or None, omis
+
+
+def _champs_de(serializer):
+    """Champs d'un sérialiseur, ou de l'élément d'un ListSerializer (many=True)"""
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    return serializer.fields if isinstance(serializer, serializers.Serializer) else None
+
+
+def elaguer(serializer, champs=None, omis=None, chemin=''):
+    """
+    Retire du sérialiseur les champs non demandés (champs) ou omis (omis).
+    Lève ValueError pour un champ inconnu.
+    """
+    champs_serializer = _champs_de(serializer)
+    inconnus = [
+        f"{chemin}{nom}" for nom in (*(champs or {}), *(omis or {}))
+        if champs_serializer is None or nom not in champs_serializer
+    ]
+    if inconnus:
+        raise ValueError(f"Champs inconnus: {', '.join(sorted(set(inconnus)))}")
+
+    for nom in list(champs_serializer):
+        if champs is not None and nom not in champs:
+            champs_serializer.pop(nom)
+        elif nom in (omis or {}) and not omis[nom]:
+            champs_serializer.pop(nom)
+        else:
+            sous_champs = (champs or {}).get(nom) or None
+            sous_omis = (omis or {}).get(nom) or {}
+            if sous_champs or sous_omis:
+                elaguer(champs_serializer[nom], sous_champs, sous_omis, f"{chemin}{nom}.")
+
+
+# ========================================
+# PLAN DE REQUÊTE
+# ========================================
+
+class _PlanIndetermine(Exception):
+    pass
+
+
+def _ajouter(plan, modele, prefixe, chemin, joindre=False):
+    """
+    Enregistre les jointures et colonnes lues par le chemin ORM `chemin`
+    (depuis `modele`). Un chemin terminé par une relation ne charge que la clé
+    étrangère, sauf avec joindre (objet lié lu en entier).
+    """
+    relations, colonnes = plan
+    parties = chemin.split('__')
+    parcours = prefixe
+    for i, partie in enumerate(parties):
+        derniere = i == len(parties) - 1
+        if partie == 'pk':
+            partie = modele._meta.pk.name
+        try:
+            champ = modele._meta.get_field(partie)
+        except FieldDoesNotExist:
+            # Méthode ou propriété (ex. get_full_name) : tout l'objet courant
+            if not parcours:
+                raise _PlanIndetermine(chemin)
+            colonnes.update(f"{parcours}{f.name}" for f in modele._meta.concrete_fields)
+            return
+        if not champ.is_relation:
+            colonnes.add(f"{parcours}{partie}")
+            return
+        if not (champ.many_to_one or champ.one_to_one):
+            raise _PlanIndetermine(chemin)
+        if champ.concrete:
+            colonnes.add(f"{parcours}{partie}")
+            if derniere and not joindre:
+                return
+        relations.add(f"{parcours}{partie}")
+        modele = champ.related_model
+        parcours = f"{parcours}{partie}__"
+        if derniere:
+            colonnes.update(f"{parcours}{f.name}" for f in modele._meta.concrete_fields)
+
+
+def _visiter(plan, serializer, modele, prefixe=''):
+    dependances = getattr(serializer, 'dependances_champs', {})
+    for nom, champ in serializer.fields.items():
+        if champ.write_only:
+            continue
+        if isinstance(champ, serializers.SerializerMethodField):
+            if nom not in dependances:
+                raise _PlanIndetermine(nom)
+            for chemin in dependances[nom]:
+                _ajouter(plan, modele, prefixe, chemin, joindre=True)
+        elif isinstance(champ, serializers.ListSerializer) and champ.source != '*':
+            # Relation inverse (éléments de paie…) : lue par le prefetch_related du ViewSet
+            lien = modele._meta.get_field(champ.source)
+            if not (lien.one_to_many or lien.many_to_many):
+                raise _PlanIndetermine(nom)
+        elif isinstance(champ, serializers.ManyRelatedField) or champ.source == '*':
+            raise _PlanIndetermine(nom)
+        elif isinstance(champ, serializers.Serializer):
+            # Objet lié imbriqué (clé étrangère ou un-à-un) : ses propres champs décident
+            lien = modele._meta.get_field(champ.source)
+            if not (lien.many_to_one or lien.one_to_one):
+                raise _PlanIndetermine(nom)
+            if lien.concrete:
+                plan[1].add(f"{prefixe}{champ.source}")
+            plan[0].add(f"{prefixe}{champ.source}")
+            _visiter(plan, champ, lien.related_model, f"{prefixe}{champ.source}__")
+        else:
+            _ajouter(plan, modele, prefixe, champ.source.replace('.', '__'))
+
+
+def plan_requete(serializer, modele):
+    """
+    (jointures, colonnes) nécessaires aux champs du sérialiseur, ou None si
+    un champ ne permet pas de les déterminer.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    plan = (set(), set())
+    try:
+        _visiter(plan, serializer, modele)
+    except (_PlanIndetermine, FieldDoesNotExist):
+        return None
+    return plan
+
+
+# ========================================
+# MIXIN DES VIEWSETS
+# ========================================
+
+def _vrai(valeur):
+    return str(valeur).lower() in ('1', 'true', 'oui')
+
+
+class ChampsDemandesMixin:
+    """
+    ?fields= / ?omit= sur les lectures (GET), ?compact=true pour la liste
+    (serializer_liste_class). Pour list et retrieve, le queryset ne joint et
+    ne charge que ce que lisent les champs restants.
+    """
+    serializer_liste_class = None
+
+    def get_champs_demandes(self):
+        if not hasattr(self, '_champs_demandes'):
+            demande = None
+            if self.request is not None and self.request.method == 'GET':
+                champs, omis = parse_champs(self.request.query_params)
+                if champs or omis:
+                    demande = (champs, omis)
+            self._champs_demandes = demande
+        return self._champs_demandes
+
+    def _liste_compacte(self):
+        return (
+            self.action == 'list' and self.serializer_liste_class is not None
+            and _vrai(self.request.query_params.get('compact'))
+        )
+
+    def get_serializer_class(self):
+        if self._liste_compacte():
+            return self.serializer_liste_class
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        demande = self.get_champs_demandes()
+        if demande is not None:
+            try:
+                elaguer(serializer, *demande)
+            except ValueError as e:
+                raise DRFValidationError({'error': str(e)})
+        return serializer
+
+    def filter_queryset(self, queryset):
+        # Après get_queryset des vues (qui peuvent ajouter jointures et annotations) et les filtres
+        queryset = super().filter_queryset(queryset)
+        if self.action not in ('list', 'retrieve') or not (self.get_champs_demandes() or self._liste_compacte()):
+            return queryset
+        plan = plan_requete(self.get_serializer(), queryset.model)
+        if plan is None:
+            return queryset
+        relations, colonnes = plan
+        return queryset.select_related(None).select_related(*sorted(relations)).only(*sorted(colonnes))
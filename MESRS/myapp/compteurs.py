@@ -0,0 +1,245 @@
+# myapp/compteurs.py
+"""
+Compteurs journaliers d'absences par service (table CompteurAbsences).
+
+Pour chaque (service, jour, type_absence, statut) :
+- absences : absences couvrant ce jour ;
+- debuts : absences commençant ce jour.
+
+Les compteurs dénombrent des absences, pas des agents : un agent ayant deux
+absences qui se chevauchent compte deux fois ce jour-là, comme dans les
+plannings construits depuis la table Absence.
+
+Les absences qui chevauchent [debut, fin] sont celles en cours le jour `debut`
+plus celles qui commencent dans ]debut, fin] : tout décompte sur une période
+est une lecture par plage de dates de la table, sans parcourir Absence.
+
+Une absence est comptée dans le service actuel de l'agent (les agents sans
+service ne sont pas comptés). La table est tenue à jour par les signaux
+d'Absence et de Personne (signals.py) et par la validation en lot ;
+`python manage.py reconstruire_compteurs_absences` la recalcule.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from .models import Absence, CompteurAbsences
+
+
+CHAMPS_ABSENCE = ('type_absence', 'statut', 'date_debut', 'date_fin')
+
+
+# ========================================
+# MISE À JOUR
+# ========================================
+
+def _variations():
+    return defaultdict(lambda: [0, 0])
+
+
+def ajouter_variations(variations, lignes, signe=1):
+    """
+    Ajoute à `variations` la contribution d'absences (signe=-1 pour les retirer).
+
+    - lignes : itérable de (service_id, type_absence, statut, date_debut, date_fin)
+    - variations : {(service_id, jour, type_absence, statut): [Δabsences, Δdebuts]}
+    """
+    for service_id, type_absence, statut, date_debut, date_fin in lignes:
+        if service_id is None or date_debut is None or date_fin is None or date_fin < date_debut:
+            continue
+        for i in range((date_fin - date_debut).days + 1):
+            variations[(service_id, date_debut + timedelta(days=i), type_absence, statut)][0] += signe
+        variations[(service_id, date_debut, type_absence, statut)][1] += signe
+    return variations
+
+
+def appliquer_variations(variations):
+    """
+    Applique des variations en trois requêtes : création des compteurs
+    manquants, lecture verrouillée, mise à jour groupée.
+    """
+    variations = {cle: delta for cle, delta in variations.items() if delta[0] or delta[1]}
+    if not variations:
+        return
+
+    with transaction.atomic():
+        CompteurAbsences.objects.bulk_create(
+            [
+                CompteurAbsences(service_id=s, jour=j, type_absence=t, statut=st)
+                for s, j, t, st in variations
+            ],
+            ignore_conflicts=True,
+            batch_size=1000,
+        )
+        jours = [cle[1] for cle in variations]
+        compteurs = CompteurAbsences.objects.select_for_update().filter(
+            service_id__in={cle[0] for cle in variations},
+            jour__range=(min(jours), max(jours)),
+            type_absence__in={cle[2] for cle in variations},
+            statut__in={cle[3] for cle in variations},
+        )
+        a_modifier = []
+        for compteur in compteurs:
+            delta = variations.get((compteur.service_id, compteur.jour, compteur.type_absence, compteur.statut))
+            if delta:
+                compteur.absences += delta[0]
+                compteur.debuts += delta[1]
+                a_modifier.append(compteur)
+        CompteurAbsences.objects.bulk_update(a_modifier, ['absences', 'debuts'], batch_size=1000)
+
+
+def absence_modifiee(avant=None, apres=None):
+    """
+    Reporte la création (avant=None), la modification ou la suppression
+    (apres=None) d'une absence. avant/apres : (service_id, *CHAMPS_ABSENCE).
+    """
+    if avant == apres:
+        return
+    variations = _variations()
+    if avant is not None:
+        ajouter_variations(variations, [avant], -1)
+    if apres is not None:
+        ajouter_variations(variations, [apres])
+    appliquer_variations(variations)
+
+
+def changer_statut(absences, nouveau_statut):
+    """
+    Reporte un changement de statut fait par UPDATE groupé (sans signaux).
+    absences : itérable de (service_id, *CHAMPS_ABSENCE) avant le changement.
+    """
+    absences = list(absences)
+    variations = ajouter_variations(_variations(), absences, -1)
+    ajouter_variations(variations, ((s, t, nouveau_statut, d, f) for s, t, _, d, f in absences))
+    appliquer_variations(variations)
+
+
+def changer_service(personne_id, ancien_service_id, nouveau_service_id):
+    """Déplace les absences d'un agent vers son nouveau service"""
+    absences = list(Absence.objects.filter(personne_id=personne_id).values_list(*CHAMPS_ABSENCE))
+    variations = _variations()
+    ajouter_variations(variations, ((ancien_service_id, *a) for a in absences), -1)
+    ajouter_variations(variations, ((nouveau_service_id, *a) for a in absences))
+    appliquer_variations(variations)
+
+
+def reconstruire(service=None):
+    """
+    Recalcule les compteurs (d'un service ou de tous) depuis la table Absence.
+    Retourne le nombre de compteurs écrits.
+    """
+    absences = Absence.objects.filter(personne__service__isnull=False)
+    compteurs = CompteurAbsences.objects.all()
+    if service is not None:
+        absences = absences.filter(personne__service=service)
+        compteurs = compteurs.filter(service=service)
+
+    variations = ajouter_variations(
+        _variations(),
+        absences.values_list('personne__service_id', *CHAMPS_ABSENCE).order_by().iterator(chunk_size=2000)
+    )
+    with transaction.atomic():
+        compteurs.delete()
+        CompteurAbsences.objects.bulk_create(
+            [
+                CompteurAbsences(service_id=s, jour=j, type_absence=t, statut=st, absences=n, debuts=d)
+                for (s, j, t, st), (n, d) in variations.items()
+            ],
+            batch_size=2000,
+        )
+    return len(variations)
+
+
+# ========================================
+# LECTURE
+# ========================================
+
+def _compteurs(service=None, statuts=None):
+    compteurs = CompteurAbsences.objects.all()
+    if service is not None:
+        compteurs = compteurs.filter(service=service)
+    if statuts is not None:
+        compteurs = compteurs.filter(statut__in=statuts)
+    return compteurs
+
+
+def _somme_periode(debut, fin, suffixe=''):
+    """Sommes conditionnelles donnant le nombre d'absences chevauchant [debut, fin]"""
+    return {
+        f'en_cours{suffixe}': Sum('absences', filter=Q(jour=debut)),
+        f'commencees{suffixe}': Sum('debuts', filter=Q(jour__gt=debut, jour__lte=fin)),
+    }
+
+
+def absences_periode(service, debut, fin, statuts=None, par=('type_absence', 'statut')):
+    """
+    Nombre d'absences chevauchant [debut, fin], groupé par les champs `par`.
+    Retourne une liste de tuples (*valeurs de par, nombre), nombres non nuls.
+    """
+    lignes = (
+        _compteurs(service, statuts).filter(jour__range=(debut, fin))
+        .values_list(*par)
+        .annotate(**_somme_periode(debut, fin))
+        .order_by()
+    )
+    resultat = []
+    for *cles, en_cours, commencees in lignes:
+        nombre = (en_cours or 0) + (commencees or 0)
+        if nombre:
+            resultat.append((*cles, nombre))
+    return resultat
+
+
+def absences_par_periodes(service, periodes, statuts=None):
+    """Nombre d'absences chevauchant chacune des périodes [(debut, fin)] (une requête)"""
+    if not periodes:
+        return []
+    sommes = {}
+    for i, (debut, fin) in enumerate(periodes):
+        sommes.update(_somme_periode(debut, fin, f'_{i}'))
+    totaux = _compteurs(service, statuts).filter(
+        jour__range=(min(d for d, _ in periodes), max(f for _, f in periodes))
+    ).aggregate(**sommes)
+    return [
+        (totaux[f'en_cours_{i}'] or 0) + (totaux[f'commencees_{i}'] or 0)
+        for i in range(len(periodes))
+    ]
+
+
+def total_absences(service, statuts=None):
+    """Nombre total d'absences du service (toutes dates)"""
+    return _compteurs(service, statuts).aggregate(total=Sum('debuts'))['total'] or 0
+
+
+def absences_par_jour(service, debut, fin, statuts=None):
+    """Nombre d'absences couvrant chaque jour de [debut, fin] (liste, un entier par jour)"""
+    comptes = dict(
+        _compteurs(service, statuts).filter(jour__range=(debut, fin))
+        .values_list('jour')
+        .annotate(total=Sum('absences'))
+        .order_by()
+    )
+    return [comptes.get(debut + timedelta(days=i), 0) for i in range((fin - debut).days + 1)]
+
+
+def absences_par_mois_et_type(service, annee_debut, annee_fin):
+    """
+    Nombre d'absences chevauchant chaque mois de [annee_debut, annee_fin], par type.
+    Retourne {type_absence: [nombre par mois]} (une requête : le 1er de chaque
+    mois pour les absences en cours, les autres jours pour les débuts).
+    """
+    origine = annee_debut * 12
+    nb_mois = (annee_fin - annee_debut + 1) * 12
+    par_type = {}
+    lignes = (
+        _compteurs(service).filter(jour__year__gte=annee_debut, jour__year__lte=annee_fin)
+        .filter(Q(jour__day=1) | Q(debuts__gt=0))
+        .values_list('type_absence', 'jour', 'absences', 'debuts')
+        .order_by()
+    )
+    for type_absence, jour, absences, debuts in lignes.iterator(chunk_size=2000):
+        mois = par_type.setdefault(type_absence, [0] * nb_mois)
+        mois[jour.year * 12 + jour.month - 1 - origine] += absences if jour.day == 1 else debuts
+    return par_type
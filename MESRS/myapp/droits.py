@@ -0,0 +1,63 @@
+# myapp/droits.py
+"""
+Registre des permissions applicatives par rôle.
+
+Les permissions ne dépendent que du rôle : elles sont définies une fois au
+chargement du module. Les informations de service viennent du scope
+(scope.py), mémorisé sur la requête et, si SCOPE_CACHE_TIMEOUT est actif,
+en cache sous une clé (version, id utilisateur, rôle) invalidée par les
+signaux dès qu'un chef ou un rattachement de service change.
+
+La connexion JWT et /api/permissions/mes_permissions/ lisent ce registre.
+"""
+from .scope import get_scope
+
+
+PERMISSIONS_PAR_ROLE = {
+    'admin_rh': (
+        'view_all', 'add_all', 'change_all', 'delete_all',
+        'approve_all', 'manage_users', 'assign_roles',
+        'view_dashboard_admin', 'manage_services',
+    ),
+    'chef_enseignant': (
+        'view_service_enseignant', 'add_enseignant', 'change_enseignant',
+        'approve_absence_enseignant', 'view_paie_service',
+        'view_dashboard_chef', 'manage_team_enseignant',
+    ),
+    'chef_pat': (
+        'view_service_pat', 'add_pat', 'change_pat',
+        'approve_absence_pat', 'view_paie_service',
+        'view_dashboard_chef', 'manage_team_pat',
+    ),
+    'chef_contractuel': (
+        'view_service_contractuel', 'add_contractuel', 'change_contractuel',
+        'approve_absence_contractuel', 'view_paie_service',
+        'view_dashboard_chef', 'manage_team_contractuel',
+    ),
+    'employe': (
+        'view_self', 'change_self', 'request_absence',
+        'view_own_paie', 'view_own_documents', 'view_dashboard_personal',
+    ),
+}
+PERMISSIONS_DEFAUT = ('view_self',)
+
+
+def permissions_du_role(role):
+    """Permissions d'un rôle (view_self seul pour un rôle inconnu)"""
+    return list(PERMISSIONS_PAR_ROLE.get(role, PERMISSIONS_DEFAUT))
+
+
+def profil_droits(request_or_user):
+    """
+    Rôle, permissions et service de l'utilisateur, sans requête lorsque
+    le scope est déjà connu (même requête HTTP ou cache).
+    """
+    scope = get_scope(request_or_user)
+    if scope is None:
+        return None
+    return {
+        'role': scope.role,
+        'permissions': permissions_du_role(scope.role),
+        'service': scope.service_info(),
+        'is_chef': scope.is_chef,
+    }
@@ -0,0 +1,305 @@
+# myapp/exports.py
+"""
+Exports en flux (CSV, XLSX, NDJSON) des rapports.
+
+Les lignes sont produites par des générateurs qui lisent la base par blocs
+(iterator(chunk_size=...)) : la mémoire du worker reste constante quelle que
+soit la taille de l'export. Le format XLSX nécessite openpyxl (optionnel).
+"""
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import Subquery
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .models import Absence
+from .rapports import filtre_chevauchement
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+FORMATS_EXPORT = ('json', 'csv', 'xlsx', 'ndjson')
+
+
+# ========================================
+# RENDERERS
+# ========================================
+# DRF utilise ?format= pour la négociation de contenu : sans renderer déclaré
+# pour csv/xlsx/ndjson, ces valeurs renvoient un 404 avant d'atteindre la vue.
+
+class _ExportRenderer(BaseRenderer):
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Seuls les messages d'erreur passent par le renderer : on les sérialise en JSON
+        if isinstance(data, (bytes, str)):
+            return data
+        return json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+
+
+class CSVRenderer(_ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class XLSXRenderer(_ExportRenderer):
+    media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    format = 'xlsx'
+    charset = None
+
+
+class NDJSONRenderer(_ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+EXPORT_RENDERERS = [CSVRenderer, XLSXRenderer, NDJSONRenderer]
+
+# À utiliser dans @action(renderer_classes=...) des actions d'export
+EXPORT_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + EXPORT_RENDERERS
+
+
+class PDFRenderer(_ExportRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class ZIPRenderer(_ExportRenderer):
+    media_type = 'application/zip'
+    format = 'zip'
+    charset = None
+
+
+# Bulletins de salaire (bulletins.py) : PDF unitaire et ZIP par lot
+BULLETIN_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [PDFRenderer, ZIPRenderer]
+
+
+# ========================================
+# SOURCES DE DONNÉES
+# ========================================
+
+def lignes_absences_agents(agents, debut, fin, champs, detaille=False):
+    """
+    Génère une ligne par agent avec ses absences sur [debut, fin].
+
+    - agents : queryset d'agents (clé primaire = personne), déjà filtré par scope
+    - champs : liste de (colonne, lookup ORM) décrivant les colonnes de l'agent
+
+    Deux requêtes lues en parallèle par blocs, toutes deux triées par personne :
+    les agents et leurs absences sont fusionnés comme dans un merge join.
+    """
+    lookups = ['personne_id'] + [lookup for _, lookup in champs]
+    lignes_agents = (
+        agents.order_by('personne_id')
+        .values_list(*lookups)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    absences = (
+        Absence.objects.filter(
+            filtre_chevauchement(debut, fin),
+            personne_id__in=Subquery(agents.values('personne_id'))
+        )
+        .order_by('personne_id', 'id')
+        .values_list('personne_id', 'type_absence', 'date_debut', 'date_fin')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+    absence = next(absences, None)
+    for ligne in lignes_agents:
+        personne_id = ligne[0]
+        nombre = 0
+        jours = 0
+        types = []
+        while absence is not None and absence[0] <= personne_id:
+            if absence[0] == personne_id:
+                _, type_absence, date_debut, date_fin = absence
+                nombre += 1
+                if detaille:
+                    jours += (date_fin - max(date_debut, debut)).days + 1
+                    if type_absence not in types:
+                        types.append(type_absence)
+                else:
+                    jours += (date_fin - date_debut).days + 1
+            absence = next(absences, None)
+
+        donnees = {colonne: valeur for (colonne, _), valeur in zip(champs, ligne[1:])}
+        donnees['nombre_absences'] = nombre
+        donnees['jours_absence'] = jours
+        if detaille:
+            donnees['types_absence'] = ', '.join(types)
+        yield donnees
+
+
+# ========================================
+# RÉPONSES EN FLUX
+# ========================================
+
+class _Echo:
+    """Pseudo-fichier : csv.writer écrit, on récupère la ligne formatée"""
+
+    def write(self, value):
+        return value
+
+
+def _valeur_export(valeur):
+    if isinstance(valeur, Decimal):
+        return float(valeur)
+    if isinstance(valeur, (date, datetime)):
+        return valeur.isoformat()
+    return valeur
+
+
+def _flux_csv(lignes, colonnes):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(colonnes)
+    for ligne in lignes:
+        yield writer.writerow([ligne.get(c, '') for c in colonnes])
+
+
+def _flux_ndjson(lignes, colonnes):
+    for ligne in lignes:
+        yield json.dumps(
+            {c: _valeur_export(ligne.get(c)) for c in colonnes}, ensure_ascii=False
+        ) + '\n'
+
+
+def _classeur_xlsx(lignes, colonnes, titre):
+    """Classeur openpyxl en mode write-only"""
+    from openpyxl import Workbook
+
+    classeur = Workbook(write_only=True)
+    feuille = classeur.create_sheet(title=titre[:31])
+    feuille.append(colonnes)
+    for ligne in lignes:
+        feuille.append([_valeur_export(ligne.get(c)) for c in colonnes])
+    return classeur
+
+
+def _fichier_xlsx(lignes, colonnes, titre):
+    """Classeur XLSX écrit dans un fichier temporaire"""
+    fichier = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    _classeur_xlsx(lignes, colonnes, titre).save(fichier)
+    fichier.seek(0)
+    return fichier
+
+
+def xlsx_disponible():
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def reponse_export(lignes, colonnes, format_export, nom_fichier):
+    """
+    Réponse HTTP en flux pour un générateur de lignes (dict).
+    format_export : 'csv', 'xlsx' ou 'ndjson'.
+    """
+    if format_export == 'csv':
+        response = StreamingHttpResponse(_flux_csv(lignes, colonnes), content_type='text/csv; charset=utf-8')
+    elif format_export == 'ndjson':
+        response = StreamingHttpResponse(_flux_ndjson(lignes, colonnes), content_type='application/x-ndjson; charset=utf-8')
+    elif format_export == 'xlsx':
+        response = FileResponse(
+            _fichier_xlsx(lignes, colonnes, nom_fichier),
+            content_type=XLSXRenderer.media_type
+        )
+    else:
+        raise ValueError(f"Format d'export non supporté: {format_export}")
+
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}.{format_export}"'
+    return response
+
+
+def ecrire_export(lignes, colonnes, format_export, fichier, titre='export'):
+    """
+    Écrit les lignes dans un fichier binaire ouvert (exports en tâche de fond).
+    format_export : 'csv', 'xlsx' ou 'ndjson'.
+    """
+    if format_export == 'xlsx':
+        _classeur_xlsx(lignes, colonnes, titre).save(fichier)
+        return
+    if format_export == 'csv':
+        flux = _flux_csv(lignes, colonnes)
+    elif format_export == 'ndjson':
+        flux = _flux_ndjson(lignes, colonnes)
+    else:
+        raise ValueError(f"Format d'export non supporté: {format_export}")
+
+    texte = io.TextIOWrapper(fichier, encoding='utf-8', newline='')
+    texte.writelines(flux)
+    texte.flush()
+    texte.detach()
+
+
+def _colonnes_absences_agents(champs, detaille):
+    colonnes = [colonne for colonne, _ in champs] + ['nombre_absences', 'jours_absence']
+    if detaille:
+        colonnes.append('types_absence')
+    return colonnes
+
+
+def _rapport_json(lignes, service, mois, type_rapport):
+    return {
+        'donnees': list(lignes),
+        'periode': mois,
+        'service': service.nom,
+        'type_rapport': type_rapport,
+        'genere_le': timezone.now().isoformat()
+    }
+
+
+def verifier_format_export(format_export):
+    """Message d'erreur si le format demandé n'est pas disponible, sinon None"""
+    if format_export not in FORMATS_EXPORT:
+        return f"Format non supporté. Formats: {', '.join(FORMATS_EXPORT)}"
+    if format_export == 'xlsx' and not xlsx_disponible():
+        return "Export XLSX indisponible (openpyxl non installé)"
+    return None
+
+
+def exporter_absences_agents(agents, service, mois, debut, fin, type_rapport,
+                             format_export, champs, prefixe_fichier):
+    """
+    Export du rapport d'absences mensuel des agents d'un service.
+    JSON : réponse DRF habituelle ; csv/xlsx/ndjson : fichier produit en flux.
+    """
+    erreur = verifier_format_export(format_export)
+    if erreur:
+        return Response({'error': erreur}, status=400)
+
+    detaille = type_rapport == 'detaille'
+    lignes = lignes_absences_agents(agents, debut, fin, champs, detaille=detaille)
+
+    if format_export == 'json':
+        return Response(_rapport_json(lignes, service, mois, type_rapport))
+
+    colonnes = _colonnes_absences_agents(champs, detaille)
+    return reponse_export(lignes, colonnes, format_export, f"{prefixe_fichier}_{type_rapport}_{mois}")
+
+
+def ecrire_absences_agents(agents, service, mois, debut, fin, type_rapport,
+                           format_export, champs, fichier):
+    """Même rapport qu'exporter_absences_agents, écrit dans un fichier binaire ouvert"""
+    detaille = type_rapport == 'detaille'
+    lignes = lignes_absences_agents(agents, debut, fin, champs, detaille=detaille)
+
+    if format_export == 'json':
+        texte = io.TextIOWrapper(fichier, encoding='utf-8')
+        json.dump(_rapport_json(lignes, service, mois, type_rapport), texte,
+                  ensure_ascii=False, default=_valeur_export)
+        texte.flush()
+        texte.detach()
+        return
+
+    ecrire_export(lignes, _colonnes_absences_agents(champs, detaille), format_export, fichier, mois)
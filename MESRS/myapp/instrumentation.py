@@ -0,0 +1,308 @@
+# myapp/instrumentation.py
+"""
+Instrumentation des requêtes HTTP, conçue pour rester active en production.
+
+Pour chaque requête, InstrumentationMiddleware mesure :
+- le nombre de requêtes SQL et leur durée cumulée (execute_wrapper de Django,
+  sans dépendre de DEBUG ni conserver le texte des requêtes) ;
+- les requêtes répétées à l'identique au paramètre près (signature N+1) ;
+- le temps de rendu de la réponse (sérialisation JSON/CSV) et sa taille.
+
+Ces mesures sont renvoyées dans l'en-tête Server-Timing, cumulées par vue
+dans un registre en mémoire exposé au format Prometheus sur /api/metrics/,
+et les requêtes lentes sont journalisées avec leurs requêtes SQL les plus
+coûteuses. Pour une StreamingHttpResponse (exports), dont le contenu et ses
+requêtes SQL sont produits pendant l'envoi, la mesure se poursuit jusqu'à la
+fin du flux ; l'en-tête Server-Timing, envoyé avant, n'en couvre que le début.
+Le registre est propre à chaque processus : avec plusieurs
+workers, chacun expose ses propres compteurs.
+"""
+import logging
+import re
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden
+
+
+logger = logging.getLogger(__name__)
+
+SEUIL_LENT_MS_DEFAUT = 1000
+SEUIL_DOUBLONS_DEFAUT = 10
+NOMBRE_REQUETES_JOURNAL = 5
+# Bornes (secondes) de l'histogramme des durées
+BORNES_DUREE = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Listes IN (%s, %s, …) de longueur variable ramenées à une seule signature
+_LISTE_PARAMETRES = re.compile(r'\(%s(?:, %s)+\)')
+
+
+def _parametre(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+
+def signature(sql):
+    """Forme de la requête, identique pour deux exécutions ne différant que par les paramètres"""
+    return _LISTE_PARAMETRES.sub('(%s…)', sql) if ' IN (' in sql else sql
+
+
+# ========================================
+# MESURE D'UNE REQUÊTE HTTP
+# ========================================
+
+class MesureRequete:
+    """Compteurs d'une requête HTTP, alimentés par le wrapper d'exécution SQL"""
+
+    def __init__(self):
+        self.nombre_sql = 0
+        self.duree_sql = 0.0
+        self.duree_rendu = 0.0
+        self.duree = 0.0
+        self.taille = None
+        self.debut_rendu = None
+        # signature -> [exécutions, durée cumulée]
+        self.signatures = {}
+
+    def executer(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duree = time.perf_counter() - debut
+            self.nombre_sql += 1
+            self.duree_sql += duree
+            cumul = self.signatures.setdefault(signature(sql), [0, 0.0])
+            cumul[0] += 1
+            cumul[1] += duree
+
+    def commencer_rendu(self):
+        self.debut_rendu = time.perf_counter()
+
+    def terminer_rendu(self, response):
+        if self.debut_rendu is not None:
+            self.duree_rendu = time.perf_counter() - self.debut_rendu
+
+    @property
+    def doublons(self):
+        """Exécutions en trop : requêtes répétées au-delà de leur première exécution"""
+        return sum(nombre - 1 for nombre, _ in self.signatures.values())
+
+    def plus_couteuses(self, nombre=NOMBRE_REQUETES_JOURNAL):
+        return sorted(self.signatures.items(), key=lambda item: item[1][1], reverse=True)[:nombre]
+
+    def server_timing(self):
+        return ', '.join([
+            f'sql;dur={self.duree_sql * 1000:.1f};desc="{self.nombre_sql} requêtes, {self.doublons} répétées"',
+            f'rendu;dur={self.duree_rendu * 1000:.1f}',
+            f'total;dur={self.duree * 1000:.1f}',
+        ])
+
+
+# ========================================
+# REGISTRE DES MÉTRIQUES (PROMETHEUS)
+# ========================================
+
+class Registre:
+    """Métriques cumulées par (méthode, vue, classe de statut), protégées par un verrou"""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._series = {}
+
+    def enregistrer(self, methode, vue, statut, mesure):
+        cle = (methode, vue, f'{statut // 100}xx')
+        with self._verrou:
+            serie = self._series.get(cle)
+            if serie is None:
+                serie = self._series[cle] = {
+                    'requetes': 0, 'duree': 0.0, 'buckets': [0] * len(BORNES_DUREE),
+                    'sql': 0, 'duree_sql': 0.0, 'doublons': 0, 'duree_rendu': 0.0, 'octets': 0,
+                }
+            serie['requetes'] += 1
+            serie['duree'] += mesure.duree
+            for i, borne in enumerate(BORNES_DUREE):
+                if mesure.duree <= borne:
+                    serie['buckets'][i] += 1
+            serie['sql'] += mesure.nombre_sql
+            serie['duree_sql'] += mesure.duree_sql
+            serie['doublons'] += mesure.doublons
+            serie['duree_rendu'] += mesure.duree_rendu
+            serie['octets'] += mesure.taille or 0
+
+    def reinitialiser(self):
+        with self._verrou:
+            self._series.clear()
+
+    def exposition(self):
+        """Métriques au format texte Prometheus (version 0.0.4)"""
+        with self._verrou:
+            series = {cle: {**serie, 'buckets': list(serie['buckets'])} for cle, serie in self._series.items()}
+
+        def etiquettes(cle, **autres):
+            methode, vue, statut = cle
+            valeurs = {'methode': methode, 'vue': vue, 'statut': statut, **autres}
+            return ','.join(f'{nom}="{valeur}"' for nom, valeur in valeurs.items())
+
+        lignes = []
+
+        def metrique(nom, type_metrique, aide, champ):
+            lignes.append(f'# HELP {nom} {aide}')
+            lignes.append(f'# TYPE {nom} {type_metrique}')
+            for cle, serie in series.items():
+                lignes.append(f'{nom}{{{etiquettes(cle)}}} {serie[champ]}')
+
+        metrique('mesrs_http_requetes_total', 'counter', 'Requêtes HTTP traitées', 'requetes')
+        lignes.append('# HELP mesrs_http_duree_secondes Durée de traitement des requêtes HTTP')
+        lignes.append('# TYPE mesrs_http_duree_secondes histogram')
+        for cle, serie in series.items():
+            for borne, nombre in zip(BORNES_DUREE, serie['buckets']):
+                lignes.append(f'mesrs_http_duree_secondes_bucket{{{etiquettes(cle, le=borne)}}} {nombre}')
+            lignes.append(f'mesrs_http_duree_secondes_bucket{{{etiquettes(cle, le="+Inf")}}} {serie["requetes"]}')
+            lignes.append(f'mesrs_http_duree_secondes_sum{{{etiquettes(cle)}}} {serie["duree"]:.6f}')
+            lignes.append(f'mesrs_http_duree_secondes_count{{{etiquettes(cle)}}} {serie["requetes"]}')
+        metrique('mesrs_sql_requetes_total', 'counter', 'Requêtes SQL exécutées', 'sql')
+        metrique('mesrs_sql_duree_secondes_total', 'counter', 'Durée cumulée des requêtes SQL', 'duree_sql')
+        metrique('mesrs_sql_repetees_total', 'counter',
+                 'Requêtes SQL répétées dans une même requête HTTP (signature N+1)', 'doublons')
+        metrique('mesrs_rendu_secondes_total', 'counter', 'Durée cumulée du rendu des réponses', 'duree_rendu')
+        metrique('mesrs_reponse_octets_total', 'counter', 'Taille cumulée des réponses', 'octets')
+        return '\n'.join(lignes) + '\n'
+
+
+registre = Registre()
+
+
+# ========================================
+# MIDDLEWARE ET ENDPOINT
+# ========================================
+
+class FluxMesure:
+    """
+    Contenu d'une StreamingHttpResponse compté au fil de l'envoi ; fin(taille)
+    est appelée une fois, à l'épuisement du flux ou à sa fermeture par le serveur.
+    """
+
+    def __init__(self, contenu, fin):
+        self._contenu = iter(contenu)
+        self._fin = fin
+        self.taille = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            morceau = next(self._contenu)
+        except StopIteration:
+            self.close()
+            raise
+        self.taille += len(morceau)
+        return morceau
+
+    def close(self):
+        fin, self._fin = self._fin, None
+        if fin is not None:
+            fin(self.taille)
+
+
+class InstrumentationMiddleware:
+    """
+    À placer en tête de MIDDLEWARE pour mesurer toute la chaîne.
+    Désactivable par settings.INSTRUMENTATION_ACTIVE = False.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _parametre('INSTRUMENTATION_ACTIVE', True):
+            return self.get_response(request)
+
+        mesure = MesureRequete()
+        request.instrumentation = mesure
+        debut = time.perf_counter()
+        pile = ExitStack()
+        try:
+            for alias in connections:
+                pile.enter_context(connections[alias].execute_wrapper(mesure.executer))
+            response = self.get_response(request)
+        except BaseException:
+            pile.close()
+            raise
+        mesure.duree = time.perf_counter() - debut
+        response['Server-Timing'] = mesure.server_timing()
+
+        if response.streaming and not isinstance(response, FileResponse) and not getattr(response, 'is_async', False):
+            # Flux généré pendant l'envoi (exports CSV…) : wrapper SQL actif et
+            # mesure enregistrée jusqu'à la fin du flux
+            def fin(taille):
+                pile.close()
+                mesure.taille = taille
+                mesure.duree = time.perf_counter() - debut
+                self.terminer(request, response, mesure)
+
+            response.streaming_content = FluxMesure(response.streaming_content, fin)
+            return response
+
+        pile.close()
+        if not response.streaming:
+            mesure.taille = len(response.content)
+        elif response.has_header('Content-Length'):
+            # Fichier envoyé tel quel (bulletins) : taille connue, sans lecture du flux
+            mesure.taille = int(response['Content-Length'])
+        self.terminer(request, response, mesure)
+        return response
+
+    def terminer(self, request, response, mesure):
+        vue = request.resolver_match.view_name if request.resolver_match else 'inconnue'
+        registre.enregistrer(request.method, vue, response.status_code, mesure)
+        self.journaliser(request, response, mesure)
+
+    def process_template_response(self, request, response):
+        # Réponses DRF : le rendu (sérialisation du contenu) a lieu après ce point
+        mesure = getattr(request, 'instrumentation', None)
+        if mesure is not None:
+            mesure.commencer_rendu()
+            response.add_post_render_callback(mesure.terminer_rendu)
+        return response
+
+    def journaliser(self, request, response, mesure):
+        seuil_lent = _parametre('INSTRUMENTATION_SEUIL_LENT_MS', SEUIL_LENT_MS_DEFAUT) / 1000
+        seuil_doublons = _parametre('INSTRUMENTATION_SEUIL_DOUBLONS', SEUIL_DOUBLONS_DEFAUT)
+        if mesure.duree < seuil_lent and mesure.doublons < seuil_doublons:
+            return
+
+        logger.warning(
+            "Requête %s %s %s : %.0f ms, %d requêtes SQL (%.0f ms, %d répétées), rendu %.0f ms, %s octets",
+            'lente' if mesure.duree >= seuil_lent else 'N+1 probable',
+            request.method, request.path, mesure.duree * 1000, mesure.nombre_sql,
+            mesure.duree_sql * 1000, mesure.doublons, mesure.duree_rendu * 1000,
+            mesure.taille if mesure.taille is not None else '?',
+            extra={
+                'statut': response.status_code,
+                'requetes_sql': mesure.nombre_sql,
+                'duree_sql_ms': round(mesure.duree_sql * 1000, 1),
+                'requetes_repetees': mesure.doublons,
+                'requetes_couteuses': [
+                    {'sql': sql[:300], 'executions': nombre, 'duree_ms': round(duree * 1000, 1)}
+                    for sql, (nombre, duree) in mesure.plus_couteuses()
+                ],
+            },
+        )
+
+
+def _autorise(request):
+    jeton = _parametre('METRIQUES_JETON', '')
+    if jeton and request.headers.get('Authorization') == f'Bearer {jeton}':
+        return True
+    return request.META.get('REMOTE_ADDR') in _parametre('METRIQUES_IPS_AUTORISEES', ['127.0.0.1', '::1'])
+
+
+def metriques(request):
+    """/api/metrics/ : exposition Prometheus (IP autorisée ou jeton METRIQUES_JETON)"""
+    if not _autorise(request):
+        return HttpResponseForbidden("Accès aux métriques refusé")
+    return HttpResponse(registre.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,290 @@
+# myapp/journalisation.py
+"""
+Journalisation structurée et non bloquante.
+
+- ContexteRequeteMiddleware attribue un identifiant à chaque requête
+  (en-tête X-Request-ID repris ou généré) et le rend visible des journaux.
+- GestionnaireAsynchrone (QueueHandler) place les enregistrements dans une
+  file ; l'écriture sur disque et sur la console est faite par un thread
+  QueueListener, hors du thread qui traite la requête.
+- FormatteurJSON produit une ligne JSON par enregistrement : request_id,
+  utilisateur, rôle, durée écoulée depuis le début de la requête et champs
+  passés par `extra`.
+- MasquageFilter remplace les identifiants (mots de passe, jetons) par
+  '***' ; EchantillonnageFilter ne conserve qu'une fraction des messages DEBUG.
+
+Ce module est chargé par settings.LOGGING : il ne doit pas importer de modèles.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import time
+import uuid
+from collections.abc import Mapping
+from datetime import datetime, timezone as dt_timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from django.utils.functional import empty
+
+
+MASQUE = '***'
+CLES_SENSIBLES = (
+    'password', 'mot_de_passe', 'passwd', 'token', 'access', 'refresh',
+    'secret', 'authorization', 'cookie', 'api_key',
+)
+_CLE_SENSIBLE = re.compile('|'.join(CLES_SENSIBLES), re.IGNORECASE)
+# 'password': 'xxx' / "token": "xxx" / password=xxx / Bearer xxx dans un texte déjà formaté
+_VALEUR_SENSIBLE = re.compile(
+    r"""(?P<cle>['"]?\b\w*(?:%s)\w*['"]?\s*[:=]\s*)(?P<valeur>(?:Bearer\s+)?(?:'[^']*'|"[^"]*"|[^\s,;&}\]]+))"""
+    % '|'.join(CLES_SENSIBLES),
+    re.IGNORECASE,
+)
+_BEARER = re.compile(r'(Bearer\s+)[\w\-.~+/]+=*', re.IGNORECASE)
+# Spécificateur %… d'un message de journal ; argument précédé d'un nom sensible ('refresh %s', 'token=%r')
+_SPECIFICATEUR = re.compile(r'%(?:\((?P<nom>[^)]*)\))?[#0\- +]*(?:\*|\d+)?(?:\.(?:\*|\d+))?[hlL]?(?P<type>[%a-zA-Z])')
+_APRES_CLE_SENSIBLE = re.compile(
+    r"""(?:%s)\w*['"]?\s*[:=]?\s*(?:Bearer\s+)?['"]?$""" % '|'.join(CLES_SENSIBLES), re.IGNORECASE
+)
+_REQUEST_ID_VALIDE = re.compile(r'^[\w\-]{1,64}$')
+
+# Attributs standard d'un LogRecord, exclus des champs libres du JSON
+_ATTRIBUTS_STANDARD = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id', 'utilisateur', 'role', 'duree_ms',
+}
+
+_requete_courante = contextvars.ContextVar('requete_courante', default=None)
+
+
+def masquer_texte(texte):
+    texte = _VALEUR_SENSIBLE.sub(lambda m: m.group('cle') + MASQUE, texte)
+    return _BEARER.sub(r'\g<1>' + MASQUE, texte)
+
+
+def masquer_arguments(gabarit, args):
+    """
+    Arguments d'un message `gabarit % args` avec masqués ceux qui suivent un
+    nom sensible dans le gabarit (ex. logger.info("refresh %s", jeton)).
+    """
+    args = masquer(args)
+    if not isinstance(gabarit, str):
+        return args
+    if isinstance(args, Mapping):
+        args = dict(args)
+    else:
+        args = list(args)
+    position, fin_precedent = 0, 0
+    for specificateur in _SPECIFICATEUR.finditer(gabarit):
+        if specificateur.group('type') == '%':
+            fin_precedent = specificateur.end()
+            continue
+        sensible = _APRES_CLE_SENSIBLE.search(gabarit[fin_precedent:specificateur.start()])
+        if isinstance(args, dict):
+            if sensible and specificateur.group('nom') in args:
+                args[specificateur.group('nom')] = MASQUE
+        elif position < len(args):
+            if sensible:
+                args[position] = MASQUE
+            position += 1
+        fin_precedent = specificateur.end()
+    return args if isinstance(args, dict) else tuple(args)
+
+
+def masquer(valeur):
+    """Copie de la valeur avec les champs sensibles masqués (dict, QueryDict, listes, texte)"""
+    if isinstance(valeur, Mapping):
+        return {
+            cle: MASQUE if isinstance(cle, str) and _CLE_SENSIBLE.search(cle) else masquer(v)
+            for cle, v in valeur.items()
+        }
+    if isinstance(valeur, (list, tuple)):
+        return type(valeur)(masquer(v) for v in valeur)
+    if isinstance(valeur, str):
+        return masquer_texte(valeur)
+    return valeur
+
+
+# ========================================
+# CONTEXTE DE REQUÊTE
+# ========================================
+
+class ContexteRequeteMiddleware:
+    """À placer en tête de MIDDLEWARE : identifiant de requête et contexte des journaux"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        entrant = request.headers.get('X-Request-ID', '')
+        request.request_id = entrant if _REQUEST_ID_VALIDE.match(entrant) else uuid.uuid4().hex
+        request.debut_journal = time.perf_counter()
+        jeton = _requete_courante.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _requete_courante.reset(jeton)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+
+def _utilisateur(request):
+    """Utilisateur déjà authentifié, sans déclencher d'authentification depuis un journal"""
+    user = request.__dict__.get('user')
+    wrapped = getattr(user, '_wrapped', None)
+    if wrapped is empty:
+        return None
+    return wrapped if wrapped is not None else user
+
+
+class ContexteRequeteFilter(logging.Filter):
+    """
+    Ajoute request_id, utilisateur, rôle et durée écoulée à chaque enregistrement.
+    Les valeurs passées par `extra` (ex. utilisateur à la connexion) sont conservées.
+    """
+
+    def filter(self, record):
+        request = _requete_courante.get()
+        contexte = {'request_id': None, 'utilisateur': None, 'role': None, 'duree_ms': None}
+        if request is not None:
+            contexte['request_id'] = request.request_id
+            contexte['duree_ms'] = round((time.perf_counter() - request.debut_journal) * 1000, 1)
+            user = _utilisateur(request)
+            if user is not None and user.is_authenticated:
+                contexte['utilisateur'] = user.username
+                contexte['role'] = getattr(user, 'role', None)
+        for cle, valeur in contexte.items():
+            if getattr(record, cle, None) is None:
+                setattr(record, cle, valeur)
+        return True
+
+
+class MasquageFilter(logging.Filter):
+    """Masque mots de passe et jetons dans le message, ses arguments et les champs extra"""
+
+    def filter(self, record):
+        # Masquage du message final : le gabarit seul ne contient pas les valeurs
+        # passées en arguments, et le modifier fausserait le formatage %
+        if record.args:
+            record.args = masquer_arguments(record.msg, record.args)
+        try:
+            message = record.getMessage()
+        except (TypeError, ValueError, KeyError):
+            # Gabarit et arguments incompatibles : l'erreur est signalée par le gestionnaire
+            if isinstance(record.msg, str):
+                record.msg = masquer_texte(record.msg)
+        else:
+            record.msg = masquer_texte(message)
+            record.args = None
+        for cle in set(vars(record)) - _ATTRIBUTS_STANDARD:
+            if _CLE_SENSIBLE.search(cle):
+                setattr(record, cle, MASQUE)
+            else:
+                setattr(record, cle, masquer(getattr(record, cle)))
+        return True
+
+
+class EchantillonnageFilter(logging.Filter):
+    """Ne conserve qu'une proportion `taux` des messages DEBUG ; les autres niveaux passent"""
+
+    def __init__(self, taux=1.0):
+        super().__init__()
+        self.taux = float(taux)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.taux >= 1:
+            return True
+        return random.random() < self.taux
+
+
+# ========================================
+# FORMAT ET ÉCRITURE
+# ========================================
+
+class FormatteurJSON(logging.Formatter):
+    """Une ligne JSON par enregistrement"""
+
+    def format(self, record):
+        donnees = {
+            'horodatage': datetime.fromtimestamp(record.created, dt_timezone.utc).isoformat(timespec='milliseconds'),
+            'niveau': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for cle in ('request_id', 'utilisateur', 'role', 'duree_ms'):
+            if getattr(record, cle, None) is not None:
+                donnees[cle] = getattr(record, cle)
+        for cle in set(vars(record)) - _ATTRIBUTS_STANDARD:
+            donnees[cle] = getattr(record, cle)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            donnees['exception'] = record.exc_text
+        return json.dumps(donnees, ensure_ascii=False, default=str)
+
+
+class FormatteurTexte(logging.Formatter):
+    """Format lisible pour la console de développement"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = None
+        return super().format(record)
+
+
+class GestionnaireAsynchrone(QueueHandler):
+    """
+    QueueHandler vers un fichier (JSON) et/ou la console, écrits par un thread
+    QueueListener. Le message est résolu dans le thread appelant (les arguments
+    peuvent changer ensuite), le formatage et l'écriture dans le thread d'écriture.
+    """
+
+    def __init__(self, fichier=None, console=False, niveau_fichier='INFO',
+                 niveau_console='DEBUG', json_console=False):
+        super().__init__(queue.SimpleQueue())
+        self.cibles = []
+        if fichier:
+            os.makedirs(os.path.dirname(os.fspath(fichier)), exist_ok=True)
+            gestionnaire = logging.FileHandler(fichier, encoding='utf-8')
+            gestionnaire.setLevel(niveau_fichier)
+            gestionnaire.setFormatter(FormatteurJSON())
+            self.cibles.append(gestionnaire)
+        if console:
+            gestionnaire = logging.StreamHandler()
+            gestionnaire.setLevel(niveau_console)
+            gestionnaire.setFormatter(FormatteurJSON() if json_console else FormatteurTexte())
+            self.cibles.append(gestionnaire)
+        self._demarrer()
+        atexit.register(self.close)
+        # Serveurs qui forkent après le chargement (gunicorn --preload) : le thread
+        # d'écriture n'existe pas dans le processus enfant
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._demarrer)
+
+    def _demarrer(self):
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, *self.cibles, respect_handler_level=True)
+        self.listener.start()
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener is not None and listener._thread is not None:
+            listener.stop()
+        for gestionnaire in self.cibles:
+            gestionnaire.close()
+        super().close()
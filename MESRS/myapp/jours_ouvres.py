@@ -0,0 +1,176 @@
+# myapp/jours_ouvres.py
+"""
+Arithmétique des jours ouvrés et calcul des taux de présence.
+
+- Les jours ouvrés d'un intervalle sont comptés en forme close (semaines
+  complètes + reste), sans parcourir les jours un par un.
+- Le week-end (settings.JOURS_WEEKEND) et les jours fériés sont configurables :
+  fêtes nationales mauritaniennes à date fixe + settings.JOURS_FERIES pour les
+  fêtes religieuses, dont la date change chaque année.
+- Avec NumPy, le décompte sur un grand nombre d'absences est vectorisé
+  (numpy.busday_count).
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+
+from django.conf import settings
+
+try:
+    import numpy as np
+except ImportError:  # NumPy est optionnel
+    np = None
+
+
+# Fêtes légales à date fixe en Mauritanie : (mois, jour) -> libellé
+JOURS_FERIES_FIXES = {
+    (1, 1): "Jour de l'An",
+    (5, 1): 'Fête du Travail',
+    (5, 25): "Journée de l'Afrique",
+    (11, 28): "Fête de l'Indépendance",
+}
+
+
+def get_weekend():
+    """Jours de repos hebdomadaire (0 = lundi … 6 = dimanche)"""
+    return tuple(getattr(settings, 'JOURS_WEEKEND', (5, 6)))
+
+
+def est_weekend(jour, weekend=None):
+    return jour.weekday() in (weekend if weekend is not None else get_weekend())
+
+
+def jours_feries(debut, fin):
+    """Liste triée des jours fériés compris dans [debut, fin]"""
+    feries = set()
+    for annee in range(debut.year, fin.year + 1):
+        for (mois, jour) in JOURS_FERIES_FIXES:
+            feries.add(date(annee, mois, jour))
+    for valeur in getattr(settings, 'JOURS_FERIES', []):
+        feries.add(date.fromisoformat(valeur) if isinstance(valeur, str) else valeur)
+    return sorted(j for j in feries if debut <= j <= fin)
+
+
+def compter_jours_ouvres(debut, fin, weekend=None, feries=None):
+    """
+    Nombre de jours ouvrés de [debut, fin] (bornes incluses).
+    feries : liste triée de jours fériés (par défaut jours_feries(debut, fin)).
+    """
+    if fin < debut:
+        return 0
+    weekend = weekend if weekend is not None else get_weekend()
+    feries = feries if feries is not None else jours_feries(debut, fin)
+
+    nb_jours = (fin - debut).days + 1
+    semaines, reste = divmod(nb_jours, 7)
+    jours = semaines * (7 - len(weekend))
+    premier = debut.weekday()
+    jours += sum(1 for i in range(reste) if (premier + i) % 7 not in weekend)
+
+    # Fériés tombant un jour ouvré de l'intervalle
+    i0 = bisect_left(feries, debut)
+    i1 = bisect_right(feries, fin)
+    jours -= sum(1 for jour in feries[i0:i1] if jour.weekday() not in weekend)
+    return jours
+
+
+def fusionner_intervalles(intervalles):
+    """Fusionne des intervalles de dates qui se chevauchent ou se touchent"""
+    fusion = []
+    for debut, fin in sorted(intervalles):
+        if fusion and debut <= fusion[-1][1] + timedelta(days=1):
+            if fin > fusion[-1][1]:
+                fusion[-1][1] = fin
+        else:
+            fusion.append([debut, fin])
+    return [tuple(i) for i in fusion]
+
+
+def _compter_intervalles(intervalles, weekend, feries):
+    """Jours ouvrés de chaque intervalle (liste)"""
+    if np is not None and len(intervalles) > 1:
+        masque = ''.join('0' if i in weekend else '1' for i in range(7))
+        debuts = np.array([d for d, _ in intervalles], dtype='datetime64[D]')
+        fins = np.array([f for _, f in intervalles], dtype='datetime64[D]') + 1
+        return np.busday_count(
+            debuts, fins, weekmask=masque, holidays=np.array(feries, dtype='datetime64[D]')
+        ).tolist()
+    return [compter_jours_ouvres(d, f, weekend, feries) for d, f in intervalles]
+
+
+def jours_absence_par_personne(absences, debut, fin):
+    """
+    Jours ouvrés d'absence de chaque personne sur [debut, fin].
+
+    absences : itérable de (personne_id, date_debut, date_fin). Les absences
+    sont tronquées aux bornes de la période et les chevauchements d'une même
+    personne ne sont comptés qu'une fois.
+    """
+    weekend = get_weekend()
+    feries = jours_feries(debut, fin)
+
+    par_personne = {}
+    for personne_id, date_debut, date_fin in absences:
+        d, f = max(date_debut, debut), min(date_fin, fin)
+        if d <= f:
+            par_personne.setdefault(personne_id, []).append((d, f))
+
+    personnes = []
+    intervalles = []
+    for personne_id, liste in par_personne.items():
+        for intervalle in fusionner_intervalles(liste):
+            personnes.append(personne_id)
+            intervalles.append(intervalle)
+
+    jours = {}
+    for personne_id, nombre in zip(personnes, _compter_intervalles(intervalles, weekend, feries)):
+        jours[personne_id] = jours.get(personne_id, 0) + nombre
+    return jours
+
+
+def disponibilite_par_personne(absences, debut, fin):
+    """
+    Disponibilité de chaque personne absente sur [debut, fin] :
+    {personne_id: {jours_absence, jours_disponibles, taux_disponibilite}}.
+    """
+    jours_ouvres = compter_jours_ouvres(debut, fin)
+    disponibilite = {}
+    for personne_id, jours in jours_absence_par_personne(absences, debut, fin).items():
+        disponibilite[personne_id] = {
+            'jours_absence': jours,
+            'jours_disponibles': jours_ouvres - jours,
+            'taux_disponibilite': round((jours_ouvres - jours) / jours_ouvres * 100, 2) if jours_ouvres else 100,
+        }
+    return disponibilite
+
+
+def taux_presence(nb_employes, jours_perdus, jours_ouvres):
+    """Taux de présence (%) : jours ouvrés travaillés / jours ouvrés dus"""
+    if nb_employes == 0 or jours_ouvres == 0:
+        return 100
+    total = nb_employes * jours_ouvres
+    return round(max(0, (total - jours_perdus) / total * 100), 2)
+
+
+def presence_periode(absences, nb_employes, debut, fin):
+    """
+    Indicateurs de présence d'un effectif sur [debut, fin] (une requête).
+
+    absences : queryset d'Absence (déjà restreint au périmètre et au statut voulu)
+    Retourne {jours_ouvres, jours_ouvres_perdus, taux_presence, agents_absents},
+    agents_absents comptant les personnes ayant au moins une de ces absences
+    sur la période.
+    """
+    lignes = (
+        absences.filter(date_debut__lte=fin, date_fin__gte=debut)
+        .values_list('personne_id', 'date_debut', 'date_fin')
+        .order_by()
+    )
+    jours_ouvres = compter_jours_ouvres(debut, fin)
+    jours = jours_absence_par_personne(lignes.iterator(chunk_size=2000), debut, fin)
+    perdus = sum(jours.values())
+    return {
+        'jours_ouvres': jours_ouvres,
+        'jours_ouvres_perdus': perdus,
+        'taux_presence': taux_presence(nb_employes, perdus, jours_ouvres),
+        'agents_absents': len(jours),
+    }
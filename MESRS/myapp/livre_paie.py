@@ -0,0 +1,230 @@
+# myapp/livre_paie.py
+"""
+Livre de paie : totaux mensuels précalculés (tables LivrePaie et LivrePaieElement).
+
+LivrePaie agrège les paies par (mois_annee, service, type_employe, grade,
+statut_paiement) : nombre de paies, brut, net, retenues, allocations.
+LivrePaieElement agrège les éléments de paie des mêmes paies par code.
+Les résumés mensuels et annuels du ministère se lisent dans ces tables, sans
+parcourir Paie ni ElementPaie.
+
+Une paie est comptée dans le service et le type actuels de l'agent, avec le
+grade figé sur la paie. Le livre est tenu à jour par compartiment
+(mois, service) : toute écriture programme, à la validation de la
+transaction, le recalcul des compartiments touchés (signaux de Paie et de
+Personne dans signals.py, lancement de paie dans moteur_paie.py). Les
+éléments de paie sont toujours écrits avec leur paie et n'ont pas de signal.
+`python manage.py reconstruire_livre_paie` recalcule tout le livre.
+"""
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from .models import ElementPaie, LivrePaie, LivrePaieElement, Paie, Service
+
+
+MONTANTS = ('salaire_brut', 'salaire_net', 'deductions', 'allocations_familiales')
+# Axes de ventilation des résumés
+AXES = {
+    'service': ('service', 'service__nom'),
+    'type_employe': ('type_employe',),
+    'grade': ('grade',),
+    'statut': ('statut_paiement',),
+}
+# Ventilation par code d'élément : lue dans LivrePaieElement
+AXE_CODE = 'code'
+
+_en_attente = threading.local()
+
+
+# ========================================
+# MISE À JOUR
+# ========================================
+
+def marquer(mois_annee, service_id):
+    """
+    Programme le recalcul du compartiment (mois, service) à la validation de
+    la transaction courante (immédiatement hors transaction). Les compartiments
+    marqués dans une même transaction sont recalculés une seule fois.
+    """
+    if not mois_annee or service_id is None:
+        return
+    compartiments = getattr(_en_attente, 'compartiments', None)
+    if compartiments is None:
+        compartiments = _en_attente.compartiments = set()
+    compartiments.add((mois_annee, service_id))
+    transaction.on_commit(_rafraichir_en_attente)
+
+
+def _rafraichir_en_attente():
+    compartiments = getattr(_en_attente, 'compartiments', None)
+    if not compartiments:
+        return
+    _en_attente.compartiments = set()
+    par_mois = defaultdict(set)
+    for mois_annee, service_id in compartiments:
+        par_mois[mois_annee].add(service_id)
+    for mois_annee, service_ids in sorted(par_mois.items()):
+        rafraichir(mois_annee, service_ids)
+
+
+def rafraichir(mois_annee, service_ids=None):
+    """
+    Recalcule le livre d'un mois pour les services donnés (None = tous) depuis
+    Paie et ElementPaie. Retourne le nombre de lignes LivrePaie écrites.
+    """
+    paies = Paie.objects.filter(mois_annee=mois_annee)
+    elements_paie = ElementPaie.objects.filter(paie__mois_annee=mois_annee)
+    lignes = LivrePaie.objects.filter(mois_annee=mois_annee)
+    lignes_elements = LivrePaieElement.objects.filter(mois_annee=mois_annee)
+    if service_ids is not None:
+        service_ids = sorted(set(service_ids))
+        paies = paies.filter(personne__service_id__in=service_ids)
+        elements_paie = elements_paie.filter(paie__personne__service_id__in=service_ids)
+        lignes = lignes.filter(service_id__in=service_ids)
+        lignes_elements = lignes_elements.filter(service_id__in=service_ids)
+
+    cles = ('personne__service_id', 'personne__type_employe', 'grade', 'statut_paiement')
+    totaux = (
+        paies.values_list(*cles)
+        .annotate(
+            nombre=Count('id'),
+            **{f'total_{montant}': Sum(montant) for montant in MONTANTS}
+        )
+        .order_by()
+    )
+    totaux_elements = (
+        elements_paie
+        .values_list(*(f'paie__{cle}' for cle in cles), 'code', 'type_element')
+        .annotate(nombre=Count('id'), total=Sum('montant'), dernier_libelle=Max('libelle'))
+        .order_by()
+    )
+
+    with transaction.atomic():
+        # Verrou des services : deux recalculs d'un même compartiment ne s'entrelacent pas
+        services = Service.objects.select_for_update().order_by('id')
+        if service_ids is not None:
+            services = services.filter(id__in=service_ids)
+        list(services.values_list('id', flat=True))
+
+        lignes.delete()
+        lignes_elements.delete()
+        nouvelles = LivrePaie.objects.bulk_create(
+            [
+                LivrePaie(
+                    mois_annee=mois_annee, service_id=s, type_employe=t, grade=g,
+                    statut_paiement=st, nombre=n,
+                    **{montant: valeur or 0 for montant, valeur in zip(MONTANTS, montants)}
+                )
+                for s, t, g, st, n, *montants in totaux
+            ],
+            batch_size=1000,
+        )
+        LivrePaieElement.objects.bulk_create(
+            [
+                LivrePaieElement(
+                    mois_annee=mois_annee, service_id=s, type_employe=t, grade=g,
+                    statut_paiement=st, code=code, type_element=type_element,
+                    libelle=libelle or '', nombre=n, montant=total or 0,
+                )
+                for s, t, g, st, code, type_element, n, total, libelle in totaux_elements
+            ],
+            batch_size=1000,
+        )
+    return len(nouvelles)
+
+
+def changer_agent(personne_id, ancien_service_id, nouveau_service_id):
+    """Recalcule les mois payés d'un agent dont le service ou le type a changé"""
+    mois = Paie.objects.filter(personne_id=personne_id).values_list('mois_annee', flat=True).distinct()
+    for mois_annee in mois:
+        marquer(mois_annee, ancien_service_id)
+        marquer(mois_annee, nouveau_service_id)
+
+
+def reconstruire(mois_annee=None):
+    """Recalcule tout le livre (ou un mois). Retourne le nombre de lignes écrites."""
+    if mois_annee is not None:
+        return rafraichir(mois_annee)
+    mois = set(Paie.objects.values_list('mois_annee', flat=True).distinct().order_by())
+    with transaction.atomic():
+        LivrePaie.objects.exclude(mois_annee__in=mois).delete()
+        LivrePaieElement.objects.exclude(mois_annee__in=mois).delete()
+    return sum(rafraichir(m) for m in sorted(mois))
+
+
+# ========================================
+# LECTURE
+# ========================================
+
+def _filtrer(queryset, service=None, filtres=None):
+    if service is not None:
+        queryset = queryset.filter(service=service)
+    for champ, valeur in (filtres or {}).items():
+        if valeur not in (None, ''):
+            queryset = queryset.filter(**{champ: valeur})
+    return queryset
+
+
+def _totaux(ligne):
+    return {
+        'nombre_employes': ligne['nb_paies'] or 0,
+        'total_brut': ligne['brut'] or Decimal(0),
+        'total_net': ligne['net'] or Decimal(0),
+        'total_deductions': ligne['retenues'] or Decimal(0),
+        'total_allocations': ligne['allocations'] or Decimal(0),
+    }
+
+
+_SOMMES = {
+    'nb_paies': Sum('nombre'),
+    'brut': Sum('salaire_brut'),
+    'net': Sum('salaire_net'),
+    'retenues': Sum('deductions'),
+    'allocations': Sum('allocations_familiales'),
+}
+
+
+def ventilation(mois, service=None, filtres=None, par=None, par_mois=True):
+    """
+    Totaux des mois demandés (liste de 'YYYY-MM'), en une requête.
+    - par=None : totaux
+    - par='code' : [{code, type_element, libelle, nombre, montant}]
+    - par=axe de AXES : [{<champs de l'axe>, **totaux}]
+    Avec par_mois, le résultat est un dict {mois: résultat} ; sinon les mois
+    sont cumulés. `filtres` restreint les lignes lues (ex. {'grade': 'assistant'}).
+    """
+    mois = list(mois)
+    cles = ['mois_annee'] if par_mois else []
+    resultats = {m: ([] if par else _totaux(dict.fromkeys(_SOMMES))) for m in (mois if par_mois else [None])}
+
+    if par == AXE_CODE:
+        lignes = (
+            _filtrer(LivrePaieElement.objects.filter(mois_annee__in=mois), service, filtres)
+            .values(*cles, 'code', 'type_element')
+            .annotate(dernier_libelle=Max('libelle'), nb=Sum('nombre'), total=Sum('montant'))
+            .order_by(*cles, 'type_element', 'code')
+        )
+        for ligne in lignes:
+            resultats[ligne.get('mois_annee')].append({
+                'code': ligne['code'], 'type_element': ligne['type_element'],
+                'libelle': ligne['dernier_libelle'], 'nombre': ligne['nb'], 'montant': ligne['total'],
+            })
+    else:
+        champs = AXES[par] if par else ()
+        livre = _filtrer(LivrePaie.objects.filter(mois_annee__in=mois), service, filtres)
+        if not cles and not champs:
+            return _totaux(livre.aggregate(**_SOMMES))
+        lignes = livre.values(*cles, *champs).annotate(**_SOMMES).order_by(*cles, *champs)
+        for ligne in lignes:
+            totaux = _totaux(ligne)
+            if par:
+                axe = {champ.replace('__', '_'): ligne[champ] for champ in champs}
+                resultats[ligne.get('mois_annee')].append(axe | totaux)
+            else:
+                resultats[ligne.get('mois_annee')] = totaux
+
+    return resultats if par_mois else resultats[None]
@@ -0,0 +1,233 @@
+# myapp/management/commands/benchmark_api.py
+import json
+import math
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from myapp.models import Absence, Paie, Personne, Service, User
+from myapp.urls import router
+
+
+ROLES = ('admin_rh', 'chef_enseignant', 'chef_pat', 'chef_contractuel', 'employe')
+PERCENTILES = (50, 90, 95, 99)
+
+# Routes exclues : effets de bord ou réponses non représentatives
+EXCLUES = {'debug_user_info', 'resultat'}
+
+
+def parametres_actions(aujourd_hui):
+    """Paramètres de requête des actions : communs (mois, année, semaine) et spécifiques"""
+    annee, semaine, _ = aujourd_hui.isocalendar()
+    debut_mois = aujourd_hui.replace(day=1)
+    mois_precedent = (debut_mois - timedelta(days=1)).replace(day=1)
+    communs = f"mois={aujourd_hui:%Y-%m}&annee={aujourd_hui.year}&semaine={annee}-W{semaine:02d}"
+    specifiques = {
+        'comparaison_periodes': (
+            f"periode1_debut={mois_precedent}&periode1_fin={debut_mois - timedelta(days=1)}"
+            f"&periode2_debut={debut_mois}&periode2_fin={aujourd_hui}"
+        ),
+    }
+    return communs, specifiques
+
+
+def percentile(valeurs, p):
+    """Percentile par rang le plus proche (valeurs triées)"""
+    if not valeurs:
+        return None
+    rang = max(math.ceil(p / 100 * len(valeurs)), 1)
+    return valeurs[rang - 1]
+
+
+def utilisateurs_par_role():
+    """Un compte par rôle : chef du service le plus peuplé, employé rattaché à une fiche"""
+    comptes = {'admin_rh': User.objects.filter(role='admin_rh', is_active=True).order_by('id').first()}
+    for role in ROLES[1:4]:
+        service = (
+            Service.objects.filter(chef_service__role=role, chef_service__is_active=True)
+            .annotate(effectif=Count('employes')).order_by('-effectif', 'id')
+            .select_related('chef_service').first()
+        )
+        comptes[role] = service.chef_service if service else None
+    personne = Personne.objects.filter(user__role='employe', user__is_active=True).select_related('user').first()
+    comptes['employe'] = personne.user if personne else None
+    return {role: user for role, user in comptes.items() if user is not None}
+
+
+def routes_get(aujourd_hui):
+    """
+    (nom, chemin) de chaque route GET du router : list, retrieve et actions.
+    Les routes de détail utilisent l'id '{pk}', remplacé par un id visible.
+    """
+    communs, specifiques = parametres_actions(aujourd_hui)
+    routes = []
+    for prefixe, viewset, _ in router.registry:
+        actions = []
+        if hasattr(viewset, 'list'):
+            actions.append((f'{prefixe}:list', f'/api/{prefixe}/'))
+        if hasattr(viewset, 'retrieve'):
+            actions.append((f'{prefixe}:retrieve', f'/api/{prefixe}/{{pk}}/'))
+        for action in viewset.get_extra_actions():
+            if 'get' not in action.mapping or action.__name__ in EXCLUES:
+                continue
+            if action.detail:
+                chemin = f'/api/{prefixe}/{{pk}}/{action.url_path}/'
+            else:
+                chemin = f'/api/{prefixe}/{action.url_path}/?{specifiques.get(action.__name__, communs)}'
+            actions.append((f'{prefixe}:{action.__name__}', chemin))
+        routes.extend(actions)
+    return routes
+
+
+def comparer(reference, resultats, tolerance, marge_ms):
+    """Régressions par rapport à une référence : latence médiane et nombre de requêtes SQL"""
+    regressions = []
+    for cle, mesure in resultats.items():
+        avant = reference.get(cle)
+        if avant is None or avant['statut'] != mesure['statut']:
+            continue
+        if mesure['requetes'] > avant['requetes']:
+            regressions.append(f"{cle}: {avant['requetes']} → {mesure['requetes']} requêtes SQL")
+        if (mesure['p50_ms'] > avant['p50_ms'] * tolerance
+                and mesure['p50_ms'] - avant['p50_ms'] > marge_ms):
+            regressions.append(f"{cle}: p50 {avant['p50_ms']} → {mesure['p50_ms']} ms")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ("Mesure chaque route GET de l'API pour chaque rôle (percentiles de latence, "
+            "requêtes SQL) et compare à une référence JSON ; toute réponse 5xx est un échec")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5, help="Mesures par route (défaut: 5)")
+        parser.add_argument('--sortie', help="Fichier JSON où enregistrer les résultats")
+        parser.add_argument('--reference', help="Résultats JSON d'une exécution précédente à comparer")
+        parser.add_argument('--tolerance', type=float, default=1.25,
+                            help="Ratio de latence médiane toléré avant régression (défaut: 1.25)")
+        parser.add_argument('--marge-ms', type=float, default=5,
+                            help="Écart absolu minimal (ms) pour signaler une régression (défaut: 5)")
+        parser.add_argument('--roles', nargs='+', choices=ROLES, help="Limiter à ces rôles")
+        parser.add_argument('--filtre', help="Ne mesurer que les routes dont le nom contient ce texte")
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations doit être supérieur ou égal à 1")
+        reference = None
+        if options['reference']:
+            with open(options['reference'], encoding='utf-8') as fichier:
+                reference = json.load(fichier)['resultats']
+
+        comptes = utilisateurs_par_role()
+        roles = [r for r in (options['roles'] or ROLES) if r in comptes]
+        if not roles:
+            raise CommandError("Aucun compte utilisable : peupler la base (manage.py seed_perf)")
+
+        routes = [
+            r for r in routes_get(timezone.localdate())
+            if not options['filtre'] or options['filtre'] in r[0]
+        ]
+
+        resultats = {}
+        hotes = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=hotes, DEBUG=False):
+            for role in roles:
+                client = APIClient()
+                # Une exception non gérée doit produire une 500 mesurée, pas interrompre le benchmark
+                client.raise_request_exception = False
+                client.force_authenticate(comptes[role])
+                ids = {}
+                for nom, chemin in routes:
+                    prefixe = nom.split(':')[0]
+                    if '{pk}' in chemin:
+                        if prefixe not in ids:
+                            continue
+                        chemin = chemin.replace('{pk}', str(ids[prefixe]))
+                    mesure, donnees = self.mesurer(client, chemin, options['iterations'])
+                    if nom.endswith(':list'):
+                        objet = self._premier_objet(donnees)
+                        if objet is not None:
+                            ids[prefixe] = objet
+                    cle = f"{role} {nom}"
+                    resultats[cle] = {'chemin': chemin, **mesure}
+                    ligne = (
+                        f"{mesure['statut']} {cle}: p50 {mesure['p50_ms']} ms, "
+                        f"p95 {mesure['p95_ms']} ms, {mesure['requetes']} requêtes"
+                    )
+                    self.stdout.write(self.style.ERROR(ligne) if mesure['statut'] >= 500 else ligne)
+
+        rapport = {
+            'genere_le': timezone.now().isoformat(),
+            'base': connection.vendor,
+            'iterations': options['iterations'],
+            'volumes': {
+                'personnes': Personne.objects.count(),
+                'absences': Absence.objects.count(),
+                'paies': Paie.objects.count(),
+            },
+            'resultats': resultats,
+        }
+        if options['sortie']:
+            with open(options['sortie'], 'w', encoding='utf-8') as fichier:
+                json.dump(rapport, fichier, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Résultats enregistrés dans {options['sortie']}")
+
+        echecs = [f"{cle}: erreur {mesure['statut']} sur {mesure['chemin']}"
+                  for cle, mesure in resultats.items() if mesure['statut'] >= 500]
+        regressions = []
+        if reference is not None:
+            regressions = comparer(reference, resultats, options['tolerance'], options['marge_ms'])
+        for ligne in echecs + regressions:
+            self.stdout.write(self.style.ERROR(ligne))
+
+        erreurs = []
+        if echecs:
+            erreurs.append(f"{len(echecs)} route(s) en erreur serveur")
+        if regressions:
+            erreurs.append(f"{len(regressions)} régression(s) par rapport à {options['reference']}")
+        if erreurs:
+            raise CommandError(" ; ".join(erreurs))
+        if reference is not None:
+            self.stdout.write(self.style.SUCCESS("Aucune régression par rapport à la référence"))
+
+    def mesurer(self, client, chemin, iterations):
+        """Une requête d'échauffement puis `iterations` mesures"""
+        reponse = client.get(chemin)
+        durees = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as requetes:
+                debut = time.perf_counter()
+                reponse = client.get(chemin)
+                durees.append((time.perf_counter() - debut) * 1000)
+        durees.sort()
+        mesure = {
+            'statut': reponse.status_code,
+            'requetes': len(requetes),
+            'moyenne_ms': round(sum(durees) / len(durees), 2),
+            'max_ms': round(durees[-1], 2),
+        }
+        for p in PERCENTILES:
+            mesure[f'p{p}_ms'] = round(percentile(durees, p), 2)
+        donnees = None
+        if reponse.status_code == 200 and reponse.get('Content-Type', '').startswith('application/json'):
+            donnees = reponse.json()
+        return mesure, donnees
+
+    @staticmethod
+    def _premier_objet(donnees):
+        """Clé primaire du premier objet d'une liste (paginée ou non)"""
+        if isinstance(donnees, dict):
+            donnees = donnees.get('results')
+        if isinstance(donnees, list) and donnees and isinstance(donnees[0], dict):
+            for cle in ('id', 'personne_id', 'pk'):
+                if cle in donnees[0]:
+                    return donnees[0][cle]
+            personne = donnees[0].get('personne')
+            return personne.get('id') if isinstance(personne, dict) else personne
+        return None
@@ -0,0 +1,25 @@
+# myapp/management/commands/reconstruire_compteurs_absences.py
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.compteurs import reconstruire
+from myapp.models import Service
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs journaliers d'absences par service depuis la table Absence"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--service', type=int,
+                            help="Ne reconstruire que les compteurs de ce service (id)")
+
+    def handle(self, *args, **options):
+        service = None
+        if options['service'] is not None:
+            try:
+                service = Service.objects.get(pk=options['service'])
+            except Service.DoesNotExist:
+                raise CommandError(f"Service {options['service']} introuvable")
+
+        nombre = reconstruire(service)
+        portee = f"du service {service.nom}" if service else "de tous les services"
+        self.stdout.write(self.style.SUCCESS(f"{nombre} compteur(s) reconstruit(s) {portee}"))
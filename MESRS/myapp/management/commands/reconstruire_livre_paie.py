@@ -0,0 +1,22 @@
+# myapp/management/commands/reconstruire_livre_paie.py
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.livre_paie import reconstruire
+
+
+class Command(BaseCommand):
+    help = "Recalcule le livre de paie (totaux mensuels par service, type, grade et code) depuis les paies"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mois', help="Ne recalculer que ce mois (YYYY-MM)")
+
+    def handle(self, *args, **options):
+        mois = options['mois']
+        if mois is not None and not re.fullmatch(r'\d{4}-\d{2}', mois):
+            raise CommandError("Paramètre --mois invalide (format: YYYY-MM)")
+
+        nombre = reconstruire(mois)
+        portee = f"du mois {mois}" if mois else "de tous les mois"
+        self.stdout.write(self.style.SUCCESS(f"{nombre} ligne(s) du livre de paie reconstruite(s) {portee}"))
@@ -0,0 +1,338 @@
+# myapp/management/commands/seed_perf.py
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from myapp import livre_paie
+from myapp.compteurs import reconstruire
+from myapp.models import (
+    Absence, Contractuel, Document, ElementPaie, Enseignant, Paie, Personne,
+    PersonnelPAT, Service, Structure, User
+)
+from myapp.moteur_paie import calculer_paie, date_paiement_defaut, get_parametres
+
+
+# Données générées reconnaissables (et supprimables par --reinitialiser)
+PREFIXE = 'PERF'
+
+TYPES_SERVICE = ('enseignant', 'pat', 'contractuel')
+# Proportion des agents par type de personnel
+REPARTITION = {'enseignant': 0.45, 'pat': 0.40, 'contractuel': 0.15}
+
+NOMS = ['Ahmed', 'Mohamed', 'Sidi', 'Cheikh', 'Ely', 'Brahim', 'Moussa', 'Abdallahi',
+        'Oumar', 'Mamadou', 'Yahya', 'Ismail', 'Ould Ahmed', 'Ould Sidi', 'Diallo', 'Ba']
+PRENOMS_H = ['Mohamed', 'Ahmed', 'Sidi', 'Cheikh', 'Abdallahi', 'Moussa', 'Oumar', 'Yacoub']
+PRENOMS_F = ['Fatimetou', 'Mariem', 'Aicha', 'Khadija', 'Zeinabou', 'Mariama', 'Salma', 'Vatma']
+
+GRADES_PAT = ['A1', 'A2', 'B1', 'B2', 'C1']
+# (type d'absence, durée min, durée max, poids)
+ABSENCES = [
+    ('CONGÉ_ANNUEL', 5, 30, 60),
+    ('CONGÉ_MALADIE', 1, 10, 30),
+    ('DÉTACHEMENT', 30, 180, 3),
+    ('DISPONIBILITÉ', 30, 90, 3),
+    ('ANNÉE_SABBATIQUE', 180, 365, 1),
+]
+DUREE_MATERNITE = 98
+
+
+class Command(BaseCommand):
+    help = ("Génère un ministère fictif à l'échelle de la production (services, structures, "
+            "agents, absences, paies, documents) pour les mesures de performance")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--agents', type=int, default=20000, help="Nombre d'agents (défaut: 20000)")
+        parser.add_argument('--services', type=int, default=4,
+                            help="Services par type de personnel (défaut: 4)")
+        parser.add_argument('--annees', type=int, default=3,
+                            help="Années d'historique d'absences (défaut: 3)")
+        parser.add_argument('--mois-paie', type=int, default=12,
+                            help="Mois de paie générés, jusqu'au mois en cours (défaut: 12)")
+        parser.add_argument('--documents', type=int, default=2,
+                            help="Documents par agent, en moyenne (défaut: 2)")
+        parser.add_argument('--taille-lot', type=int, default=2000,
+                            help="Agents générés par transaction (défaut: 2000)")
+        parser.add_argument('--graine', type=int, default=42, help="Graine aléatoire (défaut: 42)")
+        parser.add_argument('--mot-de-passe', default='perf',
+                            help="Mot de passe des comptes perf_* (défaut: perf)")
+        parser.add_argument('--reinitialiser', action='store_true',
+                            help="Supprimer d'abord les données d'un précédent seed_perf")
+
+    def handle(self, *args, **options):
+        existants = Service.objects.filter(nom__startswith=f'{PREFIXE} ')
+        if existants.exists():
+            if not options['reinitialiser']:
+                raise CommandError("Des données seed_perf existent déjà (utiliser --reinitialiser)")
+            self.stdout.write("Suppression des données précédentes...")
+            with transaction.atomic():
+                existants.delete()
+                User.objects.filter(username__startswith='perf_').delete()
+
+        self.aleatoire = random.Random(options['graine'])
+        self.aujourd_hui = timezone.localdate()
+        self.mot_de_passe = make_password(options['mot_de_passe'])
+        self.parametres = get_parametres()
+        self.paies_calculees = {}
+        debut = time.monotonic()
+
+        with transaction.atomic():
+            services = self.creer_services(options['services'])
+        self.stdout.write(f"{len(services)} services et leurs structures créés")
+
+        numero = 0
+        nombres = {'absences': 0, 'paies': 0, 'elements': 0, 'documents': 0}
+        total = options['agents']
+        while numero < total:
+            taille = min(options['taille_lot'], total - numero)
+            with transaction.atomic():
+                agents = self.creer_agents(services, numero, taille)
+                nombres['absences'] += self.creer_absences(agents, options['annees'])
+                paies, elements = self.creer_paies(agents, options['mois_paie'])
+                nombres['paies'] += paies
+                nombres['elements'] += elements
+                nombres['documents'] += self.creer_documents(agents, options['documents'])
+            numero += taille
+            self.stdout.write(f"  {numero}/{total} agents")
+
+        self.creer_comptes_employes(services)
+        compteurs = reconstruire()
+        lignes_livre = livre_paie.reconstruire()
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} agents, {nombres['absences']} absences, {nombres['paies']} paies "
+            f"({nombres['elements']} éléments), {nombres['documents']} documents, "
+            f"{compteurs} compteurs d'absences, {lignes_livre} lignes du livre de paie "
+            f"en {time.monotonic() - debut:.0f} s"
+        ))
+
+    # ========================================
+    # SERVICES, STRUCTURES ET COMPTES
+    # ========================================
+
+    def _utilisateur(self, username, role, **champs):
+        # Mot de passe haché une seule fois pour tous les comptes
+        return User.objects.create(username=username, password=self.mot_de_passe, role=role,
+                                   email=f"{username}@perf.mesrs.mr", **champs)
+
+    def creer_services(self, par_type):
+        self._utilisateur('perf_admin', 'admin_rh', is_staff=True)
+
+        services = []
+        for type_service in TYPES_SERVICE:
+            for i in range(1, par_type + 1):
+                chef = self._utilisateur(f'perf_chef_{type_service}_{i}', f'chef_{type_service}')
+                service = Service.objects.create(
+                    nom=f'{PREFIXE} {type_service} {i}', type_service=type_service, chef_service=chef,
+                    description='Service généré par seed_perf',
+                )
+                # Arborescence direction → 3 divisions → 2 bureaux (save() calcule le chemin)
+                feuilles = []
+                direction = Structure.objects.create(
+                    nom=f'Direction {service.nom}', type_structure='DIRECTION', service=service
+                )
+                for d in range(1, 4):
+                    division = Structure.objects.create(
+                        nom=f'Division {d} {service.nom}', type_structure='DIVISION',
+                        service=service, parent_structure=direction
+                    )
+                    for b in range(1, 3):
+                        feuilles.append(Structure.objects.create(
+                            nom=f'Bureau {d}.{b} {service.nom}', type_structure='BUREAU',
+                            service=service, parent_structure=division
+                        ))
+                service.feuilles = feuilles
+                services.append(service)
+        return services
+
+    def creer_comptes_employes(self, services):
+        """Un compte employé par service, rattaché à son premier agent"""
+        for service in services:
+            personne = Personne.objects.filter(service=service, user__isnull=True).order_by('id').first()
+            if personne is None:
+                continue
+            personne.user = self._utilisateur(
+                f'perf_employe_{service.pk}', 'employe', first_name=personne.prenom, last_name=personne.nom
+            )
+            personne.save(update_fields=['user'])
+
+    # ========================================
+    # AGENTS
+    # ========================================
+
+    def _date(self, debut, fin):
+        return debut + timedelta(days=self.aleatoire.randrange(max((fin - debut).days, 1)))
+
+    def creer_agents(self, services, numero, taille):
+        """Crée un lot de personnes et leur fiche ; retourne [(personne_id, type, genre, carriere)]"""
+        a = self.aleatoire
+        par_type = {t: [s for s in services if s.type_service == t] for t in TYPES_SERVICE}
+        types = list(REPARTITION)
+        poids = list(REPARTITION.values())
+
+        personnes = []
+        for i in range(numero, numero + taille):
+            type_employe = a.choices(types, poids)[0]
+            service = a.choice(par_type[type_employe])
+            genre = a.choice(['MASCULIN', 'FEMININ'])
+            naissance = self._date(date(1960, 1, 1), date(2000, 1, 1))
+            personnes.append(Personne(
+                nom=a.choice(NOMS),
+                prenom=a.choice(PRENOMS_H if genre == 'MASCULIN' else PRENOMS_F),
+                date_naissance=naissance, lieu_naissance='Nouakchott',
+                nni=f'9{i:09d}', nationalite='Mauritanienne', genre=genre,
+                situation_familiale=a.choice(['Célibataire', 'Marié(e)']),
+                adresse='Nouakchott', nom_pere=a.choice(PRENOMS_H),
+                dernier_diplome=a.choice(['Licence', 'Master', 'Doctorat', 'BTS']),
+                pays_obtention_diplome='Mauritanie',
+                annee_obtention_diplome=naissance.year + a.randint(21, 30),
+                specialite_formation=a.choice(['Informatique', 'Droit', 'Gestion', 'Physique']),
+                fonction=a.choice(['Agent', 'Cadre', 'Enseignant-chercheur', 'Technicien']),
+                type_employe=type_employe, numero_employe=f'{PREFIXE}{i:07d}',
+                date_embauche=self._date(date(1990, 1, 1), self.aujourd_hui),
+                service=service, structure=a.choice(service.feuilles),
+                statut_actif=a.random() > 0.03,
+            ))
+        Personne.objects.bulk_create(personnes, batch_size=1000)
+        # Clés primaires relues par numéro : bulk_create ne les renvoie pas sous MySQL
+        ids = dict(Personne.objects.filter(
+            numero_employe__in=[p.numero_employe for p in personnes]
+        ).values_list('numero_employe', 'id'))
+
+        agents = []
+        fiches = {'enseignant': [], 'pat': [], 'contractuel': []}
+        for p in personnes:
+            personne_id = ids[p.numero_employe]
+            debut = p.date_embauche
+            if p.type_employe == 'enseignant':
+                fiche = Enseignant(
+                    personne_id=personne_id, corps='Enseignement supérieur',
+                    grade=a.choice([g for g, _ in Enseignant.GRADE_CHOICES]),
+                    echelon=str(a.randint(1, 10)), indice=a.randint(400, 1200),
+                    date_entree_service_publique=debut, date_entree_enseignement_superieur=debut,
+                    date_fin_service_obligatoire=debut + timedelta(days=35 * 365),
+                )
+                carriere = {'grade': fiche.grade, 'echelon': fiche.echelon, 'indice': fiche.indice}
+            elif p.type_employe == 'pat':
+                fiche = PersonnelPAT(
+                    personne_id=personne_id, grade=a.choice(GRADES_PAT),
+                    poste=a.choices([c for c, _ in PersonnelPAT.POSTE_CHOICES], [1, 2, 3, 2, 5, 8, 79])[0],
+                    nbi_mac=a.randint(0, 50), indice=a.randint(250, 900),
+                    anciennete_echelon=str(a.randint(1, 10)), date_changement=debut,
+                    anciennete_grade=str(a.randint(0, 20)), date_nomination=debut, date_prise_service=debut,
+                )
+                carriere = {'grade': fiche.grade, 'echelon': fiche.anciennete_echelon, 'indice': fiche.indice}
+            else:
+                fin_contrat = self._date(self.aujourd_hui - timedelta(days=60), self.aujourd_hui + timedelta(days=730))
+                fiche = Contractuel(
+                    personne_id=personne_id, type_contrat=a.choice([c for c, _ in Contractuel.TYPE_CONTRAT_CHOICES]),
+                    duree_contrat='24 mois', date_debut_contrat=debut,
+                    date_fin_contrat=None if a.random() < 0.3 else fin_contrat,
+                    salaire_mensuel=Decimal(a.randrange(30000, 150000, 500)),
+                )
+                carriere = {'grade': '', 'echelon': '', 'indice': None, 'salaire_mensuel': fiche.salaire_mensuel}
+            fiches[p.type_employe].append(fiche)
+            agents.append((personne_id, p.type_employe, p.genre, carriere))
+
+        for modele, liste in ((Enseignant, fiches['enseignant']), (PersonnelPAT, fiches['pat']),
+                              (Contractuel, fiches['contractuel'])):
+            modele.objects.bulk_create(liste, batch_size=1000)
+        return agents
+
+    # ========================================
+    # ABSENCES, PAIES, DOCUMENTS
+    # ========================================
+
+    def creer_absences(self, agents, annees):
+        """Absences successives (sans chevauchement) de chaque agent sur la période"""
+        a = self.aleatoire
+        debut_historique = date(self.aujourd_hui.year - annees + 1, 1, 1)
+        horizon = self.aujourd_hui + timedelta(days=90)
+        types = [t for t, _, _, _ in ABSENCES]
+        poids = [p for _, _, _, p in ABSENCES]
+        durees = {t: (mini, maxi) for t, mini, maxi, _ in ABSENCES}
+
+        absences = []
+        for personne_id, _, genre, _ in agents:
+            jour = debut_historique + timedelta(days=a.randrange(120))
+            while jour < horizon:
+                type_absence = a.choices(types, poids)[0]
+                if genre == 'FEMININ' and a.random() < 0.01:
+                    type_absence, duree = 'CONGÉ_MATERNITÉ', DUREE_MATERNITE
+                else:
+                    duree = a.randint(*durees[type_absence])
+                fin = jour + timedelta(days=duree - 1)
+                if jour > self.aujourd_hui:
+                    statut = a.choices(['EN_ATTENTE', 'APPROUVÉ', 'REFUSÉ'], [60, 35, 5])[0]
+                else:
+                    statut = a.choices(['APPROUVÉ', 'REFUSÉ', 'ANNULÉ', 'EN_ATTENTE'], [82, 10, 5, 3])[0]
+                absences.append(Absence(
+                    personne_id=personne_id, type_absence=type_absence, date_debut=jour, date_fin=fin,
+                    statut=statut, motif='Généré par seed_perf',
+                ))
+                jour = fin + timedelta(days=a.randint(20, 150))
+        Absence.objects.bulk_create(absences, batch_size=2000)
+        return len(absences)
+
+    def _calcul(self, carriere, nb_enfants):
+        # Beaucoup d'agents partagent la même carrière : le calcul est mémorisé
+        cle = (tuple(sorted(carriere.items())), nb_enfants)
+        if cle not in self.paies_calculees:
+            self.paies_calculees[cle] = calculer_paie(carriere, nb_enfants, self.parametres)
+        return self.paies_calculees[cle]
+
+    def creer_paies(self, agents, nb_mois):
+        a = self.aleatoire
+        premier = self.aujourd_hui.year * 12 + self.aujourd_hui.month - nb_mois
+        mois_liste = [f"{m // 12}-{m % 12 + 1:02d}" for m in range(premier, premier + nb_mois)]
+        mois_courant = mois_liste[-1]
+
+        paies = []
+        calculs = {}
+        for personne_id, _, _, carriere in agents:
+            nb_enfants = a.choice([0, 0, 1, 2, 3, 4, 5, 7])
+            calcul = self._calcul(carriere, nb_enfants)
+            for mois in mois_liste:
+                calculs[(personne_id, mois)] = calcul
+                paies.append(Paie(
+                    personne_id=personne_id, mois_annee=mois, nb_enfants=nb_enfants,
+                    date_paiement=date_paiement_defaut(mois),
+                    statut_paiement='EN_COURS' if mois == mois_courant else 'PAYÉ',
+                    salaire_brut=calcul['salaire_brut'], salaire_net=calcul['salaire_net'],
+                    deductions=calcul['deductions'], allocations_familiales=calcul['allocations_familiales'],
+                    montant_imposable_mensuel=calcul['montant_imposable_mensuel'],
+                    grade=carriere['grade'], echelon=carriere['echelon'],
+                    indice='' if carriere['indice'] is None else str(carriere['indice']),
+                    mode_reglement='Virement', compte_bancaire=f'MR{personne_id:012d}',
+                ))
+        Paie.objects.bulk_create(paies, batch_size=2000)
+
+        elements = []
+        lignes = Paie.objects.filter(
+            personne_id__in=[agent[0] for agent in agents], mois_annee__in=mois_liste
+        ).values_list('id', 'personne_id', 'mois_annee')
+        for paie_id, personne_id, mois in lignes.iterator(chunk_size=2000):
+            for element in calculs[(personne_id, mois)]['elements']:
+                elements.append(ElementPaie(paie_id=paie_id, **element))
+        ElementPaie.objects.bulk_create(elements, batch_size=5000)
+        return len(paies), len(elements)
+
+    def creer_documents(self, agents, moyenne):
+        """Métadonnées seules : les fichiers référencés ne sont pas écrits sur disque"""
+        a = self.aleatoire
+        types = [t for t, _ in Document.TYPE_DOCUMENT_CHOICES]
+        documents = []
+        for personne_id, _, _, _ in agents:
+            for n in range(a.randint(0, 2 * moyenne)):
+                type_document = a.choice(types)
+                documents.append(Document(
+                    nom=f'{type_document.lower()}_{personne_id}_{n}.pdf', type_document=type_document,
+                    chemin_fichier=f'documents/perf/{personne_id}_{n}.pdf',
+                    taille_fichier=a.randint(20_000, 2_000_000), proprietaire_id=personne_id,
+                ))
+        Document.objects.bulk_create(documents, batch_size=2000)
+        return len(documents)
@@ -0,0 +1,56 @@
+# myapp/management/commands/traiter_taches.py
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from myapp.taches import executer_tache, purger_taches, recuperer_orphelines, reserver_tache
+
+
+class Command(BaseCommand):
+    help = "Worker de la file de tâches de fond (exports, rapports annuels, lancements de paie)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--une-fois', action='store_true',
+                            help="Traiter les tâches en attente puis s'arrêter")
+        parser.add_argument('--intervalle', type=float, default=2,
+                            help="Attente en secondes quand la file est vide (défaut: 2)")
+        parser.add_argument('--max-taches', type=int, default=0,
+                            help="S'arrêter après N tâches (0 = sans limite)")
+        parser.add_argument('--purge-intervalle', type=int, default=600,
+                            help="Secondes entre deux purges des résultats expirés (défaut: 600)")
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Worker {worker} démarré")
+
+        traitees = 0
+        derniere_purge = 0
+        while True:
+            close_old_connections()
+            if time.monotonic() - derniere_purge >= options['purge_intervalle']:
+                purgees = purger_taches()
+                relancees = recuperer_orphelines()
+                if purgees or relancees:
+                    self.stdout.write(f"{purgees} tâche(s) expirée(s) supprimée(s), {relancees} relancée(s)")
+                derniere_purge = time.monotonic()
+
+            tache = reserver_tache(worker)
+            if tache is None:
+                if options['une_fois']:
+                    break
+                time.sleep(options['intervalle'])
+                continue
+
+            self.stdout.write(f"Tâche {tache.pk} ({tache.type_tache}) démarrée")
+            executer_tache(tache)
+            style = self.style.SUCCESS if tache.statut == 'TERMINE' else self.style.ERROR
+            self.stdout.write(style(f"Tâche {tache.pk} : {tache.statut}"))
+
+            traitees += 1
+            if options['max_taches'] and traitees >= options['max_taches']:
+                break
+
+        self.stdout.write(f"Worker {worker} arrêté ({traitees} tâche(s) traitée(s))")
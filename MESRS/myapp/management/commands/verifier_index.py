@@ -0,0 +1,127 @@
+# myapp/management/commands/verifier_index.py
+import json
+import re
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from myapp.approbations import absences_a_valider, annoter_file
+from myapp.models import Absence, CompteurAbsences, Paie, Personne, Service
+from myapp.rapports import bornes_mois, filtre_chevauchement
+
+
+def requetes_rapports(service, personne, mois_paie, debut, fin):
+    """Requêtes des plannings, rapports et tableaux de bord, telles qu'émises par les vues"""
+    return [
+        ("planning du service", Absence.objects.filter(
+            filtre_chevauchement(debut, fin), personne__service=service,
+            statut__in=['APPROUVÉ', 'EN_ATTENTE']
+        )),
+        ("absences d'un agent sur la période", Absence.objects.filter(
+            filtre_chevauchement(debut, fin), personne=personne
+        )),
+        ("présence (absences approuvées des agents)", Absence.objects.filter(
+            filtre_chevauchement(debut, fin), statut='APPROUVÉ',
+            personne__in=Personne.objects.filter(service=service).values('pk')
+        )),
+        ("vue mensuelle RH (toutes les absences approuvées)", Absence.objects.filter(
+            filtre_chevauchement(debut, fin), statut='APPROUVÉ'
+        )),
+        ("file de validation", annoter_file(absences_a_valider())),
+        ("compteurs journaliers du service", CompteurAbsences.objects.filter(
+            service=service, jour__range=(debut, fin)
+        )),
+        ("paies du mois", Paie.objects.filter(mois_annee=mois_paie)),
+        ("paies du mois à payer", Paie.objects.filter(mois_annee=mois_paie, statut_paiement='EN_COURS')),
+    ]
+
+
+# ========================================
+# LECTURE DES PLANS D'EXÉCUTION
+# ========================================
+
+def _parcours_mysql(noeud, tables):
+    if isinstance(noeud, dict):
+        if noeud.get('access_type') == 'ALL' and 'table_name' in noeud:
+            tables.append(noeud['table_name'])
+        for valeur in noeud.values():
+            _parcours_mysql(valeur, tables)
+    elif isinstance(noeud, list):
+        for valeur in noeud:
+            _parcours_mysql(valeur, tables)
+    return tables
+
+
+def tables_parcourues(queryset):
+    """Plan de la requête et tables lues intégralement (sans index)"""
+    if connection.vendor == 'mysql':
+        plan = queryset.explain(format='json')
+        return plan, _parcours_mysql(json.loads(plan), [])
+    plan = queryset.explain()
+    if connection.vendor == 'sqlite':
+        # "SCAN table" sans "USING ... INDEX" : lecture de toute la table
+        tables = re.findall(r'\bSCAN (\w+)(?! USING)', plan)
+    elif connection.vendor == 'postgresql':
+        tables = re.findall(r'Seq Scan on (\w+)', plan)
+    else:
+        raise CommandError(f"Base {connection.vendor} non prise en charge")
+    return plan, tables
+
+
+class Command(BaseCommand):
+    help = ("Exécute EXPLAIN sur les requêtes des rapports et échoue si l'une d'elles "
+            "parcourt une table entière (à lancer sur une base peuplée)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mois', help="Mois analysé YYYY-MM (défaut: mois en cours)")
+        parser.add_argument('--min-lignes', type=int, default=1000,
+                            help="Tables plus petites ignorées : l'optimiseur les parcourt "
+                                 "volontiers en entier (défaut: 1000)")
+        parser.add_argument('--plans', action='store_true', help="Afficher les plans complets")
+
+    def handle(self, *args, **options):
+        try:
+            debut, fin = bornes_mois(options['mois'] or timezone.localdate().strftime('%Y-%m'))
+        except ValueError:
+            raise CommandError("Paramètre --mois invalide (format: YYYY-MM)")
+
+        service = Service.objects.annotate(nombre=Count('employes')).order_by('-nombre').first()
+        personne = Personne.objects.annotate(nombre=Count('absences')).order_by('-nombre').first()
+        mois_paie = Paie.objects.order_by('-mois_annee').values_list('mois_annee', flat=True).first()
+        if service is None or personne is None or mois_paie is None:
+            raise CommandError("Base vide : la peupler avant l'analyse (manage.py seed_perf)")
+
+        modeles = {modele._meta.db_table: modele for modele in apps.get_models()}
+        tailles = {}
+        echecs = []
+        for nom, queryset in requetes_rapports(service, personne, mois_paie, debut, fin):
+            plan, tables = tables_parcourues(queryset)
+            for table in tables:
+                if table not in tailles:
+                    # Alias de sous-requête (U0, T5…) : taille inconnue, compté comme parcours complet
+                    tailles[table] = modeles[table].objects.count() if table in modeles else None
+            completes = [
+                t for t in tables if tailles[t] is None or tailles[t] >= options['min_lignes']
+            ]
+
+            chrono = time.perf_counter()
+            nombre = queryset.count()
+            duree = (time.perf_counter() - chrono) * 1000
+
+            etat = self.style.ERROR('PARCOURS COMPLET') if completes else self.style.SUCCESS('ok')
+            self.stdout.write(f"{etat} {nom}: {nombre} ligne(s), {duree:.1f} ms")
+            for table in tables:
+                taille = '?' if tailles[table] is None else tailles[table]
+                self.stdout.write(f"    parcours de {table} ({taille} lignes)")
+            if options['plans']:
+                self.stdout.write(plan)
+            if completes:
+                echecs.append(f"{nom} ({', '.join(completes)})")
+
+        if echecs:
+            raise CommandError("Parcours complets de table : " + '; '.join(echecs))
+        self.stdout.write(self.style.SUCCESS("Aucun parcours complet de table"))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:29
+
+from django.db import migrations, models
+
+
+def remplir_chemins(apps, schema_editor):
+    """Calcule chemin/niveau des structures existantes en partant des racines"""
+    Structure = apps.get_model('myapp', 'Structure')
+    enfants = {}
+    for pk, parent_id in Structure.objects.values_list('pk', 'parent_structure_id'):
+        enfants.setdefault(parent_id, []).append(pk)
+
+    a_traiter = [(pk, '/', 0) for pk in enfants.get(None, [])]
+    vus = set()
+    while a_traiter:
+        pk, prefixe, niveau = a_traiter.pop()
+        if pk in vus:
+            continue
+        vus.add(pk)
+        chemin = f"{prefixe}{pk}/"
+        Structure.objects.filter(pk=pk).update(chemin=chemin, niveau=niveau)
+        a_traiter.extend((enfant, chemin, niveau + 1) for enfant in enfants.get(pk, []))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_paie_compte_bancaire_paie_echelon_paie_grade_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='structure',
+            name='chemin',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='structure',
+            name='niveau',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Profondeur (racine = 0)'),
+        ),
+        migrations.RunPython(remplir_chemins, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_structure_chemin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LancementPaie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois_annee', models.CharField(max_length=7)),
+                ('date_paiement', models.DateField()),
+                ('personnes', models.JSONField(blank=True, default=list, help_text="Sélection explicite d'ids de personnes (vide = tout le périmètre)")),
+                ('statut', models.CharField(choices=[('EN_COURS', 'En cours'), ('TERMINE', 'Terminé'), ('ECHEC', 'Échec')], default='EN_COURS', max_length=15)),
+                ('nombre_total', models.PositiveIntegerField(default=0)),
+                ('nombre_traites', models.PositiveIntegerField(default=0)),
+                ('nombre_ignores', models.PositiveIntegerField(default=0, help_text='Paies déjà payées, suspendues ou annulées, laissées intactes')),
+                ('dernier_personne_id', models.PositiveIntegerField(blank=True, help_text='Point de reprise', null=True)),
+                ('erreur', models.TextField(blank=True)),
+                ('date_lancement', models.DateTimeField(auto_now_add=True)),
+                ('date_fin', models.DateTimeField(blank=True, null=True)),
+                ('lance_par', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='myapp.service')),
+            ],
+            options={
+                'ordering': ['-date_lancement'],
+            },
+        ),
+    ]
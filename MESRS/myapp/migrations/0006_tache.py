@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:36
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_lancementpaie'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_tache', models.CharField(choices=[('export_rapport', 'Export de rapport'), ('rapport_annuel', 'Rapport annuel'), ('lancement_paie', 'Lancement de la paie')], max_length=30)),
+                ('parametres', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('EN_COURS', 'En cours'), ('TERMINE', 'Terminé'), ('ECHEC', 'Échec'), ('ANNULE', 'Annulé')], default='EN_ATTENTE', max_length=15)),
+                ('progression', models.FloatField(default=0, help_text='Avancement en %')),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('resultat', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('fichier', models.FileField(blank=True, upload_to='taches/')),
+                ('erreur', models.TextField(blank=True)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_debut', models.DateTimeField(blank=True, null=True)),
+                ('date_maj', models.DateTimeField(auto_now=True, help_text='Dernier signe de vie du worker')),
+                ('date_fin', models.DateTimeField(blank=True, null=True)),
+                ('expire_le', models.DateTimeField(blank=True, help_text='Suppression du résultat après cette date', null=True)),
+                ('cree_par', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='taches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date_creation'],
+                'indexes': [models.Index(fields=['statut', 'type_tache'], name='myapp_tache_statut_251d61_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_tache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoriqueAbsence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('statut_precedent', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('APPROUVÉ', 'Approuvé'), ('REFUSÉ', 'Refusé'), ('ANNULÉ', 'Annulé')], max_length=15)),
+                ('statut_nouveau', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('APPROUVÉ', 'Approuvé'), ('REFUSÉ', 'Refusé'), ('ANNULÉ', 'Annulé')], max_length=15)),
+                ('commentaire', models.TextField(blank=True)),
+                ('en_lot', models.BooleanField(default=False, help_text='Décision prise par validation en lot')),
+                ('date_action', models.DateTimeField(auto_now_add=True)),
+                ('absence', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historique', to='myapp.absence')),
+                ('effectue_par', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date_action', '-id'],
+            },
+        ),
+    ]
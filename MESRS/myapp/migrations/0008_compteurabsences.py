@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:43
+
+import django.db.models.deletion
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def remplir_compteurs(apps, schema_editor):
+    """Calcule les compteurs journaliers à partir des absences existantes"""
+    Absence = apps.get_model('myapp', 'Absence')
+    CompteurAbsences = apps.get_model('myapp', 'CompteurAbsences')
+    compteurs = {}
+    lignes = (
+        Absence.objects.filter(personne__service__isnull=False)
+        .values_list('personne__service_id', 'type_absence', 'statut', 'date_debut', 'date_fin')
+        .order_by()
+    )
+    for service_id, type_absence, statut, date_debut, date_fin in lignes.iterator(chunk_size=2000):
+        for i in range((date_fin - date_debut).days + 1):
+            cle = (service_id, date_debut + timedelta(days=i), type_absence, statut)
+            compteurs.setdefault(cle, [0, 0])[0] += 1
+        compteurs.setdefault((service_id, date_debut, type_absence, statut), [0, 0])[1] += 1
+
+    CompteurAbsences.objects.bulk_create(
+        [
+            CompteurAbsences(service_id=s, jour=j, type_absence=t, statut=st, nombre=n, debuts=d)
+            for (s, j, t, st), (n, d) in compteurs.items()
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_historiqueabsence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompteurAbsences',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('type_absence', models.CharField(choices=[('CONGÉ_ANNUEL', 'Congé annuel'), ('CONGÉ_MALADIE', 'Congé maladie'), ('CONGÉ_MATERNITÉ', 'Congé maternité'), ('DÉTACHEMENT', 'Détachement'), ('DISPONIBILITÉ', 'Disponibilité'), ('ANNÉE_SABBATIQUE', 'Année sabbatique')], max_length=20)),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('APPROUVÉ', 'Approuvé'), ('REFUSÉ', 'Refusé'), ('ANNULÉ', 'Annulé')], max_length=15)),
+                ('nombre', models.IntegerField(default=0, help_text='Absences couvrant ce jour')),
+                ('debuts', models.IntegerField(default=0, help_text='Absences commençant ce jour')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compteurs_absences', to='myapp.service')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['jour'], name='myapp_compt_jour_87b484_idx')],
+                'unique_together': {('service', 'jour', 'type_absence', 'statut')},
+            },
+        ),
+        migrations.RunPython(remplir_compteurs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_compteurabsences'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='absence',
+            index=models.Index(fields=['personne', 'date_debut', 'date_fin'], name='myapp_absen_personn_1eb2eb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='absence',
+            index=models.Index(fields=['statut', 'date_debut'], name='myapp_absen_statut_8751e2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paie',
+            index=models.Index(fields=['mois_annee', 'statut_paiement'], name='myapp_paie_mois_an_f8ced7_idx'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.1 on 2026-10-17 12:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def remplir_livre(apps, schema_editor):
+    """Calcule le livre de paie à partir des paies existantes"""
+    Paie = apps.get_model('myapp', 'Paie')
+    ElementPaie = apps.get_model('myapp', 'ElementPaie')
+    LivrePaie = apps.get_model('myapp', 'LivrePaie')
+    LivrePaieElement = apps.get_model('myapp', 'LivrePaieElement')
+    cles = ('mois_annee', 'personne__service_id', 'personne__type_employe', 'grade', 'statut_paiement')
+
+    totaux = (
+        Paie.objects.values_list(*cles)
+        .annotate(Count('id'), Sum('salaire_brut'), Sum('salaire_net'),
+                  Sum('deductions'), Sum('allocations_familiales'))
+        .order_by()
+    )
+    LivrePaie.objects.bulk_create(
+        [
+            LivrePaie(mois_annee=m, service_id=s, type_employe=t, grade=g, statut_paiement=st,
+                      nombre=n, salaire_brut=brut or 0, salaire_net=net or 0,
+                      deductions=retenues or 0, allocations_familiales=allocations or 0)
+            for m, s, t, g, st, n, brut, net, retenues, allocations in totaux
+        ],
+        batch_size=1000,
+    )
+
+    totaux_elements = (
+        ElementPaie.objects.values_list(*(f'paie__{cle}' for cle in cles), 'code', 'type_element')
+        .annotate(Count('id'), Sum('montant'), Max('libelle'))
+        .order_by()
+    )
+    LivrePaieElement.objects.bulk_create(
+        [
+            LivrePaieElement(mois_annee=m, service_id=s, type_employe=t, grade=g, statut_paiement=st,
+                             code=code, type_element=type_element, nombre=n, montant=montant or 0,
+                             libelle=libelle or '')
+            for m, s, t, g, st, code, type_element, n, montant, libelle in totaux_elements
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_index_absence_paie'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LivrePaie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois_annee', models.CharField(max_length=7)),
+                ('type_employe', models.CharField(choices=[('enseignant', 'Personnel Enseignant'), ('pat', 'Personnel PAT'), ('contractuel', 'Personnel Contractuel')], max_length=15)),
+                ('grade', models.CharField(blank=True, max_length=200)),
+                ('statut_paiement', models.CharField(choices=[('EN_COURS', 'En cours'), ('PAYÉ', 'Payé'), ('SUSPENDU', 'Suspendu'), ('ANNULÉ', 'Annulé')], max_length=15)),
+                ('nombre', models.IntegerField(default=0, help_text='Nombre de paies')),
+                ('salaire_brut', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('salaire_net', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('deductions', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('allocations_familiales', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='livre_paie', to='myapp.service')),
+            ],
+            options={
+                'unique_together': {('mois_annee', 'service', 'type_employe', 'grade', 'statut_paiement')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LivrePaieElement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mois_annee', models.CharField(max_length=7)),
+                ('type_employe', models.CharField(choices=[('enseignant', 'Personnel Enseignant'), ('pat', 'Personnel PAT'), ('contractuel', 'Personnel Contractuel')], max_length=15)),
+                ('grade', models.CharField(blank=True, max_length=200)),
+                ('statut_paiement', models.CharField(choices=[('EN_COURS', 'En cours'), ('PAYÉ', 'Payé'), ('SUSPENDU', 'Suspendu'), ('ANNULÉ', 'Annulé')], max_length=15)),
+                ('code', models.CharField(max_length=10)),
+                ('type_element', models.CharField(choices=[('GAIN', 'Gain'), ('RETENUE', 'Retenue')], max_length=10)),
+                ('libelle', models.CharField(blank=True, max_length=200)),
+                ('nombre', models.IntegerField(default=0, help_text="Nombre d'éléments")),
+                ('montant', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='livre_paie_elements', to='myapp.service')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mois_annee', 'code'], name='myapp_livre_mois_an_a03ef5_idx')],
+            },
+        ),
+        migrations.RunPython(remplir_livre, migrations.RunPython.noop),
+    ]
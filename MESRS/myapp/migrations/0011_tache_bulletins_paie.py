@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_livrepaie'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tache',
+            name='type_tache',
+            field=models.CharField(choices=[('export_rapport', 'Export de rapport'), ('rapport_annuel', 'Rapport annuel'), ('lancement_paie', 'Lancement de la paie'), ('bulletins_paie', 'Bulletins de salaire')], max_length=30),
+        ),
+    ]
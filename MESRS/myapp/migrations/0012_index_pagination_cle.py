@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-17 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_tache_bulletins_paie'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='absence',
+            index=models.Index(fields=['date_debut', 'id'], name='myapp_absen_date_de_7bcadb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['date_upload', 'id'], name='myapp_docum_date_up_ce730f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paie',
+            index=models.Index(fields=['mois_annee', 'id'], name='myapp_paie_mois_an_e3531f_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-17 12:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_index_pagination_cle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VerrouTache',
+            fields=[
+                ('type_tache', models.CharField(max_length=30, primary_key=True, serialize=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-17 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_verroutache'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='compteurabsences',
+            old_name='nombre',
+            new_name='absences',
+        ),
+        migrations.AlterField(
+            model_name='compteurabsences',
+            name='absences',
+            field=models.IntegerField(default=0, help_text="Absences couvrant ce jour (deux absences d'un même agent comptent deux fois)"),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 12:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0014_compteur_absences_nombre_absences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lancementpaie',
+            name='nombre_sans_carriere',
+            field=models.PositiveIntegerField(default=0, help_text='Personnes sans grade, indice ni salaire contractuel : paie non calculable'),
+        ),
+    ]
@@ -1,5 +1,9 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
@@ -63,6 +67,15 @@ class Service(models.Model):
         return self.nom
 
 
+class StructureQuerySet(models.QuerySet):
+    """Requêtes sur la hiérarchie des structures (via le chemin matérialisé)"""
+    
+    def sous_arbre(self, structure, inclure_soi=True):
+        """Structures de l'arbre enraciné en `structure` (une requête indexée)"""
+        queryset = self.filter(chemin__startswith=structure.chemin)
+        return queryset if inclure_soi else queryset.exclude(pk=structure.pk)
+
+
 class Structure(models.Model):
     """Modèle pour les structures organisationnelles"""
     nom = models.CharField(max_length=255)
@@ -71,9 +84,61 @@ class Structure(models.Model):
     description = models.TextField(blank=True)
     parent_structure = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='sous_structures')
     service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='structures')
+    # Chemin matérialisé "/<id racine>/…/<id>/", maintenu par save()
+    chemin = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
+    niveau = models.PositiveIntegerField(default=0, editable=False, help_text="Profondeur (racine = 0)")
+    
+    objects = StructureQuerySet.as_manager()
     
     def __str__(self):
         return self.nom
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Parent tel que chargé : permet de détecter un déplacement au save()
+        instance._parent_initial = instance.__dict__.get('parent_structure_id')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        parent_initial = getattr(self, '_parent_initial', None)
+        deplacement = self.pk is None or not self.chemin or parent_initial != self.parent_structure_id
+        
+        parent = None
+        if deplacement and self.parent_structure_id:
+            parent = Structure.objects.filter(pk=self.parent_structure_id).values('chemin', 'niveau').first()
+            if self.chemin and parent and parent['chemin'].startswith(self.chemin):
+                raise ValidationError("Une structure ne peut pas être rattachée à l'une de ses sous-structures")
+        
+        super().save(*args, **kwargs)
+        self._parent_initial = self.parent_structure_id
+        if not deplacement:
+            return
+        
+        nouveau_chemin = f"{parent['chemin'] if parent else '/'}{self.pk}/"
+        nouveau_niveau = parent['niveau'] + 1 if parent else 0
+        if nouveau_chemin == self.chemin:
+            return
+        
+        if self.chemin:
+            # Déplacement : tout le sous-arbre est réécrit en une requête
+            Structure.objects.filter(chemin__startswith=self.chemin).update(
+                chemin=Concat(Value(nouveau_chemin), Substr('chemin', len(self.chemin) + 1)),
+                niveau=F('niveau') + (nouveau_niveau - self.niveau)
+            )
+        else:
+            Structure.objects.filter(pk=self.pk).update(chemin=nouveau_chemin, niveau=nouveau_niveau)
+        self.chemin = nouveau_chemin
+        self.niveau = nouveau_niveau
+    
+    def descendants(self, inclure_soi=False):
+        """Sous-structures à tous les niveaux"""
+        return Structure.objects.sous_arbre(self, inclure_soi=inclure_soi)
+    
+    def ancetres(self):
+        """Structures parentes, de la racine au parent direct"""
+        ids = [int(i) for i in self.chemin.strip('/').split('/')[:-1] if i]
+        return Structure.objects.filter(pk__in=ids).order_by('niveau')
 
 
 class Personne(models.Model):
@@ -311,6 +376,16 @@ class Absence(models.Model):
     approuve_par = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     commentaire_approbateur = models.TextField(blank=True)
     
+    class Meta:
+        indexes = [
+            # Absences d'un agent sur une période (chevauchement date_debut <= fin, date_fin >= debut)
+            models.Index(fields=['personne', 'date_debut', 'date_fin']),
+            # Files de validation et plannings filtrés par statut
+            models.Index(fields=['statut', 'date_debut']),
+            # Historique parcouru par clé (pagination.KeysetPagination)
+            models.Index(fields=['date_debut', 'id']),
+        ]
+    
     def __str__(self):
         return f"Absence {self.type_absence} - {self.personne}"
     
@@ -323,6 +398,45 @@ class Absence(models.Model):
         return False
 
 
+class HistoriqueAbsence(models.Model):
+    """Journal des décisions prises sur les demandes d'absence"""
+    absence = models.ForeignKey(Absence, on_delete=models.CASCADE, related_name='historique')
+    statut_precedent = models.CharField(max_length=15, choices=Absence.STATUT_ABSENCE_CHOICES)
+    statut_nouveau = models.CharField(max_length=15, choices=Absence.STATUT_ABSENCE_CHOICES)
+    commentaire = models.TextField(blank=True)
+    effectue_par = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    en_lot = models.BooleanField(default=False, help_text="Décision prise par validation en lot")
+    date_action = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-date_action', '-id']
+    
+    def __str__(self):
+        return f"{self.absence_id}: {self.statut_precedent} → {self.statut_nouveau}"
+
+
+class CompteurAbsences(models.Model):
+    """
+    Compteurs journaliers d'absences par service, tenus à jour par signaux
+    (voir compteurs.py) et reconstruits par reconstruire_compteurs_absences.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='compteurs_absences')
+    jour = models.DateField()
+    type_absence = models.CharField(max_length=20, choices=Absence.TYPE_ABSENCE_CHOICES)
+    statut = models.CharField(max_length=15, choices=Absence.STATUT_ABSENCE_CHOICES)
+    absences = models.IntegerField(
+        default=0, help_text="Absences couvrant ce jour (deux absences d'un même agent comptent deux fois)"
+    )
+    debuts = models.IntegerField(default=0, help_text="Absences commençant ce jour")
+
+    class Meta:
+        unique_together = ['service', 'jour', 'type_absence', 'statut']
+        indexes = [models.Index(fields=['jour'])]
+
+    def __str__(self):
+        return f"{self.service_id} {self.jour} {self.type_absence}/{self.statut}: {self.absences}"
+
+
 class Paie(models.Model):
     """Modèle pour la gestion de la paie"""
     STATUT_PAIEMENT_CHOICES = [
@@ -354,6 +468,10 @@ class Paie(models.Model):
     
     class Meta:
         unique_together = ['personne', 'mois_annee']
+        indexes = [
+            models.Index(fields=['mois_annee', 'statut_paiement']),
+            models.Index(fields=['mois_annee', 'id']),
+        ]
     
     def __str__(self):
         return f"Paie {self.mois_annee} - {self.personne}"
@@ -383,6 +501,140 @@ class ElementPaie(models.Model):
         return f"{self.code} - {self.libelle} ({self.paie})"
 
 
+class LivrePaie(models.Model):
+    """
+    Totaux mensuels des paies par service, type d'employé, grade et statut,
+    tenus à jour par livre_paie.py (reconstruire_livre_paie pour tout recalculer).
+    """
+    mois_annee = models.CharField(max_length=7)  # Format: "2024-01"
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='livre_paie')
+    type_employe = models.CharField(max_length=15, choices=Personne.TYPE_EMPLOYE_CHOICES)
+    grade = models.CharField(max_length=200, blank=True)
+    statut_paiement = models.CharField(max_length=15, choices=Paie.STATUT_PAIEMENT_CHOICES)
+    nombre = models.IntegerField(default=0, help_text="Nombre de paies")
+    salaire_brut = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    salaire_net = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    deductions = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    allocations_familiales = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['mois_annee', 'service', 'type_employe', 'grade', 'statut_paiement']
+
+    def __str__(self):
+        return f"{self.mois_annee} {self.service_id} {self.type_employe}/{self.grade}: {self.nombre} paie(s)"
+
+
+class LivrePaieElement(models.Model):
+    """Totaux mensuels des éléments de paie par code, sur les mêmes axes que LivrePaie"""
+    mois_annee = models.CharField(max_length=7)
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='livre_paie_elements')
+    type_employe = models.CharField(max_length=15, choices=Personne.TYPE_EMPLOYE_CHOICES)
+    grade = models.CharField(max_length=200, blank=True)
+    statut_paiement = models.CharField(max_length=15, choices=Paie.STATUT_PAIEMENT_CHOICES)
+    code = models.CharField(max_length=10)
+    type_element = models.CharField(max_length=10, choices=ElementPaie.TYPE_ELEMENT_CHOICES)
+    libelle = models.CharField(max_length=200, blank=True)
+    nombre = models.IntegerField(default=0, help_text="Nombre d'éléments")
+    montant = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['mois_annee', 'code'])]
+
+    def __str__(self):
+        return f"{self.mois_annee} {self.service_id} {self.code}: {self.montant}"
+
+
+class LancementPaie(models.Model):
+    """Lancement de la paie mensuelle en masse (suivi de progression et reprise)"""
+    STATUT_CHOICES = [
+        ('EN_COURS', 'En cours'),
+        ('TERMINE', 'Terminé'),
+        ('ECHEC', 'Échec'),
+    ]
+    
+    mois_annee = models.CharField(max_length=7)  # Format: "2024-01"
+    date_paiement = models.DateField()
+    service = models.ForeignKey(Service, on_delete=models.SET_NULL, null=True, blank=True)
+    personnes = models.JSONField(default=list, blank=True, help_text="Sélection explicite d'ids de personnes (vide = tout le périmètre)")
+    statut = models.CharField(max_length=15, choices=STATUT_CHOICES, default='EN_COURS')
+    nombre_total = models.PositiveIntegerField(default=0)
+    nombre_traites = models.PositiveIntegerField(default=0)
+    nombre_ignores = models.PositiveIntegerField(default=0, help_text="Paies déjà payées, suspendues ou annulées, laissées intactes")
+    nombre_sans_carriere = models.PositiveIntegerField(default=0, help_text="Personnes sans grade, indice ni salaire contractuel : paie non calculable")
+    dernier_personne_id = models.PositiveIntegerField(null=True, blank=True, help_text="Point de reprise")
+    erreur = models.TextField(blank=True)
+    lance_par = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    date_lancement = models.DateTimeField(auto_now_add=True)
+    date_fin = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-date_lancement']
+    
+    def __str__(self):
+        return f"Lancement paie {self.mois_annee} ({self.statut})"
+    
+    @property
+    def progression(self):
+        """Avancement en %"""
+        if not self.nombre_total:
+            return 100 if self.statut == 'TERMINE' else 0
+        faits = self.nombre_traites + self.nombre_ignores + self.nombre_sans_carriere
+        return round(faits / self.nombre_total * 100, 2)
+
+
+class Tache(models.Model):
+    """Tâche de fond exécutée par le worker (python manage.py traiter_taches)"""
+    TYPE_TACHE_CHOICES = [
+        ('export_rapport', 'Export de rapport'),
+        ('rapport_annuel', 'Rapport annuel'),
+        ('lancement_paie', 'Lancement de la paie'),
+        ('bulletins_paie', 'Bulletins de salaire'),
+    ]
+    STATUT_CHOICES = [
+        ('EN_ATTENTE', 'En attente'),
+        ('EN_COURS', 'En cours'),
+        ('TERMINE', 'Terminé'),
+        ('ECHEC', 'Échec'),
+        ('ANNULE', 'Annulé'),
+    ]
+    
+    type_tache = models.CharField(max_length=30, choices=TYPE_TACHE_CHOICES)
+    parametres = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    statut = models.CharField(max_length=15, choices=STATUT_CHOICES, default='EN_ATTENTE')
+    progression = models.FloatField(default=0, help_text="Avancement en %")
+    message = models.CharField(max_length=255, blank=True)
+    resultat = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    fichier = models.FileField(upload_to='taches/', blank=True)
+    erreur = models.TextField(blank=True)
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    cree_par = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='taches')
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_debut = models.DateTimeField(null=True, blank=True)
+    date_maj = models.DateTimeField(auto_now=True, help_text="Dernier signe de vie du worker")
+    date_fin = models.DateTimeField(null=True, blank=True)
+    expire_le = models.DateTimeField(null=True, blank=True, help_text="Suppression du résultat après cette date")
+    
+    class Meta:
+        ordering = ['-date_creation']
+        indexes = [models.Index(fields=['statut', 'type_tache'])]
+    
+    def __str__(self):
+        return f"{self.get_type_tache_display()} #{self.pk} ({self.statut})"
+
+
+class VerrouTache(models.Model):
+    """
+    Ligne verrouillée (SELECT … FOR UPDATE) pendant la réservation d'une tâche
+    de ce type : les workers comptent les tâches EN_COURS l'un après l'autre,
+    la limite de concurrence par type ne peut pas être dépassée.
+    """
+    type_tache = models.CharField(max_length=30, primary_key=True)
+    
+    def __str__(self):
+        return self.type_tache
+
+
 class Detachement(models.Model):
     """Modèle pour les détachements"""
     STATUT_DETACHEMENT_CHOICES = [
@@ -424,6 +676,9 @@ class Document(models.Model):
     proprietaire = models.ForeignKey(Personne, on_delete=models.CASCADE, related_name='documents')
     uploade_par = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     
+    class Meta:
+        indexes = [models.Index(fields=['date_upload', 'id'])]
+    
     def __str__(self):
         return f"{self.nom} - {self.proprietaire}"
 
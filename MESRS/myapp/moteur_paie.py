@@ -0,0 +1,363 @@
+# myapp/moteur_paie.py
+"""
+Calcul et lancement de la paie mensuelle en masse.
+
+- Le salaire est calculé à partir des données de carrière : indice, échelon et
+  grade pour les enseignants et le PAT, salaire contractuel pour les
+  contractuels. Les paramètres par défaut (PARAMETRES_PAIE) sont indicatifs et
+  se surchargent via settings.PAIE_PARAMETRES.
+- Les personnes sont traitées par lots triés par id. Chaque lot est écrit dans
+  une transaction (bulk_create en upsert sur (personne, mois_annee), puis
+  remplacement des éléments de paie) et le point de reprise est enregistré
+  dans la même transaction : un lancement interrompu reprend après le dernier
+  lot validé.
+- Le livre de paie (livre_paie.py) des services concernés est recalculé une
+  fois en fin de lancement, y compris en échec, pour les lots déjà validés.
+"""
+import re
+from datetime import date
+from calendar import monthrange
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from . import livre_paie
+from .models import ElementPaie, LancementPaie, Paie, Personne
+
+
+TAILLE_LOT_PAIE = 500
+
+# Compteurs et point de reprise enregistrés avec chaque lot
+CHAMPS_PROGRESSION = ['nombre_traites', 'nombre_ignores', 'nombre_sans_carriere', 'dernier_personne_id']
+
+PARAMETRES_PAIE = {
+    # Valeur du point d'indice (MRU)
+    'valeur_point_indice': '30',
+    # Majoration du traitement de base par échelon
+    'taux_echelon': '0.02',
+    # Indemnité mensuelle forfaitaire par grade
+    'indemnites_grade': {
+        'professeur': '15000',
+        'maitre_assistant': '10000',
+        'docteur': '8000',
+        'assistant': '6000',
+    },
+    # Valeur du point de NBI (nbi_mac du PAT) ; 0 = non versée
+    'valeur_point_nbi': '0',
+    'allocation_par_enfant': '800',
+    'max_enfants_allocation': 6,
+    # Retenue pour pension (titulaires) / sécurité sociale (contractuels)
+    'taux_pension': '0.06',
+    'taux_cotisation_contractuel': '0.01',
+    # ITS : abattement mensuel puis barème progressif (plafond de tranche, taux)
+    'abattement_its': '6000',
+    'bareme_its': [('9000', '0.15'), ('21000', '0.25'), (None, '0.40')],
+}
+
+# Codes des éléments générés (cohérents avec les bulletins existants)
+CODE_TRAITEMENT = '100'
+CODE_ECHELON = '110'
+CODE_INDEMNITE_GRADE = '120'
+CODE_NBI = '130'
+CODE_ALLOCATIONS = '150'
+CODE_PENSION = '500'
+CODE_ITS = '600'
+
+# Champs mis à jour quand la paie du mois existe déjà (upsert)
+CHAMPS_UPSERT = [
+    'salaire_net', 'salaire_brut', 'nb_enfants', 'allocations_familiales', 'deductions',
+    'date_paiement', 'traite_par', 'grade', 'echelon', 'indice', 'mode_reglement',
+    'compte_bancaire', 'montant_imposable_mensuel', 'montant_imposable_progressif',
+]
+
+CENTIME = Decimal('0.01')
+
+
+def _montant(valeur):
+    return Decimal(valeur).quantize(CENTIME, rounding=ROUND_HALF_UP)
+
+
+def get_parametres():
+    """Paramètres de paie (valeurs par défaut surchargées par settings.PAIE_PARAMETRES)"""
+    parametres = dict(PARAMETRES_PAIE)
+    parametres.update(getattr(settings, 'PAIE_PARAMETRES', {}))
+    return parametres
+
+
+def date_paiement_defaut(mois_annee):
+    """Dernier jour du mois 'YYYY-MM'"""
+    annee, mois = (int(x) for x in mois_annee.split('-'))
+    return date(annee, mois, monthrange(annee, mois)[1])
+
+
+def _numero_echelon(echelon):
+    """Échelon saisi en texte ('3', 'Échelon 3', ...) ramené à un entier"""
+    trouve = re.search(r'\d+', echelon or '')
+    return int(trouve.group()) if trouve else 0
+
+
+# ========================================
+# CALCUL D'UNE PAIE
+# ========================================
+
+def donnees_carriere(personne):
+    """
+    Données de carrière utiles au calcul, ou None si la fiche de l'agent
+    (enseignant, PAT ou contractuel) est absente ou incomplète.
+    La personne doit être chargée avec select_related des trois fiches.
+    """
+    if personne.type_employe == 'enseignant' and hasattr(personne, 'enseignant'):
+        fiche = personne.enseignant
+        return {'grade': fiche.grade, 'echelon': fiche.echelon, 'indice': fiche.indice}
+    if personne.type_employe == 'pat' and hasattr(personne, 'personnelpat'):
+        fiche = personne.personnelpat
+        return {'grade': fiche.grade, 'echelon': fiche.anciennete_echelon, 'indice': fiche.indice,
+                'nbi': fiche.nbi_mac}
+    if personne.type_employe == 'contractuel' and hasattr(personne, 'contractuel'):
+        if personne.contractuel.salaire_mensuel is None:
+            return None
+        return {'grade': '', 'echelon': '', 'indice': None,
+                'salaire_mensuel': personne.contractuel.salaire_mensuel}
+    return None
+
+
+def calculer_its(imposable, parametres):
+    """ITS mensuel par tranches sur le revenu imposable après abattement"""
+    base = imposable - Decimal(parametres['abattement_its'])
+    impot = Decimal(0)
+    plancher = Decimal(0)
+    for plafond, taux in parametres['bareme_its']:
+        if base <= plancher:
+            break
+        haut = base if plafond is None else min(base, Decimal(plafond))
+        impot += (haut - plancher) * Decimal(taux)
+        if plafond is None:
+            break
+        plancher = Decimal(plafond)
+    return _montant(impot)
+
+
+def calculer_paie(carriere, nb_enfants, parametres):
+    """
+    Montants d'une paie et éléments du bulletin.
+
+    Retourne {salaire_brut, salaire_net, deductions, allocations_familiales,
+    montant_imposable_mensuel, elements}, elements étant une liste de dicts
+    prêts pour ElementPaie.
+    """
+    elements = []
+
+    def ligne(code, libelle, type_element, montant, taux=None):
+        if montant:
+            elements.append({
+                'code': code, 'libelle': libelle, 'type_element': type_element,
+                'montant': montant, 'taux': taux, 'ordre': len(elements) + 1,
+            })
+        return montant
+
+    if 'salaire_mensuel' in carriere:
+        traitement = ligne(CODE_TRAITEMENT, 'Salaire contractuel', 'GAIN', _montant(carriere['salaire_mensuel']))
+        echelon = indemnite = nbi = Decimal(0)
+        taux_retenue = Decimal(parametres['taux_cotisation_contractuel'])
+        libelle_retenue = 'Cotisation sécurité sociale'
+    else:
+        traitement = ligne(CODE_TRAITEMENT, 'Traitement de base', 'GAIN',
+                           _montant(carriere['indice'] * Decimal(parametres['valeur_point_indice'])))
+        taux_echelon = Decimal(parametres['taux_echelon']) * _numero_echelon(carriere['echelon'])
+        echelon = ligne(CODE_ECHELON, 'Majoration échelon', 'GAIN',
+                        _montant(traitement * taux_echelon), _montant(taux_echelon * 100))
+        indemnite = ligne(CODE_INDEMNITE_GRADE, 'Indemnité de grade', 'GAIN',
+                          _montant(parametres['indemnites_grade'].get(carriere['grade'], 0)))
+        nbi = ligne(CODE_NBI, 'Nouvelle bonification indiciaire', 'GAIN',
+                    _montant((carriere.get('nbi') or 0) * Decimal(parametres['valeur_point_nbi'])))
+        taux_retenue = Decimal(parametres['taux_pension'])
+        libelle_retenue = 'Retenue pension'
+
+    enfants = min(nb_enfants, parametres['max_enfants_allocation'])
+    allocations = ligne(CODE_ALLOCATIONS, 'Allocations familiales', 'GAIN',
+                        _montant(enfants * Decimal(parametres['allocation_par_enfant'])))
+
+    brut = traitement + echelon + indemnite + nbi + allocations
+    pension = ligne(CODE_PENSION, libelle_retenue, 'RETENUE',
+                    _montant((traitement + echelon) * taux_retenue), _montant(taux_retenue * 100))
+    # Les allocations familiales ne sont pas imposables
+    imposable = brut - allocations - pension
+    its = ligne(CODE_ITS, 'ITS', 'RETENUE', calculer_its(imposable, parametres))
+
+    deductions = pension + its
+    return {
+        'salaire_brut': brut,
+        'salaire_net': brut - deductions,
+        'deductions': deductions,
+        'allocations_familiales': allocations,
+        'montant_imposable_mensuel': imposable,
+        'elements': elements,
+    }
+
+
+# ========================================
+# LANCEMENT EN MASSE
+# ========================================
+
+def selection_lancement(lancement):
+    """Personnes actives concernées par le lancement, triées par id"""
+    personnes = Personne.objects.filter(statut_actif=True)
+    if lancement.service_id:
+        personnes = personnes.filter(service_id=lancement.service_id)
+    if lancement.personnes:
+        personnes = personnes.filter(id__in=lancement.personnes)
+    return personnes.order_by('id')
+
+
+def preparer_lancement(mois_annee, date_paiement=None, service=None, personnes=None, lance_par=None):
+    """Crée le lancement et fige le nombre de personnes à traiter"""
+    lancement = LancementPaie(
+        mois_annee=mois_annee,
+        date_paiement=date_paiement or date_paiement_defaut(mois_annee),
+        service=service,
+        personnes=sorted(set(personnes or [])),
+        lance_par=lance_par,
+    )
+    lancement.nombre_total = selection_lancement(lancement).count()
+    lancement.save()
+    return lancement
+
+
+def _paies_precedentes(personne_ids, mois_annee):
+    """Dernière paie antérieure au mois de chaque personne (une requête)"""
+    dernier_mois = (
+        Paie.objects.filter(personne_id=OuterRef('personne_id'), mois_annee__lt=mois_annee)
+        .order_by('-mois_annee')
+        .values('mois_annee')[:1]
+    )
+    lignes = Paie.objects.filter(
+        personne_id__in=personne_ids, mois_annee=Subquery(dernier_mois)
+    ).values(
+        'personne_id', 'mois_annee', 'nb_enfants', 'mode_reglement',
+        'compte_bancaire', 'montant_imposable_progressif'
+    )
+    return {ligne['personne_id']: ligne for ligne in lignes}
+
+
+def _traiter_lot(lancement, lot, parametres):
+    """
+    Calcule et écrit les paies d'un lot. Retourne (traités, ignorés, sans carrière) :
+    les ignorés ont déjà une paie réglée, les sans carrière n'ont pas de données
+    de carrière permettant le calcul.
+    """
+    mois_annee = lancement.mois_annee
+    ids = [personne.id for personne in lot]
+
+    existantes = {
+        ligne['personne_id']: ligne
+        for ligne in Paie.objects.filter(personne_id__in=ids, mois_annee=mois_annee).values(
+            'personne_id', 'statut_paiement', 'nb_enfants', 'mode_reglement', 'compte_bancaire'
+        )
+    }
+    precedentes = _paies_precedentes(ids, mois_annee)
+
+    paies = []
+    elements = {}
+    sans_carriere = 0
+    for personne in lot:
+        existante = existantes.get(personne.id)
+        # Paies déjà payées, suspendues ou annulées : on n'y touche pas
+        if existante and existante['statut_paiement'] != 'EN_COURS':
+            continue
+        carriere = donnees_carriere(personne)
+        if carriere is None:
+            sans_carriere += 1
+            continue
+
+        precedente = precedentes.get(personne.id, {})
+        # Situation familiale et règlement : paie du mois si elle existe, sinon la précédente
+        reference = existante or precedente
+        calcul = calculer_paie(carriere, reference.get('nb_enfants', 0), parametres)
+        # Cumul imposable depuis janvier
+        cumul = Decimal(0)
+        if precedente.get('mois_annee', '')[:4] == mois_annee[:4]:
+            cumul = precedente.get('montant_imposable_progressif') or Decimal(0)
+
+        elements[personne.id] = calcul.pop('elements')
+        paies.append(Paie(
+            personne_id=personne.id,
+            mois_annee=mois_annee,
+            date_paiement=lancement.date_paiement,
+            traite_par_id=lancement.lance_par_id,
+            nb_enfants=reference.get('nb_enfants', 0),
+            grade=carriere['grade'],
+            echelon=carriere['echelon'],
+            indice=str(carriere['indice'] or ''),
+            mode_reglement=reference.get('mode_reglement', ''),
+            compte_bancaire=reference.get('compte_bancaire', ''),
+            montant_imposable_progressif=cumul + calcul['montant_imposable_mensuel'],
+            **calcul
+        ))
+
+    if paies:
+        # Upsert sur (personne, mois_annee) ; MySQL (ON DUPLICATE KEY UPDATE)
+        # n'accepte pas de cible explicite
+        cible = ['personne', 'mois_annee'] if connection.features.supports_update_conflicts_with_target else None
+        Paie.objects.bulk_create(paies, update_conflicts=True, unique_fields=cible, update_fields=CHAMPS_UPSERT)
+
+        paie_ids = dict(
+            Paie.objects.filter(personne_id__in=elements, mois_annee=mois_annee)
+            .values_list('personne_id', 'id')
+        )
+        ElementPaie.objects.filter(paie_id__in=paie_ids.values()).delete()
+        ElementPaie.objects.bulk_create([
+            ElementPaie(paie_id=paie_ids[personne_id], **element)
+            for personne_id, lignes in elements.items()
+            for element in lignes
+        ])
+
+    return len(paies), len(lot) - len(paies) - sans_carriere, sans_carriere
+
+
+def executer_lancement(lancement, taille_lot=TAILLE_LOT_PAIE, progression=None):
+    """
+    Exécute (ou reprend) un lancement à partir de son point de reprise.
+    En cas d'erreur, le lot en cours est annulé et le lancement passe en ÉCHEC ;
+    les lots précédents restent acquis.
+    progression : fonction appelée avec le lancement après chaque lot validé.
+    """
+    parametres = get_parametres()
+    personnes = selection_lancement(lancement).select_related('enseignant', 'personnelpat', 'contractuel')
+
+    lancement.statut = 'EN_COURS'
+    lancement.erreur = ''
+    lancement.save(update_fields=['statut', 'erreur'])
+
+    try:
+        while True:
+            lot = list(personnes.filter(id__gt=lancement.dernier_personne_id or 0)[:taille_lot])
+            if not lot:
+                break
+            with transaction.atomic():
+                traites, ignores, sans_carriere = _traiter_lot(lancement, lot, parametres)
+                lancement.nombre_traites += traites
+                lancement.nombre_ignores += ignores
+                lancement.nombre_sans_carriere += sans_carriere
+                lancement.dernier_personne_id = lot[-1].id
+                lancement.save(update_fields=CHAMPS_PROGRESSION)
+            if progression is not None:
+                progression(lancement)
+    except Exception as e:
+        lancement.refresh_from_db(fields=CHAMPS_PROGRESSION)
+        lancement.statut = 'ECHEC'
+        lancement.erreur = str(e)
+    else:
+        lancement.statut = 'TERMINE'
+
+    if lancement.nombre_traites:
+        services = None
+        if lancement.service_id or lancement.personnes:
+            services = selection_lancement(lancement).values_list('service_id', flat=True).order_by().distinct()
+        livre_paie.rafraichir(lancement.mois_annee, services)
+
+    lancement.date_fin = timezone.now()
+    lancement.save(update_fields=['statut', 'erreur', 'date_fin'])
+    return lancement
@@ -0,0 +1,299 @@
+# myapp/pagination.py
+"""
+Classes de pagination spécifiques.
+
+La pagination par défaut (PageNumberPagination) exécute un COUNT(*) et un
+OFFSET qui grandit avec le numéro de page ; les listes longues et très
+consultées utilisent une pagination par clé (keyset) : chaque page est lue
+par un WHERE sur les colonnes de tri indexées, après la dernière ligne de la
+page précédente. La page 1 000 coûte alors autant que la page 1.
+
+- KeysetPagination : tri composite (ex. ('-date_debut', '-id')), curseur
+  opaque contenant les valeurs de la dernière ligne, total optionnel
+  (?count=true) approximatif.
+- PaginationAdaptative (DEFAULT_PAGINATION_CLASS) : pages numérotées, ou
+  keyset avec ?pagination=cursor sur les ViewSets déclarant keyset_ordering ;
+  un ViewSet peut choisir le keyset par défaut (pagination_defaut = 'cursor').
+"""
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, ValidationError
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# Durée de mise en cache des totaux approximatifs (secondes)
+CACHE_COMPTE_DEFAUT = 300
+
+
+# ========================================
+# TOTAL APPROXIMATIF
+# ========================================
+
+def _lignes_table(queryset):
+    """Nombre de lignes de la table d'après les statistiques du SGBD (None si indisponible)"""
+    connexion = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connexion.vendor == 'mysql':
+        sql = "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+    elif connexion.vendor == 'postgresql':
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass"
+    else:
+        return None
+    try:
+        with connexion.cursor() as curseur:
+            curseur.execute(sql, [table])
+            ligne = curseur.fetchone()
+    except DatabaseError:
+        return None
+    # reltuples vaut -1 tant que la table n'a pas été analysée
+    if ligne is None or ligne[0] is None or ligne[0] < 0:
+        return None
+    return int(ligne[0])
+
+
+def compte_approximatif(queryset):
+    """
+    Total approximatif d'un queryset : statistiques de la table s'il n'est
+    pas filtré (MySQL, PostgreSQL), sinon COUNT(*) mis en cache
+    settings.PAGINATION_CACHE_COMPTE secondes par requête SQL.
+    """
+    if not queryset.query.where:
+        lignes = _lignes_table(queryset)
+        if lignes is not None:
+            return lignes
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    cle = 'compte:' + hashlib.sha1(f"{queryset.db}:{sql}:{params!r}".encode('utf-8')).hexdigest()
+    delai = getattr(settings, 'PAGINATION_CACHE_COMPTE', CACHE_COMPTE_DEFAUT)
+    return cache.get_or_set(cle, queryset.count, delai)
+
+
+# ========================================
+# PAGINATION PAR CLÉ
+# ========================================
+
+def _valeur_curseur(valeur):
+    # Dates et heures à la microseconde près : une valeur tronquée ferait sauter ou répéter des lignes
+    if isinstance(valeur, date):
+        return valeur.isoformat()
+    if isinstance(valeur, Decimal):
+        return str(valeur)
+    raise TypeError(f"Valeur de curseur non sérialisable : {valeur!r}")
+
+
+def _inverser(champ):
+    return champ[1:] if champ.startswith('-') else f'-{champ}'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination par clé sur un tri composite de champs non nuls de la table,
+    terminé par la clé primaire. Le tri est, par priorité : ?ordering= (champs
+    autorisés par l'OrderingFilter de la vue), `ordering` de la classe,
+    `keyset_ordering` de la vue.
+    """
+    ordering = None
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Curseur invalide'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.champs = self.get_ordering(request, queryset, view)
+        self.modele = queryset.model
+
+        valeurs, arriere = self.decode_cursor(request)
+        ordre = [_inverser(champ) for champ in self.champs] if arriere else self.champs
+        page_qs = queryset.order_by(*ordre)
+        colonnes, differees = queryset.query.deferred_loading
+        if colonnes and not differees:
+            # Queryset réduit par only() (?fields=) : le curseur lit les colonnes du tri
+            page_qs = page_qs.only(*colonnes, *(self._champ_modele(self.modele, champ).name for champ in self.champs))
+        if valeurs is not None:
+            page_qs = page_qs.filter(self._apres(ordre, valeurs))
+
+        lignes = list(page_qs[:self.page_size + 1])
+        suite = len(lignes) > self.page_size
+        lignes = lignes[:self.page_size]
+        if arriere:
+            lignes.reverse()
+            self.has_next, self.has_previous = valeurs is not None, suite
+        else:
+            self.has_next, self.has_previous = suite, valeurs is not None
+        self.page = lignes
+
+        self.count = None
+        if str(request.query_params.get(self.count_query_param, '')).lower() in ('1', 'true', 'oui'):
+            self.count = compte_approximatif(queryset)
+        return lignes
+
+    # Tri
+
+    def _champ_modele(self, modele, nom):
+        nom = nom.lstrip('-')
+        if nom == 'pk':
+            return modele._meta.pk
+        try:
+            champ = modele._meta.get_field(nom)
+        except FieldDoesNotExist:
+            return None
+        if not champ.concrete or champ.null or champ.is_relation:
+            return None
+        return champ
+
+    def get_ordering(self, request, queryset, view):
+        modele = queryset.model
+        demande = None
+        if view is not None and OrderingFilter in getattr(view, 'filter_backends', ()):
+            if request.query_params.get(api_settings.ORDERING_PARAM):
+                demande = OrderingFilter().get_ordering(request, queryset, view)
+        for ordre in (demande, self.ordering, getattr(view, 'keyset_ordering', None)):
+            if ordre and all(self._champ_modele(modele, champ) for champ in ordre):
+                break
+        else:
+            ordre = ('-pk',)
+        ordre = [champ.replace('pk', modele._meta.pk.attname) if champ.lstrip('-') == 'pk' else champ
+                 for champ in ordre]
+        # La clé primaire départage les ex aequo, dans le sens du dernier champ
+        if not any(self._champ_modele(modele, champ).primary_key for champ in ordre):
+            pk = modele._meta.pk.attname
+            ordre.append(f'-{pk}' if ordre[-1].startswith('-') else pk)
+        return ordre
+
+    def _apres(self, ordre, valeurs):
+        """
+        (a, b, c) après (x, y, z) : a > x OU (a = x ET b > y) OU (a = x ET b = y ET c > z).
+        La borne redondante a >= x permet au SGBD de commencer la lecture de
+        l'index à x au lieu de le parcourir depuis le début.
+        """
+        condition = Q()
+        egalites = {}
+        for champ, valeur in zip(ordre, valeurs):
+            nom = champ.lstrip('-')
+            operateur = 'lt' if champ.startswith('-') else 'gt'
+            condition |= Q(**egalites, **{f'{nom}__{operateur}': valeur})
+            egalites[nom] = valeur
+        premier = ordre[0]
+        borne = Q(**{f"{premier.lstrip('-')}__{'lte' if premier.startswith('-') else 'gte'}": valeurs[0]})
+        return borne & condition
+
+    # Curseur
+
+    def get_page_size(self, request):
+        try:
+            taille = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(taille, self.max_page_size) if taille > 0 else self.page_size
+
+    def decode_cursor(self, request):
+        """(valeurs de la ligne repère, sens arrière) ou (None, False) en début de liste"""
+        encode = request.query_params.get(self.cursor_query_param)
+        if not encode:
+            return None, False
+        try:
+            donnees = json.loads(base64.urlsafe_b64decode(encode.encode('ascii')).decode('utf-8'))
+            valeurs = donnees['v']
+            if len(valeurs) != len(self.champs):
+                raise ValueError
+            valeurs = [
+                self._champ_modele(self.modele, champ).to_python(valeur)
+                for champ, valeur in zip(self.champs, valeurs)
+            ]
+            return valeurs, bool(donnees.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, ligne, arriere):
+        valeurs = [getattr(ligne, self._champ_modele(self.modele, champ).attname) for champ in self.champs]
+        donnees = json.dumps({'v': valeurs, 'r': int(arriere)}, default=_valeur_curseur, separators=(',', ':'))
+        encode = base64.urlsafe_b64encode(donnees.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encode)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], arriere=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], arriere=True)
+
+    def get_paginated_response(self, data):
+        reponse = OrderedDict([('next', self.get_next_link()), ('previous', self.get_previous_link())])
+        if self.count is not None:
+            reponse['count'] = self.count
+            reponse['count_approximatif'] = True
+        reponse['results'] = data
+        return Response(reponse)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'count_approximatif': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+
+class PaginationAdaptative(PageNumberPagination):
+    """
+    Pages numérotées (réponse habituelle : count, next, previous, results),
+    ou pagination par clé avec ?pagination=cursor pour les vues déclarant
+    keyset_ordering. Une vue avec pagination_defaut = 'cursor' pagine par clé
+    sauf ?pagination=page.
+    """
+    pagination_query_param = 'pagination'
+
+    def _mode(self, request, view):
+        if not getattr(view, 'keyset_ordering', None):
+            return 'page'
+        return request.query_params.get(self.pagination_query_param) or getattr(view, 'pagination_defaut', 'page')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self._mode(request, view) == 'cursor':
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FileValidationPagination(KeysetPagination):
+    """File de validation des absences, de la plus proche à la plus lointaine"""
+    ordering = ('date_debut', 'id')
+    page_size = 50
@@ -0,0 +1,278 @@
+# myapp/pdf.py
+"""
+Écriture de PDF en Python pur et mise en page du bulletin de salaire.
+
+DocumentPDF produit des pages A4 de texte, traits et cadres avec les polices
+standard Helvetica et Helvetica-Bold (aucune police embarquée, encodage
+WinAnsi : les caractères hors cp1252, p. ex. l'écriture arabe, sont remplacés
+par « ? »). La sortie ne contient ni date ni identifiant aléatoire : les mêmes
+données donnent les mêmes octets.
+
+Ce module n'importe pas Django : rendre_bulletin s'exécute dans un pool de
+processus (voir bulletins.py).
+"""
+import unicodedata
+import zlib
+from decimal import Decimal
+
+
+A4 = (595.28, 841.89)
+
+# Chasses (1/1000 em) des caractères ASCII 32 à 126
+_CHASSES = {
+    False: [
+        278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+        556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+        1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+        667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+        333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+        556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+    ],
+    True: [
+        278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+        556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+        975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+        667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+        333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+        611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+    ],
+}
+_CHASSE_DEFAUT = 556
+
+
+def _chasse(caractere, gras):
+    code = ord(caractere)
+    if not 32 <= code <= 126:
+        # Lettres accentuées : chasse de la lettre de base
+        base = unicodedata.normalize('NFD', caractere)[0]
+        code = ord(base)
+        if not 32 <= code <= 126:
+            return _CHASSE_DEFAUT
+    return _CHASSES[gras][code - 32]
+
+
+def largeur_texte(texte, taille, gras=False):
+    """Largeur en points d'un texte dans la police standard"""
+    return sum(_chasse(c, gras) for c in texte) * taille / 1000
+
+
+def _chaine_pdf(texte):
+    donnees = texte.encode('cp1252', errors='replace')
+    return b'(' + donnees.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _nombre(valeur):
+    return f'{valeur:.2f}'.rstrip('0').rstrip('.')
+
+
+class DocumentPDF:
+    """
+    Document PDF minimal. Les coordonnées sont en points depuis le coin
+    supérieur gauche de la page (y vers le bas).
+    """
+
+    def __init__(self, titre='', format_page=A4):
+        self.titre = titre
+        self.largeur, self.hauteur = format_page
+        self.pages = []
+
+    def nouvelle_page(self):
+        self.pages.append([])
+
+    def _ajouter(self, commande):
+        if not self.pages:
+            self.nouvelle_page()
+        self.pages[-1].append(commande)
+
+    def texte(self, x, y, texte, taille=9, gras=False, alignement='gauche'):
+        """Texte dont la ligne de base est en y ; alignement gauche, droite ou centre par rapport à x"""
+        texte = str(texte)
+        if alignement != 'gauche':
+            largeur = largeur_texte(texte, taille, gras)
+            x -= largeur if alignement == 'droite' else largeur / 2
+        police = b'/F2' if gras else b'/F1'
+        self._ajouter(
+            b'BT ' + police + b' ' + _nombre(taille).encode() + b' Tf '
+            + f'{_nombre(x)} {_nombre(self.hauteur - y)} Td '.encode()
+            + _chaine_pdf(texte) + b' Tj ET'
+        )
+
+    def trait(self, x1, y1, x2, y2, epaisseur=0.5):
+        self._ajouter(
+            f'{_nombre(epaisseur)} w {_nombre(x1)} {_nombre(self.hauteur - y1)} m '
+            f'{_nombre(x2)} {_nombre(self.hauteur - y2)} l S'.encode()
+        )
+
+    def cadre(self, x, y, largeur, hauteur, epaisseur=0.5, fond=None):
+        """Rectangle de coin supérieur gauche (x, y) ; fond : niveau de gris (0 noir, 1 blanc)"""
+        rectangle = f'{_nombre(x)} {_nombre(self.hauteur - y - hauteur)} {_nombre(largeur)} {_nombre(hauteur)} re'
+        if fond is not None:
+            self._ajouter(f'q {_nombre(fond)} g {rectangle} f Q'.encode())
+        self._ajouter(f'{_nombre(epaisseur)} w {rectangle} S'.encode())
+
+    def octets(self):
+        """Document complet (flux de contenu compressés)"""
+        if not self.pages:
+            self.nouvelle_page()
+        objets = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            None,  # Pages, complété une fois les pages numérotées
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+            b'<< /Title ' + _chaine_pdf(self.titre) + b' /Producer (MESRS) >>',
+        ]
+        pages = []
+        for commandes in self.pages:
+            contenu = zlib.compress(b'\n'.join(commandes), 6)
+            objets.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(contenu) + contenu + b'\nendstream')
+            objets.append(
+                f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_nombre(self.largeur)} {_nombre(self.hauteur)}] '
+                f'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {len(objets)} 0 R >>'.encode()
+            )
+            pages.append(len(objets))
+        objets[1] = (
+            f'<< /Type /Pages /Kids [{" ".join(f"{n} 0 R" for n in pages)}] /Count {len(pages)} >>'.encode()
+        )
+
+        sortie = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        positions = []
+        for numero, objet in enumerate(objets, start=1):
+            positions.append(len(sortie))
+            sortie += b'%d 0 obj\n' % numero + objet + b'\nendobj\n'
+        debut_xref = len(sortie)
+        sortie += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objets) + 1)
+        for position in positions:
+            sortie += b'%010d 00000 n \n' % position
+        sortie += b'trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            len(objets) + 1, debut_xref
+        )
+        return bytes(sortie)
+
+
+# ========================================
+# BULLETIN DE SALAIRE
+# ========================================
+
+MARGE = 40
+LIGNES_PAR_PAGE = 30
+
+
+def montant(valeur):
+    """1234567.8 -> '1 234 567,80' ; vide si valeur absente"""
+    if valeur in (None, ''):
+        return ''
+    entier, decimales = f'{Decimal(valeur):,.2f}'.split('.')
+    return f"{entier.replace(',', ' ')},{decimales}"
+
+
+def _entete(pdf, donnees, suite=False):
+    centre = pdf.largeur / 2
+    pdf.texte(centre, 50, "RÉPUBLIQUE ISLAMIQUE DE MAURITANIE", 10, gras=True, alignement='centre')
+    pdf.texte(centre, 64, "Ministère de l'Enseignement Supérieur et de la Recherche Scientifique",
+              9, alignement='centre')
+    titre = f"BULLETIN DE SALAIRE - {donnees['mois']}" + (" (suite)" if suite else "")
+    pdf.cadre(MARGE, 78, pdf.largeur - 2 * MARGE, 24, fond=0.9)
+    pdf.texte(centre, 95, titre, 12, gras=True, alignement='centre')
+
+
+def _bloc_agent(pdf, donnees, y):
+    agent = donnees['agent']
+    gauche = [
+        ("Nom et prénom", f"{agent['nom']} {agent['prenom']}"),
+        ("N° employé", agent['numero_employe']),
+        ("NNI", agent['nni']),
+        ("Service", agent['service']),
+        ("Fonction", agent['fonction']),
+    ]
+    droite = [
+        ("Grade", donnees['grade']),
+        ("Échelon", donnees['echelon']),
+        ("Indice", donnees['indice']),
+        ("Enfants", donnees['nb_enfants']),
+        ("Date de paiement", donnees['date_paiement']),
+    ]
+    milieu = pdf.largeur / 2
+    pdf.cadre(MARGE, y, pdf.largeur - 2 * MARGE, 16 * len(gauche) + 8)
+    for i, ((libelle_g, valeur_g), (libelle_d, valeur_d)) in enumerate(zip(gauche, droite)):
+        ligne = y + 16 + 16 * i
+        pdf.texte(MARGE + 8, ligne, libelle_g, 8, gras=True)
+        pdf.texte(MARGE + 95, ligne, valeur_g or '', 9)
+        pdf.texte(milieu + 8, ligne, libelle_d, 8, gras=True)
+        pdf.texte(milieu + 95, ligne, valeur_d if valeur_d not in (None, '') else '', 9)
+    return y + 16 * len(gauche) + 8
+
+
+# Colonnes du tableau des éléments : (titre, x, alignement)
+_COLONNES = [
+    ("Code", MARGE + 6, 'gauche'),
+    ("Libellé", MARGE + 50, 'gauche'),
+    ("Taux %", 330, 'droite'),
+    ("Gains", 440, 'droite'),
+    ("Retenues", A4[0] - MARGE - 6, 'droite'),
+]
+
+
+def _tableau(pdf, elements, y):
+    largeur = pdf.largeur - 2 * MARGE
+    pdf.cadre(MARGE, y, largeur, 18, fond=0.9)
+    for titre, x, alignement in _COLONNES:
+        pdf.texte(x, y + 12, titre, 8, gras=True, alignement=alignement)
+    y += 18
+    for element in elements:
+        y += 15
+        gain = element['type_element'] == 'GAIN'
+        valeurs = [
+            element['code'], element['libelle'], montant(element['taux']),
+            montant(element['montant']) if gain else '', '' if gain else montant(element['montant']),
+        ]
+        for valeur, (_, x, alignement) in zip(valeurs, _COLONNES):
+            pdf.texte(x, y - 4, valeur, 9, alignement=alignement)
+        pdf.trait(MARGE, y, MARGE + largeur, y, 0.25)
+    return y
+
+
+def _totaux(pdf, donnees, y):
+    y += 14
+    lignes = [
+        ("Salaire brut", donnees['salaire_brut']),
+        ("Total des retenues", donnees['deductions']),
+        ("dont allocations familiales (non imposables)", donnees['allocations_familiales']),
+        ("Imposable du mois", donnees['montant_imposable_mensuel']),
+        ("Cumul imposable de l'année", donnees['montant_imposable_progressif']),
+    ]
+    droite = pdf.largeur - MARGE - 6
+    for libelle, valeur in lignes:
+        y += 14
+        pdf.texte(300, y, libelle, 9)
+        pdf.texte(droite, y, montant(valeur), 9, alignement='droite')
+    y += 12
+    pdf.cadre(290, y, droite + 6 - 290, 24, 1, fond=0.85)
+    pdf.texte(300, y + 16, "NET À PAYER", 11, gras=True)
+    pdf.texte(droite, y + 16, montant(donnees['salaire_net']), 11, gras=True, alignement='droite')
+    y += 44
+    reglement = donnees['mode_reglement'] or ''
+    if donnees['compte_bancaire']:
+        reglement = f"{reglement} - compte {donnees['compte_bancaire']}".strip(' -')
+    if reglement:
+        pdf.texte(MARGE, y, f"Règlement : {reglement}", 9)
+    return y
+
+
+def rendre_bulletin(donnees):
+    """
+    PDF (octets) d'un bulletin de salaire à partir des données préparées par
+    bulletins.donnees_bulletin (dict de chaînes et nombres, sans objet Django).
+    """
+    pdf = DocumentPDF(titre=f"Bulletin de salaire {donnees['mois']} - {donnees['agent']['numero_employe']}")
+    elements = donnees['elements']
+    pages = [elements[i:i + LIGNES_PAR_PAGE] for i in range(0, len(elements), LIGNES_PAR_PAGE)] or [[]]
+    for numero, lignes in enumerate(pages):
+        pdf.nouvelle_page()
+        _entete(pdf, donnees, suite=numero > 0)
+        y = _bloc_agent(pdf, donnees, 112) + 12
+        y = _tableau(pdf, lignes, y)
+        if numero == len(pages) - 1:
+            _totaux(pdf, donnees, y)
+        if len(pages) > 1:
+            pdf.texte(pdf.largeur / 2, pdf.hauteur - 30, f"Page {numero + 1}/{len(pages)}", 8, alignement='centre')
+    return pdf.octets()
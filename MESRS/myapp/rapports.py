@@ -0,0 +1,269 @@
+# myapp/rapports.py
+"""
+Moteur de calcul des rapports d'absences.
+
+Toutes les fonctions travaillent sur des querysets déjà filtrés selon le scope
+de l'utilisateur et s'exécutent en un nombre constant de requêtes SQL,
+indépendamment de l'effectif. Les variantes *_service lisent les décomptes
+d'absences d'un service dans ses compteurs journaliers (compteurs.py).
+"""
+from calendar import monthrange
+from datetime import date, datetime
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .compteurs import absences_par_mois_et_type, absences_periode
+
+
+MOIS_NOMS = ['Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
+             'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre']
+
+# Nombre maximal d'années couvertes par un rapport pluriannuel
+MAX_ANNEES_RAPPORT = 20
+
+
+def filtre_chevauchement(debut, fin, prefixe=''):
+    """Q des absences qui chevauchent l'intervalle [debut, fin]"""
+    return Q(**{f'{prefixe}date_debut__lte': fin, f'{prefixe}date_fin__gte': debut})
+
+
+def statistiques_mensuelles(agents, absences, debut, fin, champ_repartition, top_n=5):
+    """
+    Statistiques d'un mois pour un ensemble d'agents (Enseignant, PersonnelPAT…).
+
+    - agents : queryset du modèle d'agent (clé primaire = personne)
+    - absences : queryset d'Absence définissant le périmètre des répartitions
+    - champ_repartition : champ de l'agent utilisé pour la répartition et le top
+
+    Trois requêtes au total : répartition des agents, absences groupées par
+    (type, statut), top des agents les plus absents. Le nombre d'agents absents
+    est fourni par presence_periode, sur les seules absences approuvées.
+    """
+    groupes = (
+        absences.filter(filtre_chevauchement(debut, fin))
+        .values_list('type_absence', 'statut')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    return _statistiques_mensuelles(agents, groupes, debut, fin, champ_repartition, top_n)
+
+
+def statistiques_mensuelles_service(agents, service, debut, fin, champ_repartition, top_n=5):
+    """
+    Comme statistiques_mensuelles pour les absences d'un service : les
+    répartitions par type et statut sont lues dans les compteurs journaliers.
+    """
+    groupes = absences_periode(service, debut, fin)
+    return _statistiques_mensuelles(agents, groupes, debut, fin, champ_repartition, top_n)
+
+
+def _statistiques_mensuelles(agents, groupes, debut, fin, champ_repartition, top_n):
+    """groupes : itérable de (type_absence, statut, nombre d'absences)"""
+    repartition = list(
+        agents.values(champ_repartition)
+        .annotate(count=Count('personne'))
+        .order_by(champ_repartition)
+    )
+    total = sum(ligne['count'] for ligne in repartition)
+
+    par_type = {}
+    par_statut = {}
+    for type_absence, statut, count in groupes:
+        par_type[type_absence] = par_type.get(type_absence, 0) + count
+        par_statut[statut] = par_statut.get(statut, 0) + count
+
+    absences_agents = filtre_chevauchement(debut, fin, 'personne__absences__')
+    top = (
+        agents.annotate(nombre_absences=Count('personne__absences', filter=absences_agents))
+        .filter(nombre_absences__gt=0)
+        .order_by('-nombre_absences', 'personne_id')
+        .values('personne_id', 'personne__nom', 'personne__prenom', champ_repartition, 'nombre_absences')
+        [:top_n]
+    )
+
+    return {
+        'total': total,
+        'repartition': repartition,
+        'absences_par_type': [
+            {'type_absence': cle, 'count': par_type[cle]} for cle in sorted(par_type)
+        ],
+        'absences_par_statut': [
+            {'statut': cle, 'count': par_statut[cle]} for cle in sorted(par_statut)
+        ],
+        'top_absences': [
+            {
+                'personne_id': ligne['personne_id'],
+                'nom': ligne['personne__nom'],
+                'prenom': ligne['personne__prenom'],
+                'categorie': ligne[champ_repartition],
+                'nombre_absences': ligne['nombre_absences'],
+            }
+            for ligne in top
+        ],
+    }
+
+
+def bornes_mois(mois):
+    """Premier et dernier jour du mois 'YYYY-MM' ; lève ValueError si invalide"""
+    debut = datetime.strptime(f"{mois}-01", '%Y-%m-%d').date()
+    return debut, debut.replace(day=monthrange(debut.year, debut.month)[1])
+
+
+# ========================================
+# RAPPORT ANNUEL / PLURIANNUEL
+# ========================================
+
+def _index_mois(jour):
+    """Numéro absolu du mois (année * 12 + mois - 1)"""
+    return jour.year * 12 + jour.month - 1
+
+
+def _cumuler(diff, nb_mois):
+    """Somme préfixe d'un tableau de différences"""
+    valeurs = []
+    courant = 0
+    for i in range(nb_mois):
+        courant += diff[i]
+        valeurs.append(courant)
+    return valeurs
+
+
+def _entete_mois(origine, i):
+    annee, mois = divmod(origine + i, 12)
+    return {'annee': annee, 'mois': mois + 1, 'nom_mois': MOIS_NOMS[mois]}
+
+
+def absences_par_mois(absences, annee_debut, annee_fin):
+    """
+    Nombre d'absences chevauchant chaque mois de [annee_debut, annee_fin],
+    au total et par type.
+
+    Une seule requête : les intervalles sont lus une fois puis répartis sur les
+    mois par tableau de différences (O(absences + mois × types)).
+    """
+    origine = annee_debut * 12
+    nb_mois = (annee_fin - annee_debut + 1) * 12
+    total = [0] * (nb_mois + 1)
+    par_type = {}
+
+    intervalles = (
+        absences.filter(filtre_chevauchement(date(annee_debut, 1, 1), date(annee_fin, 12, 31)))
+        .values_list('type_absence', 'date_debut', 'date_fin')
+        .order_by()
+    )
+    for type_absence, debut, fin in intervalles.iterator(chunk_size=2000):
+        i0 = max(_index_mois(debut) - origine, 0)
+        i1 = min(_index_mois(fin) - origine, nb_mois - 1)
+        diff = par_type.setdefault(type_absence, [0] * (nb_mois + 1))
+        for tableau in (total, diff):
+            tableau[i0] += 1
+            tableau[i1 + 1] -= 1
+
+    totaux = _cumuler(total, nb_mois)
+    cumuls_type = {t: _cumuler(diff, nb_mois) for t, diff in par_type.items()}
+    return _donnees_mensuelles(origine, nb_mois, totaux, cumuls_type)
+
+
+def absences_par_mois_service(service, annee_debut, annee_fin):
+    """Comme absences_par_mois pour un service, lu dans les compteurs journaliers"""
+    nb_mois = (annee_fin - annee_debut + 1) * 12
+    cumuls_type = absences_par_mois_et_type(service, annee_debut, annee_fin)
+    totaux = [sum(mois[i] for mois in cumuls_type.values()) for i in range(nb_mois)]
+    return _donnees_mensuelles(annee_debut * 12, nb_mois, totaux, cumuls_type)
+
+
+def _donnees_mensuelles(origine, nb_mois, totaux, cumuls_type):
+    donnees = []
+    for i in range(nb_mois):
+        donnees.append({
+            **_entete_mois(origine, i),
+            'nombre_absences': totaux[i],
+            'absences_par_type': [
+                {'type_absence': t, 'count': cumuls_type[t][i]}
+                for t in sorted(cumuls_type) if cumuls_type[t][i]
+            ]
+        })
+    return donnees
+
+
+def effectifs_par_mois(agents, annee_debut, annee_fin):
+    """
+    Effectif en fin de chaque mois, reconstitué depuis date_embauche.
+
+    Un agent inactif est compté jusqu'au mois précédant sa dernière mise à jour
+    (updated_at), seule trace disponible de sa sortie des effectifs.
+    """
+    origine = annee_debut * 12
+    nb_mois = (annee_fin - annee_debut + 1) * 12
+    diff = [0] * (nb_mois + 1)
+
+    lignes = agents.values_list(
+        'personne__date_embauche', 'personne__statut_actif', 'personne__updated_at'
+    ).order_by()
+    for date_embauche, actif, updated_at in lignes.iterator(chunk_size=2000):
+        i0 = max(_index_mois(date_embauche) - origine, 0)
+        i1 = nb_mois - 1
+        if not actif and updated_at is not None:
+            i1 = min(_index_mois(timezone.localtime(updated_at).date()) - origine - 1, i1)
+        if i0 > i1:
+            continue
+        diff[i0] += 1
+        diff[i1 + 1] -= 1
+
+    effectifs = _cumuler(diff, nb_mois)
+    return [{**_entete_mois(origine, i), 'effectif': effectifs[i]} for i in range(nb_mois)]
+
+
+def rapport_annuel(agents, absences, annee_debut, annee_fin=None):
+    """
+    Rapport d'absences sur une ou plusieurs années civiles (deux requêtes).
+    """
+    annee_fin = annee_fin or annee_debut
+    donnees = absences_par_mois(absences, annee_debut, annee_fin)
+    return _rapport_annuel(agents, donnees, annee_debut, annee_fin)
+
+
+def rapport_annuel_service(agents, service, annee_debut, annee_fin=None):
+    """Rapport annuel des absences d'un service, lu dans les compteurs journaliers"""
+    annee_fin = annee_fin or annee_debut
+    donnees = absences_par_mois_service(service, annee_debut, annee_fin)
+    return _rapport_annuel(agents, donnees, annee_debut, annee_fin)
+
+
+def _rapport_annuel(agents, donnees, annee_debut, annee_fin):
+    total = sum(d['nombre_absences'] for d in donnees)
+    trimestres = []
+    for i in range(0, len(donnees), 3):
+        bloc = donnees[i:i + 3]
+        trimestres.append({
+            'trimestre': f"T{(bloc[0]['mois'] - 1) // 3 + 1}",
+            'annee': bloc[0]['annee'],
+            'absences': sum(d['nombre_absences'] for d in bloc)
+        })
+
+    return {
+        'donnees_mensuelles': donnees,
+        'evolution_effectifs': effectifs_par_mois(agents, annee_debut, annee_fin),
+        'statistiques_annuelles': {
+            'total_absences': total,
+            'moyenne_mensuelle': round(total / len(donnees), 2),
+            'mois_plus_absences': max(donnees, key=lambda x: x['nombre_absences']),
+            'mois_moins_absences': min(donnees, key=lambda x: x['nombre_absences'])
+        },
+        'donnees_trimestrielles': trimestres,
+    }
+
+
+def parse_periode_annuelle(params):
+    """
+    Lit ?annee= ou ?annee_debut=&annee_fin= ; lève ValueError si invalide.
+    """
+    annee = int(params.get('annee', timezone.now().year))
+    annee_debut = int(params.get('annee_debut', annee))
+    annee_fin = int(params.get('annee_fin', annee_debut))
+    if annee_fin < annee_debut:
+        raise ValueError("annee_fin doit être supérieure ou égale à annee_debut")
+    if annee_fin - annee_debut + 1 > MAX_ANNEES_RAPPORT:
+        raise ValueError(f"La période est limitée à {MAX_ANNEES_RAPPORT} ans")
+    return annee_debut, annee_fin
@@ -0,0 +1,268 @@
+# myapp/scope.py
+"""
+Résolution du périmètre hiérarchique (scope) de l'utilisateur connecté.
+
+Le scope (rôle, service, type de service, personnes visibles) est calculé une
+seule fois par requête et mémorisé sur l'objet request. Il peut aussi être
+conservé dans le cache Django entre les requêtes : la clé inclut un numéro de
+version incrémenté par les signaux dès que Service.chef_service ou
+Personne.service change (voir signals.py).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+
+SCOPE_CACHE_VERSION_KEY = 'scope:version'
+
+
+class ScopeUtilisateur:
+    """Périmètre de visibilité d'un utilisateur"""
+
+    def __init__(self, user_id, role, service_id=None, service_nom=None,
+                 type_service=None, personne_id=None):
+        self.user_id = user_id
+        self.role = role
+        self.service_id = service_id
+        self.service_nom = service_nom
+        self.type_service = type_service
+        self.personne_id = personne_id
+        self._personne_ids = None
+        self._service = None
+
+    @property
+    def is_admin_rh(self):
+        return self.role == 'admin_rh'
+
+    @property
+    def is_chef(self):
+        return bool(self.role) and self.role.startswith('chef_')
+
+    @property
+    def has_service(self):
+        return self.service_id is not None
+
+    def service_info(self):
+        """Infos du service au format renvoyé par l'API"""
+        if not self.has_service:
+            return None
+        return {
+            'id': self.service_id,
+            'nom': self.service_nom,
+            'type_service': self.type_service
+        }
+
+    def service(self):
+        """
+        Instance Service complète, chargée au plus une fois par scope (donc par
+        requête). Lève Service.DoesNotExist si le service a été supprimé depuis
+        la mise en cache du scope.
+        """
+        if not self.has_service:
+            return None
+        if self._service is None:
+            from .models import Service
+            self._service = Service.objects.get(pk=self.service_id)
+        return self._service
+
+    def personne_ids(self):
+        """Ids des personnes visibles (None = toutes, pour l'Admin RH)"""
+        if self.is_admin_rh:
+            return None
+        if self._personne_ids is None:
+            from .models import Personne
+            if self.is_chef:
+                if self.has_service:
+                    self._personne_ids = list(
+                        Personne.objects.filter(service_id=self.service_id).values_list('id', flat=True)
+                    )
+                else:
+                    self._personne_ids = []
+            else:
+                self._personne_ids = [self.personne_id] if self.personne_id else []
+        return self._personne_ids
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'role': self.role,
+            'service_id': self.service_id,
+            'service_nom': self.service_nom,
+            'type_service': self.type_service,
+            'personne_id': self.personne_id,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def get_scope_version():
+    """Version courante des scopes en cache"""
+    version = cache.get(SCOPE_CACHE_VERSION_KEY)
+    if version is None:
+        cache.add(SCOPE_CACHE_VERSION_KEY, 1, None)
+        version = cache.get(SCOPE_CACHE_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_scopes():
+    """Invalide tous les scopes en cache (appelé par les signaux)"""
+    try:
+        cache.incr(SCOPE_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(SCOPE_CACHE_VERSION_KEY, 2, None)
+
+
+def _cache_key(user):
+    return f"scope:{get_scope_version()}:{user.pk}:{user.role}"
+
+
+def _calculer_scope(user):
+    """Calcule le scope depuis la base (une requête au maximum)"""
+    from .models import Personne, Service
+
+    role = getattr(user, 'role', None) or 'employe'
+    if role == 'admin_rh':
+        return ScopeUtilisateur(user.pk, role)
+
+    if role.startswith('chef_'):
+        service = Service.objects.filter(chef_service=user).order_by('id').first()
+        if service is None:
+            return ScopeUtilisateur(user.pk, role)
+        scope = ScopeUtilisateur(
+            user.pk, role,
+            service_id=service.id,
+            service_nom=service.nom,
+            type_service=service.type_service
+        )
+        # Ligne complète déjà lue : service() ne refera pas de requête
+        scope._service = service
+        return scope
+
+    personne = (
+        Personne.objects.filter(user=user)
+        .select_related('service')
+        .only('id', 'service__id', 'service__nom', 'service__type_service')
+        .first()
+    )
+    if personne is None:
+        return ScopeUtilisateur(user.pk, role)
+    return ScopeUtilisateur(
+        user.pk, role,
+        service_id=personne.service.id,
+        service_nom=personne.service.nom,
+        type_service=personne.service.type_service,
+        personne_id=personne.id
+    )
+
+
+def get_scope(request_or_user):
+    """
+    Retourne le scope de l'utilisateur.
+
+    Accepte une request (DRF ou Django) ou directement un utilisateur ; dans le
+    premier cas le résultat est mémorisé sur la request.
+    """
+    request = None
+    user = request_or_user
+    if hasattr(request_or_user, 'user') and not hasattr(request_or_user, 'role'):
+        request = request_or_user
+        user = request.user
+        # La request DRF enveloppe la HttpRequest : on mémorise sur cette dernière
+        request = getattr(request, '_request', request)
+        scope = getattr(request, '_scope_utilisateur', None)
+        if scope is not None and scope.user_id == user.pk:
+            return scope
+
+    if user is None or not user.is_authenticated:
+        return None
+
+    timeout = getattr(settings, 'SCOPE_CACHE_TIMEOUT', 0)
+    scope = None
+    if timeout:
+        key = _cache_key(user)
+        data = cache.get(key)
+        if data is not None:
+            scope = ScopeUtilisateur.from_dict(data)
+        else:
+            scope = _calculer_scope(user)
+            cache.set(key, scope.to_dict(), timeout)
+    else:
+        scope = _calculer_scope(user)
+
+    if request is not None:
+        request._scope_utilisateur = scope
+    return scope
+
+
+def get_service_du_chef(request, type_service=None):
+    """
+    Service dirigé par le chef connecté, résolu depuis le scope.
+    Lève Service.DoesNotExist comme Service.objects.get(chef_service=user).
+    """
+    from .models import Service
+
+    scope = get_scope(request)
+    if scope is None or not scope.is_chef or not scope.has_service:
+        raise Service.DoesNotExist
+    if type_service and scope.type_service != type_service:
+        raise Service.DoesNotExist
+    return scope.service()
+
+
+class ScopeQuerysetMixin:
+    """
+    Mixin de filtrage hiérarchique des querysets.
+
+    Les ViewSets déclarent les chemins ORM vers le service et vers l'utilisateur
+    propriétaire ; le mixin applique la règle commune :
+    - admin_rh : tout
+    - chef_* (autorisé) : les objets de son service
+    - autres : ses propres objets (ou ceux de son service si scope_employe_par_service)
+    """
+    scope_service_field = 'personne__service'
+    scope_user_field = 'personne__user'
+    scope_chef_roles = None           # None = tous les rôles chef_*
+    scope_type_service = None         # Type de service exigé pour le chef
+    scope_employe_par_service = False
+
+    def get_scope(self):
+        return get_scope(self.request)
+
+    def get_scope_service_q(self, scope):
+        """Filtre appliqué pour un chef (surchargeable pour les cas composés)"""
+        return Q(**{f"{self.scope_service_field}_id": scope.service_id})
+
+    def get_scope_employe_q(self, scope):
+        """Filtre appliqué pour un employé"""
+        if self.scope_employe_par_service:
+            if not scope.has_service:
+                return None
+            return Q(**{f"{self.scope_service_field}_id": scope.service_id})
+        if self.scope_user_field is None:
+            return None
+        return Q(**{self.scope_user_field: scope.user_id})
+
+    def filter_queryset_by_scope(self, queryset):
+        scope = self.get_scope()
+        if scope is None:
+            return queryset.none()
+
+        if scope.is_admin_rh:
+            return queryset
+
+        if scope.is_chef and (self.scope_chef_roles is None or scope.role in self.scope_chef_roles):
+            if not scope.has_service:
+                return queryset.none()
+            if self.scope_type_service and scope.type_service != self.scope_type_service:
+                return queryset.none()
+            return queryset.filter(self.get_scope_service_q(scope))
+
+        q = self.get_scope_employe_q(scope)
+        if q is None:
+            return queryset.none()
+        return queryset.filter(q)
+
+    def get_queryset(self):
+        return self.filter_queryset_by_scope(super().get_queryset())
@@ -1,11 +1,15 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from django.db.models import Count, F, Prefetch, Q, Window
+from django.db.models.functions import RowNumber
 from .models import (
     User, Service, Structure, Personne, Enseignant, PersonnelPAT, Contractuel,
-    Recrutement, Candidat, Absence, Paie, ElementPaie, Detachement, Document,
+    Recrutement, Candidat, Absence, HistoriqueAbsence, Paie, ElementPaie, LancementPaie,
+    Tache, Detachement, Document,
     StatutOffre, TypeStructure,  TypeContrat, TypeAbsence,
     StatutPaiement, StatutAbsence, TypeDocument, StatutCandidature
 )
+from .scope import get_scope
 
 
 # ========================================
@@ -36,15 +40,21 @@ class UserSerializer(serializers.ModelSerializer):
     def get_service_info(self, obj):
         """Retourne les infos du service selon le rôle"""
         if obj.role.startswith('chef_'):
-            try:
-                service = Service.objects.get(chef_service=obj)
-                return {
-                    'id': service.id,
-                    'nom': service.nom,
-                    'type_service': service.type_service
-                }
-            except Service.DoesNotExist:
+            if hasattr(obj, 'services_diriges'):
+                # Services préchargés par UserViewSet.get_queryset
+                service = obj.services_diriges[0] if obj.services_diriges else None
+            else:
+                request = self.context.get('request')
+                if request is not None and request.user.pk == obj.pk:
+                    return get_scope(request).service_info()
+                service = Service.objects.filter(chef_service=obj).order_by('id').first()
+            if service is None:
                 return None
+            return {
+                'id': service.id,
+                'nom': service.nom,
+                'type_service': service.type_service
+            }
         elif hasattr(obj, 'personne') and obj.personne.service:
             service = obj.personne.service
             return {
@@ -96,10 +106,18 @@ class ServiceSerializer(serializers.ModelSerializer):
         ]
     
     def get_nombre_employes(self, obj):
+        if hasattr(obj, 'nombre_employes'):
+            return obj.nombre_employes
         return obj.employes.count()
     
     def get_repartition_employes(self, obj):
-        """Répartition des employés par type"""
+        """Répartition des employés par type (annotations de annoter_effectifs_services si présentes)"""
+        if hasattr(obj, 'nombre_enseignants'):
+            return {
+                'enseignant': obj.nombre_enseignants,
+                'pat': obj.nombre_pat,
+                'contractuel': obj.nombre_contractuels,
+            }
         employes = obj.employes.all()
         return {
             'enseignant': employes.filter(type_employe='enseignant').count(),
@@ -114,6 +132,19 @@ class ServiceSerializer(serializers.ModelSerializer):
         return value
 
 
+def annoter_effectifs_services(queryset):
+    """
+    Annote les effectifs de chaque service (total et par type d'employé) en une
+    seule requête agrégée, et charge le chef de service dans la même requête.
+    """
+    return queryset.select_related('chef_service').annotate(
+        nombre_employes=Count('employes'),
+        nombre_enseignants=Count('employes', filter=Q(employes__type_employe='enseignant')),
+        nombre_pat=Count('employes', filter=Q(employes__type_employe='pat')),
+        nombre_contractuels=Count('employes', filter=Q(employes__type_employe='contractuel')),
+    )
+
+
 class PersonneSerializer(serializers.ModelSerializer):
     manager_nom = serializers.CharField(source='manager.nom', read_only=True)
     manager_prenom = serializers.CharField(source='manager.prenom', read_only=True)
@@ -124,6 +155,8 @@ class PersonneSerializer(serializers.ModelSerializer):
     user_username = serializers.CharField(source='user.username', read_only=True)
     age = serializers.SerializerMethodField()
     nom_complet = serializers.SerializerMethodField()
+    # Colonnes lues par les SerializerMethodField (champs.py : ?fields= réduit les requêtes)
+    dependances_champs = {'age': ('date_naissance',), 'nom_complet': ('prenom', 'nom')}
     
     class Meta:
         model = Personne
@@ -182,6 +215,7 @@ class EnseignantSerializer(serializers.ModelSerializer):
     personne_nom_complet = serializers.CharField(source='personne.prenom', read_only=True)
     personne_service = serializers.CharField(source='personne.service.nom', read_only=True)
     anciennete_service = serializers.SerializerMethodField()
+    dependances_champs = {'anciennete_service': ('date_entree_enseignement_superieur',)}
     
     class Meta:
         model = Enseignant
@@ -225,6 +259,11 @@ class PersonnelPATSerializer(serializers.ModelSerializer):
     
     # ✅ IMPORTANT: Ajouter l'ID pour les clés uniques dans le frontend
     id = serializers.IntegerField(source='personne.id', read_only=True)
+    dependances_champs = {
+        'personne_nom_complet': ('personne__prenom', 'personne__nom'),
+        'poste_label': ('poste',),
+        'anciennete_grade_annees': ('date_nomination',),
+    }
     
     class Meta:
         model = PersonnelPAT
@@ -290,6 +329,10 @@ class ContractuelSerializer(serializers.ModelSerializer):
     personne_service = serializers.CharField(source='personne.service.nom', read_only=True)
     duree_contrat_jours = serializers.SerializerMethodField()
     jours_restants = serializers.SerializerMethodField()
+    dependances_champs = {
+        'duree_contrat_jours': ('date_debut_contrat', 'date_fin_contrat'),
+        'jours_restants': ('date_fin_contrat',),
+    }
     
     class Meta:
         model = Contractuel
@@ -355,6 +398,14 @@ class StructureSerializer(serializers.ModelSerializer):
     
     def get_nombre_employes(self, obj):
         return obj.employes.count() if hasattr(obj, 'employes') else 0
+    
+    def validate_parent_structure(self, value):
+        """Empêcher de rattacher une structure à elle-même ou à l'un de ses descendants"""
+        if value and self.instance and self.instance.chemin and value.chemin.startswith(self.instance.chemin):
+            raise serializers.ValidationError(
+                "Une structure ne peut pas être rattachée à l'une de ses sous-structures"
+            )
+        return value
 
 
 class RecrutementSerializer(serializers.ModelSerializer):
@@ -404,6 +455,11 @@ class AbsenceSerializer(serializers.ModelSerializer):
         required=False,  # Rendre optionnel pour permettre aux employés de ne pas le fournir
         allow_null=True
     )
+    # peut_approuver compare l'utilisateur au chef du service de la personne
+    dependances_champs = {
+        'duree_absence': ('date_debut', 'date_fin'),
+        'peut_approuver': ('personne__service__chef_service',),
+    }
     
     class Meta:
         model = Absence
@@ -426,6 +482,34 @@ class AbsenceSerializer(serializers.ModelSerializer):
         return False
 
 
+class AbsenceValidationSerializer(AbsenceSerializer):
+    """
+    Absence de la file de validation (approbations.annoter_file) : urgence et
+    approbateur_id sont annotés, peut_approuver ne déclenche aucune requête.
+    """
+    urgence = serializers.CharField(read_only=True)
+    
+    class Meta(AbsenceSerializer.Meta):
+        fields = AbsenceSerializer.Meta.fields + ['urgence']
+    
+    def get_peut_approuver(self, obj):
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            return request.user.role == 'admin_rh' or obj.approbateur_id == request.user.id
+        return False
+
+
+class HistoriqueAbsenceSerializer(serializers.ModelSerializer):
+    effectue_par_nom = serializers.CharField(source='effectue_par.get_full_name', read_only=True)
+    
+    class Meta:
+        model = HistoriqueAbsence
+        fields = [
+            'id', 'absence', 'statut_precedent', 'statut_nouveau', 'commentaire',
+            'effectue_par', 'effectue_par_nom', 'en_lot', 'date_action'
+        ]
+
+
 class ElementPaieSerializer(serializers.ModelSerializer):
     """Serializer pour les éléments détaillés du bulletin"""
     class Meta:
@@ -458,6 +542,40 @@ class PaieSerializer(serializers.ModelSerializer):
         ]
 
 
+class LancementPaieSerializer(serializers.ModelSerializer):
+    service_nom = serializers.CharField(source='service.nom', read_only=True)
+    lance_par_nom = serializers.CharField(source='lance_par.get_full_name', read_only=True)
+    progression = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = LancementPaie
+        fields = [
+            'id', 'mois_annee', 'date_paiement', 'service', 'service_nom', 'personnes',
+            'statut', 'nombre_total', 'nombre_traites', 'nombre_ignores', 'nombre_sans_carriere', 'progression',
+            'dernier_personne_id', 'erreur', 'lance_par', 'lance_par_nom',
+            'date_lancement', 'date_fin'
+        ]
+        read_only_fields = fields
+
+
+class TacheSerializer(serializers.ModelSerializer):
+    type_libelle = serializers.CharField(source='get_type_tache_display', read_only=True)
+    cree_par_nom = serializers.CharField(source='cree_par.get_full_name', read_only=True)
+    resultat_disponible = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Tache
+        fields = [
+            'id', 'type_tache', 'type_libelle', 'parametres', 'statut', 'progression',
+            'message', 'erreur', 'resultat_disponible', 'cree_par', 'cree_par_nom',
+            'date_creation', 'date_debut', 'date_fin', 'expire_le'
+        ]
+        read_only_fields = fields
+    
+    def get_resultat_disponible(self, obj):
+        return obj.statut == 'TERMINE'
+
+
 class DetachementSerializer(serializers.ModelSerializer):
     personne_nom = serializers.CharField(source='personne.nom', read_only=True)
     personne_prenom = serializers.CharField(source='personne.prenom', read_only=True)
@@ -484,6 +602,7 @@ class DocumentSerializer(serializers.ModelSerializer):
     proprietaire_prenom = serializers.CharField(source='proprietaire.prenom', read_only=True)
     uploade_par_nom = serializers.CharField(source='uploade_par.get_full_name', read_only=True)
     taille_fichier_mb = serializers.SerializerMethodField()
+    dependances_champs = {'taille_fichier_mb': ('taille_fichier',)}
     
     class Meta:
         model = Document
@@ -613,10 +732,163 @@ class DocumentSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+# ========================================
+# SERIALIZERS DE LISTE COMPACTS
+# ========================================
+# Variantes des listes servies par ?compact=true (sélecteurs, application mobile) :
+# colonnes directes ou via une seule jointure, sans SerializerMethodField
+
+class PersonneListeSerializer(serializers.ModelSerializer):
+    service_nom = serializers.CharField(source='service.nom', read_only=True, default=None)
+    
+    class Meta:
+        model = Personne
+        fields = ['id', 'nom', 'prenom', 'numero_employe', 'fonction', 'service_nom']
+        read_only_fields = fields
+
+
+class EnseignantListeSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='pk', read_only=True)
+    nom = serializers.CharField(source='personne.nom', read_only=True)
+    prenom = serializers.CharField(source='personne.prenom', read_only=True)
+    numero_employe = serializers.CharField(source='personne.numero_employe', read_only=True)
+    service_nom = serializers.CharField(source='personne.service.nom', read_only=True, default=None)
+    
+    class Meta:
+        model = Enseignant
+        fields = ['id', 'nom', 'prenom', 'numero_employe', 'service_nom', 'grade', 'echelon', 'indice']
+        read_only_fields = fields
+
+
+class PersonnelPATListeSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='pk', read_only=True)
+    nom = serializers.CharField(source='personne.nom', read_only=True)
+    prenom = serializers.CharField(source='personne.prenom', read_only=True)
+    numero_employe = serializers.CharField(source='personne.numero_employe', read_only=True)
+    service_nom = serializers.CharField(source='personne.service.nom', read_only=True, default=None)
+    
+    class Meta:
+        model = PersonnelPAT
+        fields = ['id', 'nom', 'prenom', 'numero_employe', 'service_nom', 'grade', 'poste', 'indice']
+        read_only_fields = fields
+
+
+class ContractuelListeSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='pk', read_only=True)
+    nom = serializers.CharField(source='personne.nom', read_only=True)
+    prenom = serializers.CharField(source='personne.prenom', read_only=True)
+    numero_employe = serializers.CharField(source='personne.numero_employe', read_only=True)
+    service_nom = serializers.CharField(source='personne.service.nom', read_only=True, default=None)
+    
+    class Meta:
+        model = Contractuel
+        fields = ['id', 'nom', 'prenom', 'numero_employe', 'service_nom', 'type_contrat', 'date_fin_contrat']
+        read_only_fields = fields
+
+
+class AbsenceListeSerializer(serializers.ModelSerializer):
+    personne_nom = serializers.CharField(source='personne.nom', read_only=True)
+    personne_prenom = serializers.CharField(source='personne.prenom', read_only=True)
+    
+    class Meta:
+        model = Absence
+        fields = [
+            'id', 'personne', 'personne_nom', 'personne_prenom',
+            'type_absence', 'date_debut', 'date_fin', 'statut'
+        ]
+        read_only_fields = fields
+
+
 # ========================================
 # SERIALIZERS DÉTAILLÉS
 # ========================================
 
+# Sections du profil détaillé sélectionnables par ?include= / ?exclude=
+PROFIL_SECTIONS = ('absences', 'paies', 'documents', 'detachements', 'equipe', 'type_employe_details')
+
+# Historiques limitables par ?limite= (toutes) ou ?limite_<section>= : tri du plus récent au plus ancien
+# section -> (champ propriétaire, tri)
+PROFIL_HISTORIQUES = {
+    'absences': ('personne', '-date_debut'),
+    'paies': ('personne', '-mois_annee'),
+    'documents': ('proprietaire', '-date_upload'),
+    'detachements': ('personne', '-date_debut_detachement'),
+}
+
+
+def parse_options_profil(params):
+    """
+    Lit ?include=, ?exclude=, ?limite= et ?limite_<section>= ; lève ValueError si invalide.
+    Retourne (sections, limites).
+    """
+    def _liste(nom):
+        valeurs = [v.strip() for v in params.get(nom, '').split(',') if v.strip()]
+        inconnues = set(valeurs) - set(PROFIL_SECTIONS)
+        if inconnues:
+            raise ValueError(f"Sections inconnues: {', '.join(sorted(inconnues))}")
+        return valeurs
+
+    include = _liste('include')
+    exclude = _liste('exclude')
+    sections = set(include or PROFIL_SECTIONS) - set(exclude)
+
+    limites = {}
+    for section in PROFIL_HISTORIQUES:
+        valeur = params.get(f'limite_{section}', params.get('limite'))
+        if valeur in (None, ''):
+            continue
+        try:
+            limite = int(valeur)
+        except ValueError:
+            raise ValueError(f"Limite invalide pour {section}: {valeur}")
+        if limite < 0:
+            raise ValueError("La limite doit être positive")
+        limites[section] = limite
+    return sections, limites
+
+
+def prefetch_profil(queryset, sections=PROFIL_SECTIONS, limites=None):
+    """
+    Plan de requêtes du profil détaillé : une requête pour la personne (service,
+    chef, utilisateur, manager, fiche enseignant/PAT/contractuel) puis une par
+    section incluse, quel que soit le volume de l'historique.
+    """
+    limites = limites or {}
+    queryset = queryset.select_related(
+        'service__chef_service', 'user', 'manager',
+        'enseignant', 'personnelpat', 'contractuel'
+    )
+
+    def _historique(section, qs):
+        if section in limites:
+            # N plus récents par propriétaire (fonction fenêtre : compatible prefetch)
+            proprietaire, tri = PROFIL_HISTORIQUES[section]
+            ordre = [F(tri[1:]).desc(), F('id').desc()]
+            qs = qs.annotate(
+                rang_profil=Window(RowNumber(), partition_by=F(proprietaire), order_by=ordre)
+            ).filter(rang_profil__lte=limites[section]).order_by(*ordre)
+        return Prefetch(section, queryset=qs)
+
+    prefetches = []
+    if 'absences' in sections:
+        prefetches.append(_historique('absences', Absence.objects.select_related('approuve_par')))
+    if 'paies' in sections:
+        prefetches.append(_historique('paies', Paie.objects.select_related('traite_par')))
+        prefetches.append('paies__elements')
+    if 'documents' in sections:
+        prefetches.append(_historique('documents', Document.objects.select_related('uploade_par')))
+    if 'detachements' in sections:
+        prefetches.append(_historique(
+            'detachements',
+            Detachement.objects.select_related('structure_origine', 'structure_detachement')
+        ))
+    if 'equipe' in sections:
+        prefetches.append(Prefetch(
+            'equipe', queryset=Personne.objects.select_related('service__chef_service', 'user')
+        ))
+    return queryset.prefetch_related(*prefetches)
+
+
 class PersonneDetailSerializer(serializers.ModelSerializer):
     """Sérialiseur détaillé pour une personne avec toutes ses relations"""
     absences = AbsenceSerializer(many=True, read_only=True)
@@ -634,6 +906,15 @@ class PersonneDetailSerializer(serializers.ModelSerializer):
         model = Personne
         fields = '__all__'
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sections retenues par parse_options_profil (toutes par défaut)
+        sections = self.context.get('sections_profil')
+        if sections is not None:
+            for section in PROFIL_SECTIONS:
+                if section not in sections:
+                    self.fields.pop(section, None)
+    
     def get_service_info(self, obj):
         if obj.service:
             return {
@@ -684,7 +965,14 @@ class PersonneDetailSerializer(serializers.ModelSerializer):
 
 
 class StructureTreeSerializer(serializers.ModelSerializer):
-    """Sérialiseur pour l'arborescence des structures"""
+    """
+    Sérialiseur pour l'arborescence des structures.
+
+    Si le contexte fournit 'enfants' ({parent_id: [structures]}, voir
+    StructureViewSet.arborescence), l'arbre est assemblé en mémoire sans requête ;
+    'max_depth' limite la profondeur et 'effectifs' ({structure_id: (directs, total)})
+    ajoute les effectifs de chaque nœud.
+    """
     sous_structures = serializers.SerializerMethodField()
     service_nom = serializers.CharField(source='service.nom', read_only=True)
     
@@ -696,9 +984,28 @@ class StructureTreeSerializer(serializers.ModelSerializer):
         ]
     
     def get_sous_structures(self, obj):
-        if obj.sous_structures.exists():
-            return StructureTreeSerializer(obj.sous_structures.all(), many=True).data
-        return []
+        enfants = self.context.get('enfants')
+        if enfants is None:
+            if obj.sous_structures.exists():
+                return StructureTreeSerializer(obj.sous_structures.all(), many=True).data
+            return []
+        
+        profondeur = self.context.get('profondeur', 1)
+        max_depth = self.context.get('max_depth')
+        if max_depth is not None and profondeur >= max_depth:
+            return []
+        # Protection contre les cycles parent/enfant en base
+        chemin = self.context.get('chemin', frozenset()) | {obj.id}
+        sous_structures = [s for s in enfants.get(obj.id, []) if s.id not in chemin]
+        contexte = {**self.context, 'profondeur': profondeur + 1, 'chemin': chemin}
+        return StructureTreeSerializer(sous_structures, many=True, context=contexte).data
+    
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        effectifs = self.context.get('effectifs')
+        if effectifs is not None:
+            data['nombre_employes'], data['nombre_employes_total'] = effectifs.get(instance.id, (0, 0))
+        return data
 
 
 # ========================================
@@ -0,0 +1,174 @@
+# myapp/signals.py
+"""
+Signaux d'invalidation des caches dérivés des modèles.
+"""
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import compteurs, livre_paie
+from .models import Absence, Paie, Personne, Service
+from .scope import invalidate_scopes
+
+
+# ========================================
+# SCOPE HIÉRARCHIQUE (voir scope.py)
+# ========================================
+
+def _snapshot(instance, champs):
+    # Lecture via __dict__ : ne déclenche pas de requête sur les champs différés
+    return tuple(instance.__dict__.get(champ) for champ in champs)
+
+
+SERVICE_CHAMPS_SCOPE = ('chef_service_id', 'nom', 'type_service')
+PERSONNE_CHAMPS_SCOPE = ('service_id', 'user_id')
+
+
+@receiver(post_init, sender=Service)
+def memoriser_chef_service(sender, instance, **kwargs):
+    instance._scope_snapshot = _snapshot(instance, SERVICE_CHAMPS_SCOPE)
+
+
+@receiver(post_save, sender=Service)
+def service_modifie(sender, instance, created, **kwargs):
+    snapshot = _snapshot(instance, SERVICE_CHAMPS_SCOPE)
+    if created or snapshot != getattr(instance, '_scope_snapshot', None):
+        invalidate_scopes()
+    instance._scope_snapshot = snapshot
+
+
+@receiver(post_init, sender=Personne)
+def memoriser_service_personne(sender, instance, **kwargs):
+    instance._scope_snapshot = _snapshot(instance, PERSONNE_CHAMPS_SCOPE)
+
+
+@receiver(post_save, sender=Personne)
+def personne_modifiee(sender, instance, created, **kwargs):
+    snapshot = _snapshot(instance, PERSONNE_CHAMPS_SCOPE)
+    if created or snapshot != getattr(instance, '_scope_snapshot', None):
+        invalidate_scopes()
+    instance._scope_snapshot = snapshot
+
+
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=Personne)
+def scope_supprime(sender, instance, **kwargs):
+    invalidate_scopes()
+
+
+# ========================================
+# COMPTEURS D'ABSENCES (voir compteurs.py)
+# ========================================
+# L'état précédent est relu en base (pre_save) : il reste exact même si
+# l'instance a été chargée avec des champs différés.
+
+def _service_de(personne_id):
+    return Personne.objects.filter(pk=personne_id).values_list('service_id', flat=True).first()
+
+
+@receiver(pre_save, sender=Absence)
+def memoriser_absence_compteurs(sender, instance, raw=False, **kwargs):
+    instance._compteurs_avant = None
+    if not raw and instance.pk is not None and not instance._state.adding:
+        instance._compteurs_avant = (
+            Absence.objects.filter(pk=instance.pk)
+            .values_list('personne__service_id', *compteurs.CHAMPS_ABSENCE)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Absence)
+def absence_enregistree(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    apres = (_service_de(instance.personne_id), *(getattr(instance, c) for c in compteurs.CHAMPS_ABSENCE))
+    compteurs.absence_modifiee(getattr(instance, '_compteurs_avant', None), apres)
+    instance._compteurs_avant = None
+
+
+@receiver(post_delete, sender=Absence)
+def absence_supprimee(sender, instance, origin=None, **kwargs):
+    # Suppression d'un service : ses compteurs sont supprimés en cascade
+    if isinstance(origin, Service) or getattr(origin, 'model', None) is Service:
+        return
+    avant = (_service_de(instance.personne_id), *(getattr(instance, c) for c in compteurs.CHAMPS_ABSENCE))
+    compteurs.absence_modifiee(avant, None)
+
+
+@receiver(pre_save, sender=Personne)
+def memoriser_service_compteurs(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._compteurs_service_avant = None
+    if raw or instance.pk is None or instance._state.adding:
+        return
+    if update_fields is not None and 'service' not in update_fields and 'service_id' not in update_fields:
+        return
+    instance._compteurs_service_avant = (_service_de(instance.pk),)
+
+
+@receiver(post_save, sender=Personne)
+def service_personne_modifie(sender, instance, **kwargs):
+    avant = getattr(instance, '_compteurs_service_avant', None)
+    instance._compteurs_service_avant = None
+    if avant is not None and avant[0] != instance.service_id:
+        compteurs.changer_service(instance.pk, avant[0], instance.service_id)
+
+
+# ========================================
+# LIVRE DE PAIE (voir livre_paie.py)
+# ========================================
+# Les compartiments (mois, service) touchés sont recalculés à la validation
+# de la transaction ; l'état précédent est relu en base comme pour les compteurs.
+
+@receiver(pre_save, sender=Paie)
+def memoriser_paie_livre(sender, instance, raw=False, **kwargs):
+    instance._livre_avant = None
+    if not raw and instance.pk is not None and not instance._state.adding:
+        instance._livre_avant = (
+            Paie.objects.filter(pk=instance.pk)
+            .values_list('personne_id', 'mois_annee', 'personne__service_id')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Paie)
+def paie_enregistree(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    avant = getattr(instance, '_livre_avant', None)
+    instance._livre_avant = None
+    if avant is not None:
+        personne_id, mois_annee, service_id = avant
+        livre_paie.marquer(mois_annee, service_id)
+        if personne_id != instance.personne_id:
+            service_id = _service_de(instance.personne_id)
+    else:
+        service_id = _service_de(instance.personne_id)
+    livre_paie.marquer(instance.mois_annee, service_id)
+
+
+@receiver(post_delete, sender=Paie)
+def paie_supprimee(sender, instance, origin=None, **kwargs):
+    # Suppression d'un service : ses lignes du livre sont supprimées en cascade
+    if isinstance(origin, Service) or getattr(origin, 'model', None) is Service:
+        return
+    livre_paie.marquer(instance.mois_annee, _service_de(instance.personne_id))
+
+
+@receiver(pre_save, sender=Personne)
+def memoriser_agent_livre(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._livre_agent_avant = None
+    if raw or instance.pk is None or instance._state.adding:
+        return
+    champs = {'service', 'service_id', 'type_employe'}
+    if update_fields is not None and not champs.intersection(update_fields):
+        return
+    instance._livre_agent_avant = (
+        Personne.objects.filter(pk=instance.pk).values_list('service_id', 'type_employe').first()
+    )
+
+
+@receiver(post_save, sender=Personne)
+def agent_livre_modifie(sender, instance, **kwargs):
+    avant = getattr(instance, '_livre_agent_avant', None)
+    instance._livre_agent_avant = None
+    if avant is not None and avant != (instance.service_id, instance.type_employe):
+        livre_paie.changer_agent(instance.pk, avant[0], instance.service_id)
@@ -0,0 +1,299 @@
+# myapp/simulation.py
+"""
+Simulation de la masse salariale (« que coûterait… ? »), sans écriture en base.
+
+L'effectif actif est chargé en une requête sous forme de colonnes (indice,
+échelon, NBI, salaire contractuel, enfants…). Les règles de
+moteur_paie.calculer_paie sont appliquées à toutes les personnes à la fois :
+sur des tableaux NumPy s'il est installé, sinon personne par personne en
+Python. La paie actuelle (paramètres en vigueur) et la paie simulée
+(paramètres modifiés par le scénario) sont calculées par le même moteur : les
+écarts ne mesurent que l'effet du scénario.
+
+Un scénario surcharge les clés de moteur_paie.PARAMETRES_PAIE et peut ajouter :
+- revalorisation_indice : taux appliqué aux indices (0.05 = +5 %, arrondi à l'entier)
+- revalorisation_contractuel : taux appliqué aux salaires contractuels
+"""
+import math
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Paie, Personne
+from .moteur_paie import PARAMETRES_PAIE, _numero_echelon, get_parametres
+
+try:
+    import numpy as np
+except ImportError:  # NumPy est optionnel
+    np = None
+
+
+REVALORISATIONS = ('revalorisation_indice', 'revalorisation_contractuel')
+MONTANTS = ('brut', 'net', 'deductions', 'allocations')
+# Personnes les plus touchées renvoyées par défaut
+LIMITE_PERSONNES = 100
+
+
+# ========================================
+# SCÉNARIO
+# ========================================
+
+def _nombre(cle, valeur):
+    try:
+        return float(Decimal(str(valeur)))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"{cle} : nombre attendu")
+
+
+def parametres_scenario(scenario):
+    """
+    Paramètres de paie numériques (float) du scénario : paramètres en vigueur
+    surchargés par le scénario. Lève ValueError si une clé ou une valeur est invalide.
+    """
+    scenario = scenario or {}
+    inconnues = set(scenario) - set(PARAMETRES_PAIE) - set(REVALORISATIONS)
+    if inconnues:
+        raise ValueError(f"Paramètres inconnus : {', '.join(sorted(inconnues))}")
+
+    brut = get_parametres()
+    parametres = {cle: _nombre(cle, brut[cle]) for cle in PARAMETRES_PAIE
+                  if cle not in ('indemnites_grade', 'bareme_its')}
+    parametres['indemnites_grade'] = {grade: _nombre(grade, v) for grade, v in brut['indemnites_grade'].items()}
+    parametres['bareme_its'] = [(None if plafond is None else _nombre('bareme_its', plafond), _nombre('bareme_its', taux))
+                                for plafond, taux in brut['bareme_its']]
+    parametres.update(dict.fromkeys(REVALORISATIONS, 0.0))
+
+    for cle, valeur in scenario.items():
+        if cle == 'indemnites_grade':
+            if not isinstance(valeur, dict):
+                raise ValueError("indemnites_grade : objet {grade: montant} attendu")
+            # Seuls les grades cités changent
+            parametres[cle] = {**parametres[cle], **{g: _nombre(g, v) for g, v in valeur.items()}}
+        elif cle == 'bareme_its':
+            if not isinstance(valeur, list) or not valeur or any(
+                    not isinstance(t, (list, tuple)) or len(t) != 2 for t in valeur):
+                raise ValueError("bareme_its : liste de [plafond ou null, taux] attendue")
+            parametres[cle] = [(None if p is None else _nombre(cle, p), _nombre(cle, t)) for p, t in valeur]
+        else:
+            parametres[cle] = _nombre(cle, valeur)
+    return parametres
+
+
+# ========================================
+# EFFECTIF EN COLONNES
+# ========================================
+
+def charger_effectif(service=None):
+    """
+    Personnes actives dont la paie est calculable (mêmes règles que
+    moteur_paie.donnees_carriere), en colonnes. Une requête ; le nombre
+    d'enfants est celui de la dernière paie.
+    """
+    personnes = Personne.objects.filter(statut_actif=True)
+    if service is not None:
+        personnes = personnes.filter(service=service)
+    derniere_paie = Paie.objects.filter(personne=OuterRef('pk')).order_by('-mois_annee').values('nb_enfants')[:1]
+    lignes = (
+        personnes
+        .annotate(enfants=Coalesce(Subquery(derniere_paie), Value(0), output_field=IntegerField()))
+        .values_list(
+            'id', 'numero_employe', 'nom', 'prenom', 'type_employe', 'service_id', 'service__nom',
+            'enseignant__grade', 'enseignant__echelon', 'enseignant__indice',
+            'personnelpat__grade', 'personnelpat__anciennete_echelon', 'personnelpat__indice',
+            'personnelpat__nbi_mac', 'contractuel__salaire_mensuel', 'enfants',
+        )
+        .order_by('id')
+    )
+
+    effectif = {cle: [] for cle in (
+        'id', 'numero_employe', 'nom', 'service_id', 'service_nom', 'grade',
+        'contractuel', 'indice', 'echelon', 'nbi', 'salaire_contractuel', 'nb_enfants',
+    )}
+    ignores = 0
+    for (pk, numero, nom, prenom, type_employe, service_id, service_nom,
+         ens_grade, ens_echelon, ens_indice, pat_grade, pat_echelon, pat_indice, pat_nbi,
+         salaire, enfants) in lignes:
+        if type_employe == 'enseignant' and ens_indice is not None:
+            colonnes = (ens_grade, 0, ens_indice, _numero_echelon(ens_echelon), 0, 0)
+        elif type_employe == 'pat' and pat_indice is not None:
+            colonnes = (pat_grade, 0, pat_indice, _numero_echelon(pat_echelon), pat_nbi or 0, 0)
+        elif type_employe == 'contractuel' and salaire is not None:
+            colonnes = ('', 1, 0, 0, 0, float(salaire))
+        else:
+            ignores += 1
+            continue
+        for cle, valeur in zip(
+                ('id', 'numero_employe', 'nom', 'service_id', 'service_nom', 'nb_enfants'),
+                (pk, numero, f"{nom} {prenom}", service_id, service_nom, enfants)):
+            effectif[cle].append(valeur)
+        for cle, valeur in zip(('grade', 'contractuel', 'indice', 'echelon', 'nbi', 'salaire_contractuel'), colonnes):
+            effectif[cle].append(valeur)
+    return effectif, ignores
+
+
+# ========================================
+# RÈGLES DE PAIE
+# ========================================
+
+class _OperationsNumpy:
+    minimum = staticmethod(lambda a, b: np.minimum(a, b))
+    maximum = staticmethod(lambda a, b: np.maximum(a, b))
+    # Arrondi au centime (ou à l'entier) par excès à partir de 0,5, comme ROUND_HALF_UP
+    arrondi = staticmethod(lambda x, unite=100: np.floor(x * unite + 0.5 + 1e-9) / unite)
+
+
+class _OperationsPython:
+    minimum = staticmethod(min)
+    maximum = staticmethod(max)
+    arrondi = staticmethod(lambda x, unite=100: math.floor(x * unite + 0.5 + 1e-9) / unite)
+
+
+def _regles(c, p, ops):
+    """
+    Règles de moteur_paie.calculer_paie sur des colonnes NumPy ou sur une
+    personne (scalaires). Les colonnes sans objet valent 0 (indice des
+    contractuels, salaire contractuel des titulaires…).
+    """
+    arrondi = ops.arrondi
+    indice = arrondi(c['indice'] * (1 + p['revalorisation_indice']), 1)
+    traitement = (arrondi(indice * p['valeur_point_indice'])
+                  + arrondi(c['salaire_contractuel'] * (1 + p['revalorisation_contractuel'])))
+    echelon = arrondi(traitement * (p['taux_echelon'] * c['echelon']))
+    nbi = arrondi(c['nbi'] * p['valeur_point_nbi'])
+    allocations = arrondi(ops.minimum(c['nb_enfants'], p['max_enfants_allocation']) * p['allocation_par_enfant'])
+    brut = traitement + echelon + c['indemnite'] + nbi + allocations
+
+    taux_retenue = p['taux_pension'] + c['contractuel'] * (p['taux_cotisation_contractuel'] - p['taux_pension'])
+    pension = arrondi((traitement + echelon) * taux_retenue)
+    base = brut - allocations - pension - p['abattement_its']
+    its = 0
+    plancher = 0
+    for plafond, taux in p['bareme_its']:
+        haut = base if plafond is None else ops.minimum(base, plafond)
+        its = its + ops.maximum(haut - plancher, 0) * taux
+        if plafond is None:
+            break
+        plancher = plafond
+    deductions = pension + arrondi(its)
+    return {'brut': brut, 'net': brut - deductions, 'deductions': deductions, 'allocations': allocations}
+
+
+def calculer(effectif, parametres):
+    """Montants mensuels de chaque personne : {montant: tableau NumPy ou liste}"""
+    indemnites = parametres['indemnites_grade']
+    colonnes = {
+        cle: effectif[cle]
+        for cle in ('contractuel', 'indice', 'echelon', 'nbi', 'salaire_contractuel', 'nb_enfants')
+    }
+    colonnes['indemnite'] = [
+        0.0 if contractuel else indemnites.get(grade, 0.0)
+        for grade, contractuel in zip(effectif['grade'], effectif['contractuel'])
+    ]
+    if np is not None:
+        return _regles({cle: np.asarray(v, dtype=float) for cle, v in colonnes.items()}, parametres, _OperationsNumpy)
+
+    resultats = {montant: [] for montant in MONTANTS}
+    cles = list(colonnes)
+    for valeurs in zip(*colonnes.values()):
+        for montant, valeur in _regles(dict(zip(cles, valeurs)), parametres, _OperationsPython).items():
+            resultats[montant].append(valeur)
+    return resultats
+
+
+# ========================================
+# AGRÉGATS
+# ========================================
+
+def _sommes_par(codes, nb_groupes, montants):
+    """Sommes des montants par groupe (codes : indice du groupe de chaque personne)"""
+    if np is not None:
+        codes = np.asarray(codes, dtype=np.int64)
+        return {cle: np.bincount(codes, weights=v, minlength=nb_groupes).tolist() for cle, v in montants.items()}
+    sommes = {cle: [0.0] * nb_groupes for cle in montants}
+    for cle, valeurs in montants.items():
+        colonne = sommes[cle]
+        for code, valeur in zip(codes, valeurs):
+            colonne[code] += valeur
+    return sommes
+
+
+def _comparaison(actuel, simule):
+    actuel = {cle: round(v, 2) for cle, v in actuel.items()}
+    simule = {cle: round(v, 2) for cle, v in simule.items()}
+    return {'actuel': actuel, 'simule': simule, 'ecart': {cle: round(simule[cle] - actuel[cle], 2) for cle in actuel}}
+
+
+def _ventilation(cles, libelles, actuel, simule):
+    groupes = {}
+    codes = [groupes.setdefault(cle, len(groupes)) for cle in cles]
+    effectifs = _sommes_par(codes, len(groupes), {'n': [1.0] * len(codes)})['n']
+    sommes_actuel = _sommes_par(codes, len(groupes), actuel)
+    sommes_simule = _sommes_par(codes, len(groupes), simule)
+    resultat = []
+    for cle, code in groupes.items():
+        resultat.append({
+            **libelles(cle),
+            'nombre': int(effectifs[code]),
+            **_comparaison({m: sommes_actuel[m][code] for m in MONTANTS}, {m: sommes_simule[m][code] for m in MONTANTS}),
+        })
+    return sorted(resultat, key=lambda ligne: -abs(ligne['ecart']['brut']))
+
+
+def simuler(scenario, service=None, limite_personnes=LIMITE_PERSONNES):
+    """
+    Paie mensuelle actuelle et simulée de l'effectif (d'un service ou du
+    ministère) : totaux, ventilation par service et par grade, et écarts des
+    personnes les plus touchées (limite_personnes ; 0 = toutes).
+    Lève ValueError si le scénario est invalide.
+    """
+    debut = time.perf_counter()
+    parametres_actuels = parametres_scenario({})
+    parametres = parametres_scenario(scenario)
+    effectif, ignores = charger_effectif(service)
+
+    actuel = calculer(effectif, parametres_actuels)
+    simule = calculer(effectif, parametres)
+
+    noms_services = dict(zip(effectif['service_id'], effectif['service_nom']))
+    grades = [
+        'contractuel' if contractuel else (grade or '')
+        for grade, contractuel in zip(effectif['grade'], effectif['contractuel'])
+    ]
+
+    if np is not None:
+        ecarts = simule['net'] - actuel['net']
+        touchees = np.flatnonzero(np.abs(ecarts) >= 0.005)
+        touchees = touchees[np.argsort(-np.abs(ecarts[touchees]), kind='stable')].tolist()
+    else:
+        ecarts = [s - a for s, a in zip(simule['net'], actuel['net'])]
+        touchees = sorted((i for i, e in enumerate(ecarts) if abs(e) >= 0.005), key=lambda i: -abs(ecarts[i]))
+    retenues = touchees[:limite_personnes] if limite_personnes else touchees
+
+    personnes = [
+        {
+            'id': effectif['id'][i],
+            'numero_employe': effectif['numero_employe'][i],
+            'nom': effectif['nom'][i],
+            'service': effectif['service_id'][i],
+            'grade': grades[i],
+            **_comparaison({m: float(actuel[m][i]) for m in MONTANTS}, {m: float(simule[m][i]) for m in MONTANTS}),
+        }
+        for i in retenues
+    ]
+
+    return {
+        'moteur': 'numpy' if np is not None else 'python',
+        'scenario': scenario or {},
+        'effectif': len(effectif['id']),
+        'ignores': ignores,
+        **_comparaison({m: float(sum(actuel[m])) for m in MONTANTS}, {m: float(sum(simule[m])) for m in MONTANTS}),
+        'par_service': _ventilation(
+            effectif['service_id'], lambda s: {'service': s, 'service_nom': noms_services[s]}, actuel, simule
+        ),
+        'par_grade': _ventilation(grades, lambda g: {'grade': g}, actuel, simule),
+        'nombre_personnes_touchees': len(touchees),
+        'personnes': personnes,
+        'duree_ms': round((time.perf_counter() - debut) * 1000, 1),
+    }
@@ -0,0 +1,343 @@
+# myapp/taches.py
+"""
+File de tâches de fond adossée à la base de données (pas de broker externe).
+
+- Les vues enregistrent une Tache EN_ATTENTE (soumettre_tache) et répondent
+  aussitôt avec son id ; le client suit /api/taches/<id>/ puis télécharge
+  /api/taches/<id>/resultat/.
+- Le worker (python manage.py traiter_taches) réserve les tâches une à une,
+  dans la limite de settings.TACHES_CONCURRENCE tâches simultanées par type,
+  et les exécute avec l'exécuteur enregistré pour leur type (@executeur).
+- Les résultats (fichiers sous MEDIA_ROOT/taches/) sont supprimés avec la
+  tâche après settings.TACHES_RETENTION_HEURES.
+"""
+import logging
+import os
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .bulletins import ecrire_zip, paies_du_lot
+from .exports import ecrire_absences_agents
+from .models import Enseignant, LancementPaie, Paie, PersonnelPAT, Service, Tache, VerrouTache
+from .moteur_paie import executer_lancement
+from .rapports import bornes_mois, rapport_annuel_service
+
+
+logger = logging.getLogger(__name__)
+
+# Tâches simultanées par type (surchargeable par settings.TACHES_CONCURRENCE)
+CONCURRENCE_DEFAUT = {
+    'export_rapport': 2,
+    'rapport_annuel': 2,
+    'lancement_paie': 1,
+    'bulletins_paie': 1,
+}
+RETENTION_HEURES_DEFAUT = 72
+# Tâche EN_COURS sans signe de vie depuis ce délai : worker considéré comme arrêté
+DELAI_ORPHELINE_MINUTES_DEFAUT = 30
+# Signe de vie des tâches en cours, même sans avancer() de leur exécuteur
+POULS_SECONDES_DEFAUT = 60
+MAX_TENTATIVES = 3
+
+EXECUTEURS = {}
+
+
+def executeur(type_tache):
+    """Enregistre la fonction exécutant les tâches d'un type : f(tache) -> résultat (dict)"""
+    def decorateur(fonction):
+        EXECUTEURS[type_tache] = fonction
+        return fonction
+    return decorateur
+
+
+def get_concurrence(type_tache):
+    limites = {**CONCURRENCE_DEFAUT, **getattr(settings, 'TACHES_CONCURRENCE', {})}
+    return limites.get(type_tache, 1)
+
+
+def get_retention():
+    return timedelta(hours=getattr(settings, 'TACHES_RETENTION_HEURES', RETENTION_HEURES_DEFAUT))
+
+
+# ========================================
+# CÔTÉ API
+# ========================================
+
+def soumettre_tache(type_tache, parametres, user=None):
+    """Met une tâche en file d'attente et la retourne"""
+    if type_tache not in EXECUTEURS:
+        raise ValueError(f"Type de tâche inconnu: {type_tache}")
+    return Tache.objects.create(type_tache=type_tache, parametres=parametres, cree_par=user)
+
+
+def annuler_tache(tache):
+    """Annule une tâche encore en attente ; retourne False si elle a déjà démarré"""
+    return bool(
+        Tache.objects.filter(pk=tache.pk, statut='EN_ATTENTE')
+        .update(statut='ANNULE', date_fin=timezone.now(), expire_le=timezone.now() + get_retention())
+    )
+
+
+# ========================================
+# CÔTÉ WORKER
+# ========================================
+
+def avancer(tache, progression, message=''):
+    """Enregistre l'avancement (et un signe de vie) sans recharger la tâche"""
+    tache.progression = round(progression, 2)
+    tache.message = message[:255]
+    Tache.objects.filter(pk=tache.pk).update(
+        progression=tache.progression, message=tache.message, date_maj=timezone.now()
+    )
+
+
+def reserver_tache(worker):
+    """
+    Réserve la plus ancienne tâche en attente dont le type n'a pas atteint sa
+    limite de concurrence. Retourne la tâche (passée EN_COURS) ou None.
+    """
+    types = (
+        Tache.objects.filter(statut='EN_ATTENTE')
+        .values_list('type_tache', flat=True)
+        .annotate(premiere=Min('date_creation'))
+        .order_by('premiere')
+    )
+    for type_tache in list(types):
+        tache = _reserver_du_type(type_tache, worker)
+        if tache is not None:
+            return tache
+    return None
+
+
+def _reserver_du_type(type_tache, worker):
+    # Créée hors transaction : le verrou ci-dessous porte toujours sur une ligne existante
+    VerrouTache.objects.get_or_create(type_tache=type_tache)
+    with transaction.atomic():
+        # Les réservations d'un même type sont sérialisées par ce verrou ; les
+        # lectures verrouillantes suivantes voient celles déjà validées
+        VerrouTache.objects.select_for_update().get(type_tache=type_tache)
+        en_cours = list(
+            Tache.objects.select_for_update()
+            .filter(type_tache=type_tache, statut='EN_COURS')
+            .values_list('id', flat=True)
+        )
+        if len(en_cours) >= get_concurrence(type_tache):
+            return None
+
+        attente = Tache.objects.filter(statut='EN_ATTENTE', type_tache=type_tache)
+        if connection.features.has_select_for_update_skip_locked:
+            # Une tâche en cours d'annulation (annuler_tache) n'est pas attendue
+            attente = attente.select_for_update(skip_locked=True)
+        tache = attente.order_by('date_creation', 'id').first()
+        if tache is None:
+            return None
+
+        tache.statut = 'EN_COURS'
+        tache.worker = worker
+        tache.tentatives += 1
+        tache.date_debut = timezone.now()
+        tache.save(update_fields=['statut', 'worker', 'tentatives', 'date_debut', 'date_maj'])
+        return tache
+
+
+def _reservation(tache):
+    """La tâche telle que réservée par ce worker (vide si elle a été remise en file entre-temps)"""
+    return Tache.objects.filter(
+        pk=tache.pk, statut='EN_COURS', worker=tache.worker, tentatives=tache.tentatives
+    )
+
+
+class Pouls(threading.Thread):
+    """
+    Met à jour date_maj d'une tâche en cours toutes les `intervalle` secondes,
+    pour que recuperer_orphelines ne la remette pas en file pendant un
+    exécuteur long qui n'appelle pas avancer().
+    """
+
+    def __init__(self, tache, intervalle):
+        super().__init__(name=f"pouls-tache-{tache.pk}", daemon=True)
+        self.tache = tache
+        self.intervalle = intervalle
+        self.arret = threading.Event()
+
+    def run(self):
+        try:
+            while not self.arret.wait(self.intervalle):
+                try:
+                    _reservation(self.tache).update(date_maj=timezone.now())
+                except DatabaseError:
+                    logger.warning("Signe de vie de la tâche %s non enregistré", self.tache.pk, exc_info=True)
+        finally:
+            # Connexion propre à ce thread
+            connection.close()
+
+    def arreter(self):
+        self.arret.set()
+        self.join()
+
+
+def executer_tache(tache):
+    """
+    Exécute une tâche réservée et enregistre son résultat ou son erreur.
+    Le résultat n'est enregistré que si la tâche est toujours réservée par ce
+    worker : une tâche remise en file et reprise ailleurs n'est pas terminée deux fois.
+    """
+    fonction = EXECUTEURS.get(tache.type_tache)
+    pouls = Pouls(tache, getattr(settings, 'TACHES_POULS_SECONDES', POULS_SECONDES_DEFAUT))
+    pouls.start()
+    try:
+        if fonction is None:
+            raise ValueError(f"Aucun exécuteur pour le type {tache.type_tache}")
+        resultat = fonction(tache)
+    except Exception as e:
+        logger.exception("Échec de la tâche %s", tache.pk)
+        tache.statut = 'ECHEC'
+        tache.erreur = str(e)
+    else:
+        tache.statut = 'TERMINE'
+        tache.resultat = resultat
+        tache.progression = 100
+    finally:
+        pouls.arreter()
+
+    tache.date_fin = timezone.now()
+    tache.expire_le = tache.date_fin + get_retention()
+    enregistree = _reservation(tache).update(
+        statut=tache.statut, erreur=tache.erreur, resultat=tache.resultat,
+        progression=tache.progression, fichier=tache.fichier.name or '',
+        date_fin=tache.date_fin, expire_le=tache.expire_le, date_maj=tache.date_fin,
+    )
+    if not enregistree:
+        logger.warning("Tâche %s reprise par un autre worker : résultat de %s abandonné", tache.pk, tache.worker)
+        if tache.fichier:
+            tache.fichier.delete(save=False)
+        tache.refresh_from_db()
+    return tache
+
+
+def enregistrer_fichier(tache, nom, ecrire):
+    """
+    Produit le fichier résultat d'une tâche : ecrire(fichier) écrit dans un
+    fichier temporaire binaire, copié ensuite dans le stockage des médias.
+    """
+    with tempfile.TemporaryFile() as fichier:
+        ecrire(fichier)
+        fichier.seek(0)
+        tache.fichier.save(f"{tache.pk}_{nom}", File(fichier), save=False)
+
+
+def recuperer_orphelines():
+    """
+    Remet en file les tâches dont le worker s'est arrêté en cours d'exécution
+    (plus de signe de vie) ; ECHEC après MAX_TENTATIVES.
+    """
+    delai = getattr(settings, 'TACHES_DELAI_ORPHELINE_MINUTES', DELAI_ORPHELINE_MINUTES_DEFAUT)
+    limite = timezone.now() - timedelta(minutes=delai)
+    orphelines = Tache.objects.filter(statut='EN_COURS', date_maj__lt=limite)
+    relancees = orphelines.filter(tentatives__lt=MAX_TENTATIVES).update(
+        statut='EN_ATTENTE', worker='', date_maj=timezone.now()
+    )
+    maintenant = timezone.now()
+    orphelines.update(
+        statut='ECHEC', erreur='Worker arrêté pendant l\'exécution',
+        date_fin=maintenant, expire_le=maintenant + get_retention()
+    )
+    return relancees
+
+
+def purger_taches():
+    """Supprime les tâches expirées et leurs fichiers ; retourne le nombre supprimé"""
+    expirees = Tache.objects.filter(expire_le__lt=timezone.now())
+    for tache in expirees.exclude(fichier='').only('id', 'fichier'):
+        tache.fichier.delete(save=False)
+    nombre, _ = expirees.delete()
+    return nombre
+
+
+# ========================================
+# EXÉCUTEURS
+# ========================================
+
+def _agents_et_service(parametres):
+    """Agents d'un service (même périmètre que celui du chef dans les vues)"""
+    modeles = {'enseignant': Enseignant, 'pat': PersonnelPAT}
+    service = Service.objects.get(pk=parametres['service_id'])
+    agents = modeles[parametres['agents']].objects.filter(personne__service=service)
+    return agents, service
+
+
+@executeur('export_rapport')
+def tache_export_rapport(tache):
+    p = tache.parametres
+    agents, service = _agents_et_service(p)
+    debut, fin = bornes_mois(p['mois'])
+
+    enregistrer_fichier(
+        tache,
+        f"{p['prefixe_fichier']}_{p['type_rapport']}_{p['mois']}.{p['format']}",
+        lambda fichier: ecrire_absences_agents(
+            agents, service, p['mois'], debut, fin, p['type_rapport'],
+            p['format'], [tuple(c) for c in p['champs']], fichier
+        )
+    )
+    return {'fichier': os.path.basename(tache.fichier.name), 'taille': tache.fichier.size}
+
+
+@executeur('rapport_annuel')
+def tache_rapport_annuel(tache):
+    p = tache.parametres
+    agents, service = _agents_et_service(p)
+    donnees = rapport_annuel_service(agents, service, p['annee_debut'], p['annee_fin'])
+    return {
+        'annee': p['annee_debut'],
+        'annee_fin': p['annee_fin'],
+        'service': service.nom,
+        **donnees,
+        'genere_le': timezone.now().isoformat()
+    }
+
+
+@executeur('lancement_paie')
+def tache_lancement_paie(tache):
+    lancement = LancementPaie.objects.get(pk=tache.parametres['lancement_id'])
+
+    def progression(lancement):
+        avancer(tache, lancement.progression,
+                f"{lancement.nombre_traites} paies calculées sur {lancement.nombre_total}")
+
+    executer_lancement(lancement, taille_lot=tache.parametres.get('taille_lot', 500), progression=progression)
+    if lancement.statut == 'ECHEC':
+        raise RuntimeError(lancement.erreur)
+    return {
+        'lancement': lancement.pk,
+        'nombre_traites': lancement.nombre_traites,
+        'nombre_ignores': lancement.nombre_ignores,
+        'nombre_sans_carriere': lancement.nombre_sans_carriere,
+    }
+
+
+@executeur('bulletins_paie')
+def tache_bulletins_paie(tache):
+    p = tache.parametres
+    paies = Paie.objects.filter(mois_annee=p['mois'])
+    if p.get('service_id') is not None:
+        paies = paies.filter(personne__service_id=p['service_id'])
+
+    def progression(fait, total):
+        avancer(tache, 100 * fait / total, f"{fait} bulletins rendus sur {total}")
+
+    resultat = {}
+    suffixe = f"_{p['service_id']}" if p.get('service_id') is not None else ''
+    enregistrer_fichier(
+        tache,
+        f"bulletins_{p['mois']}{suffixe}.zip",
+        lambda fichier: resultat.update(ecrire_zip(paies_du_lot(paies), fichier, progression=progression))
+    )
+    return {'mois': p['mois'], 'service_id': p.get('service_id'), **resultat}
@@ -1,3 +1,2143 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import (
+    approbations, bulletins, calendrier, compteurs, droits, exports, instrumentation, journalisation,
+    jours_ouvres, livre_paie, moteur_paie, rapports, simulation, taches,
+)
+from .approbations import valider_absences_en_lot
+from .champs import parse_champs
+from .models import (
+    Absence, CompteurAbsences, Contractuel, ElementPaie, Enseignant, LivrePaie, LivrePaieElement, Paie,
+    Personne, PersonnelPAT, Service, Structure, Tache, User,
+)
+from .moteur_paie import (
+    PARAMETRES_PAIE, calculer_its, calculer_paie, donnees_carriere, executer_lancement,
+    get_parametres, preparer_lancement,
+)
+from .pagination import KeysetPagination
+from .scope import get_scope, get_service_du_chef
+from .views import AbsenceViewSet, EnseignantViewSet, PersonneViewSet
+
+
+# ========================================
+# DONNÉES DE TEST
+# ========================================
+
+def creer_service(nom='Service test', type_service='enseignant', chef=None):
+    return Service.objects.create(nom=nom, type_service=type_service, chef_service=chef)
+
+
+def creer_personne(service, numero, type_employe=None, **champs):
+    """Personne avec les champs obligatoires renseignés (numero : entier unique)"""
+    valeurs = {
+        'nom': f'Nom{numero}', 'prenom': f'Prenom{numero}', 'date_naissance': date(1980, 1, 1),
+        'lieu_naissance': 'Nouakchott', 'nni': f'{numero:010d}', 'nationalite': 'Mauritanienne',
+        'genre': 'M', 'situation_familiale': 'Marié', 'adresse': 'Nouakchott', 'nom_pere': 'Pere',
+        'dernier_diplome': 'Master', 'pays_obtention_diplome': 'Mauritanie',
+        'annee_obtention_diplome': 2005, 'specialite_formation': 'Gestion', 'fonction': 'Agent',
+        'type_employe': type_employe or service.type_service, 'numero_employe': f'T{numero:06d}',
+        'date_embauche': date(2010, 1, 1), 'service': service,
+    }
+    valeurs.update(champs)
+    return Personne.objects.create(**valeurs)
+
+
+def creer_enseignant(personne, grade='professeur', echelon='3', indice=1000):
+    return Enseignant.objects.create(
+        personne=personne, corps='Enseignement supérieur', grade=grade, echelon=echelon, indice=indice,
+        date_entree_service_publique=date(2005, 1, 1), date_entree_enseignement_superieur=date(2006, 1, 1),
+        date_fin_service_obligatoire=date(2040, 1, 1),
+    )
+
+
+def creer_pat(personne, grade='A1', echelon='Échelon 4', indice=700, nbi=20):
+    return PersonnelPAT.objects.create(
+        personne=personne, grade=grade, indice=indice, nbi_mac=nbi, anciennete_echelon=echelon,
+        date_changement=date(2020, 1, 1), anciennete_grade='3 ans', date_nomination=date(2015, 1, 1),
+        date_prise_service=date(2015, 2, 1),
+    )
+
+
+def creer_contractuel(personne, salaire=Decimal('20000')):
+    return Contractuel.objects.create(
+        personne=personne, type_contrat='CDD', duree_contrat='2 ans',
+        date_debut_contrat=date(2024, 1, 1), salaire_mensuel=salaire,
+    )
+
+
+def creer_paie(personne, mois_annee, nb_enfants=0, **champs):
+    valeurs = {
+        'personne': personne, 'mois_annee': mois_annee, 'nb_enfants': nb_enfants,
+        'salaire_brut': Decimal('1000'), 'salaire_net': Decimal('900'),
+        'date_paiement': moteur_paie.date_paiement_defaut(mois_annee),
+    }
+    valeurs.update(champs)
+    return Paie.objects.create(**valeurs)
+
+
+def montants_elements(paie):
+    return {element.code: element.montant for element in paie.elements.all()}
+
+
+# ========================================
+# PÉRIMÈTRE HIÉRARCHIQUE (SCOPE)
+# ========================================
+
+class ScopeFiltrageTests(TestCase):
+    """Règle commune du ScopeQuerysetMixin selon le rôle"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='admin_rh')
+        cls.chef_enseignant = User.objects.create_user('chef_ens', password='x', role='chef_enseignant')
+        cls.chef_pat = User.objects.create_user('chef_pat', password='x', role='chef_pat')
+        cls.chef_sans_service = User.objects.create_user('chef_seul', password='x', role='chef_pat')
+        cls.employe = User.objects.create_user('employe', password='x', role='employe')
+        cls.enseignement = creer_service('Enseignement', 'enseignant', cls.chef_enseignant)
+        cls.pat = creer_service('PAT', 'pat', cls.chef_pat)
+        cls.moi = creer_personne(cls.enseignement, 1, user=cls.employe)
+        cls.collegue = creer_personne(cls.enseignement, 2)
+        cls.agent_pat = creer_personne(cls.pat, 3)
+        for personne in (cls.moi, cls.collegue):
+            creer_enseignant(personne)
+        creer_pat(cls.agent_pat)
+        cls.absences = {
+            personne.pk: Absence.objects.create(
+                personne=personne, type_absence='CONGÉ_ANNUEL',
+                date_debut=date(2026, 3, 2), date_fin=date(2026, 3, 3),
+            ).pk
+            for personne in (cls.moi, cls.collegue, cls.agent_pat)
+        }
+
+    def visibles(self, viewset_class, user):
+        request = Request(APIRequestFactory().get('/api/'))
+        request.user = user
+        viewset = viewset_class(request=request, action='list', format_kwarg=None)
+        return set(viewset.get_queryset().values_list('pk', flat=True))
+
+    def test_personnes_par_role(self):
+        tous = {self.moi.pk, self.collegue.pk, self.agent_pat.pk}
+        attendus = {
+            self.admin: tous,
+            self.chef_enseignant: {self.moi.pk, self.collegue.pk},
+            self.chef_pat: {self.agent_pat.pk},
+            self.chef_sans_service: set(),
+            self.employe: {self.moi.pk},
+        }
+        for user, personnes in attendus.items():
+            with self.subTest(user=user.username):
+                self.assertEqual(self.visibles(PersonneViewSet, user), personnes)
+                self.assertEqual(
+                    self.visibles(AbsenceViewSet, user), {self.absences[pk] for pk in personnes}
+                )
+
+    def test_roles_de_chef_restreints_au_type_de_service(self):
+        self.assertEqual(self.visibles(EnseignantViewSet, self.chef_enseignant), {self.moi.pk, self.collegue.pk})
+        self.assertEqual(self.visibles(EnseignantViewSet, self.chef_pat), set())
+
+    @override_settings(SCOPE_CACHE_TIMEOUT=60)
+    def test_cache_invalide_par_les_signaux(self):
+        self.assertEqual(get_scope(self.chef_pat).service_id, self.pat.pk)
+        self.assertEqual(self.visibles(PersonneViewSet, self.chef_pat), {self.agent_pat.pk})
+
+        # Changement de chef : le scope en cache est invalidé
+        self.pat.chef_service = self.chef_sans_service
+        self.pat.save()
+        self.assertIsNone(get_scope(self.chef_pat).service_id)
+        self.assertEqual(get_scope(self.chef_sans_service).service_id, self.pat.pk)
+
+        # Mutation d'un agent : visible dans son nouveau service
+        self.collegue.service = self.pat
+        self.collegue.save()
+        self.assertEqual(self.visibles(PersonneViewSet, self.chef_sans_service), {self.agent_pat.pk, self.collegue.pk})
+        self.assertEqual(self.visibles(PersonneViewSet, self.chef_enseignant), {self.moi.pk})
+
+
+class ScopeServiceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.chef = User.objects.create_user('chef', password='x', role='chef_pat', first_name='Awa', last_name='Sy')
+        cls.service = Service.objects.create(
+            nom='Scolarité', type_service='pat', chef_service=cls.chef, description='Inscriptions'
+        )
+
+    def requete(self, user):
+        request = Request(APIRequestFactory().get('/api/'))
+        request.user = user
+        return request
+
+    def test_service_du_chef_complet(self):
+        request = self.requete(self.chef)
+        service = get_service_du_chef(request, 'pat')
+        self.assertEqual(service.pk, self.service.pk)
+        self.assertEqual((service.chef_service, service.description), (self.chef, 'Inscriptions'))
+        # Même instance pour toute la requête, sans nouvelle requête SQL
+        with self.assertNumQueries(0):
+            self.assertIs(get_service_du_chef(request), service)
+        with self.assertRaises(Service.DoesNotExist):
+            get_service_du_chef(request, 'enseignant')
+
+    def test_service_charge_une_fois_depuis_le_cache(self):
+        with override_settings(SCOPE_CACHE_TIMEOUT=60):
+            get_scope(self.chef)
+            scope = get_scope(self.requete(self.chef))
+            with self.assertNumQueries(1):
+                self.assertEqual(scope.service().chef_service_id, self.chef.pk)
+                scope.service()
+
+    def test_creation_par_le_chef(self):
+        autre_service = creer_service('Autre service', 'pat')
+        client = APIClient()
+        client.force_authenticate(self.chef)
+        donnees = {
+            'nom': 'Ba', 'prenom': 'Mariem', 'date_naissance': '1990-05-04', 'lieu_naissance': 'Kiffa',
+            'nni': '1234567890', 'nationalite': 'Mauritanienne', 'genre': 'FEMININ',
+            'situation_familiale': 'Célibataire',
+            'adresse': 'Nouakchott', 'nom_pere': 'Pere', 'dernier_diplome': 'Licence',
+            'pays_obtention_diplome': 'Mauritanie', 'annee_obtention_diplome': 2012,
+            'specialite_formation': 'Gestion', 'fonction': 'Agent', 'type_employe': 'pat',
+            'numero_employe': 'T000001', 'date_embauche': '2015-01-01', 'service': autre_service.pk,
+        }
+        # Le chef ne crée que dans son propre service
+        response = client.post('/api/personnes/', donnees, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['service'], self.service.pk)
+        self.assertEqual(response.data['chef_service_nom'], 'Awa Sy')
+
+
+# ========================================
+# RAPPORTS D'ABSENCES
+# ========================================
+
+class RapportMensuelTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = creer_service()
+        autre = creer_personne(creer_service('Autre service'), 9)
+        cls.personnes = [creer_personne(cls.service, i) for i in range(1, 5)]
+        for personne, grade in zip(cls.personnes, ['professeur', 'professeur', 'assistant', 'docteur']):
+            creer_enseignant(personne, grade=grade)
+
+        def absence(personne, type_absence, statut, debut, fin):
+            Absence.objects.create(
+                personne=personne, type_absence=type_absence, statut=statut, date_debut=debut, date_fin=fin
+            )
+        p1, p2, p3, _ = cls.personnes
+        absence(p1, 'CONGÉ_ANNUEL', 'APPROUVÉ', date(2026, 2, 25), date(2026, 3, 3))
+        absence(p1, 'CONGÉ_MALADIE', 'EN_ATTENTE', date(2026, 3, 10), date(2026, 3, 12))
+        absence(p2, 'CONGÉ_ANNUEL', 'REFUSÉ', date(2026, 3, 31), date(2026, 4, 2))
+        # Hors du mois ou hors du service
+        absence(p3, 'CONGÉ_ANNUEL', 'APPROUVÉ', date(2026, 4, 1), date(2026, 4, 5))
+        absence(p3, 'CONGÉ_MALADIE', 'APPROUVÉ', date(2026, 2, 1), date(2026, 2, 28))
+        absence(autre, 'CONGÉ_ANNUEL', 'APPROUVÉ', date(2026, 3, 5), date(2026, 3, 6))
+
+    def agents(self):
+        return Enseignant.objects.filter(personne__service=self.service)
+
+    def verifier(self, stats):
+        p1, p2 = self.personnes[:2]
+        self.assertEqual(stats['total'], 4)
+        self.assertEqual(stats['repartition'], [
+            {'grade': 'assistant', 'count': 1}, {'grade': 'docteur', 'count': 1},
+            {'grade': 'professeur', 'count': 2},
+        ])
+        self.assertEqual(stats['absences_par_type'], [
+            {'type_absence': 'CONGÉ_ANNUEL', 'count': 2}, {'type_absence': 'CONGÉ_MALADIE', 'count': 1},
+        ])
+        self.assertEqual(stats['absences_par_statut'], [
+            {'statut': 'APPROUVÉ', 'count': 1}, {'statut': 'EN_ATTENTE', 'count': 1},
+            {'statut': 'REFUSÉ', 'count': 1},
+        ])
+        self.assertEqual(
+            [(ligne['personne_id'], ligne['categorie'], ligne['nombre_absences']) for ligne in stats['top_absences']],
+            [(p1.pk, 'professeur', 2), (p2.pk, 'professeur', 1)]
+        )
+
+    def test_statistiques_en_nombre_constant_de_requetes(self):
+        with self.assertNumQueries(3):
+            stats = rapports.statistiques_mensuelles(
+                self.agents(), Absence.objects.filter(personne__service=self.service),
+                date(2026, 3, 1), date(2026, 3, 31), 'grade'
+            )
+        self.verifier(stats)
+
+    def test_variante_compteurs_identique(self):
+        with self.assertNumQueries(3):
+            stats = rapports.statistiques_mensuelles_service(
+                self.agents(), self.service, date(2026, 3, 1), date(2026, 3, 31), 'grade'
+            )
+        self.verifier(stats)
+
+    def test_bornes_mois(self):
+        self.assertEqual(rapports.bornes_mois('2024-02'), (date(2024, 2, 1), date(2024, 2, 29)))
+        with self.assertRaises(ValueError):
+            rapports.bornes_mois('2024-13')
+
+
+class RapportAnnuelTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = creer_service()
+        ancien = creer_personne(cls.service, 1)
+        recrue = creer_personne(cls.service, 2, date_embauche=date(2025, 6, 15))
+        parti = creer_personne(cls.service, 3, statut_actif=False)
+        for personne in (ancien, recrue, parti):
+            creer_enseignant(personne)
+        # Sortie des effectifs datée par la dernière mise à jour (auto_now)
+        Personne.objects.filter(pk=parti.pk).update(updated_at=datetime(2025, 10, 10, 12, tzinfo=dt_timezone.utc))
+
+        for personne, type_absence, debut, fin in (
+            (ancien, 'CONGÉ_ANNUEL', date(2025, 12, 20), date(2026, 1, 5)),
+            (ancien, 'CONGÉ_MALADIE', date(2026, 3, 15), date(2026, 5, 2)),
+            (recrue, 'CONGÉ_ANNUEL', date(2024, 11, 1), date(2025, 2, 3)),
+            (recrue, 'CONGÉ_ANNUEL', date(2027, 1, 1), date(2027, 1, 2)),
+        ):
+            Absence.objects.create(personne=personne, type_absence=type_absence, date_debut=debut, date_fin=fin)
+
+    def rapport(self):
+        with self.assertNumQueries(2):
+            return rapports.rapport_annuel(
+                Enseignant.objects.filter(personne__service=self.service),
+                Absence.objects.filter(personne__service=self.service), 2025, 2026
+            )
+
+    def test_repartition_par_mois(self):
+        rapport = self.rapport()
+        donnees = rapport['donnees_mensuelles']
+        self.assertEqual(len(donnees), 24)
+        # Les absences sont comptées dans chaque mois qu'elles chevauchent, y compris d'une année à l'autre
+        par_mois = {(d['annee'], d['mois']): d['nombre_absences'] for d in donnees if d['nombre_absences']}
+        self.assertEqual(par_mois, {
+            (2025, 1): 1, (2025, 2): 1, (2025, 12): 1, (2026, 1): 1, (2026, 3): 1, (2026, 4): 1, (2026, 5): 1,
+        })
+        self.assertEqual(donnees[12]['nom_mois'], 'Janvier')
+        self.assertEqual(donnees[14]['absences_par_type'], [{'type_absence': 'CONGÉ_MALADIE', 'count': 1}])
+
+        self.assertEqual(
+            [(t['annee'], t['trimestre'], t['absences']) for t in rapport['donnees_trimestrielles'] if t['absences']],
+            [(2025, 'T1', 2), (2025, 'T4', 1), (2026, 'T1', 2), (2026, 'T2', 2)]
+        )
+        statistiques = rapport['statistiques_annuelles']
+        self.assertEqual((statistiques['total_absences'], statistiques['moyenne_mensuelle']), (7, 0.29))
+        self.assertEqual((statistiques['mois_plus_absences']['annee'], statistiques['mois_plus_absences']['mois']),
+                         (2025, 1))
+
+    def test_evolution_des_effectifs(self):
+        effectifs = {(e['annee'], e['mois']): e['effectif'] for e in self.rapport()['evolution_effectifs']}
+        self.assertEqual(
+            [effectifs[mois] for mois in ((2025, 1), (2025, 6), (2025, 9), (2025, 10), (2026, 12))],
+            [2, 3, 3, 2, 2]
+        )
+
+    def test_variante_compteurs_identique(self):
+        attendu = self.rapport()
+        rapport = rapports.rapport_annuel_service(
+            Enseignant.objects.filter(personne__service=self.service), self.service, 2025, 2026
+        )
+        self.assertEqual(rapport, attendu)
+
+    def test_periode_annuelle(self):
+        self.assertEqual(rapports.parse_periode_annuelle({'annee': '2024'}), (2024, 2024))
+        self.assertEqual(rapports.parse_periode_annuelle({'annee_debut': '2020', 'annee_fin': '2022'}), (2020, 2022))
+        for params in ({'annee_debut': '2022', 'annee_fin': '2020'}, {'annee_debut': '1990', 'annee_fin': '2020'},
+                       {'annee': 'abc'}):
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                rapports.parse_periode_annuelle(params)
+
+
+# ========================================
+# EXPORTS
+# ========================================
+
+class ExportsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.chef = User.objects.create_user('chef', password='x', role='chef_enseignant')
+        cls.service = creer_service(chef=cls.chef)
+        cls.personnes = [creer_personne(cls.service, i) for i in range(1, 4)]
+        for personne in cls.personnes:
+            creer_enseignant(personne)
+        p1, p2, _ = cls.personnes
+        for personne, type_absence, debut, fin in (
+            (p1, 'CONGÉ_ANNUEL', date(2026, 2, 26), date(2026, 3, 3)),
+            (p1, 'CONGÉ_MALADIE', date(2026, 3, 10), date(2026, 3, 11)),
+            (p1, 'CONGÉ_ANNUEL', date(2026, 3, 20), date(2026, 3, 20)),
+            (p2, 'CONGÉ_ANNUEL', date(2026, 4, 1), date(2026, 4, 3)),
+        ):
+            Absence.objects.create(personne=personne, type_absence=type_absence, date_debut=debut, date_fin=fin)
+
+    def lignes(self, detaille=False):
+        return list(exports.lignes_absences_agents(
+            Enseignant.objects.filter(personne__service=self.service), date(2026, 3, 1), date(2026, 3, 31),
+            [('nom', 'personne__nom'), ('grade', 'grade')], detaille=detaille
+        ))
+
+    def exporter(self, format_export, **params):
+        client = APIClient()
+        client.force_authenticate(self.chef)
+        return client.get('/api/enseignants/export_rapport/', {'format': format_export, 'mois': '2026-03', **params})
+
+    def test_fusion_agents_et_absences(self):
+        self.assertEqual(self.lignes(), [
+            {'nom': 'Nom1', 'grade': 'professeur', 'nombre_absences': 3, 'jours_absence': 9},
+            {'nom': 'Nom2', 'grade': 'professeur', 'nombre_absences': 0, 'jours_absence': 0},
+            {'nom': 'Nom3', 'grade': 'professeur', 'nombre_absences': 0, 'jours_absence': 0},
+        ])
+        # Rapport détaillé : jours comptés depuis le début du mois, types dédoublonnés
+        detail = self.lignes(detaille=True)[0]
+        self.assertEqual((detail['jours_absence'], detail['types_absence']), (6, 'CONGÉ_ANNUEL, CONGÉ_MALADIE'))
+
+    def test_csv_en_flux(self):
+        response = self.exporter('csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response['Content-Disposition'], 'attachment; filename="rapport_enseignants_mensuel_2026-03.csv"'
+        )
+        lignes = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(lignes[0], ['nom', 'prenom', 'grade', 'nombre_absences', 'jours_absence'])
+        self.assertEqual(lignes[1], ['Nom1', 'Prenom1', 'professeur', '3', '9'])
+        self.assertEqual(len(lignes), 4)
+
+    def test_ndjson_et_json(self):
+        response = self.exporter('ndjson', type='detaille')
+        lignes = [json.loads(ligne) for ligne in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual(len(lignes), 3)
+        self.assertEqual(lignes[0]['indice'], 1000)
+        self.assertEqual(lignes[0]['types_absence'], 'CONGÉ_ANNUEL, CONGÉ_MALADIE')
+
+        response = self.exporter('json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([ligne['nombre_absences'] for ligne in response.data['donnees']], [3, 0, 0])
+
+    def test_xlsx(self):
+        if not exports.xlsx_disponible():
+            self.skipTest("openpyxl non installé")
+        from openpyxl import load_workbook
+
+        response = self.exporter('xlsx')
+        self.assertEqual(response.status_code, 200)
+        feuille = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        lignes = list(feuille.iter_rows(values_only=True))
+        self.assertEqual(lignes[1], ('Nom1', 'Prenom1', 'professeur', 3, 9))
+
+    def test_ecriture_fichier_identique_au_flux(self):
+        colonnes = ['nom', 'grade', 'nombre_absences', 'jours_absence']
+        fichier = io.BytesIO()
+        exports.ecrire_export(self.lignes(), colonnes, 'csv', fichier)
+        flux = ''.join(exports._flux_csv(self.lignes(), colonnes))
+        self.assertEqual(fichier.getvalue().decode('utf-8'), flux)
+
+    def test_format_non_supporte(self):
+        self.assertIsNone(exports.verifier_format_export('ndjson'))
+        self.assertIn('Format non supporté', exports.verifier_format_export('pdf'))
+        with self.assertRaises(ValueError):
+            exports.reponse_export(iter([]), ['nom'], 'pdf', 'rapport')
+
+
+# ========================================
+# CALENDRIER DES ABSENCES
+# ========================================
+
+@override_settings(JOURS_WEEKEND=(5, 6))
+class CalendrierTests(SimpleTestCase):
+    debut, fin = date(2026, 3, 1), date(2026, 3, 10)
+    intervalles = [
+        (date(2026, 2, 20), date(2026, 3, 2)),    # commence avant la période
+        (date(2026, 3, 2), date(2026, 3, 4)),
+        (date(2026, 3, 4), date(2026, 3, 4)),
+        (date(2026, 3, 9), date(2026, 3, 31)),    # finit après la période
+        (date(2026, 3, 12), date(2026, 3, 15)),   # hors période
+        (date(2026, 3, 5), date(2026, 3, 4)),     # intervalle vide
+    ]
+
+    def compte_naif(self):
+        jours = [self.debut + timedelta(days=i) for i in range((self.fin - self.debut).days + 1)]
+        return [sum(1 for d, f in self.intervalles if d <= jour <= f) for jour in jours]
+
+    def test_compter_par_jour(self):
+        attendu = [1, 2, 1, 2, 0, 0, 0, 0, 1, 1]
+        self.assertEqual(self.compte_naif(), attendu)
+        self.assertEqual(calendrier.compter_par_jour(self.intervalles, self.debut, self.fin), attendu)
+        with mock.patch.object(calendrier, 'np', None):
+            self.assertEqual(calendrier.compter_par_jour(self.intervalles, self.debut, self.fin), attendu)
+        self.assertEqual(calendrier.compter_par_jour([], self.debut, self.fin), [0] * 10)
+        self.assertEqual(calendrier.compter_par_jour(self.intervalles, self.fin, self.debut), [])
+
+    def test_planning(self):
+        elements = [(d, f, f'a{i}') for i, (d, f) in enumerate(self.intervalles)]
+        planning = calendrier.construire_planning(self.debut, self.fin, elements)
+        self.assertEqual(list(planning), [(self.debut + timedelta(days=i)).isoformat() for i in range(10)])
+        jour = planning['2026-03-04']
+        self.assertEqual((jour['absents'], jour['nombre_absents']), (['a1', 'a2'], 2))
+        self.assertEqual((jour['jour_semaine'], jour['est_weekend']), ('Wednesday', False))
+        self.assertTrue(planning['2026-03-07']['est_weekend'])
+        self.assertEqual(calendrier.jour_max(planning)['date'], '2026-03-02')
+
+        heatmap = calendrier.construire_planning(self.debut, self.fin, elements, comptes_seuls=True)
+        self.assertEqual([j['nombre_absents'] for j in heatmap.values()], self.compte_naif())
+        self.assertNotIn('absents', heatmap['2026-03-04'])
+
+        # Comptes déjà connus (compteurs journaliers) : les éléments sont ignorés
+        comptes = list(range(10))
+        heatmap = calendrier.construire_planning(self.debut, self.fin, [], comptes_seuls=True, comptes=comptes)
+        self.assertEqual([j['nombre_absents'] for j in heatmap.values()], comptes)
+        self.assertIsNone(calendrier.jour_max({}))
+
+
+# ========================================
+# PRÉSENCE ET JOURS OUVRÉS
+# ========================================
+
+class JoursOuvresTests(SimpleTestCase):
+
+    def compte_naif(self, debut, fin, weekend, feries):
+        jours = (debut + timedelta(days=i) for i in range((fin - debut).days + 1))
+        return sum(1 for jour in jours if jour.weekday() not in weekend and jour not in feries)
+
+    def test_forme_close_egale_au_parcours(self):
+        origine = date(2025, 12, 20)
+        for weekend in ((5, 6), (4, 5), (4,), ()):
+            with override_settings(JOURS_WEEKEND=weekend, JOURS_FERIES=['2026-01-06', date(2026, 1, 10)]):
+                for decalage in range(0, 15, 2):
+                    for duree in (0, 1, 5, 6, 7, 8, 13, 30, 45):
+                        debut = origine + timedelta(days=decalage)
+                        fin = debut + timedelta(days=duree)
+                        feries = set(jours_ouvres.jours_feries(debut, fin))
+                        with self.subTest(weekend=weekend, debut=debut, fin=fin):
+                            self.assertEqual(
+                                jours_ouvres.compter_jours_ouvres(debut, fin),
+                                self.compte_naif(debut, fin, weekend, feries)
+                            )
+
+    @override_settings(JOURS_WEEKEND=(5, 6), JOURS_FERIES=['2026-03-20'])
+    def test_feries(self):
+        self.assertEqual(
+            jours_ouvres.jours_feries(date(2025, 12, 1), date(2026, 5, 31)),
+            [date(2026, 1, 1), date(2026, 3, 20), date(2026, 5, 1), date(2026, 5, 25)]
+        )
+        # Mars 2026 : 22 jours de semaine, dont le vendredi 20 férié
+        self.assertEqual(jours_ouvres.compter_jours_ouvres(date(2026, 3, 1), date(2026, 3, 31)), 21)
+        # 1er mai 2027 : un samedi, pas décompté deux fois
+        self.assertEqual(jours_ouvres.compter_jours_ouvres(date(2027, 4, 26), date(2027, 5, 2)), 5)
+        self.assertEqual(jours_ouvres.compter_jours_ouvres(date(2026, 3, 2), date(2026, 3, 1)), 0)
+
+    @override_settings(JOURS_WEEKEND=(5, 6), JOURS_FERIES=[])
+    def test_jours_absence_par_personne(self):
+        absences = [
+            (1, date(2026, 2, 25), date(2026, 3, 4)),    # tronquée au 1er mars
+            (1, date(2026, 3, 3), date(2026, 3, 6)),     # chevauche la précédente
+            (1, date(2026, 3, 9), date(2026, 3, 9)),     # contiguë après le week-end
+            (2, date(2026, 3, 7), date(2026, 3, 8)),     # week-end seul
+            (3, date(2026, 4, 1), date(2026, 4, 3)),     # hors période
+        ]
+        debut, fin = date(2026, 3, 1), date(2026, 3, 31)
+        attendu = {1: 6, 2: 0}
+        self.assertEqual(jours_ouvres.jours_absence_par_personne(absences, debut, fin), attendu)
+        with mock.patch.object(jours_ouvres, 'np', None):
+            self.assertEqual(jours_ouvres.jours_absence_par_personne(absences, debut, fin), attendu)
+
+        disponibilite = jours_ouvres.disponibilite_par_personne(absences, debut, fin)
+        self.assertEqual(disponibilite[1], {'jours_absence': 6, 'jours_disponibles': 16, 'taux_disponibilite': 72.73})
+        self.assertEqual(disponibilite[2]['taux_disponibilite'], 100.0)
+
+    def test_fusion_et_taux(self):
+        self.assertEqual(
+            jours_ouvres.fusionner_intervalles([
+                (date(2026, 3, 5), date(2026, 3, 6)), (date(2026, 3, 1), date(2026, 3, 3)),
+                (date(2026, 3, 4), date(2026, 3, 4)), (date(2026, 3, 10), date(2026, 3, 12)),
+            ]),
+            [(date(2026, 3, 1), date(2026, 3, 6)), (date(2026, 3, 10), date(2026, 3, 12))]
+        )
+        self.assertEqual(jours_ouvres.taux_presence(5, 2, 22), 98.18)
+        self.assertEqual(jours_ouvres.taux_presence(0, 0, 22), 100)
+        self.assertEqual(jours_ouvres.taux_presence(1, 30, 22), 0)
+
+
+@override_settings(JOURS_WEEKEND=(5, 6), JOURS_FERIES=[])
+class PresenceRapportsMensuelsTests(TestCase):
+    """Présents, absents et taux de présence reposent sur les mêmes absences approuvées"""
+
+    def preparer(self, role, type_service, creer_agent):
+        chef = User.objects.create_user(role, password='x', role=role)
+        service = creer_service(type_service=type_service, chef=chef)
+        personnes = [creer_personne(service, i) for i in range(1, 6)]
+        for personne in personnes:
+            creer_agent(personne)
+            Absence.objects.create(
+                personne=personne, type_absence='CONGÉ_ANNUEL',
+                date_debut=date(2026, 3, 9), date_fin=date(2026, 3, 10),
+            )
+        Absence.objects.create(
+            personne=personnes[0], type_absence='CONGÉ_MALADIE', statut='APPROUVÉ',
+            date_debut=date(2026, 3, 2), date_fin=date(2026, 3, 3),
+        )
+        client = APIClient()
+        client.force_authenticate(chef)
+        return client
+
+    def test_rapport_enseignants(self):
+        client = self.preparer('chef_enseignant', 'enseignant', creer_enseignant)
+        response = client.get('/api/enseignants/rapport_mensuel/', {'mois': '2026-03'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['statistiques'], {
+            'total_enseignants': 5, 'enseignants_presents': 4, 'enseignants_absents': 1,
+            'jours_ouvres': 22, 'jours_ouvres_perdus': 2, 'taux_presence': 98.18,
+        })
+        self.assertEqual(response.data['absences_par_statut'], [
+            {'statut': 'APPROUVÉ', 'count': 1}, {'statut': 'EN_ATTENTE', 'count': 5},
+        ])
+
+    def test_rapport_pat(self):
+        client = self.preparer('chef_pat', 'pat', creer_pat)
+        response = client.get('/api/personnel-pat/rapport_mensuel/', {'mois': '2026-03'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['statistiques'], {
+            'total_pat': 5, 'agents_presents': 4, 'agents_absents': 1,
+            'jours_ouvres': 22, 'jours_ouvres_perdus': 2, 'taux_presence': 98.18,
+        })
+
+
+# ========================================
+# PROFIL DÉTAILLÉ ET HIÉRARCHIE
+# ========================================
+
+class ProfilEtHierarchieTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='admin_rh')
+        cls.chef = User.objects.create_user('chef', password='x', role='chef_enseignant')
+        cls.employe = User.objects.create_user('employe', password='x', role='employe')
+        cls.service = creer_service(chef=cls.chef)
+        autre_service = creer_service('Autre service')
+        cls.personne = creer_personne(cls.service, 1, user=cls.employe)
+        creer_personne(cls.service, 2)
+        creer_personne(autre_service, 3)
+        for jour in (2, 9, 16):
+            Absence.objects.create(
+                personne=cls.personne, type_absence='CONGÉ_ANNUEL',
+                date_debut=date(2026, 3, jour), date_fin=date(2026, 3, jour + 1),
+            )
+
+    def client_pour(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_hierarchie_par_role(self):
+        attendus = {self.admin: (3, 2, 3), self.chef: (2, 1, 3), self.employe: (1, 1, 3)}
+        for user, (personnes, services, absences) in attendus.items():
+            for url in ('/api/permissions/test_hierarchie/', '/api/debug/permissions/'):
+                with self.subTest(role=user.role, url=url):
+                    response = self.client_pour(user).get(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.data['access_tests'], {
+                        'personnes_visibles': personnes, 'services_visibles': services,
+                        'absences_visibles': absences,
+                    })
+
+    def test_profil_sections_et_limite(self):
+        url = f'/api/personnes/{self.personne.pk}/'
+        response = self.client_pour(self.admin).get(url, {'include': 'absences', 'limite': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [absence['date_debut'] for absence in response.data['absences']], ['2026-03-16', '2026-03-09']
+        )
+        self.assertNotIn('paies', response.data)
+
+        response = self.client_pour(self.admin).get(url, {'include': 'inconnue'})
+        self.assertEqual(response.status_code, 400)
+
+
+# ========================================
+# STRUCTURES
+# ========================================
+
+class ArborescenceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='admin_rh')
+        cls.chef = User.objects.create_user('chef', password='x', role='chef_enseignant')
+        enseignement = creer_service(chef=cls.chef)
+        pat = creer_service('PAT', 'pat')
+
+        def structure(nom, service, parent=None):
+            return Structure.objects.create(nom=nom, type_structure='Département', service=service,
+                                            parent_structure=parent)
+        cls.a = structure('A', enseignement)
+        cls.b = structure('B', enseignement, cls.a)
+        cls.c = structure('C', enseignement, cls.b)
+        cls.d = structure('D', enseignement, cls.a)
+        cls.x = structure('X', pat)
+        numero = 0
+        for noeud, nombre in ((cls.a, 2), (cls.b, 1), (cls.c, 3), (cls.x, 1)):
+            for _ in range(nombre):
+                numero += 1
+                creer_personne(noeud.service, numero, structure=noeud)
+
+    def arborescence(self, user, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/structures/arborescence/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def resume(self, noeuds):
+        return [
+            (n['nom'], n.get('nombre_employes'), n.get('nombre_employes_total'), self.resume(n['sous_structures']))
+            for n in noeuds
+        ]
+
+    def test_effectifs_directs_et_sous_arbre(self):
+        self.assertEqual(self.resume(self.arborescence(self.admin, effectifs='true')), [
+            ('A', 2, 6, [('B', 1, 4, [('C', 3, 3, [])]), ('D', 0, 0, [])]),
+            ('X', 1, 1, []),
+        ])
+
+    def test_profondeur_et_perimetre(self):
+        self.assertEqual(self.resume(self.arborescence(self.admin, max_depth=2)), [
+            ('A', None, None, [('B', None, None, []), ('D', None, None, [])]),
+            ('X', None, None, []),
+        ])
+        self.assertEqual([n['nom'] for n in self.arborescence(self.chef)], ['A'])
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        self.assertEqual(client.get('/api/structures/arborescence/', {'max_depth': 0}).status_code, 400)
+
+    def test_nombre_de_requetes_independant_de_la_taille(self):
+        with CaptureQueriesContext(connection) as avant:
+            self.arborescence(self.admin, effectifs='true')
+        parent = self.c
+        for i in range(5):
+            parent = Structure.objects.create(nom=f'N{i}', type_structure='Cellule', service=self.c.service,
+                                              parent_structure=parent)
+        with CaptureQueriesContext(connection) as apres:
+            donnees = self.arborescence(self.admin, effectifs='true')
+        self.assertEqual(len(apres), len(avant))
+        self.assertEqual(donnees[0]['nombre_employes_total'], 6)
+
+
+class CheminMaterialiseTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = creer_service()
+
+    def structure(self, nom, parent=None):
+        return Structure.objects.create(nom=nom, type_structure='Département', service=self.service,
+                                        parent_structure=parent)
+
+    def chemins(self):
+        return {s.nom: (s.chemin, s.niveau) for s in Structure.objects.all()}
+
+    def test_chemin_a_la_creation(self):
+        a = self.structure('A')
+        b = self.structure('B', a)
+        c = self.structure('C', b)
+        self.assertEqual(self.chemins(), {
+            'A': (f'/{a.pk}/', 0), 'B': (f'/{a.pk}/{b.pk}/', 1), 'C': (f'/{a.pk}/{b.pk}/{c.pk}/', 2),
+        })
+        self.assertEqual(list(c.ancetres()), [a, b])
+        self.assertEqual(set(a.descendants()), {b, c})
+        self.assertEqual(set(Structure.objects.sous_arbre(b)), {b, c})
+
+    def test_deplacement_reecrit_le_sous_arbre(self):
+        a, x = self.structure('A'), self.structure('X')
+        b = self.structure('B', a)
+        c = self.structure('C', b)
+        d = self.structure('D', c)
+
+        b.parent_structure = x
+        b.save()
+        self.assertEqual(self.chemins(), {
+            'A': (f'/{a.pk}/', 0), 'X': (f'/{x.pk}/', 0), 'B': (f'/{x.pk}/{b.pk}/', 1),
+            'C': (f'/{x.pk}/{b.pk}/{c.pk}/', 2), 'D': (f'/{x.pk}/{b.pk}/{c.pk}/{d.pk}/', 3),
+        })
+        self.assertEqual(set(a.descendants()), set())
+        self.assertEqual(set(x.descendants()), {b, c, d})
+
+        # Rattachement à la racine, depuis une instance relue
+        c = Structure.objects.get(pk=c.pk)
+        c.parent_structure = None
+        c.save()
+        self.assertEqual(self.chemins()['D'], (f'/{c.pk}/{d.pk}/', 1))
+        self.assertEqual(self.chemins()['B'], (f'/{x.pk}/{b.pk}/', 1))
+
+        # Une modification sans déplacement ne touche pas au chemin
+        d = Structure.objects.get(pk=d.pk)
+        d.nom = 'D bis'
+        with self.assertNumQueries(1):
+            d.save()
+        self.assertEqual(self.chemins()['D bis'], (f'/{c.pk}/{d.pk}/', 1))
+
+    def test_cycle_refuse(self):
+        a = self.structure('A')
+        b = self.structure('B', a)
+        a.parent_structure = b
+        with self.assertRaises(ValidationError):
+            a.save()
+        self.assertEqual(Structure.objects.get(pk=a.pk).parent_structure_id, None)
+
+    def test_employes_du_sous_arbre(self):
+        admin = User.objects.create_user('admin', password='x', role='admin_rh')
+        a = self.structure('A')
+        b = self.structure('B', a)
+        autre = self.structure('Autre')
+        for numero, structure in enumerate((a, b, b, autre), start=1):
+            creer_personne(self.service, numero, structure=structure)
+        client = APIClient()
+        client.force_authenticate(admin)
+        self.assertEqual(len(client.get(f'/api/structures/{a.pk}/employes/').data), 1)
+        self.assertEqual(len(client.get(f'/api/structures/{a.pk}/employes/', {'recursive': 'true'}).data), 3)
+
+
+# ========================================
+# MOTEUR DE PAIE
+# ========================================
+
+class CalculItsTests(SimpleTestCase):
+    """Barème par défaut : abattement 6 000, puis 15 % jusqu'à 9 000, 25 % jusqu'à 21 000, 40 % au-delà"""
+
+    def its(self, imposable):
+        return calculer_its(Decimal(imposable), PARAMETRES_PAIE)
+
+    def test_sous_abattement(self):
+        self.assertEqual(self.its('0'), Decimal('0.00'))
+        self.assertEqual(self.its('5999.99'), Decimal('0.00'))
+        self.assertEqual(self.its('6000'), Decimal('0.00'))
+
+    def test_limites_de_tranches(self):
+        self.assertEqual(self.its('6100'), Decimal('15.00'))
+        # Plafond de la première tranche : 9 000 × 15 %
+        self.assertEqual(self.its('15000'), Decimal('1350.00'))
+        self.assertEqual(self.its('15004'), Decimal('1351.00'))
+        # Plafond de la deuxième tranche : 1 350 + 12 000 × 25 %
+        self.assertEqual(self.its('27000'), Decimal('4350.00'))
+        self.assertEqual(self.its('27010'), Decimal('4354.00'))
+
+    def test_arrondi_au_centime(self):
+        # 0,01 × 25 % = 0,0025 → 0,00 ; 0,02 × 25 % = 0,005 → 0,01 (arrondi au demi supérieur)
+        self.assertEqual(self.its('15000.01'), Decimal('1350.00'))
+        self.assertEqual(self.its('15000.02'), Decimal('1350.01'))
+
+
+class CalculPaieTests(SimpleTestCase):
+
+    def test_titulaire(self):
+        carriere = {'grade': 'professeur', 'echelon': '3', 'indice': 1000}
+        calcul = calculer_paie(carriere, 2, PARAMETRES_PAIE)
+
+        lignes = {element['code']: element['montant'] for element in calcul['elements']}
+        self.assertEqual(lignes, {
+            '100': Decimal('30000.00'),   # 1 000 × 30
+            '110': Decimal('1800.00'),    # 3 échelons × 2 %
+            '120': Decimal('15000.00'),   # indemnité professeur
+            '150': Decimal('1600.00'),    # 2 enfants
+            '500': Decimal('1908.00'),    # 6 % de (traitement + échelon)
+            '600': Decimal('11506.80'),
+        })
+        self.assertEqual(calcul['salaire_brut'], Decimal('48400.00'))
+        self.assertEqual(calcul['deductions'], Decimal('13414.80'))
+        self.assertEqual(calcul['salaire_net'], Decimal('34985.20'))
+        # Allocations familiales non imposables
+        self.assertEqual(calcul['montant_imposable_mensuel'], Decimal('44892.00'))
+        self.assertEqual([element['ordre'] for element in calcul['elements']], [1, 2, 3, 4, 5, 6])
+
+    def test_contractuel(self):
+        carriere = {'grade': '', 'echelon': '', 'indice': None, 'salaire_mensuel': Decimal('20000')}
+        calcul = calculer_paie(carriere, 1, PARAMETRES_PAIE)
+
+        lignes = {element['code']: element for element in calcul['elements']}
+        # Ni majoration d'échelon ni indemnité de grade ; cotisation au lieu de la pension
+        self.assertEqual(set(lignes), {'100', '150', '500', '600'})
+        self.assertEqual(lignes['100']['libelle'], 'Salaire contractuel')
+        self.assertEqual(lignes['500']['libelle'], 'Cotisation sécurité sociale')
+        self.assertEqual(lignes['500']['montant'], Decimal('200.00'))
+        self.assertEqual(lignes['600']['montant'], Decimal('2550.00'))
+        self.assertEqual(calcul['salaire_brut'], Decimal('20800.00'))
+        self.assertEqual(calcul['salaire_net'], Decimal('18050.00'))
+
+    def test_plafond_enfants_allocation(self):
+        carriere = {'grade': 'assistant', 'echelon': '1', 'indice': 500}
+        six = calculer_paie(carriere, 6, PARAMETRES_PAIE)
+        dix = calculer_paie(carriere, 10, PARAMETRES_PAIE)
+        self.assertEqual(six['allocations_familiales'], Decimal('4800.00'))
+        self.assertEqual(dix, six)
+
+        sans_enfant = calculer_paie(carriere, 0, PARAMETRES_PAIE)
+        self.assertNotIn('150', [element['code'] for element in sans_enfant['elements']])
+
+    def test_nbi_du_pat(self):
+        parametres = {**PARAMETRES_PAIE, 'valeur_point_nbi': '10'}
+        carriere = {'grade': 'A1', 'echelon': 'Échelon 4', 'indice': 700, 'nbi': 20}
+        calcul = calculer_paie(carriere, 0, parametres)
+        lignes = {element['code']: element['montant'] for element in calcul['elements']}
+        self.assertEqual(lignes['130'], Decimal('200.00'))
+        self.assertEqual(calcul['salaire_brut'], lignes['100'] + lignes['110'] + lignes['130'])
+
+
+class LancementPaieTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = creer_service()
+        cls.enseignants = [creer_personne(cls.service, i) for i in (1, 2)]
+        creer_enseignant(cls.enseignants[0], grade='professeur', echelon='3', indice=1000)
+        creer_enseignant(cls.enseignants[1], grade='assistant', echelon='Échelon 7', indice=620)
+        cls.pat = creer_personne(cls.service, 3, 'pat')
+        creer_pat(cls.pat)
+        cls.contractuel = creer_personne(cls.service, 4, 'contractuel')
+        creer_contractuel(cls.contractuel)
+        # Sans fiche de carrière : paie non calculable
+        cls.sans_fiche = creer_personne(cls.service, 5)
+        creer_paie(cls.enseignants[0], '2026-02', nb_enfants=3, mode_reglement='Code 340')
+
+    def lancer(self, mois_annee='2026-03', **options):
+        return executer_lancement(preparer_lancement(mois_annee), **options)
+
+    def etat_paies(self, mois_annee='2026-03'):
+        return {
+            paie.personne_id: (paie.id, paie.salaire_brut, paie.salaire_net, montants_elements(paie))
+            for paie in Paie.objects.filter(mois_annee=mois_annee).prefetch_related('elements')
+        }
+
+    def test_paies_calculees(self):
+        lancement = self.lancer(taille_lot=2)
+
+        self.assertEqual(lancement.statut, 'TERMINE')
+        self.assertEqual(
+            (lancement.nombre_total, lancement.nombre_traites, lancement.nombre_ignores,
+             lancement.nombre_sans_carriere),
+            (5, 4, 0, 1)
+        )
+        self.assertEqual(lancement.progression, 100)
+        self.assertFalse(Paie.objects.filter(personne=self.sans_fiche).exists())
+
+        parametres = get_parametres()
+        for personne in Personne.objects.exclude(pk=self.sans_fiche.pk).select_related(
+                'enseignant', 'personnelpat', 'contractuel'):
+            paie = Paie.objects.get(personne=personne, mois_annee='2026-03')
+            attendu = calculer_paie(donnees_carriere(personne), paie.nb_enfants, parametres)
+            self.assertEqual(paie.salaire_net, attendu['salaire_net'])
+            self.assertEqual(montants_elements(paie), {e['code']: e['montant'] for e in attendu['elements']})
+
+        # Situation familiale et règlement repris de la paie précédente
+        paie = Paie.objects.get(personne=self.enseignants[0], mois_annee='2026-03')
+        self.assertEqual((paie.nb_enfants, paie.mode_reglement), (3, 'Code 340'))
+
+    def test_relance_idempotente(self):
+        self.lancer(taille_lot=2)
+        avant = self.etat_paies()
+        nombre_elements = ElementPaie.objects.count()
+
+        lancement = self.lancer(taille_lot=3)
+
+        self.assertEqual(lancement.statut, 'TERMINE')
+        self.assertEqual(self.etat_paies(), avant)
+        self.assertEqual(ElementPaie.objects.count(), nombre_elements)
+
+    def test_relance_met_a_jour_sauf_paies_payees(self):
+        self.lancer()
+        Paie.objects.filter(personne=self.pat, mois_annee='2026-03').update(statut_paiement='PAYÉ')
+        payee = self.etat_paies()[self.pat.pk]
+        Enseignant.objects.filter(personne=self.enseignants[1]).update(indice=700)
+        PersonnelPAT.objects.filter(personne=self.pat).update(indice=900)
+
+        lancement = self.lancer()
+
+        # La paie payée est ignorée, la personne sans fiche de carrière comptée à part
+        self.assertEqual(
+            (lancement.nombre_traites, lancement.nombre_ignores, lancement.nombre_sans_carriere), (3, 1, 1)
+        )
+        etat = self.etat_paies()
+        self.assertEqual(etat[self.pat.pk], payee)
+        self.assertEqual(etat[self.enseignants[1].pk][3]['100'], Decimal('21000.00'))
+
+    def test_reprise_apres_interruption(self):
+        traiter_lot = moteur_paie._traiter_lot
+        appels = []
+
+        def interrompu(*args, **kwargs):
+            appels.append(1)
+            if len(appels) == 2:
+                raise RuntimeError("coupure")
+            return traiter_lot(*args, **kwargs)
+
+        lancement = preparer_lancement('2026-03')
+        with mock.patch.object(moteur_paie, '_traiter_lot', side_effect=interrompu):
+            executer_lancement(lancement, taille_lot=2)
+
+        self.assertEqual(lancement.statut, 'ECHEC')
+        self.assertEqual(lancement.erreur, 'coupure')
+        # Seul le premier lot est acquis
+        premier_lot = list(Personne.objects.order_by('id').values_list('id', flat=True)[:2])
+        self.assertEqual(lancement.dernier_personne_id, premier_lot[1])
+        self.assertEqual(set(self.etat_paies()), set(premier_lot))
+
+        executer_lancement(lancement, taille_lot=2)
+
+        self.assertEqual(lancement.statut, 'TERMINE')
+        self.assertEqual(
+            (lancement.nombre_traites, lancement.nombre_ignores, lancement.nombre_sans_carriere), (4, 0, 1)
+        )
+        self.assertEqual(Paie.objects.filter(mois_annee='2026-03').count(), 4)
+        self.assertEqual(lancement.progression, 100)
+
+    def test_cumul_imposable_sur_l_annee(self):
+        self.lancer('2026-03')
+        self.lancer('2026-04')
+        mars = Paie.objects.get(personne=self.pat, mois_annee='2026-03')
+        avril = Paie.objects.get(personne=self.pat, mois_annee='2026-04')
+        self.assertEqual(
+            avril.montant_imposable_progressif,
+            mars.montant_imposable_progressif + avril.montant_imposable_mensuel
+        )
+
+
+# ========================================
+# TÂCHES DE FOND
+# ========================================
+
+@override_settings(TACHES_CONCURRENCE={'rapport_annuel': 1, 'lancement_paie': 1})
+class FileTachesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='rh', password='x', role='admin_rh')
+
+    def soumettre(self, type_tache, minute):
+        tache = taches.soumettre_tache(type_tache, {}, self.user)
+        # Ordre d'arrivée explicite (date_creation est renseignée automatiquement)
+        Tache.objects.filter(pk=tache.pk).update(date_creation=datetime(2026, 3, 2, 8, minute, tzinfo=dt_timezone.utc))
+        return tache
+
+    def vieillir(self, tache, minutes=60):
+        """Dernier signe de vie il y a `minutes` minutes"""
+        Tache.objects.filter(pk=tache.pk).update(date_maj=timezone.now() - timedelta(minutes=minutes))
+
+    def test_reservation_par_anciennete_et_limite_par_type(self):
+        rapport_1 = self.soumettre('rapport_annuel', 0)
+        rapport_2 = self.soumettre('rapport_annuel', 1)
+        paie = self.soumettre('lancement_paie', 2)
+
+        tache = taches.reserver_tache('w1')
+        self.assertEqual(tache.pk, rapport_1.pk)
+        tache.refresh_from_db()
+        self.assertEqual((tache.statut, tache.worker, tache.tentatives), ('EN_COURS', 'w1', 1))
+        self.assertIsNotNone(tache.date_debut)
+
+        # rapport_annuel a atteint sa limite : la tâche plus récente d'un autre type passe
+        self.assertEqual(taches.reserver_tache('w2').pk, paie.pk)
+        self.assertIsNone(taches.reserver_tache('w3'))
+
+        Tache.objects.filter(pk=rapport_1.pk).update(statut='TERMINE')
+        self.assertEqual(taches.reserver_tache('w3').pk, rapport_2.pk)
+
+    def test_tache_annulee_non_reservee(self):
+        tache = self.soumettre('rapport_annuel', 0)
+        self.assertTrue(taches.annuler_tache(tache))
+        self.assertIsNone(taches.reserver_tache('w1'))
+        self.assertFalse(taches.annuler_tache(tache))
+
+    def test_execution_enregistre_resultat_ou_erreur(self):
+        def echoue(tache):
+            raise ValueError("paramètres invalides")
+
+        executeurs = {'rapport_annuel': lambda tache: {'lignes': 3}, 'lancement_paie': echoue}
+        self.soumettre('rapport_annuel', 0)
+        self.soumettre('lancement_paie', 1)
+        with mock.patch.dict(taches.EXECUTEURS, executeurs):
+            reussie = taches.executer_tache(taches.reserver_tache('w1'))
+            echouee = taches.executer_tache(taches.reserver_tache('w1'))
+
+        reussie.refresh_from_db()
+        self.assertEqual((reussie.statut, reussie.resultat, reussie.progression), ('TERMINE', {'lignes': 3}, 100))
+        self.assertEqual(reussie.expire_le, reussie.date_fin + timedelta(hours=taches.RETENTION_HEURES_DEFAUT))
+        echouee.refresh_from_db()
+        self.assertEqual((echouee.statut, echouee.erreur), ('ECHEC', 'paramètres invalides'))
+        self.assertIsNone(echouee.resultat)
+
+    def test_resultat_abandonne_si_tache_reprise(self):
+        def remise_en_file(tache):
+            # Pendant l'exécution, la tâche est remise en file (worker jugé arrêté)
+            Tache.objects.filter(pk=tache.pk).update(statut='EN_ATTENTE', worker='')
+            return {'lignes': 3}
+
+        self.soumettre('rapport_annuel', 0)
+        with mock.patch.dict(taches.EXECUTEURS, {'rapport_annuel': remise_en_file}):
+            tache = taches.executer_tache(taches.reserver_tache('w1'))
+
+        self.assertEqual((tache.statut, tache.resultat, tache.date_fin), ('EN_ATTENTE', None, None))
+        self.assertEqual(taches.reserver_tache('w2').tentatives, 2)
+
+    def test_pouls_signe_de_vie(self):
+        self.soumettre('rapport_annuel', 0)
+        tache = taches.reserver_tache('w1')
+        self.vieillir(tache)
+        pouls = taches.Pouls(tache, 0)
+
+        # Deux battements puis arrêt ; la connexion du thread n'est pas fermée dans le test
+        with mock.patch.object(pouls.arret, 'wait', side_effect=[False, False, True]), \
+                mock.patch.object(taches, 'connection'):
+            pouls.run()
+        tache.refresh_from_db()
+        self.assertGreater(tache.date_maj, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(taches.recuperer_orphelines(), 0)
+
+        # Remise en file entre-temps : le pouls de l'ancienne réservation ne la ranime pas
+        Tache.objects.filter(pk=tache.pk).update(statut='EN_ATTENTE', worker='')
+        self.vieillir(tache)
+        with mock.patch.object(pouls.arret, 'wait', side_effect=[False, True]), \
+                mock.patch.object(taches, 'connection'):
+            pouls.run()
+        self.assertLess(Tache.objects.get(pk=tache.pk).date_maj, timezone.now() - timedelta(minutes=59))
+
+    @override_settings(TACHES_DELAI_ORPHELINE_MINUTES=30)
+    def test_recuperation_des_orphelines(self):
+        orpheline = self.soumettre('rapport_annuel', 0)
+        epuisee = self.soumettre('lancement_paie', 1)
+        active = self.soumettre('rapport_annuel', 2)
+        Tache.objects.update(statut='EN_COURS', worker='w1', tentatives=1)
+        Tache.objects.filter(pk=epuisee.pk).update(tentatives=taches.MAX_TENTATIVES)
+        self.vieillir(orpheline, 31)
+        self.vieillir(epuisee, 31)
+        self.vieillir(active, 10)
+
+        self.assertEqual(taches.recuperer_orphelines(), 1)
+
+        etats = {t.pk: (t.statut, t.worker) for t in Tache.objects.all()}
+        self.assertEqual(etats[orpheline.pk], ('EN_ATTENTE', ''))
+        self.assertEqual(etats[epuisee.pk][0], 'ECHEC')
+        self.assertEqual(etats[active.pk], ('EN_COURS', 'w1'))
+        self.assertIsNotNone(Tache.objects.get(pk=epuisee.pk).expire_le)
+
+        # Reprise par un autre worker, tentative suivante
+        Tache.objects.filter(pk=active.pk).update(statut='TERMINE')
+        reprise = taches.reserver_tache('w2')
+        self.assertEqual((reprise.pk, reprise.worker, reprise.tentatives), (orpheline.pk, 'w2', 2))
+
+
+# ========================================
+# VALIDATION DES ABSENCES
+# ========================================
+
+class FileValidationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='admin_rh')
+        cls.chef = User.objects.create_user('chef', password='x', role='chef_enseignant')
+        cls.employe = User.objects.create_user('employe', password='x', role='employe')
+        cls.service = creer_service('Enseignement', 'enseignant', cls.chef)
+        cls.autre_service = creer_service('Autre service')
+        cls.agent = creer_personne(cls.service, 1)
+        cls.agent_autre = creer_personne(cls.autre_service, 2)
+        cls.aujourd_hui = timezone.localdate()
+        # Délai avant le début -> urgence attendue (bornes comprises)
+        cls.attendues = {}
+        for delai, urgence in [(-2, 'urgente'), (0, 'urgente'), (3, 'urgente'), (4, 'semaine'),
+                               (7, 'semaine'), (8, 'future'), (30, 'future')]:
+            debut = cls.aujourd_hui + timedelta(days=delai)
+            absence = Absence.objects.create(
+                personne=cls.agent, type_absence='CONGÉ_ANNUEL', date_debut=debut, date_fin=debut + timedelta(days=1)
+            )
+            cls.attendues[absence.pk] = urgence
+        cls.hors_service = Absence.objects.create(
+            personne=cls.agent_autre, type_absence='CONGÉ_ANNUEL',
+            date_debut=cls.aujourd_hui + timedelta(days=1), date_fin=cls.aujourd_hui + timedelta(days=2),
+        )
+        Absence.objects.create(
+            personne=cls.agent, type_absence='CONGÉ_MALADIE', statut='APPROUVÉ',
+            date_debut=cls.aujourd_hui, date_fin=cls.aujourd_hui,
+        )
+
+    def client_de(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_urgence_annotee_et_comptee(self):
+        absences = approbations.absences_a_valider(self.service)
+        with self.assertNumQueries(1):
+            file = list(approbations.annoter_file(absences, self.aujourd_hui))
+        self.assertEqual({absence.pk: absence.urgence for absence in file}, self.attendues)
+        self.assertEqual([a.date_debut for a in file], sorted(a.date_debut for a in file))
+        self.assertEqual({absence.approbateur_id for absence in file}, {self.chef.pk})
+
+        for urgence in approbations.URGENCES:
+            with self.subTest(urgence=urgence):
+                self.assertEqual(
+                    set(absences.filter(approbations.filtre_urgence(urgence, self.aujourd_hui))
+                        .values_list('pk', flat=True)),
+                    {pk for pk, attendue in self.attendues.items() if attendue == urgence}
+                )
+        self.assertEqual(
+            approbations.compter_file(absences, self.aujourd_hui),
+            {'total_en_attente': 7, 'urgentes': 3, 'cette_semaine': 2, 'futures': 2}
+        )
+
+    def test_planning_validation_du_chef(self):
+        response = self.client_de(self.chef).get('/api/absences/planning_validation/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['statistiques'],
+            {'total_en_attente': 7, 'urgentes': 3, 'cette_semaine': 2, 'futures': 2}
+        )
+        for cle, urgence in [('absences_urgentes', 'urgente'), ('absences_semaine', 'semaine'),
+                             ('absences_futures', 'future')]:
+            with self.subTest(urgence=urgence):
+                self.assertEqual(
+                    [a['id'] for a in response.data[cle]],
+                    [pk for pk, attendue in self.attendues.items() if attendue == urgence]
+                )
+                self.assertTrue(all(a['peut_approuver'] for a in response.data[cle]))
+
+        self.assertEqual(self.client_de(self.employe).get('/api/absences/planning_validation/').status_code, 403)
+
+    def test_file_validation_filtree(self):
+        client = self.client_de(self.chef)
+        response = client.get('/api/absences/file_validation/', {'urgence': 'semaine'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [a['id'] for a in response.data['results']],
+            [pk for pk, urgence in self.attendues.items() if urgence == 'semaine']
+        )
+        # Effectifs de toute la file, pas seulement de l'urgence demandée
+        self.assertEqual(response.data['statistiques']['total_en_attente'], 7)
+        self.assertEqual(client.get('/api/absences/file_validation/', {'urgence': 'hier'}).status_code, 400)
+
+        response = self.client_de(self.admin).get(
+            '/api/absences/file_validation/', {'service': self.autre_service.pk}
+        )
+        self.assertEqual([a['id'] for a in response.data['results']], [self.hors_service.pk])
+        self.assertEqual(response.data['statistiques']['urgentes'], 1)
+
+    def test_en_attente_approbation_triee(self):
+        response = self.client_de(self.chef).get('/api/absences/en_attente_approbation/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([a['id'] for a in response.data['results']], list(self.attendues))
+        self.assertEqual(response.data['results'][0]['urgence'], 'urgente')
+
+    def test_validation_en_lot_resultat_par_id(self):
+        urgentes = [pk for pk, urgence in self.attendues.items() if urgence == 'urgente']
+        Absence.objects.filter(pk=urgentes[1]).update(statut='REFUSÉ')
+        ids = [urgentes[0], urgentes[1], self.hors_service.pk, 0, urgentes[0]]
+
+        resultats = valider_absences_en_lot(ids, 'approuver', self.chef, 'Accord', service=self.service)
+
+        self.assertEqual(
+            [(r['absence_id'], r['resultat'], r['statut']) for r in resultats],
+            [(urgentes[0], 'traitee', 'APPROUVÉ'), (urgentes[1], 'deja_traitee', 'REFUSÉ'),
+             (self.hors_service.pk, 'hors_perimetre', None), (0, 'introuvable', None)]
+        )
+        absence = Absence.objects.get(pk=urgentes[0])
+        self.assertEqual((absence.statut, absence.approuve_par, absence.commentaire_approbateur),
+                         ('APPROUVÉ', self.chef, 'Accord'))
+        self.assertEqual(Absence.objects.get(pk=self.hors_service.pk).statut, 'EN_ATTENTE')
+
+
+# ========================================
+# COMPTEURS D'ABSENCES
+# ========================================
+
+class CompteursAbsencesTests(TestCase):
+    """Les compteurs tenus à jour restent égaux à un recalcul complet"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.chef = User.objects.create_user('chef', password='x', role='chef_enseignant')
+        cls.service = creer_service(chef=cls.chef)
+        cls.autre_service = creer_service('Autre service')
+        cls.personnes = [creer_personne(cls.service, i) for i in (1, 2)]
+
+    def etat(self):
+        return set(
+            CompteurAbsences.objects.exclude(absences=0, debuts=0)
+            .values_list('service_id', 'jour', 'type_absence', 'statut', 'absences', 'debuts')
+        )
+
+    def assertEgalRecalcul(self):
+        tenu = self.etat()
+        compteurs.reconstruire()
+        self.assertEqual(tenu, self.etat())
+
+    def absence(self, personne, debut, jours, type_absence='CONGÉ_ANNUEL'):
+        return Absence.objects.create(
+            personne=personne, type_absence=type_absence,
+            date_debut=debut, date_fin=debut + timedelta(days=jours - 1),
+        )
+
+    def test_creation_modification_suppression(self):
+        a = self.absence(self.personnes[0], date(2026, 3, 2), 5)
+        b = self.absence(self.personnes[1], date(2026, 3, 4), 3, 'CONGÉ_MALADIE')
+        self.assertEgalRecalcul()
+        self.assertEqual(compteurs.absences_par_jour(self.service, date(2026, 3, 1), date(2026, 3, 7)),
+                         [0, 1, 1, 2, 2, 2, 0])
+
+        a.date_fin = date(2026, 3, 10)
+        a.save()
+        self.assertEgalRecalcul()
+
+        a.statut = 'APPROUVÉ'
+        a.save()
+        self.assertEgalRecalcul()
+
+        b.delete()
+        self.assertEgalRecalcul()
+        self.assertEqual(compteurs.total_absences(self.service), 1)
+
+    def test_validation_en_lot(self):
+        absences = [self.absence(self.personnes[i % 2], date(2026, 4, 1 + i), 2) for i in range(4)]
+        valider_absences_en_lot([a.id for a in absences[:3]], 'approuver', self.chef, service=self.service)
+        self.assertEgalRecalcul()
+        self.assertEqual(
+            compteurs.absences_periode(self.service, date(2026, 4, 1), date(2026, 4, 30), statuts=['APPROUVÉ']),
+            [('CONGÉ_ANNUEL', 'APPROUVÉ', 3)]
+        )
+
+    def test_absences_et_non_agents(self):
+        # Deux absences du même agent le même jour : deux absences, un seul agent absent
+        self.absence(self.personnes[0], date(2026, 6, 1), 3)
+        self.absence(self.personnes[0], date(2026, 6, 2), 1)
+        self.assertEgalRecalcul()
+        self.assertEqual(compteurs.absences_par_jour(self.service, date(2026, 6, 1), date(2026, 6, 3)), [1, 2, 1])
+
+    def test_changement_de_service(self):
+        self.absence(self.personnes[0], date(2026, 5, 4), 3)
+        self.absence(self.personnes[1], date(2026, 5, 5), 3)
+        personne = self.personnes[0]
+        personne.service = self.autre_service
+        personne.save()
+        self.assertEgalRecalcul()
+        self.assertEqual(compteurs.total_absences(self.service), 1)
+        self.assertEqual(compteurs.total_absences(self.autre_service), 1)
+
+
+# ========================================
+# INSTRUMENTATION
+# ========================================
+
+class InstrumentationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='admin_rh')
+        service = creer_service()
+        for i in range(1, 4):
+            creer_personne(service, i)
+
+    def setUp(self):
+        instrumentation.registre.reinitialiser()
+        self.client.force_login(self.admin)
+
+    def serie(self, methode, vue, statut='2xx'):
+        return instrumentation.registre._series[(methode, vue, statut)]
+
+    def test_signature_des_listes_in(self):
+        self.assertEqual(
+            instrumentation.signature('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            instrumentation.signature('SELECT * FROM t WHERE id IN (%s, %s)'),
+        )
+        self.assertNotEqual(
+            instrumentation.signature('SELECT * FROM t WHERE id = %s'),
+            instrumentation.signature('SELECT * FROM u WHERE id = %s'),
+        )
+
+    def test_requetes_repetees(self):
+        mesure = instrumentation.MesureRequete()
+        for sql in ['SELECT a FROM t WHERE id = %s'] * 3 + ['SELECT b FROM t']:
+            mesure.executer(lambda *args: None, sql, (1,), False, {})
+        self.assertEqual((mesure.nombre_sql, mesure.doublons), (4, 2))
+        self.assertEqual(
+            {sql: nombre for sql, (nombre, _) in mesure.plus_couteuses()},
+            {'SELECT a FROM t WHERE id = %s': 3, 'SELECT b FROM t': 1}
+        )
+
+    def test_mesure_d_une_requete_api(self):
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get('/api/personnes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^sql;dur=[\d.]+;desc="\d+ requêtes, \d+ répétées", rendu;dur=[\d.]+, total;dur=[\d.]+$'
+        )
+
+        serie = self.serie('GET', response.resolver_match.view_name)
+        self.assertEqual(serie['requetes'], 1)
+        self.assertEqual(serie['sql'], len(requetes))
+        self.assertEqual(serie['octets'], len(response.content))
+        self.assertEqual(serie['buckets'][-1], 1)
+
+    @override_settings(INSTRUMENTATION_SEUIL_LENT_MS=0)
+    def test_requete_lente_journalisee(self):
+        with self.assertLogs('myapp.instrumentation', 'WARNING') as journal:
+            self.client.get('/api/personnes/')
+        self.assertIn('Requête lente GET /api/personnes/', journal.output[0])
+        self.assertEqual(journal.records[0].statut, 200)
+        self.assertTrue(journal.records[0].requetes_couteuses)
+
+    @override_settings(INSTRUMENTATION_ACTIVE=False)
+    def test_desactivable(self):
+        response = self.client.get('/api/personnes/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(instrumentation.registre._series, {})
+
+    def flux(self, morceaux):
+        def contenu():
+            for morceau in morceaux:
+                # Requête SQL exécutée pendant l'envoi
+                Personne.objects.count()
+                yield morceau
+        middleware = instrumentation.InstrumentationMiddleware(lambda request: StreamingHttpResponse(contenu()))
+        request = RequestFactory().get('/api/export/')
+        request.resolver_match = None
+        return middleware(request)
+
+    def test_flux_mesure_jusqu_a_la_fin(self):
+        response = self.flux([b'nom;prenom\n', b'Nom1;Prenom1\n'])
+        self.assertEqual(instrumentation.registre._series, {})
+
+        contenu = b''.join(response.streaming_content)
+        serie = self.serie('GET', 'inconnue')
+        self.assertEqual((serie['requetes'], serie['sql'], serie['octets']), (1, 2, len(contenu)))
+        response.close()
+        self.assertEqual(self.serie('GET', 'inconnue')['requetes'], 1)
+
+    def test_flux_interrompu(self):
+        response = self.flux([b'a' * 10, b'b' * 10, b'c' * 10])
+        next(iter(response.streaming_content))
+        # Client déconnecté : le serveur ferme la réponse, la mesure s'arrête là
+        response.close()
+        serie = self.serie('GET', 'inconnue')
+        self.assertEqual((serie['requetes'], serie['sql'], serie['octets']), (1, 1, 10))
+
+    def test_endpoint_metriques(self):
+        vue = self.client.get('/api/personnes/').resolver_match.view_name
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        texte = response.content.decode()
+        self.assertIn(f'mesrs_http_requetes_total{{methode="GET",vue="{vue}",statut="2xx"}} 1', texte)
+        self.assertIn(
+            f'mesrs_http_duree_secondes_bucket{{methode="GET",vue="{vue}",statut="2xx",le="+Inf"}} 1', texte
+        )
+
+        with override_settings(METRIQUES_IPS_AUTORISEES=[], METRIQUES_JETON='s3cret'):
+            self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+            response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer s3cret')
+            self.assertEqual(response.status_code, 200)
+
+
+# ========================================
+# JOURNALISATION
+# ========================================
+
+class MasquageTests(SimpleTestCase):
+
+    def filtrer(self, msg, args=(), **extra):
+        record = logging.makeLogRecord({'msg': msg, 'args': args, **extra})
+        self.assertTrue(journalisation.MasquageFilter().filter(record))
+        return record
+
+    def test_message_formate(self):
+        record = self.filtrer("Connexion %s", ({'username': 'alice', 'password': 'S3cret!'},))
+        self.assertEqual(record.getMessage(), "Connexion {'username': 'alice', 'password': ***}")
+        record = self.filtrer("Requête reçue: Authorization: Bearer eyJhbGciOi.abc-def")
+        self.assertEqual(record.getMessage(), "Requête reçue: Authorization: ***")
+        record = self.filtrer("url=/api/?page=2&token=abc123&format=csv")
+        self.assertEqual(record.getMessage(), "url=/api/?page=2&token=***&format=csv")
+
+    def test_arguments_apres_un_nom_sensible(self):
+        cas = [
+            ("refresh %s pour %s", ('eyJ.abc.def', 'alice'), "refresh *** pour alice"),
+            ("token=%r (100%%) pour %d", ('abc', 3), "token=*** (100%) pour 3"),
+            ("%(mot_de_passe)s de %(user)s", {'mot_de_passe': 'x1', 'user': 'bob'}, "*** de bob"),
+        ]
+        for msg, args, attendu in cas:
+            with self.subTest(msg=msg):
+                self.assertEqual(self.filtrer(msg, args).getMessage(), attendu)
+
+    def test_arguments_incompatibles(self):
+        record = self.filtrer("Échec %s %s password=abc", ('secret=zz',))
+        # Message laissé au gestionnaire (erreur de formatage), sans valeur sensible
+        self.assertEqual(record.msg, "Échec %s %s password=***")
+        self.assertEqual(record.args, ('secret=***',))
+
+    def test_champs_extra(self):
+        record = self.filtrer("Connexion", password='x', donnees={'access': 'y', 'nom': 'z'}, jetons=['Bearer abc'])
+        self.assertEqual(record.password, '***')
+        self.assertEqual(record.donnees, {'access': '***', 'nom': 'z'})
+        self.assertEqual(record.jetons, ['Bearer ***'])
+
+
+class JournalisationTests(SimpleTestCase):
+
+    def test_formatteur_json(self):
+        record = logging.makeLogRecord({
+            'name': 'myapp.views', 'levelname': 'INFO', 'msg': "Export %s", 'args': ('csv',),
+            'request_id': 'abc', 'role': 'admin_rh', 'utilisateur': None, 'lignes': 12,
+        })
+        donnees = json.loads(journalisation.FormatteurJSON().format(record))
+        self.assertEqual(
+            {cle: donnees[cle] for cle in ('niveau', 'logger', 'message', 'request_id', 'role', 'lignes')},
+            {'niveau': 'INFO', 'logger': 'myapp.views', 'message': 'Export csv', 'request_id': 'abc',
+             'role': 'admin_rh', 'lignes': 12}
+        )
+        self.assertNotIn('utilisateur', donnees)
+
+    def test_echantillonnage_debug(self):
+        filtre = journalisation.EchantillonnageFilter(taux=0.25)
+        debug = logging.makeLogRecord({'levelno': logging.DEBUG})
+        with mock.patch.object(journalisation.random, 'random', side_effect=[0.1, 0.5]):
+            self.assertEqual([filtre.filter(debug), filtre.filter(debug)], [True, False])
+        self.assertTrue(filtre.filter(logging.makeLogRecord({'levelno': logging.INFO})))
+
+    def test_gestionnaire_asynchrone(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'journaux', 'mesrs.log')
+            gestionnaire = journalisation.GestionnaireAsynchrone(fichier=chemin)
+            logger = logging.getLogger('myapp.tests.asynchrone')
+            logger.addHandler(gestionnaire)
+            logger.setLevel(logging.DEBUG)
+            try:
+                arguments = ['avant']
+                logger.info("Valeur %s", arguments)
+                logger.debug("Ignoré sous le niveau du fichier")
+                # Message résolu à l'appel : une modification ultérieure n'apparaît pas
+                arguments.append('après')
+            finally:
+                logger.removeHandler(gestionnaire)
+                gestionnaire.close()
+            with open(chemin, encoding='utf-8') as fichier:
+                lignes = [json.loads(ligne) for ligne in fichier]
+        self.assertEqual([ligne['message'] for ligne in lignes], ["Valeur ['avant']"])
+
+
+class ContexteRequeteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='admin_rh')
+
+    def test_identifiant_de_requete(self):
+        response = self.client.get('/api/metrics/', HTTP_X_REQUEST_ID='req-42')
+        self.assertEqual(response['X-Request-ID'], 'req-42')
+        response = self.client.get('/api/metrics/', HTTP_X_REQUEST_ID='<script>')
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+    def test_contexte_des_journaux(self):
+        journaux = []
+
+        def vue(request):
+            request.user = self.admin
+            record = logging.makeLogRecord({'msg': 'dans la vue'})
+            journalisation.ContexteRequeteFilter().filter(record)
+            journaux.append(record)
+            return HttpResponse()
+
+        middleware = journalisation.ContexteRequeteMiddleware(vue)
+        response = middleware(RequestFactory().get('/api/', HTTP_X_REQUEST_ID='req-7'))
+
+        record = journaux[0]
+        self.assertEqual((record.request_id, record.utilisateur, record.role), ('req-7', 'admin', 'admin_rh'))
+        self.assertGreaterEqual(record.duree_ms, 0)
+        self.assertEqual(response['X-Request-ID'], 'req-7')
+
+        # Hors requête : champs vides
+        record = logging.makeLogRecord({'msg': 'worker'})
+        journalisation.ContexteRequeteFilter().filter(record)
+        self.assertIsNone(record.request_id)
+
+    def test_connexion_sans_mot_de_passe_journalise(self):
+        with self.assertLogs('myapp.authentication', 'INFO') as journal:
+            echec = self.client.post('/api/auth/login/', {'username': 'admin', 'password': 'x-tres-secret'})
+            reussite = self.client.post('/api/auth/login/', {'username': 'admin', 'password': 'x'})
+        self.assertEqual((echec.status_code, reussite.status_code), (401, 200))
+        *echecs, connexion = journal.records
+        self.assertTrue(echecs)
+        self.assertEqual({record.levelname for record in echecs}, {'WARNING'})
+        self.assertEqual((connexion.getMessage(), connexion.utilisateur, connexion.role),
+                         ('Connexion réussie', 'admin', 'admin_rh'))
+        for record in journal.records:
+            self.assertNotIn('x-tres-secret', json.dumps(vars(record), default=str))
+
+
+# ========================================
+# DROITS
+# ========================================
+
+class DroitsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.chef = User.objects.create_user('chef', password='x', role='chef_pat')
+        cls.chef_sans_service = User.objects.create_user('chef_seul', password='x', role='chef_enseignant')
+        cls.employe = User.objects.create_user('employe', password='x', role='employe')
+        cls.service = creer_service('Scolarité', 'pat', cls.chef)
+
+    def connexion(self, user):
+        response = self.client.post('/api/auth/login/', {'username': user.username, 'password': 'x'})
+        self.assertEqual(response.status_code, 200)
+        return response.data['user']
+
+    def mes_permissions(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/permissions/mes_permissions/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_registre_par_role(self):
+        self.assertIn('approve_absence_pat', droits.permissions_du_role('chef_pat'))
+        self.assertEqual(droits.permissions_du_role('inconnu'), ['view_self'])
+        # Copie : le registre n'est pas modifiable par un appelant
+        droits.permissions_du_role('employe').append('view_all')
+        self.assertNotIn('view_all', droits.permissions_du_role('employe'))
+
+    def test_connexion_et_mes_permissions_concordent(self):
+        for user in (self.chef, self.chef_sans_service, self.employe):
+            with self.subTest(user=user.username):
+                connexion = self.connexion(user)
+                permissions = self.mes_permissions(user)
+                attendues = droits.permissions_du_role(user.role)
+                self.assertEqual((connexion['role'], connexion['permissions']), (user.role, attendues))
+                self.assertEqual((permissions['role'], permissions['permissions']), (user.role, attendues))
+
+        connexion = self.connexion(self.chef)
+        self.assertEqual(
+            (connexion['service_id'], connexion['service_name'], connexion['service_type'], connexion['is_chef']),
+            (self.service.pk, 'Scolarité', 'pat', True)
+        )
+        self.assertEqual(
+            self.mes_permissions(self.chef)['service'], {'id': self.service.pk, 'nom': 'Scolarité', 'type': 'pat'}
+        )
+        self.assertIsNone(self.connexion(self.chef_sans_service)['service_id'])
+        self.assertIsNone(self.mes_permissions(self.chef_sans_service)['service'])
+        self.assertNotIn('service', self.mes_permissions(self.employe))
+
+    @override_settings(SCOPE_CACHE_TIMEOUT=60)
+    def test_profil_en_cache_et_invalide(self):
+        droits.profil_droits(self.chef)
+        with self.assertNumQueries(0):
+            profil = droits.profil_droits(self.chef)
+        self.assertEqual(profil['service']['nom'], 'Scolarité')
+
+        # Renommage du service et changement de rôle : le cache est invalidé par les signaux
+        self.service.nom = 'Examens'
+        self.service.save()
+        self.assertEqual(droits.profil_droits(self.chef)['service']['nom'], 'Examens')
+        self.chef.role = 'employe'
+        self.chef.save()
+        profil = droits.profil_droits(self.chef)
+        self.assertEqual((profil['role'], profil['is_chef']), ('employe', False))
+        self.assertEqual(profil['permissions'], droits.permissions_du_role('employe'))
+
+
+# ========================================
+# LIVRE DE PAIE
+# ========================================
+
+class LivrePaieTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='admin_rh')
+        cls.chef = User.objects.create_user('chef', password='x', role='chef_pat')
+        cls.enseignement = creer_service('Enseignement', 'enseignant')
+        cls.pat = creer_service('PAT', 'pat', cls.chef)
+        cls.enseignants = [creer_personne(cls.enseignement, i) for i in (1, 2)]
+        cls.agent_pat = creer_personne(cls.pat, 3, 'pat')
+
+    def creer(self, personne, mois_annee, brut, net, grade='professeur', elements=(), **champs):
+        """Paie et éléments écrits dans une transaction, comme dans les vues"""
+        with self.captureOnCommitCallbacks(execute=True):
+            paie = creer_paie(personne, mois_annee, salaire_brut=Decimal(brut), salaire_net=Decimal(net),
+                              deductions=Decimal(brut) - Decimal(net), grade=grade, **champs)
+            for code, type_element, montant in elements:
+                ElementPaie.objects.create(
+                    paie=paie, code=code, libelle=f'Élément {code}', type_element=type_element, montant=montant
+                )
+        return paie
+
+    def etat(self):
+        return (
+            set(LivrePaie.objects.values_list(
+                'mois_annee', 'service_id', 'type_employe', 'grade', 'statut_paiement', 'nombre',
+                'salaire_brut', 'salaire_net', 'deductions', 'allocations_familiales')),
+            set(LivrePaieElement.objects.values_list(
+                'mois_annee', 'service_id', 'type_employe', 'grade', 'statut_paiement', 'code', 'type_element',
+                'nombre', 'montant')),
+        )
+
+    def assertLivreAJour(self):
+        """Le livre tenu à jour par les signaux est celui d'une reconstruction complète"""
+        etat = self.etat()
+        livre_paie.reconstruire()
+        self.assertEqual(etat, self.etat())
+
+    def test_mises_a_jour_incrementales(self):
+        paie = self.creer(self.enseignants[0], '2026-03', '50000', '42000',
+                          elements=[('100', 'GAIN', Decimal('50000')), ('600', 'RETENUE', Decimal('8000'))])
+        self.creer(self.enseignants[1], '2026-03', '30000', '27000', grade='assistant',
+                   elements=[('100', 'GAIN', Decimal('30000'))])
+        self.creer(self.agent_pat, '2026-03', '20000', '18000', grade='A1')
+        avril = self.creer(self.enseignants[0], '2026-04', '50000', '42000')
+        self.assertEqual(LivrePaie.objects.filter(mois_annee='2026-03', service=self.enseignement).count(), 2)
+        self.assertLivreAJour()
+
+        # Paie déplacée sur un autre mois : l'ancien compartiment est vidé
+        with self.captureOnCommitCallbacks(execute=True):
+            avril.mois_annee = '2026-05'
+            avril.save()
+        self.assertEqual(set(LivrePaie.objects.values_list('mois_annee', flat=True)), {'2026-03', '2026-05'})
+        self.assertLivreAJour()
+
+        # Modification d'un montant de la paie et de ses éléments
+        with self.captureOnCommitCallbacks(execute=True):
+            paie.elements.filter(code='600').update(montant=Decimal('9000'))
+            paie.salaire_net = Decimal('41000')
+            paie.deductions = Decimal('9000')
+            paie.statut_paiement = 'PAYÉ'
+            paie.save()
+        ligne = LivrePaie.objects.get(mois_annee='2026-03', service=self.enseignement, grade='professeur')
+        self.assertEqual((ligne.statut_paiement, ligne.salaire_net, ligne.deductions),
+                         ('PAYÉ', Decimal('41000'), Decimal('9000')))
+        self.assertEqual(
+            LivrePaieElement.objects.get(mois_annee='2026-03', code='600').montant, Decimal('9000')
+        )
+        self.assertLivreAJour()
+
+        # Suppression : les éléments suivent la paie
+        with self.captureOnCommitCallbacks(execute=True):
+            paie.delete()
+        self.assertFalse(LivrePaie.objects.filter(mois_annee='2026-03', grade='professeur').exists())
+        self.assertFalse(LivrePaieElement.objects.filter(mois_annee='2026-03', code='600').exists())
+        self.assertLivreAJour()
+
+    def test_mutation_d_agent(self):
+        self.creer(self.enseignants[1], '2026-03', '30000', '27000', grade='assistant')
+        self.creer(self.enseignants[1], '2026-04', '30000', '27000', grade='assistant')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.enseignants[1].service = self.pat
+            self.enseignants[1].save()
+        # Paies comptées dans le service actuel de l'agent, grade figé sur la paie
+        self.assertEqual(
+            set(LivrePaie.objects.values_list('mois_annee', 'service_id', 'grade')),
+            {('2026-03', self.pat.pk, 'assistant'), ('2026-04', self.pat.pk, 'assistant')}
+        )
+        self.assertLivreAJour()
+
+    def test_plusieurs_ecritures_un_seul_recalcul(self):
+        with mock.patch.object(livre_paie, 'rafraichir', wraps=livre_paie.rafraichir) as rafraichir:
+            with self.captureOnCommitCallbacks(execute=True):
+                for i, personne in enumerate(self.enseignants):
+                    creer_paie(personne, '2026-03', grade='professeur', salaire_brut=Decimal(1000 * (i + 1)))
+        rafraichir.assert_called_once_with('2026-03', {self.enseignement.pk})
+        self.assertEqual(LivrePaie.objects.get().salaire_brut, Decimal('3000'))
+
+    def test_resume_mensuel_et_annuel(self):
+        self.creer(self.enseignants[0], '2026-03', '50000', '42000',
+                   elements=[('100', 'GAIN', Decimal('50000')), ('600', 'RETENUE', Decimal('8000'))])
+        self.creer(self.agent_pat, '2026-03', '20000', '18000', grade='A1', allocations_familiales=Decimal('900'),
+                   elements=[('100', 'GAIN', Decimal('20000'))])
+        self.creer(self.agent_pat, '2026-05', '21000', '19000', grade='A1')
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        response = client.get('/api/paies/resume_mensuel/', {'mois': '2026-03', 'par': 'code'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {cle: response.data[cle] for cle in ('nombre_employes', 'total_brut', 'total_net',
+                                                 'total_deductions', 'total_allocations')},
+            {'nombre_employes': 2, 'total_brut': Decimal('70000'), 'total_net': Decimal('60000'),
+             'total_deductions': Decimal('10000'), 'total_allocations': Decimal('900')}
+        )
+        self.assertEqual(
+            [(d['code'], d['type_element'], d['nombre'], d['montant']) for d in response.data['details']],
+            [('100', 'GAIN', 2, Decimal('70000')), ('600', 'RETENUE', 1, Decimal('8000'))]
+        )
+
+        response = client.get('/api/paies/resume_mensuel/', {'mois': '2026-03', 'par': 'service'})
+        self.assertEqual(
+            [(d['service'], d['service_nom'], d['total_net']) for d in response.data['details']],
+            [(self.enseignement.pk, 'Enseignement', Decimal('42000')), (self.pat.pk, 'PAT', Decimal('18000'))]
+        )
+        self.assertEqual(client.get('/api/paies/resume_mensuel/', {'mois': '2026-03', 'par': 'x'}).status_code, 400)
+
+        response = client.get('/api/paies/resume_annuel/', {'annee': '2026', 'type_employe': 'pat'})
+        self.assertEqual(len(response.data['mois']), 12)
+        self.assertEqual(response.data['mois'][4]['total_net'], Decimal('19000'))
+        self.assertEqual((response.data['total']['nombre_employes'], response.data['total']['total_net']),
+                         (2, Decimal('37000')))
+
+        # Le chef ne voit que son service
+        client.force_authenticate(self.chef)
+        response = client.get('/api/paies/resume_mensuel/', {'mois': '2026-03', 'service': self.enseignement.pk})
+        self.assertEqual((response.data['nombre_employes'], response.data['total_net']), (1, Decimal('18000')))
+
+
+# ========================================
+# BULLETINS DE SALAIRE
+# ========================================
+
+class BulletinsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='admin_rh')
+        cls.service = creer_service('Scolarité', 'pat')
+        autre = creer_service('Autre service', 'pat')
+        cls.paies = []
+        for i, service in [(1, cls.service), (2, cls.service), (3, cls.service), (4, autre)]:
+            paie = creer_paie(creer_personne(service, i, nom=f"Ould Ahmed{i}"), '2026-03', grade='A1')
+            ElementPaie.objects.create(paie=paie, code='100', libelle='Traitement', type_element='GAIN',
+                                       montant=Decimal('1000'))
+            cls.paies.append(paie)
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglages = override_settings(MEDIA_ROOT=dossier.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def paie(self, index=0):
+        return bulletins.paies_du_lot(Paie.objects.filter(pk=self.paies[index].pk)).get()
+
+    def test_bulletin_rendu_une_fois_par_contenu(self):
+        with mock.patch.object(bulletins, 'rendre_bulletin', wraps=bulletins.rendre_bulletin) as rendre:
+            hachage, chemin = bulletins.bulletin_pdf(self.paie())
+            self.assertEqual(bulletins.bulletin_pdf(self.paie()), (hachage, chemin))
+            # Statut de paiement non affiché : même bulletin
+            Paie.objects.filter(pk=self.paies[0].pk).update(statut_paiement='PAYÉ')
+            self.assertEqual(bulletins.bulletin_pdf(self.paie())[0], hachage)
+            self.assertEqual(rendre.call_count, 1)
+
+            # Élément modifié : nouveau bulletin, l'ancien reste tel quel
+            self.paies[0].elements.update(montant=Decimal('1200'))
+            nouveau, nouveau_chemin = bulletins.bulletin_pdf(self.paie())
+            self.assertEqual(rendre.call_count, 2)
+        self.assertNotEqual(nouveau, hachage)
+        self.assertEqual(chemin, f'bulletins/{hachage[:2]}/{hachage}.pdf')
+        for fichier in (chemin, nouveau_chemin):
+            with default_storage.open(fichier, 'rb') as pdf:
+                contenu = pdf.read()
+            self.assertTrue(contenu.startswith(b'%PDF-'))
+            self.assertTrue(contenu.rstrip().endswith(b'%%EOF'))
+
+        with mock.patch.object(bulletins, 'VERSION_GABARIT', bulletins.VERSION_GABARIT + 1):
+            self.assertNotEqual(bulletins.bulletin_pdf(self.paie())[0], nouveau)
+
+    def test_endpoint_bulletin_etag(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = f'/api/paies/{self.paies[0].pk}/bulletin.pdf/'
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF-'))
+        response.close()
+
+        etag = response['ETag']
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def lot(self):
+        return bulletins.paies_du_lot(Paie.objects.filter(personne__service=self.service))
+
+    def test_zip_du_lot(self):
+        fichier = io.BytesIO()
+        self.assertEqual(bulletins.ecrire_zip(self.lot(), fichier), {'nombre': 3, 'rendus': 3})
+        # Seconde archive : aucun bulletin rendu à nouveau
+        self.assertEqual(bulletins.ecrire_zip(self.lot(), io.BytesIO()), {'nombre': 3, 'rendus': 0})
+
+        with zipfile.ZipFile(fichier) as archive:
+            self.assertEqual(
+                archive.namelist(),
+                [f'2026-03/T00000{i}_Ould_Ahmed{i}_Prenom{i}.pdf' for i in (1, 2, 3)]
+            )
+            _, chemin = bulletins.bulletin_pdf(self.paie(1))
+            with default_storage.open(chemin, 'rb') as pdf:
+                self.assertEqual(archive.read(archive.namelist()[1]), pdf.read())
+
+    def test_rendu_dans_un_pool(self):
+        with mock.patch.object(bulletins, 'SEUIL_POOL', 2):
+            chemins, rendus = bulletins.generer_bulletins(self.lot(), processus=2)
+        self.assertEqual(rendus, 3)
+        self.assertEqual([paie.pk for paie, _ in chemins], [paie.pk for paie in self.paies[:3]])
+        self.assertTrue(all(default_storage.exists(chemin) for _, chemin in chemins))
+        self.assertEqual(chemins[0][1], bulletins.bulletin_pdf(self.paie())[1])
+
+    def test_endpoint_zip_mensuel(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/paies/bulletins/', {'mois': '2026-03', 'service': self.service.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="bulletins_2026-03_{self.service.pk}.zip"')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(len(archive.namelist()), 3)
+        response.close()
+        self.assertEqual(client.get('/api/paies/bulletins/', {'mois': 'mars'}).status_code, 400)
+
+
+# ========================================
+# SIMULATION
+# ========================================
+
+class SimulationTests(TestCase):
+    """simulation.calculer applique les règles de calculer_paie : mêmes montants au centime"""
+
+    @classmethod
+    def setUpTestData(cls):
+        enseignement = creer_service('Enseignants', 'enseignant')
+        pat = creer_service('PAT', 'pat')
+        contrats = creer_service('Contractuels', 'contractuel')
+        grades = ['professeur', 'maitre_assistant', 'docteur', 'assistant']
+        numero = 0
+        for i in range(20):
+            numero += 1
+            personne = creer_personne(enseignement, numero)
+            creer_enseignant(personne, grade=grades[i % 4], echelon=str(i % 11), indice=397 + 37 * i)
+            creer_paie(personne, '2026-01', nb_enfants=i % 9)
+        for i in range(15):
+            numero += 1
+            personne = creer_personne(pat, numero)
+            creer_pat(personne, grade=f'B{i % 3}', echelon=f'Échelon {i % 8}', indice=301 + 53 * i, nbi=7 * i)
+            creer_paie(personne, '2026-01', nb_enfants=(i * 5) % 8)
+        for i in range(10):
+            numero += 1
+            personne = creer_personne(contrats, numero)
+            creer_contractuel(personne, salaire=Decimal('7333.33') + Decimal('1234.57') * i)
+        # Salaire contractuel non renseigné : ignoré, comme par le moteur de paie
+        numero += 1
+        creer_contractuel(creer_personne(contrats, numero), salaire=None)
+
+    def attendus(self):
+        parametres = get_parametres()
+        enfants = dict(Paie.objects.values_list('personne_id', 'nb_enfants'))
+        resultats = {}
+        for personne in Personne.objects.select_related('enseignant', 'personnelpat', 'contractuel'):
+            carriere = donnees_carriere(personne)
+            if carriere is not None:
+                resultats[personne.pk] = calculer_paie(carriere, enfants.get(personne.pk, 0), parametres)
+        return resultats
+
+    def verifier(self):
+        effectif, ignores = simulation.charger_effectif()
+        self.assertEqual(ignores, 1)
+        montants = simulation.calculer(effectif, simulation.parametres_scenario({}))
+        attendus = self.attendus()
+        self.assertEqual(sorted(effectif['id']), sorted(attendus))
+        for i, pk in enumerate(effectif['id']):
+            attendu = attendus[pk]
+            for montant, cle in (('brut', 'salaire_brut'), ('net', 'salaire_net'),
+                                 ('deductions', 'deductions'), ('allocations', 'allocations_familiales')):
+                with self.subTest(personne=pk, montant=montant):
+                    self.assertEqual(Decimal(str(round(float(montants[montant][i]), 2))), attendu[cle])
+
+    def test_numpy_egal_moteur_de_paie(self):
+        if simulation.np is None:
+            self.skipTest("NumPy non installé")
+        self.verifier()
+
+    def test_python_egal_moteur_de_paie(self):
+        with mock.patch.object(simulation, 'np', None):
+            self.verifier()
+
+    @override_settings(PAIE_PARAMETRES={
+        'valeur_point_indice': '33.5', 'valeur_point_nbi': '12', 'taux_echelon': '0.025',
+        'max_enfants_allocation': 4, 'taux_pension': '0.07',
+    })
+    def test_parametres_surcharges(self):
+        self.verifier()
+        with mock.patch.object(simulation, 'np', None):
+            self.verifier()
+
+    def test_scenario_sans_changement(self):
+        resultat = simulation.simuler({})
+        self.assertEqual(resultat['effectif'], 45)
+        self.assertEqual(resultat['ecart'], dict.fromkeys(simulation.MONTANTS, 0))
+        self.assertEqual(resultat['personnes'], [])
+
+    def test_scenario_invalide(self):
+        with self.assertRaises(ValueError):
+            simulation.parametres_scenario({'inconnu': 1})
+        with self.assertRaises(ValueError):
+            simulation.parametres_scenario({'valeur_point_indice': 'abc'})
+
+
+# ========================================
+# PAGINATION PAR CLÉ
+# ========================================
+
+class PaginationTriMixte(KeysetPagination):
+    ordering = ('type_absence', '-date_debut')
+    page_size = 4
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        service = creer_service()
+        personne = creer_personne(service, 1)
+        types = ['CONGÉ_ANNUEL', 'CONGÉ_MALADIE', 'DISPONIBILITÉ']
+        # Nombreux ex aequo sur (type_absence, date_debut) : départagés par l'id
+        for i in range(23):
+            debut = date(2026, 1, 1) + timedelta(days=(i * 7) % 5)
+            Absence.objects.create(
+                personne=personne, type_absence=types[i % 3],
+                date_debut=debut, date_fin=debut + timedelta(days=2),
+            )
+        cls.attendu = list(
+            Absence.objects.order_by('type_absence', '-date_debut', '-id').values_list('id', flat=True)
+        )
+
+    def page(self, url):
+        paginator = PaginationTriMixte()
+        request = Request(APIRequestFactory().get(url))
+        lignes = paginator.paginate_queryset(Absence.objects.all(), request)
+        return paginator.get_paginated_response([absence.id for absence in lignes]).data
+
+    def test_parcours_avant_et_arriere(self):
+        vus, url, pages = [], '/api/absences/', []
+        while url:
+            donnees = self.page(url)
+            vus += donnees['results']
+            pages.append(donnees)
+            url = donnees['next']
+        self.assertEqual(vus, self.attendu)
+        self.assertEqual(len(pages), 6)
+        self.assertIsNone(pages[0]['previous'])
+
+        retour, url = [], pages[-1]['previous']
+        while url:
+            donnees = self.page(url)
+            retour = donnees['results'] + retour
+            url = donnees['previous']
+        self.assertEqual(retour + pages[-1]['results'], self.attendu)
+
+    def test_curseur_invalide(self):
+        with self.assertRaises(NotFound):
+            self.page('/api/absences/?cursor=pas-un-curseur')
+
+
+# ========================================
+# CHAMPS À LA DEMANDE
+# ========================================
+
+class ChampsDemandesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='admin_rh')
+        chef = User.objects.create_user('chef', password='x', role='chef_enseignant', first_name='Awa', last_name='Sy')
+        cls.service = creer_service('Enseignement', 'enseignant', chef)
+        cls.personnes = [creer_personne(cls.service, i) for i in (1, 2)]
+        cls.enseignant = [creer_enseignant(personne) for personne in cls.personnes][0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get(url, params)
+        self.requetes = [requete['sql'] for requete in requetes.captured_queries]
+        return response
+
+    def test_arbre_des_champs(self):
+        self.assertEqual(
+            parse_champs({'fields': 'grade, personne.nom,personne.service.nom,', 'omit': 'indice'}),
+            ({'grade': {}, 'personne': {'nom': {}, 'service': {'nom': {}}}}, {'indice': {}})
+        )
+        self.assertEqual(parse_champs({}), (None, {}))
+
+    def test_fields_et_colonnes_lues(self):
+        response = self.get('/api/personnes/', fields='id,nom,service_nom')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [dict(ligne) for ligne in response.data['results']],
+            [{'id': p.pk, 'nom': p.nom, 'service_nom': 'Enseignement'} for p in self.personnes]
+        )
+        # Seules les colonnes des champs demandés sont lues, sans la jointure vers le chef
+        liste = next(sql for sql in self.requetes if 'FROM "myapp_personne"' in sql and 'LIMIT' in sql)
+        self.assertIn('"myapp_service"."nom"', liste)
+        self.assertNotIn('"myapp_personne"."adresse"', liste)
+        self.assertNotIn('"myapp_user"', liste)
+
+    def test_omit_et_champs_imbriques(self):
+        url = f'/api/enseignants/{self.enseignant.pk}/'
+        complet = self.get(url)
+        response = self.get(url, omit='anciennete_service,personne.chef_service_nom,personne.adresse')
+        self.assertEqual(set(complet.data) - set(response.data), {'anciennete_service'})
+        self.assertEqual(set(complet.data['personne']) - set(response.data['personne']),
+                         {'chef_service_nom', 'adresse'})
+        self.assertEqual(complet.data['personne']['chef_service_nom'], 'Awa Sy')
+        # Ni la colonne omise ni la jointure vers le chef du service ne sont lues
+        detail = next(sql for sql in self.requetes if 'FROM "myapp_enseignant"' in sql)
+        self.assertNotIn('"myapp_personne"."adresse"', detail)
+        self.assertNotIn('"myapp_service"."chef_service_id"', detail)
+
+        response = self.get('/api/enseignants/', fields='grade,personne.nom,personne.prenom')
+        self.assertEqual(
+            [dict(ligne) | {'personne': dict(ligne['personne'])} for ligne in response.data['results']],
+            [{'grade': 'professeur', 'personne': {'nom': p.nom, 'prenom': p.prenom}} for p in self.personnes]
+        )
+        response = self.get('/api/enseignants/', omit='personne.chef_service_nom,personne.manager_nom')
+        self.assertNotIn('chef_service_nom', response.data['results'][0]['personne'])
+        self.assertIn('nom', response.data['results'][0]['personne'])
+
+    def test_champ_inconnu(self):
+        response = self.get('/api/personnes/', fields='id,salaire,personne.x')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Champs inconnus: personne, salaire')
+        self.assertEqual(self.get('/api/enseignants/', omit='personne.inexistant').status_code, 400)
+
+    def test_listes_compactes(self):
+        attendus = {
+            '/api/personnes/': ['id', 'nom', 'prenom', 'numero_employe', 'fonction', 'service_nom'],
+            '/api/enseignants/': ['id', 'nom', 'prenom', 'numero_employe', 'service_nom', 'grade', 'echelon',
+                                  'indice'],
+        }
+        for url, champs in attendus.items():
+            with self.subTest(url=url):
+                response = self.get(url, compact='true')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.data['results'][0]), champs)
+                self.assertEqual(response.data['results'][0]['service_nom'], 'Enseignement')
+
+        response = self.get('/api/enseignants/', compact='true', fields='id,nom')
+        self.assertEqual([dict(ligne) for ligne in response.data['results']],
+                         [{'id': p.pk, 'nom': p.nom} for p in self.personnes])
+        # Détail : sérialiseur complet
+        response = self.get(f'/api/enseignants/{self.enseignant.pk}/', compact='true')
+        self.assertEqual(response.data['personne']['chef_service_nom'], 'Awa Sy')
@@ -5,6 +5,7 @@ from rest_framework_simplejwt.views import TokenRefreshView
 
 from .views import *
 from .authentication import CustomTokenObtainPairView
+from .instrumentation import metriques
 
 # Router principal
 router = DefaultRouter()
@@ -25,6 +26,7 @@ router.register(r'absences', AbsenceViewSet)
 router.register(r'paies', PaieViewSet)
 router.register(r'detachements', DetachementViewSet)
 router.register(r'documents', DocumentViewSet)
+router.register(r'taches', TacheViewSet)
 
 # Enums ViewSets
 router.register(r'statut-offres', StatutOffreViewSet)
@@ -45,6 +47,9 @@ urlpatterns = [
     path('api/auth/login/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/auth/', include('rest_framework.urls')),
+
+    # Métriques Prometheus (myapp.instrumentation)
+    path('api/metrics/', metriques, name='metriques'),
     
     # ✅ ENDPOINTS DE DEBUG (à supprimer en production)
     path('api/debug/user-info/', UserViewSet.as_view({'get': 'debug_user_info'}), name='debug-user-info'),
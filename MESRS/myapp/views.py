@@ -2,36 +2,39 @@ from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.exceptions import ValidationError as DRFValidationError
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count, Sum
+from django.db.models import Q, Count, Prefetch
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import ValidationError
 from datetime import datetime, timedelta
 from django.conf import settings
+from django.db import transaction
+from django.core.files.storage import default_storage
 
 # Ajoutez cette ligne avec les autres imports
 from calendar import monthrange
 
-from django.db.models import Count, Q, Sum, Avg
+from django.db.models import Count, Q, Avg
 from django.utils import timezone
 from datetime import datetime, timedelta
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
 import json
 from calendar import monthrange
-import csv
-from io import StringIO
+import logging
+import tempfile
 
 from django.utils import timezone
 from datetime import timedelta
 from .models import (
     ElementPaie,
     User, Service, Structure, Personne, Enseignant, PersonnelPAT, Contractuel,
-    Recrutement, Candidat, Absence, Paie, Detachement, Document,
+    Recrutement, Candidat, Absence, Paie, LancementPaie, Tache, Detachement, Document,
     StatutOffre, TypeStructure, TypeContrat, TypeAbsence, 
     StatutPaiement, StatutAbsence, TypeDocument, StatutCandidature
 )
@@ -40,14 +43,84 @@ from .serializers import (
     UserSerializer, ServiceSerializer, StructureSerializer, PersonneSerializer, 
     EnseignantSerializer, PersonnelPATSerializer, ContractuelSerializer, 
     RecrutementSerializer, CandidatSerializer, AbsenceSerializer, PaieSerializer,
+    LancementPaieSerializer, TacheSerializer, HistoriqueAbsenceSerializer, AbsenceValidationSerializer,
     DetachementSerializer, DocumentSerializer, StatutOffreSerializer,
     TypeStructureSerializer, TypeContratSerializer,  
     TypeAbsenceSerializer, StatutPaiementSerializer, StatutAbsenceSerializer,
     TypeDocumentSerializer, StatutCandidatureSerializer,
-    PersonneDetailSerializer, StructureTreeSerializer
+    PersonneDetailSerializer, StructureTreeSerializer,
+    PersonneListeSerializer, EnseignantListeSerializer, PersonnelPATListeSerializer,
+    ContractuelListeSerializer, AbsenceListeSerializer,
+    annoter_effectifs_services, parse_options_profil, prefetch_profil
 )
 
 from .permissions import IsAdminRHOrReadOnly, IsAdminRHOrChefService, CanManageService
+from .calendrier import construire_planning, compter_par_jour, jour_max, repartir_par_jour
+from .jours_ouvres import (
+    compter_jours_ouvres, disponibilite_par_personne, get_weekend,
+    presence_periode, taux_presence
+)
+from .exports import (
+    BULLETIN_RENDERER_CLASSES, EXPORT_RENDERER_CLASSES, PDFRenderer, ZIPRenderer,
+    exporter_absences_agents, verifier_format_export,
+)
+from .moteur_paie import executer_lancement, preparer_lancement
+from .scope import ScopeQuerysetMixin, get_scope, get_service_du_chef
+from .droits import profil_droits
+from . import bulletins, livre_paie, simulation
+from .taches import annuler_tache, soumettre_tache
+from .approbations import (
+    DECISIONS, MESSAGES_RESULTAT, TRAITEE, URGENCES, absences_a_valider, compter_file,
+    annoter_file, filtre_urgence, journaliser, valider_absences_en_lot
+)
+from .champs import ChampsDemandesMixin
+from .pagination import FileValidationPagination
+from .compteurs import absences_par_jour, absences_par_periodes, total_absences
+from .rapports import (
+    statistiques_mensuelles_service, parse_periode_annuelle, rapport_annuel_service
+)
+
+logger = logging.getLogger(__name__)
+
+# Statuts des absences affichées dans les plannings
+STATUTS_PLANNING = ['APPROUVÉ', 'EN_ATTENTE']
+
+
+# ========================================
+# TÂCHES DE FOND
+# ========================================
+
+def _demande_asynchrone(request):
+    """?async=true (ou "async": true dans le corps) : traitement confié au worker"""
+    valeur = request.query_params.get('async')
+    if valeur is None and hasattr(request.data, 'get'):
+        valeur = request.data.get('async')
+    return str(valeur).lower() in ('1', 'true', 'oui')
+
+
+def _reponse_tache(tache):
+    """Réponse immédiate (202) : le client suit /api/taches/<id>/"""
+    return Response(TacheSerializer(tache).data, status=status.HTTP_202_ACCEPTED)
+
+
+def _soumettre_export(request, agents, service, mois, type_rapport, format_export, champs, prefixe_fichier):
+    """Met en file l'export d'un rapport d'absences (mêmes paramètres que l'export direct)"""
+    # La réponse décrit la tâche (JSON), quel que soit le ?format= demandé pour le fichier
+    request.accepted_renderer = JSONRenderer()
+    request.accepted_media_type = JSONRenderer.media_type
+    erreur = verifier_format_export(format_export)
+    if erreur:
+        return Response({'error': erreur}, status=400)
+    tache = soumettre_tache('export_rapport', {
+        'agents': agents,
+        'service_id': service.id,
+        'mois': mois,
+        'type_rapport': type_rapport,
+        'format': format_export,
+        'champs': champs,
+        'prefixe_fichier': prefixe_fichier,
+    }, request.user)
+    return _reponse_tache(tache)
 
 
 # ========================================
@@ -67,24 +140,23 @@ class UserViewSet(viewsets.ModelViewSet):
     search_fields = ['username', 'email', 'first_name', 'last_name']
     
     def get_queryset(self):
-        user = self.request.user
+        scope = get_scope(self.request)
         
-        if not user.is_authenticated:
+        if scope is None:
             return User.objects.none()
             
-        if user.role == 'admin_rh':
-            return User.objects.all()
-        elif user.role.startswith('chef_'):
+        queryset = User.objects.select_related('personne__service').prefetch_related(
+            Prefetch('service_set', queryset=Service.objects.order_by('id'), to_attr='services_diriges')
+        )
+        
+        if scope.is_admin_rh:
+            return queryset
+        elif scope.is_chef and scope.has_service:
             # Chef voit les employés de son service + lui-même
-            try:
-                service = Service.objects.get(chef_service=user)
-                employes_ids = service.employes.filter(user__isnull=False).values_list('user_id', flat=True)
-                return User.objects.filter(Q(id=user.id) | Q(id__in=employes_ids))
-            except Service.DoesNotExist:
-                return User.objects.filter(id=user.id)
+            return queryset.filter(Q(id=scope.user_id) | Q(personne__service_id=scope.service_id))
         else:
-            # Employé ne voit que lui-même
-            return User.objects.filter(id=user.id)
+            # Employé (ou chef sans service) ne voit que lui-même
+            return queryset.filter(id=scope.user_id)
     
     @action(detail=False, methods=['post'], permission_classes=[AllowAny], authentication_classes=[])
     def creer_employe(self, request):
@@ -158,7 +230,7 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     """
     ViewSet pour gérer les services avec hiérarchie
     """
@@ -168,24 +240,19 @@ class ServiceViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['type_service']
     search_fields = ['nom', 'description']
+    scope_employe_par_service = True
+    
+    def get_scope_service_q(self, scope):
+        # Chef ne voit que son service
+        return Q(chef_service_id=scope.user_id)
+    
+    def get_scope_employe_q(self, scope):
+        # Employé voit son service
+        return Q(id=scope.service_id) if scope.has_service else None
     
     def get_queryset(self):
-        user = self.request.user
-        
-        if not user.is_authenticated:
-            return Service.objects.none()
-            
-        if user.role == 'admin_rh':
-            return Service.objects.all()
-        elif user.role.startswith('chef_'):
-            # Chef ne voit que son service
-            return Service.objects.filter(chef_service=user)
-        else:
-            # Employé voit son service
-            if hasattr(user, 'personne') and user.personne.service:
-                return Service.objects.filter(id=user.personne.service.id)
-        
-        return Service.objects.none()
+        # Effectifs annotés : pas de COUNT par service à la sérialisation
+        return annoter_effectifs_services(super().get_queryset())
     
     @action(detail=True, methods=['get'])
     def employes(self, request, pk=None):
@@ -213,10 +280,10 @@ class ServiceViewSet(viewsets.ModelViewSet):
                 'nom': service.nom,
                 'type_service': service.type_service,
                 'chef_service': service.chef_service.get_full_name() if service.chef_service else None,
-                'nombre_employes': service.employes.count(),
-                'nombre_enseignants': service.employes.filter(type_employe='enseignant').count(),
-                'nombre_pat': service.employes.filter(type_employe='pat').count(),
-                'nombre_contractuels': service.employes.filter(type_employe='contractuel').count(),
+                'nombre_employes': service.nombre_employes,
+                'nombre_enseignants': service.nombre_enseignants,
+                'nombre_pat': service.nombre_pat,
+                'nombre_contractuels': service.nombre_contractuels,
             })
         
         return Response(stats)
@@ -241,7 +308,7 @@ class ServiceViewSet(viewsets.ModelViewSet):
             return Response([])
         except Personne.DoesNotExist:
             # Si le profil n'existe pas, retourner tous les services pour l'onboarding
-            services = Service.objects.all().order_by('nom')
+            services = annoter_effectifs_services(Service.objects.all()).order_by('nom')
             serializer = ServiceSerializer(services, many=True)
             return Response(serializer.data)
     
@@ -266,41 +333,46 @@ class ServiceViewSet(viewsets.ModelViewSet):
         except User.DoesNotExist:
             return Response({'error': 'Utilisateur non trouvé'}, status=404)
 
-class PersonneViewSet(viewsets.ModelViewSet):
+class PersonneViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     """
     ViewSet pour gérer les personnes avec filtrage hiérarchique
     """
     queryset = Personne.objects.all()
     serializer_class = PersonneSerializer
+    serializer_liste_class = PersonneListeSerializer
     permission_classes = [IsAdminRHOrChefService]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['type_employe', 'service', 'genre', 'nationalite', 'situation_familiale']
     search_fields = ['nom', 'prenom', 'nni', 'fonction']
     ordering_fields = ['nom', 'prenom', 'date_naissance']
-    
-    def get_queryset(self):
-        user = self.request.user
-        
-        if not user.is_authenticated:
-            return Personne.objects.none()
-            
-        if user.role == 'admin_rh':
-            return Personne.objects.all()
-        elif user.role.startswith('chef_'):
-            # Chef ne voit que son service
-            try:
-                service = Service.objects.get(chef_service=user)
-                return Personne.objects.filter(service=service)
-            except Service.DoesNotExist:
-                return Personne.objects.none()
-        else:
-            # Employé ne voit que lui-même
-            return Personne.objects.filter(user=user)
+    scope_service_field = 'service'
+    scope_user_field = 'user'
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return PersonneDetailSerializer
-        return PersonneSerializer
+        return super().get_serializer_class()
+    
+    def get_options_profil(self):
+        """Sections et limites du profil détaillé (?include=, ?exclude=, ?limite=)"""
+        if not hasattr(self, '_options_profil'):
+            try:
+                self._options_profil = parse_options_profil(self.request.query_params)
+            except ValueError as e:
+                raise DRFValidationError({'error': str(e)})
+        return self._options_profil
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(self, 'action', None) == 'retrieve':
+            return prefetch_profil(queryset, *self.get_options_profil())
+        return queryset
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'retrieve':
+            context['sections_profil'] = self.get_options_profil()[0]
+        return context
     
     def get_permissions(self):
         """
@@ -316,7 +388,7 @@ class PersonneViewSet(viewsets.ModelViewSet):
         # Validation : chef ne peut créer que dans son service
         if user.role.startswith('chef_'):
             try:
-                service = Service.objects.get(chef_service=user)
+                service = get_service_du_chef(self.request)
                 serializer.save(service=service)
             except Service.DoesNotExist:
                 raise ValidationError("Service non trouvé pour ce chef")
@@ -330,8 +402,12 @@ class PersonneViewSet(viewsets.ModelViewSet):
         Accessible à tous les utilisateurs authentifiés (employés, chefs, admin RH)
         """
         try:
-            personne = Personne.objects.get(user=request.user)
-            serializer = PersonneDetailSerializer(personne)
+            personne = prefetch_profil(
+                Personne.objects.filter(user=request.user), *self.get_options_profil()
+            ).get()
+            serializer = PersonneDetailSerializer(
+                personne, context={'sections_profil': self.get_options_profil()[0]}
+            )
             return Response(serializer.data)
         except Personne.DoesNotExist:
             return Response({'error': 'Profil non trouvé'}, status=404)
@@ -398,67 +474,26 @@ class PersonneViewSet(viewsets.ModelViewSet):
             'par_nationalite': list(par_nationalite)
         })
 
-class EnseignantViewSet(viewsets.ModelViewSet):
+class EnseignantViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet pour les enseignants avec hiérarchie CORRIGÉ"""
+    queryset = Enseignant.objects.select_related('personne', 'personne__service')
     serializer_class = EnseignantSerializer
+    serializer_liste_class = EnseignantListeSerializer
     permission_classes = [IsAdminRHOrChefService]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['corps', 'grade', 'echelon']
     search_fields = ['personne__nom', 'personne__prenom', 'corps', 'grade']
     ordering_fields = ['personne__nom', 'grade', 'indice']
-    
-    def get_queryset(self):
-        user = self.request.user
-        
-        print(f"🔍 EnseignantViewSet.get_queryset() appelé pour: {user.username} (rôle: {getattr(user, 'role', 'AUCUN')})")
-        
-        if not user.is_authenticated:
-            print("❌ Utilisateur non authentifié")
-            return Enseignant.objects.none()
-            
-        # ✅ CORRECTION: Vérifier que l'attribut 'role' existe
-        if not hasattr(user, 'role'):
-            print("❌ Utilisateur sans rôle défini")
-            return Enseignant.objects.none()
-            
-        if user.role == 'admin_rh':
-            print("✅ Admin RH - Accès à tous les enseignants")
-            return Enseignant.objects.select_related('personne', 'personne__service').all()
-            
-        elif user.role == 'chef_enseignant':
-            print("🎓 Chef enseignant - Recherche de son service...")
-            try:
-                # ✅ CORRECTION: Import ici pour éviter les imports circulaires
-                from .models import Service
-                service = Service.objects.get(chef_service=user, type_service='enseignant')
-                queryset = Enseignant.objects.filter(personne__service=service).select_related('personne', 'personne__service')
-                print(f"✅ Service trouvé: {service.nom} - {queryset.count()} enseignants")
-                return queryset
-            except Service.DoesNotExist:
-                print(f"❌ Aucun service 'enseignant' trouvé pour le chef {user.username}")
-                return Enseignant.objects.none()
-            except Exception as e:
-                print(f"❌ Erreur inattendue: {e}")
-                return Enseignant.objects.none()
-        else:
-            # Employé ne voit que lui-même s'il est enseignant
-            print("👤 Employé - Accès à son propre profil")
-            try:
-                return Enseignant.objects.filter(personne__user=user).select_related('personne')
-            except Exception as e:
-                print(f"❌ Erreur pour employé: {e}")
-                return Enseignant.objects.none()
+    scope_chef_roles = ('chef_enseignant',)
+    scope_type_service = 'enseignant'
     
     def list(self, request, *args, **kwargs):
-        """Override pour debugging"""
-        print(f"📋 Liste des enseignants demandée par {request.user.username}")
+        """Liste des enseignants, erreurs détaillées pour le diagnostic"""
+        logger.debug("Liste des enseignants demandée")
         
         try:
-            queryset = self.get_queryset()
-            print(f"📊 Queryset contient {queryset.count()} enseignants")
-            
             # Appliquer les filtres
-            queryset = self.filter_queryset(queryset)
+            queryset = self.filter_queryset(self.get_queryset())
             
             page = self.paginate_queryset(queryset)
             if page is not None:
@@ -466,11 +501,13 @@ class EnseignantViewSet(viewsets.ModelViewSet):
                 return self.get_paginated_response(serializer.data)
 
             serializer = self.get_serializer(queryset, many=True)
-            print(f"✅ Retour de {len(serializer.data)} enseignants")
             return Response(serializer.data)
             
+        except DRFValidationError:
+            # ?fields= / ?omit= invalides : 400 et non erreur serveur
+            raise
         except Exception as e:
-            print(f"❌ Erreur dans list(): {e}")
+            logger.exception("Erreur lors de la liste des enseignants")
             return Response({
                 'error': f'Erreur lors de la récupération des enseignants: {str(e)}',
                 'debug_info': {
@@ -483,7 +520,7 @@ class EnseignantViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         """Création d'enseignant avec vérifications"""
         user = request.user
-        print(f"➕ Création d'enseignant par {user.username}")
+        logger.info("Création d'enseignant")
         
         if user.role not in ['admin_rh', 'chef_enseignant']:
             return Response({'error': 'Permission refusée pour créer un enseignant'}, status=403)
@@ -492,7 +529,7 @@ class EnseignantViewSet(viewsets.ModelViewSet):
         if user.role == 'chef_enseignant':
             try:
                 from .models import Service
-                service = Service.objects.get(chef_service=user, type_service='enseignant')
+                service = get_service_du_chef(request, 'enseignant')
                 # Assurer que la personne est assignée au bon service
                 if 'personne' in request.data and 'service' in request.data['personne']:
                     if request.data['personne']['service'] != service.id:
@@ -534,7 +571,7 @@ class EnseignantViewSet(viewsets.ModelViewSet):
             if user.role == 'chef_enseignant':
                 try:
                     from .models import Service
-                    service = Service.objects.get(chef_service=user, type_service='enseignant')
+                    service = get_service_du_chef(request, 'enseignant')
                     debug_data['service_info'] = {
                         'id': service.id,
                         'nom': service.nom,
@@ -598,7 +635,7 @@ class EnseignantViewSet(viewsets.ModelViewSet):
                 })
                 
             except Exception as e:
-                print(f"❌ Erreur par_grade: {str(e)}")
+                logger.exception("Erreur par_grade")
                 return Response({
                     'error': str(e),
                     'success': False
@@ -630,64 +667,26 @@ class EnseignantViewSet(viewsets.ModelViewSet):
                 queryset = Enseignant.objects.select_related('personne', 'personne__service').all()
             else:
                 # Chef enseignant voit seulement son service
-                service = Service.objects.get(chef_service=user, type_service='enseignant')
+                service = get_service_du_chef(request, 'enseignant')
                 queryset = self.get_queryset()
             
             # Protection: Filtrer seulement les enseignants avec personne
             queryset = queryset.filter(personne__isnull=False)
             
-            # Statistiques générales
-            total_enseignants = queryset.count()
-            
-            # ✅ CORRECTION: Utiliser 'personne' au lieu de 'id' pour compter
-            par_grade = queryset.values('grade').annotate(count=Count('personne'))
-            
             # Dates du mois
             debut_mois = datetime.strptime(f"{mois}-01", '%Y-%m-%d').date()
             _, last_day = monthrange(debut_mois.year, debut_mois.month)
             fin_mois = debut_mois.replace(day=last_day)
             
-            # Absences du mois
-            absences_mois = Absence.objects.filter(
-                personne__service=service,
-                date_debut__lte=fin_mois,
-                date_fin__gte=debut_mois
-            ).values('type_absence').annotate(count=Count('id'))
-            
-            # Enseignants avec absences
-            enseignants_avec_absences = queryset.filter(
-                personne__absences__date_debut__lte=fin_mois,
-                personne__absences__date_fin__gte=debut_mois
-            ).distinct().count()
-            
-            # Taux de présence
-            taux_presence = ((total_enseignants - enseignants_avec_absences) / total_enseignants * 100) if total_enseignants > 0 else 100
-            
-            # Absences par statut
-            absences_par_statut = Absence.objects.filter(
-                personne__service=service,
-                date_debut__lte=fin_mois,
-                date_fin__gte=debut_mois
-            ).values('statut').annotate(count=Count('id'))
-            
-            # Top 5 enseignants avec le plus d'absences
-            top_absences = []
-            for enseignant in queryset:
-                if enseignant.personne:
-                    nb_absences = Absence.objects.filter(
-                        personne=enseignant.personne,
-                        date_debut__lte=fin_mois,
-                        date_fin__gte=debut_mois
-                    ).count()
-                    if nb_absences > 0:
-                        top_absences.append({
-                            'nom': f"{enseignant.personne.prenom} {enseignant.personne.nom}",
-                            'grade': enseignant.grade,
-                            'nombre_absences': nb_absences
-                        })
-            
-            top_absences.sort(key=lambda x: x['nombre_absences'], reverse=True)
-            top_absences = top_absences[:5]
+            # Statistiques calculées en un nombre constant de requêtes
+            stats = statistiques_mensuelles_service(queryset, service, debut_mois, fin_mois, 'grade')
+            total_enseignants = stats['total']
+            # Présents / absents sur les mêmes absences approuvées que le taux de présence
+            presence = presence_periode(
+                Absence.objects.filter(personne__in=queryset.values('personne'), statut='APPROUVÉ'),
+                total_enseignants, debut_mois, fin_mois
+            )
+            enseignants_avec_absences = presence['agents_absents']
             
             rapport = {
                 'periode': mois,
@@ -696,12 +695,21 @@ class EnseignantViewSet(viewsets.ModelViewSet):
                     'total_enseignants': total_enseignants,
                     'enseignants_presents': total_enseignants - enseignants_avec_absences,
                     'enseignants_absents': enseignants_avec_absences,
-                    'taux_presence': round(taux_presence, 2)
+                    'jours_ouvres': presence['jours_ouvres'],
+                    'jours_ouvres_perdus': presence['jours_ouvres_perdus'],
+                    'taux_presence': presence['taux_presence']
                 },
-                'repartition_grade': list(par_grade),
-                'absences_par_type': list(absences_mois),
-                'absences_par_statut': list(absences_par_statut),
-                'top_absences': top_absences,
+                'repartition_grade': stats['repartition'],
+                'absences_par_type': stats['absences_par_type'],
+                'absences_par_statut': stats['absences_par_statut'],
+                'top_absences': [
+                    {
+                        'nom': f"{ligne['prenom']} {ligne['nom']}",
+                        'grade': ligne['categorie'],
+                        'nombre_absences': ligne['nombre_absences']
+                    }
+                    for ligne in stats['top_absences']
+                ],
                 'genere_le': timezone.now().isoformat()
             }
             
@@ -714,15 +722,13 @@ class EnseignantViewSet(viewsets.ModelViewSet):
             }, status=404)
         except AttributeError as e:
             # Gérer le cas où l'utilisateur n'a pas d'attribut 'role'
-            print(f"❌ Erreur AttributeError rapport_mensuel: {str(e)}")
+            logger.exception("Utilisateur sans rôle dans rapport_mensuel")
             return Response({
                 'error': 'Erreur de configuration utilisateur',
                 'message': 'L\'utilisateur n\'a pas de rôle défini'
             }, status=500)
         except Exception as e:
-            print(f"❌ Erreur rapport_mensuel: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Erreur rapport_mensuel")
             return Response({
                 'error': 'Erreur interne',
                 'message': str(e)
@@ -730,86 +736,34 @@ class EnseignantViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def rapport_annuel(self, request):
-        """Rapport annuel des enseignants"""
+        """Rapport annuel (ou pluriannuel avec annee_debut/annee_fin) des enseignants"""
         user = request.user
         
         if user.role != 'chef_enseignant':
             return Response({'error': 'Permission refusée'}, status=403)
         
-        annee = int(request.query_params.get('annee', timezone.now().year))
+        try:
+            annee_debut, annee_fin = parse_periode_annuelle(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
         
         try:
-            service = Service.objects.get(chef_service=user, type_service='enseignant')
+            service = get_service_du_chef(request, 'enseignant')
+            if _demande_asynchrone(request):
+                return _reponse_tache(soumettre_tache('rapport_annuel', {
+                    'agents': 'enseignant', 'service_id': service.id,
+                    'annee_debut': annee_debut, 'annee_fin': annee_fin,
+                }, user))
             queryset = self.get_queryset()
             
-            # Données par mois
-            donnees_mensuelles = []
-            mois_noms = ['Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
-                        'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre']
-            
-            for mois in range(1, 13):
-                debut = datetime(annee, mois, 1).date()
-                _, last_day = monthrange(annee, mois)
-                fin = datetime(annee, mois, last_day).date()
-                
-                absences = Absence.objects.filter(
-                    personne__service=service,
-                    date_debut__lte=fin,
-                    date_fin__gte=debut
-                ).count()
-                
-                # Absences par type pour ce mois
-                absences_par_type = Absence.objects.filter(
-                    personne__service=service,
-                    date_debut__lte=fin,
-                    date_fin__gte=debut
-                ).values('type_absence').annotate(count=Count('id'))
-                
-                donnees_mensuelles.append({
-                    'mois': mois,
-                    'nom_mois': mois_noms[mois-1],
-                    'nombre_absences': absences,
-                    'absences_par_type': list(absences_par_type)
-                })
-            
-            # Évolution des effectifs
-            evolution_effectifs = []
-            for mois in range(1, 13):
-                effectif = queryset.count()  # Effectif actuel pour tous les mois
-                evolution_effectifs.append({
-                    'mois': mois,
-                    'nom_mois': mois_noms[mois-1],
-                    'effectif': effectif
-                })
-            
-            # Statistiques annuelles
-            total_absences_annee = sum(d['nombre_absences'] for d in donnees_mensuelles)
-            mois_plus_absences = max(donnees_mensuelles, key=lambda x: x['nombre_absences'])
-            mois_moins_absences = min(donnees_mensuelles, key=lambda x: x['nombre_absences'])
-            
-            # Tendances
-            premier_trimestre = sum(d['nombre_absences'] for d in donnees_mensuelles[:3])
-            deuxieme_trimestre = sum(d['nombre_absences'] for d in donnees_mensuelles[3:6])
-            troisieme_trimestre = sum(d['nombre_absences'] for d in donnees_mensuelles[6:9])
-            quatrieme_trimestre = sum(d['nombre_absences'] for d in donnees_mensuelles[9:12])
+            # Absences par mois (compteurs journaliers) et effectifs reconstitués (deux requêtes)
+            donnees = rapport_annuel_service(queryset, service, annee_debut, annee_fin)
             
             rapport = {
-                'annee': annee,
+                'annee': annee_debut,
+                'annee_fin': annee_fin,
                 'service': service.nom,
-                'donnees_mensuelles': donnees_mensuelles,
-                'evolution_effectifs': evolution_effectifs,
-                'statistiques_annuelles': {
-                    'total_absences': total_absences_annee,
-                    'moyenne_mensuelle': round(total_absences_annee / 12, 2),
-                    'mois_plus_absences': mois_plus_absences,
-                    'mois_moins_absences': mois_moins_absences
-                },
-                'donnees_trimestrielles': [
-                    {'trimestre': 'T1', 'absences': premier_trimestre},
-                    {'trimestre': 'T2', 'absences': deuxieme_trimestre},
-                    {'trimestre': 'T3', 'absences': troisieme_trimestre},
-                    {'trimestre': 'T4', 'absences': quatrieme_trimestre}
-                ],
+                **donnees,
                 'genere_le': timezone.now().isoformat()
             }
             
@@ -828,73 +782,63 @@ class EnseignantViewSet(viewsets.ModelViewSet):
         
         # Paramètres
         mois = request.query_params.get('mois', timezone.now().strftime('%Y-%m'))
+        comptes_seuls = request.query_params.get('heatmap') == 'true'
         
         try:
-            service = Service.objects.get(chef_service=user, type_service='enseignant')
+            service = get_service_du_chef(request, 'enseignant')
             
             # Dates du mois
             debut_mois = datetime.strptime(f"{mois}-01", '%Y-%m-%d').date()
             _, last_day = monthrange(debut_mois.year, debut_mois.month)
             fin_mois = debut_mois.replace(day=last_day)
             
-            # Récupérer toutes les absences du mois
-            absences = Absence.objects.filter(
-                personne__service=service,
-                date_debut__lte=fin_mois,
-                date_fin__gte=debut_mois,
-                statut__in=['APPROUVÉ', 'EN_ATTENTE']
-            ).select_related('personne').order_by('date_debut')
-            
-            # Organiser par jour
-            planning = {}
-            current_date = debut_mois
-            
-            while current_date <= fin_mois:
-                day_key = current_date.strftime('%Y-%m-%d')
-                planning[day_key] = {
-                    'date': day_key,
-                    'jour_semaine': current_date.strftime('%A'),
-                    'numero_jour': current_date.day,
-                    'est_weekend': current_date.weekday() >= 5,
-                    'absences': [],
-                    'nombre_absents': 0
-                }
-                current_date += timedelta(days=1)
-            
-            # Remplir le planning avec les absences
-            for absence in absences:
-                current_date = max(absence.date_debut, debut_mois)
-                end_date = min(absence.date_fin, fin_mois)
+            if comptes_seuls:
+                # Heatmap : lue dans les compteurs journaliers du service
+                planning = construire_planning(
+                    debut_mois, fin_mois, [], comptes_seuls=True,
+                    comptes=absences_par_jour(service, debut_mois, fin_mois, STATUTS_PLANNING)
+                )
+                total_absences_planifiees = absences_par_periodes(
+                    service, [(debut_mois, fin_mois)], STATUTS_PLANNING
+                )[0]
+            else:
+                # Récupérer toutes les absences du mois (une requête, sans instancier les modèles)
+                absences = list(Absence.objects.filter(
+                    personne__service=service,
+                    date_debut__lte=fin_mois,
+                    date_fin__gte=debut_mois,
+                    statut__in=STATUTS_PLANNING
+                ).order_by('date_debut').values(
+                    'id', 'personne_id', 'personne__nom', 'personne__prenom', 'personne__enseignant__grade',
+                    'type_absence', 'statut', 'date_debut', 'date_fin'
+                ))
                 
-                while current_date <= end_date:
-                    day_key = current_date.strftime('%Y-%m-%d')
-                    if day_key in planning:
-                        enseignant_data = {
-                            'id': absence.id,
-                            'enseignant_id': absence.personne.id,
-                            'nom': absence.personne.nom,
-                            'prenom': absence.personne.prenom,
-                            'nom_complet': f"{absence.personne.prenom} {absence.personne.nom}",
-                            'grade': absence.personne.enseignant.grade if hasattr(absence.personne, 'enseignant') else 'N/A',
-                            'type_absence': absence.type_absence,
-                            'statut': absence.statut,
-                            'debut': absence.date_debut.isoformat(),
-                            'fin': absence.date_fin.isoformat(),
-                            'duree_totale': (absence.date_fin - absence.date_debut).days + 1
-                        }
-                        planning[day_key]['absences'].append(enseignant_data)
-                    current_date += timedelta(days=1)
-            
-            # Calculer le nombre d'absents par jour
-            for day_data in planning.values():
-                day_data['nombre_absents'] = len(day_data['absences'])
+                # Organiser par jour
+                elements = []
+                for a in absences:
+                    grade = a['personne__enseignant__grade']
+                    valeur = {
+                        'id': a['id'],
+                        'enseignant_id': a['personne_id'],
+                        'nom': a['personne__nom'],
+                        'prenom': a['personne__prenom'],
+                        'nom_complet': f"{a['personne__prenom']} {a['personne__nom']}",
+                        'grade': grade if grade is not None else 'N/A',
+                        'type_absence': a['type_absence'],
+                        'statut': a['statut'],
+                        'debut': a['date_debut'].isoformat(),
+                        'fin': a['date_fin'].isoformat(),
+                        'duree_totale': (a['date_fin'] - a['date_debut']).days + 1
+                    }
+                    elements.append((a['date_debut'], a['date_fin'], valeur))
+                planning = construire_planning(debut_mois, fin_mois, elements, cle_liste='absences')
+                total_absences_planifiees = len(absences)
             
             # Statistiques du planning
-            total_jours_ouvrables = sum(1 for day in planning.values() if not day['est_weekend'])
-            total_absences_planifiees = absences.count()
+            total_jours_ouvrables = compter_jours_ouvres(debut_mois, fin_mois)
             
             # Jour avec le plus d'absences
-            jour_max_absences = max(planning.values(), key=lambda x: x['nombre_absents'])
+            jour_max_absences = jour_max(planning)
             
             return Response({
                 'mois': mois,
@@ -913,9 +857,9 @@ class EnseignantViewSet(viewsets.ModelViewSet):
         except Service.DoesNotExist:
             return Response({'error': 'Service non trouvé'}, status=404)
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERER_CLASSES)
     def export_rapport(self, request):
-        """Exporter le rapport en CSV ou JSON"""
+        """Exporter le rapport en JSON, CSV, XLSX ou NDJSON (fichiers produits en flux)"""
         user = request.user
         
         if user.role != 'chef_enseignant':
@@ -926,7 +870,7 @@ class EnseignantViewSet(viewsets.ModelViewSet):
         type_rapport = request.query_params.get('type', 'mensuel')
         
         try:
-            service = Service.objects.get(chef_service=user, type_service='enseignant')
+            service = get_service_du_chef(request, 'enseignant')
             queryset = self.get_queryset()
             
             # Dates du mois
@@ -935,98 +879,39 @@ class EnseignantViewSet(viewsets.ModelViewSet):
             fin_mois = debut_mois.replace(day=last_day)
             
             if type_rapport == 'detaille':
-                # Rapport détaillé par enseignant
-                donnees = []
-                for enseignant in queryset:
-                    absences = Absence.objects.filter(
-                        personne=enseignant.personne,
-                        date_debut__lte=fin_mois,
-                        date_fin__gte=debut_mois
-                    )
-                    
-                    total_jours_absence = sum((abs.date_fin - max(abs.date_debut, debut_mois)).days + 1 
-                                            for abs in absences)
-                    
-                    donnees.append({
-                        'nom': enseignant.personne.nom,
-                        'prenom': enseignant.personne.prenom,
-                        'grade': enseignant.grade,
-                        'corps': enseignant.corps,
-                        'indice': enseignant.indice,
-                        'nombre_absences': absences.count(),
-                        'jours_absence': total_jours_absence,
-                        'types_absence': ', '.join(absences.values_list('type_absence', flat=True).distinct())
-                    })
+                champs = [
+                    ('nom', 'personne__nom'), ('prenom', 'personne__prenom'),
+                    ('grade', 'grade'), ('corps', 'corps'), ('indice', 'indice')
+                ]
             else:
-                # Rapport synthétique
-                donnees = []
-                for enseignant in queryset:
-                    absences = Absence.objects.filter(
-                        personne=enseignant.personne,
-                        date_debut__lte=fin_mois,
-                        date_fin__gte=debut_mois
-                    )
-                    
-                    donnees.append({
-                        'nom': enseignant.personne.nom,
-                        'prenom': enseignant.personne.prenom,
-                        'grade': enseignant.grade,
-                        'nombre_absences': absences.count(),
-                        'jours_absence': sum((abs.date_fin - abs.date_debut).days + 1 for abs in absences)
-                    })
-            
-            if format_export == 'csv':
-                output = StringIO()
-                if donnees:
-                    fieldnames = donnees[0].keys()
-                    writer = csv.DictWriter(output, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(donnees)
-                
-                response = HttpResponse(output.getvalue(), content_type='text/csv; charset=utf-8')
-                filename = f"rapport_enseignants_{type_rapport}_{mois}.csv"
-                response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                return response
-            
-            # Format JSON
-            return Response({
-                'donnees': donnees,
-                'periode': mois,
-                'service': service.nom,
-                'type_rapport': type_rapport,
-                'genere_le': timezone.now().isoformat()
-            })
+                champs = [('nom', 'personne__nom'), ('prenom', 'personne__prenom'), ('grade', 'grade')]
+
+            if _demande_asynchrone(request):
+                return _soumettre_export(
+                    request, 'enseignant', service, mois, type_rapport, format_export, champs, 'rapport_enseignants'
+                )
+            return exporter_absences_agents(
+                queryset, service, mois, debut_mois, fin_mois, type_rapport,
+                format_export, champs, 'rapport_enseignants'
+            )
             
         except Service.DoesNotExist:
             return Response({'error': 'Service non trouvé'}, status=404)
         except Exception as e:
             return Response({'error': str(e)}, status=500)
         
-class PersonnelPATViewSet(viewsets.ModelViewSet):
+class PersonnelPATViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet pour le personnel PAT avec hiérarchie (miroir d'EnseignantViewSet)"""
+    queryset = PersonnelPAT.objects.select_related('personne', 'personne__service')
     serializer_class = PersonnelPATSerializer
+    serializer_liste_class = PersonnelPATListeSerializer
     permission_classes = [IsAdminRHOrChefService]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['grade', 'poste']
     search_fields = ['personne__nom', 'personne__prenom', 'grade', 'poste']
     ordering_fields = ['personne__nom', 'grade', 'indice']
-
-    def get_queryset(self):
-        user = self.request.user
-        if not user.is_authenticated:
-            return PersonnelPAT.objects.none()
-
-        if user.role == 'admin_rh':
-            return PersonnelPAT.objects.select_related('personne', 'personne__service')
-        elif user.role == 'chef_pat':
-            try:
-                service = Service.objects.get(chef_service=user, type_service='pat')
-                return PersonnelPAT.objects.filter(personne__service=service).select_related('personne', 'personne__service')
-            except Service.DoesNotExist:
-                return PersonnelPAT.objects.none()
-        else:
-            # Employé : juste lui-même s'il est PAT
-            return PersonnelPAT.objects.filter(personne__user=user).select_related('personne', 'personne__service')
+    scope_chef_roles = ('chef_pat',)
+    scope_type_service = 'pat'
 
     # ---------- Stats simples ----------
     @action(detail=False, methods=['get'])
@@ -1048,7 +933,7 @@ class PersonnelPATViewSet(viewsets.ModelViewSet):
             qs = self.get_queryset()
             info['queryset'] = {'count': qs.count(), 'sql': str(qs.query) if qs.exists() else 'EMPTY'}
             if user.role == 'chef_pat':
-                service = Service.objects.get(chef_service=user, type_service='pat')
+                service = get_service_du_chef(request, 'pat')
                 info['service'] = {
                     'id': service.id, 'nom': service.nom, 'type': service.type_service,
                     'total_employes': service.employes.filter(type_employe='pat').count()
@@ -1067,7 +952,7 @@ class PersonnelPATViewSet(viewsets.ModelViewSet):
 
         mois = request.query_params.get('mois', timezone.now().strftime('%Y-%m'))
         try:
-            service = Service.objects.get(chef_service=user, type_service='pat')
+            service = get_service_du_chef(request, 'pat')
             qs = self.get_queryset()
 
             # bornes du mois
@@ -1075,41 +960,14 @@ class PersonnelPATViewSet(viewsets.ModelViewSet):
             _, last = monthrange(debut_mois.year, debut_mois.month)
             fin_mois = debut_mois.replace(day=last)
 
-            total_pat = qs.count()
-
-            # répartition par poste
-            par_poste = qs.values('poste').annotate(count=Count('personne'))
-            # absences du mois
-            absences_mois = Absence.objects.filter(
-                personne__service=service,
-                date_debut__lte=fin_mois,
-                date_fin__gte=debut_mois
-            ).values('type_absence').annotate(count=Count('id'))
-
-            # nombre d’agents avec au moins une absence dans le mois
-            agents_absents = qs.filter(
-                personne__absences__date_debut__lte=fin_mois,
-                personne__absences__date_fin__gte=debut_mois
-            ).distinct().count()
-
-            taux_presence = ((total_pat - agents_absents) / total_pat * 100) if total_pat else 100
-
-            # top 5 absences
-            top_abs = []
-            for agent in qs:
-                n = Absence.objects.filter(
-                    personne=agent.personne,
-                    date_debut__lte=fin_mois,
-                    date_fin__gte=debut_mois
-                ).count()
-                if n > 0:
-                    top_abs.append({
-                        'nom': f"{agent.personne.prenom} {agent.personne.nom}",
-                        'poste': agent.poste,
-                        'nombre_absences': n
-                    })
-            top_abs.sort(key=lambda x: x['nombre_absences'], reverse=True)
-            top_abs = top_abs[:5]
+            stats = statistiques_mensuelles_service(qs, service, debut_mois, fin_mois, 'poste')
+            total_pat = stats['total']
+            # Présents / absents sur les mêmes absences approuvées que le taux de présence
+            presence = presence_periode(
+                Absence.objects.filter(personne__in=qs.values('personne'), statut='APPROUVÉ'),
+                total_pat, debut_mois, fin_mois
+            )
+            agents_absents = presence['agents_absents']
 
             return Response({
                 'periode': mois,
@@ -1118,11 +976,20 @@ class PersonnelPATViewSet(viewsets.ModelViewSet):
                     'total_pat': total_pat,
                     'agents_presents': total_pat - agents_absents,
                     'agents_absents': agents_absents,
-                    'taux_presence': round(taux_presence, 2)
+                    'jours_ouvres': presence['jours_ouvres'],
+                    'jours_ouvres_perdus': presence['jours_ouvres_perdus'],
+                    'taux_presence': presence['taux_presence']
                 },
-                'repartition_poste': list(par_poste),
-                'absences_par_type': list(absences_mois),
-                'top_absences': top_abs,
+                'repartition_poste': stats['repartition'],
+                'absences_par_type': stats['absences_par_type'],
+                'top_absences': [
+                    {
+                        'nom': f"{ligne['prenom']} {ligne['nom']}",
+                        'poste': ligne['categorie'],
+                        'nombre_absences': ligne['nombre_absences']
+                    }
+                    for ligne in stats['top_absences']
+                ],
                 'genere_le': timezone.now().isoformat()
             })
         except Service.DoesNotExist:
@@ -1136,42 +1003,26 @@ class PersonnelPATViewSet(viewsets.ModelViewSet):
         if user.role != 'chef_pat':
             return Response({'error': 'Permission refusée'}, status=403)
 
-        annee = int(request.query_params.get('annee', timezone.now().year))
         try:
-            service = Service.objects.get(chef_service=user, type_service='pat')
-            qs = self.get_queryset()
-
-            mois_noms = ['Janvier','Février','Mars','Avril','Mai','Juin','Juillet','Août','Septembre','Octobre','Novembre','Décembre']
-            donnees = []
-            for m in range(1, 12+1):
-                debut = datetime(annee, m, 1).date()
-                _, last = monthrange(annee, m)
-                fin = datetime(annee, m, last).date()
-
-                nb = Absence.objects.filter(
-                    personne__service=service,
-                    date_debut__lte=fin,
-                    date_fin__gte=debut
-                ).count()
-                par_type = Absence.objects.filter(
-                    personne__service=service,
-                    date_debut__lte=fin,
-                    date_fin__gte=debut
-                ).values('type_absence').annotate(count=Count('id'))
+            annee_debut, annee_fin = parse_periode_annuelle(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
 
-                donnees.append({'mois': m, 'nom_mois': mois_noms[m-1], 'nombre_absences': nb, 'absences_par_type': list(par_type)})
+        try:
+            service = get_service_du_chef(request, 'pat')
+            if _demande_asynchrone(request):
+                return _reponse_tache(soumettre_tache('rapport_annuel', {
+                    'agents': 'pat', 'service_id': service.id,
+                    'annee_debut': annee_debut, 'annee_fin': annee_fin,
+                }, user))
+            qs = self.get_queryset()
 
-            total = sum(d['nombre_absences'] for d in donnees)
+            donnees = rapport_annuel_service(qs, service, annee_debut, annee_fin)
             return Response({
-                'annee': annee,
+                'annee': annee_debut,
+                'annee_fin': annee_fin,
                 'service': service.nom,
-                'donnees_mensuelles': donnees,
-                'statistiques_annuelles': {
-                    'total_absences': total,
-                    'moyenne_mensuelle': round(total/12, 2) if donnees else 0,
-                    'mois_plus_absences': max(donnees, key=lambda x:x['nombre_absences']) if donnees else None,
-                    'mois_moins_absences': min(donnees, key=lambda x:x['nombre_absences']) if donnees else None
-                },
+                **donnees,
                 'genere_le': timezone.now().isoformat()
             })
         except Service.DoesNotExist:
@@ -1185,71 +1036,64 @@ class PersonnelPATViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Permission refusée'}, status=403)
 
         mois = request.query_params.get('mois', timezone.now().strftime('%Y-%m'))
+        comptes_seuls = request.query_params.get('heatmap') == 'true'
         try:
-            service = Service.objects.get(chef_service=user, type_service='pat')
+            service = get_service_du_chef(request, 'pat')
             debut_mois = datetime.strptime(f"{mois}-01", "%Y-%m-%d").date()
             _, last = monthrange(debut_mois.year, debut_mois.month)
             fin_mois = debut_mois.replace(day=last)
 
-            absences = Absence.objects.filter(
-                personne__service=service,
-                date_debut__lte=fin_mois,
-                date_fin__gte=debut_mois,
-                statut__in=['APPROUVÉ', 'EN_ATTENTE']
-            ).select_related('personne')
-
-            # calendrier
-            planning = {}
-            cur = debut_mois
-            while cur <= fin_mois:
-                key = cur.strftime('%Y-%m-%d')
-                planning[key] = {
-                    'date': key,
-                    'jour_semaine': cur.strftime('%A'),
-                    'numero_jour': cur.day,
-                    'est_weekend': cur.weekday() >= 5,
-                    'absences': [],
-                    'nombre_absents': 0
-                }
-                cur += timedelta(days=1)
-
-            for a in absences:
-                start = max(a.date_debut, debut_mois)
-                end = min(a.date_fin, fin_mois)
-                cur = start
-                while cur <= end:
-                    key = cur.strftime('%Y-%m-%d')
-                    if key in planning:
-                        planning[key]['absences'].append({
-                            'id': a.id,
-                            'agent_id': a.personne.id,
-                            'nom_complet': f"{a.personne.prenom} {a.personne.nom}",
-                            'poste': getattr(getattr(a.personne, 'personnelpat', None), 'poste', 'N/A'),
-                            'type_absence': a.type_absence,
-                            'statut': a.statut,
-                            'debut': a.date_debut.isoformat(),
-                            'fin': a.date_fin.isoformat()
-                        })
-                    cur += timedelta(days=1)
-
-            for d in planning.values():
-                d['nombre_absents'] = len(d['absences'])
-
-            jour_max = max(planning.values(), key=lambda x: x['nombre_absents']) if planning else None
+            if comptes_seuls:
+                # heatmap : compteurs journaliers du service
+                planning = construire_planning(
+                    debut_mois, fin_mois, [], comptes_seuls=True,
+                    comptes=absences_par_jour(service, debut_mois, fin_mois, STATUTS_PLANNING)
+                )
+                total_absences = absences_par_periodes(service, [(debut_mois, fin_mois)], STATUTS_PLANNING)[0]
+            else:
+                absences = list(Absence.objects.filter(
+                    personne__service=service,
+                    date_debut__lte=fin_mois,
+                    date_fin__gte=debut_mois,
+                    statut__in=STATUTS_PLANNING
+                ).values(
+                    'id', 'personne_id', 'personne__nom', 'personne__prenom', 'personne__personnelpat__poste',
+                    'type_absence', 'statut', 'date_debut', 'date_fin'
+                ))
+
+                # calendrier
+                elements = []
+                for a in absences:
+                    poste = a['personne__personnelpat__poste']
+                    valeur = {
+                        'id': a['id'],
+                        'agent_id': a['personne_id'],
+                        'nom_complet': f"{a['personne__prenom']} {a['personne__nom']}",
+                        'poste': poste if poste is not None else 'N/A',
+                        'type_absence': a['type_absence'],
+                        'statut': a['statut'],
+                        'debut': a['date_debut'].isoformat(),
+                        'fin': a['date_fin'].isoformat()
+                    }
+                    elements.append((a['date_debut'], a['date_fin'], valeur))
+                planning = construire_planning(debut_mois, fin_mois, elements, cle_liste='absences')
+                total_absences = len(absences)
+
+            jour_max_absences = jour_max(planning)
             return Response({
                 'mois': mois,
                 'service': service.nom,
                 'planning': planning,
                 'statistiques': {
-                    'total_absences': absences.count(),
-                    'jour_max_absences': {'date': jour_max['date'], 'nombre': jour_max['nombre_absents']} if jour_max else None
+                    'total_absences': total_absences,
+                    'jour_max_absences': {'date': jour_max_absences['date'], 'nombre': jour_max_absences['nombre_absents']} if jour_max_absences else None
                 }
             })
         except Service.DoesNotExist:
             return Response({'error': 'Service non trouvé'}, status=404)
 
-    # ---------- Export (json/csv) ----------
-    @action(detail=False, methods=['get'])
+    # ---------- Export (json/csv/xlsx/ndjson) ----------
+    @action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERER_CLASSES)
     def export_rapport(self, request):
         user = request.user
         if user.role != 'chef_pat':
@@ -1260,90 +1104,43 @@ class PersonnelPATViewSet(viewsets.ModelViewSet):
         type_rapport = request.query_params.get('type', 'mensuel')
 
         try:
-            service = Service.objects.get(chef_service=user, type_service='pat')
+            service = get_service_du_chef(request, 'pat')
             qs = self.get_queryset()
 
             debut_mois = datetime.strptime(f"{mois}-01", "%Y-%m-%d").date()
             _, last = monthrange(debut_mois.year, debut_mois.month)
             fin_mois = debut_mois.replace(day=last)
 
-            # vue synthétique/détaillée
-            donnees = []
-            for agent in qs:
-                absences = Absence.objects.filter(
-                    personne=agent.personne,
-                    date_debut__lte=fin_mois,
-                    date_fin__gte=debut_mois
+            champs = [
+                ('nom', 'personne__nom'), ('prenom', 'personne__prenom'),
+                ('poste', 'poste'), ('grade', 'grade')
+            ]
+            if _demande_asynchrone(request):
+                return _soumettre_export(
+                    request, 'pat', service, mois, type_rapport, format_export, champs, 'rapport_pat'
                 )
-                base = {
-                    'nom': agent.personne.nom,
-                    'prenom': agent.personne.prenom,
-                    'poste': agent.poste,
-                    'grade': agent.grade
-                }
-                if type_rapport == 'detaille':
-                    total_jours = sum((abs.date_fin - max(abs.date_debut, debut_mois)).days + 1 for abs in absences)
-                    donnees.append({
-                        **base,
-                        'nombre_absences': absences.count(),
-                        'jours_absence': total_jours,
-                        'types_absence': ', '.join(absences.values_list('type_absence', flat=True).distinct())
-                    })
-                else:
-                    donnees.append({
-                        **base,
-                        'nombre_absences': absences.count(),
-                        'jours_absence': sum((abs.date_fin - abs.date_debut).days + 1 for abs in absences)
-                    })
-
-            if format_export == 'csv':
-                output = StringIO()
-                if donnees:
-                    writer = csv.DictWriter(output, fieldnames=donnees[0].keys())
-                    writer.writeheader()
-                    writer.writerows(donnees)
-                resp = HttpResponse(output.getvalue(), content_type='text/csv; charset=utf-8')
-                resp['Content-Disposition'] = f'attachment; filename="rapport_pat_{type_rapport}_{mois}.csv"'
-                return resp
-
-            return Response({
-                'donnees': donnees,
-                'periode': mois,
-                'service': service.nom,
-                'type_rapport': type_rapport,
-                'genere_le': timezone.now().isoformat()
-            })
+            return exporter_absences_agents(
+                qs, service, mois, debut_mois, fin_mois, type_rapport,
+                format_export, champs, 'rapport_pat'
+            )
         except Service.DoesNotExist:
             return Response({'error': 'Service non trouvé'}, status=404)
         except Exception as e:
             return Response({'error': str(e)}, status=500)
 
 
-class ContractuelViewSet(viewsets.ModelViewSet):
+class ContractuelViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     """ViewSet pour les contractuels avec hiérarchie"""
+    queryset = Contractuel.objects.select_related('personne')
     serializer_class = ContractuelSerializer
+    serializer_liste_class = ContractuelListeSerializer
     permission_classes = [IsAdminRHOrChefService]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['type_contrat']
     search_fields = ['personne__nom', 'personne__prenom']
     ordering_fields = ['personne__nom', 'date_debut_contrat']
-    
-    def get_queryset(self):
-        user = self.request.user
-        
-        if not user.is_authenticated:
-            return Contractuel.objects.none()
-            
-        if user.role == 'admin_rh':
-            return Contractuel.objects.select_related('personne').all()
-        elif user.role == 'chef_contractuel':
-            try:
-                service = Service.objects.get(chef_service=user, type_service='contractuel')
-                return Contractuel.objects.filter(personne__service=service).select_related('personne')
-            except Service.DoesNotExist:
-                return Contractuel.objects.none()
-        else:
-            return Contractuel.objects.filter(personne__user=user).select_related('personne')
+    scope_chef_roles = ('chef_contractuel',)
+    scope_type_service = 'contractuel'
     
     @action(detail=False, methods=['get'])
     def expires_bientot(self, request):
@@ -1364,7 +1161,7 @@ class ContractuelViewSet(viewsets.ModelViewSet):
 # VIEWSETS EXISTANTS ADAPTÉS
 # ========================================
 
-class StructureViewSet(viewsets.ModelViewSet):
+class StructureViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     queryset = Structure.objects.all()
     serializer_class = StructureSerializer
     permission_classes = [IsAdminRHOrChefService]
@@ -1372,40 +1169,76 @@ class StructureViewSet(viewsets.ModelViewSet):
     filterset_fields = ['type_structure', 'parent_structure', 'service']
     search_fields = ['nom', 'description']
     ordering_fields = ['nom', 'type_structure']
-    
-    def get_queryset(self):
-        user = self.request.user
-        
-        if not user.is_authenticated:
-            return Structure.objects.none()
-            
-        if user.role == 'admin_rh':
-            return Structure.objects.all()
-        elif user.role.startswith('chef_'):
-            try:
-                service = Service.objects.get(chef_service=user)
-                return Structure.objects.filter(service=service)
-            except Service.DoesNotExist:
-                return Structure.objects.none()
-        else:
-            if hasattr(user, 'personne') and user.personne.service:
-                return Structure.objects.filter(service=user.personne.service)
-        
-        return Structure.objects.none()
+    scope_service_field = 'service'
+    scope_employe_par_service = True
     
     @action(detail=False, methods=['get'])
     def arborescence(self, request):
-        """Retourne l'arborescence des structures selon permissions"""
-        queryset = self.get_queryset()
-        structures_racine = queryset.filter(parent_structure__isnull=True)
-        serializer = StructureTreeSerializer(structures_racine, many=True)
+        """
+        Retourne l'arborescence des structures selon permissions.
+        Paramètres : max_depth (profondeur maximale, racines = 1),
+        effectifs=true (nombre d'employés par nœud, directs et sous-arbre).
+        """
+        try:
+            max_depth = request.query_params.get('max_depth')
+            max_depth = int(max_depth) if max_depth else None
+            if max_depth is not None and max_depth < 1:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'max_depth doit être un entier positif'}, status=400)
+        
+        # Toutes les structures en une requête, arbre assemblé en mémoire
+        structures = list(Structure.objects.select_related('service').order_by('id'))
+        enfants = {}
+        for structure in structures:
+            enfants.setdefault(structure.parent_structure_id, []).append(structure)
+        
+        racines_visibles = set(
+            self.get_queryset().filter(parent_structure__isnull=True).values_list('id', flat=True)
+        )
+        structures_racine = [s for s in enfants.get(None, []) if s.id in racines_visibles]
+        
+        context = {'enfants': enfants, 'max_depth': max_depth}
+        if request.query_params.get('effectifs') == 'true':
+            context['effectifs'] = self._effectifs_arborescence(enfants)
+        
+        serializer = StructureTreeSerializer(structures_racine, many=True, context=context)
         return Response(serializer.data)
     
+    def _effectifs_arborescence(self, enfants):
+        """{structure_id: (employés directs, employés du sous-arbre)} en une requête groupée"""
+        directs = dict(
+            Personne.objects.filter(structure__isnull=False)
+            .values_list('structure').annotate(count=Count('id')).order_by()
+        )
+        effectifs = {}
+        
+        # Parcours itératif en post-ordre (pas de récursion Python sur les arbres profonds)
+        for racine in enfants.get(None, []):
+            pile = [(racine, False)]
+            vus = set()
+            while pile:
+                structure, termine = pile.pop()
+                if termine:
+                    total = directs.get(structure.id, 0) + sum(
+                        effectifs.get(s.id, (0, 0))[1] for s in enfants.get(structure.id, [])
+                    )
+                    effectifs[structure.id] = (directs.get(structure.id, 0), total)
+                    continue
+                if structure.id in vus:
+                    continue
+                vus.add(structure.id)
+                pile.append((structure, True))
+                pile.extend((s, False) for s in enfants.get(structure.id, []))
+        return effectifs
+    
     @action(detail=True, methods=['get'])
     def employes(self, request, pk=None):
-        """Retourne tous les employés d'une structure"""
+        """
+        Retourne tous les employés d'une structure
+        (recursive=true : y compris ceux de toutes ses sous-structures)
+        """
         structure = self.get_object()
-        employes = Personne.objects.filter(structure=structure)
         
         # Filtrage selon permissions
         user = request.user
@@ -1413,10 +1246,17 @@ class StructureViewSet(viewsets.ModelViewSet):
             if structure.service and structure.service.chef_service != user:
                 return Response({'error': 'Permission refusée'}, status=403)
         
+        if request.query_params.get('recursive') == 'true':
+            # Sous-arbre filtré par préfixe de chemin : une requête indexée
+            employes = Personne.objects.filter(structure__chemin__startswith=structure.chemin)
+        else:
+            employes = Personne.objects.filter(structure=structure)
+        employes = employes.select_related('service__chef_service', 'user', 'manager')
+        
         serializer = PersonneSerializer(employes, many=True)
         return Response(serializer.data)
 
-class RecrutementViewSet(viewsets.ModelViewSet):
+class RecrutementViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     queryset = Recrutement.objects.select_related('structure_recruteur', 'service_recruteur').all()
     serializer_class = RecrutementSerializer
     permission_classes = [IsAdminRHOrChefService]
@@ -1424,29 +1264,11 @@ class RecrutementViewSet(viewsets.ModelViewSet):
     filterset_fields = ['type_employe', 'statut_offre', 'structure_recruteur', 'service_recruteur']
     search_fields = ['titre_poste', 'description']
     ordering_fields = ['date_limite', 'date_entree_prevue']
-    
-    def get_queryset(self):
-        user = self.request.user
-        
-        if not user.is_authenticated:
-            return Recrutement.objects.none()
-            
-        if user.role == 'admin_rh':
-            return self.queryset
-        elif user.role.startswith('chef_'):
-            try:
-                service = Service.objects.get(chef_service=user)
-                return self.queryset.filter(service_recruteur=service)
-            except Service.DoesNotExist:
-                return Recrutement.objects.none()
-        else:
-            # Employé peut voir les recrutements de son service
-            if hasattr(user, 'personne') and user.personne.service:
-                return self.queryset.filter(service_recruteur=user.personne.service)
-        
-        return Recrutement.objects.none()
+    # Employé peut voir les recrutements de son service
+    scope_service_field = 'service_recruteur'
+    scope_employe_par_service = True
 
-class CandidatViewSet(viewsets.ModelViewSet):
+class CandidatViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     queryset = Candidat.objects.select_related('recrutement').all()
     serializer_class = CandidatSerializer
     permission_classes = [IsAdminRHOrChefService]
@@ -1454,32 +1276,20 @@ class CandidatViewSet(viewsets.ModelViewSet):
     filterset_fields = ['statut_candidature', 'recrutement']
     search_fields = ['nom', 'prenom', 'email']
     ordering_fields = ['date_candidature', 'nom']
-    
-    def get_queryset(self):
-        user = self.request.user
-        
-        if not user.is_authenticated:
-            return Candidat.objects.none()
-            
-        if user.role == 'admin_rh':
-            return self.queryset
-        elif user.role.startswith('chef_'):
-            try:
-                service = Service.objects.get(chef_service=user)
-                return self.queryset.filter(recrutement__service_recruteur=service)
-            except Service.DoesNotExist:
-                return Candidat.objects.none()
-        
-        return Candidat.objects.none()
+    scope_service_field = 'recrutement__service_recruteur'
+    scope_user_field = None
 
-class AbsenceViewSet(viewsets.ModelViewSet):
+class AbsenceViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     queryset = Absence.objects.select_related('personne').all()
     serializer_class = AbsenceSerializer
+    serializer_liste_class = AbsenceListeSerializer
     permission_classes = [IsAdminRHOrChefService]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['type_absence', 'statut', 'personne']
     search_fields = ['personne__nom', 'personne__prenom']
     ordering_fields = ['date_debut', 'date_demande_absence']
+    # ?pagination=cursor : historique parcouru par clé (index date_debut, id)
+    keyset_ordering = ('-date_debut', '-id')
     
     def get_permissions(self):
         """
@@ -1488,29 +1298,12 @@ class AbsenceViewSet(viewsets.ModelViewSet):
         """
         # Si c'est une action de lecture (list, retrieve) ou création, permettre aux employés authentifiés
         # Les actions personnalisées de lecture sont aussi autorisées
-        if self.action in ['list', 'retrieve', 'create', 'en_cours', 'statistiques']:
+        if self.action in ['list', 'retrieve', 'create', 'en_cours', 'statistiques', 'historique']:
             return [IsAuthenticated()]
         
         # Pour les autres actions (update, delete, approuver, refuser, etc.), utiliser les permissions normales
         return super().get_permissions()
     
-    def get_queryset(self):
-        user = self.request.user
-        
-        if not user.is_authenticated:
-            return Absence.objects.none()
-            
-        if user.role == 'admin_rh':
-            return self.queryset
-        elif user.role.startswith('chef_'):
-            try:
-                service = Service.objects.get(chef_service=user)
-                return self.queryset.filter(personne__service=service)
-            except Service.DoesNotExist:
-                return Absence.objects.none()
-        else:
-            return self.queryset.filter(personne__user=user)
-    
     def perform_create(self, serializer):
         """
         Permet aux employés de créer leurs propres absences
@@ -1555,16 +1348,24 @@ class AbsenceViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def en_attente_approbation(self, request):
-        """Absences en attente d'approbation pour les chefs"""
+        """Absences en attente d'approbation pour les chefs (paginées, triées par date de début)"""
         user = request.user
         
         if not user.role.startswith('chef_') and user.role != 'admin_rh':
             return Response({'error': 'Permission refusée'}, status=403)
         
-        queryset = self.get_queryset()
-        absences = queryset.filter(statut='EN_ATTENTE')
+        try:
+            # Même plan que la file de validation : une requête par page, sans requête par ligne
+            absences = annoter_file(self._absences_a_valider(request))
+        except Service.DoesNotExist:
+            return Response({'error': 'Service non trouvé'}, status=404)
         
-        serializer = self.get_serializer(absences, many=True)
+        page = self.paginate_queryset(absences)
+        context = self.get_serializer_context()
+        if page is not None:
+            serializer = AbsenceValidationSerializer(page, many=True, context=context)
+            return self.get_paginated_response(serializer.data)
+        serializer = AbsenceValidationSerializer(absences, many=True, context=context)
         return Response(serializer.data)
     
     @action(detail=True, methods=['post'])
@@ -1577,10 +1378,12 @@ class AbsenceViewSet(viewsets.ModelViewSet):
         if not absence.peut_approuver(user):
             return Response({'error': 'Permission refusée pour approuver cette absence'}, status=403)
         
+        statut_precedent = absence.statut
         absence.statut = 'APPROUVÉ'
         absence.approuve_par = user
         absence.commentaire_approbateur = request.data.get('commentaire', '')
         absence.save()
+        journaliser(absence, statut_precedent, user, absence.commentaire_approbateur)
         
         return Response({'message': 'Absence approuvée avec succès'})
     
@@ -1597,10 +1400,12 @@ class AbsenceViewSet(viewsets.ModelViewSet):
         if not motif_refus:
             return Response({'error': 'Motif de refus requis'}, status=400)
         
+        statut_precedent = absence.statut
         absence.statut = 'REFUSÉ'
         absence.approuve_par = user
         absence.motif_refus = motif_refus
         absence.save()
+        journaliser(absence, statut_precedent, user, motif_refus)
         
         return Response({'message': 'Absence refusée'})
     
@@ -1616,6 +1421,12 @@ class AbsenceViewSet(viewsets.ModelViewSet):
             'par_statut': list(par_statut),
             'total': queryset.count()
         })
+    def _absences_a_valider(self, request):
+        """Demandes en attente visibles par le chef (son service) ou l'admin RH (tout)"""
+        if request.user.role == 'admin_rh':
+            return absences_a_valider()
+        return absences_a_valider(get_service_du_chef(request))
+
     @action(detail=False, methods=['get'])
     def planning_validation(self, request):
         """Planning des absences à valider pour les chefs"""
@@ -1625,53 +1436,74 @@ class AbsenceViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Permission refusée'}, status=403)
         
         try:
-            # Déterminer le scope
-            if user.role == 'admin_rh':
-                absences = Absence.objects.filter(statut='EN_ATTENTE')
-            else:
-                service = Service.objects.get(chef_service=user)
-                absences = Absence.objects.filter(
-                    personne__service=service,
-                    statut='EN_ATTENTE'
-                )
-            
-            # Organiser par priorité
-            aujourd_hui = timezone.now().date()
-            
-            # Absences urgentes (dans les 3 jours)
-            absences_urgentes = absences.filter(
-                date_debut__lte=aujourd_hui + timedelta(days=3)
-            ).select_related('personne')
-            
-            # Absences cette semaine (4-7 jours)
-            absences_semaine = absences.filter(
-                date_debut__gt=aujourd_hui + timedelta(days=3),
-                date_debut__lte=aujourd_hui + timedelta(days=7)
-            ).select_related('personne')
-            
-            # Absences futures (plus de 7 jours)
-            absences_futures = absences.filter(
-                date_debut__gt=aujourd_hui + timedelta(days=7)
-            ).select_related('personne')
+            # Une requête : demandes annotées (urgence, approbateur), réparties ici
+            absences = annoter_file(self._absences_a_valider(request))
+            serializer = AbsenceValidationSerializer(
+                absences, many=True, context=self.get_serializer_context()
+            )
+            par_urgence = {urgence: [] for urgence in URGENCES}
+            for donnees in serializer.data:
+                par_urgence[donnees['urgence']].append(donnees)
             
             return Response({
-                'absences_urgentes': AbsenceSerializer(absences_urgentes, many=True).data,
-                'absences_semaine': AbsenceSerializer(absences_semaine, many=True).data,
-                'absences_futures': AbsenceSerializer(absences_futures, many=True).data,
+                'absences_urgentes': par_urgence['urgente'],
+                'absences_semaine': par_urgence['semaine'],
+                'absences_futures': par_urgence['future'],
                 'statistiques': {
-                    'total_en_attente': absences.count(),
-                    'urgentes': absences_urgentes.count(),
-                    'cette_semaine': absences_semaine.count(),
-                    'futures': absences_futures.count()
+                    'total_en_attente': len(serializer.data),
+                    'urgentes': len(par_urgence['urgente']),
+                    'cette_semaine': len(par_urgence['semaine']),
+                    'futures': len(par_urgence['future'])
                 }
             })
             
         except Service.DoesNotExist:
             return Response({'error': 'Service non trouvé'}, status=404)
 
+    @action(detail=False, methods=['get'])
+    def file_validation(self, request):
+        """
+        File de validation paginée par curseur (?cursor=, ?page_size=).
+        Filtres : ?urgence=urgente|semaine|future, ?service=<id> (admin RH).
+        """
+        user = request.user
+        
+        if not user.role.startswith('chef_') and user.role != 'admin_rh':
+            return Response({'error': 'Permission refusée'}, status=403)
+        
+        urgence = request.query_params.get('urgence')
+        if urgence and urgence not in URGENCES:
+            return Response({'error': f"urgence invalide ({', '.join(URGENCES)})"}, status=400)
+        
+        try:
+            absences = self._absences_a_valider(request)
+        except Service.DoesNotExist:
+            return Response({'error': 'Service non trouvé'}, status=404)
+        
+        service_id = request.query_params.get('service')
+        if service_id and user.role == 'admin_rh':
+            absences = absences.filter(personne__service_id=service_id)
+        
+        statistiques = compter_file(absences)
+        if urgence:
+            absences = absences.filter(filtre_urgence(urgence))
+        
+        paginator = FileValidationPagination()
+        page = paginator.paginate_queryset(annoter_file(absences), request, view=self)
+        serializer = AbsenceValidationSerializer(page, many=True, context=self.get_serializer_context())
+        response = paginator.get_paginated_response(serializer.data)
+        response.data['statistiques'] = statistiques
+        return response
+
     @action(detail=False, methods=['post'])
     def validation_en_lot(self, request):
-        """Valider plusieurs absences en une fois"""
+        """
+        Valider plusieurs absences en une fois.
+
+        Corps : {absence_ids, action: approuver|refuser, commentaire}.
+        Chaque id reçoit un résultat : traitee, deja_traitee, hors_perimetre
+        ou introuvable.
+        """
         user = request.user
         
         if not user.role.startswith('chef_') and user.role != 'admin_rh':
@@ -1683,49 +1515,42 @@ class AbsenceViewSet(viewsets.ModelViewSet):
         
         if not absence_ids:
             return Response({'error': 'Aucune absence sélectionnée'}, status=400)
+        if not isinstance(absence_ids, list) or not all(str(i).isdigit() for i in absence_ids):
+            return Response({'error': 'absence_ids doit être une liste d\'identifiants'}, status=400)
+        if action_type not in DECISIONS:
+            return Response({'error': 'Action invalide (approuver ou refuser)'}, status=400)
         
         try:
-            # Récupérer les absences
-            absences = Absence.objects.filter(id__in=absence_ids, statut='EN_ATTENTE')
-            
-            # Vérifier les permissions pour chaque absence
-            if user.role != 'admin_rh':
-                service = Service.objects.get(chef_service=user)
-                absences = absences.filter(personne__service=service)
-            
-            resultats = {
-                'traitees': 0,
-                'erreurs': []
-            }
-            
-            for absence in absences:
-                try:
-                    if action_type == 'approuver':
-                        absence.statut = 'APPROUVÉ'
-                        absence.commentaire_approbateur = commentaire
-                    else:
-                        absence.statut = 'REFUSÉ'
-                        absence.motif_refus = commentaire
-                    
-                    absence.approuve_par = user
-                    absence.save()
-                    resultats['traitees'] += 1
-                    
-                except Exception as e:
-                    resultats['erreurs'].append({
-                        'absence_id': absence.id,
-                        'erreur': str(e)
-                    })
-            
-            return Response({
-                'message': f'{resultats["traitees"]} absences {action_type}ées avec succès',
-                'resultats': resultats
-            })
-            
+            service = None if user.role == 'admin_rh' else get_service_du_chef(request)
+            details = valider_absences_en_lot(
+                [int(i) for i in absence_ids], action_type, user, commentaire, service=service
+            )
         except Service.DoesNotExist:
             return Response({'error': 'Service non trouvé'}, status=404)
         except Exception as e:
             return Response({'error': str(e)}, status=500)
+        
+        traitees = sum(1 for d in details if d['resultat'] == TRAITEE)
+        libelle = 'approuvées' if action_type == 'approuver' else 'refusées'
+        return Response({
+            'message': f'{traitees} absences {libelle} avec succès',
+            'resultats': {
+                'traitees': traitees,
+                'ignorees': len(details) - traitees,
+                'details': details,
+                'erreurs': [
+                    {'absence_id': d['absence_id'], 'erreur': MESSAGES_RESULTAT[d['resultat']]}
+                    for d in details if d['resultat'] != TRAITEE
+                ]
+            }
+        })
+
+    @action(detail=True, methods=['get'])
+    def historique(self, request, pk=None):
+        """Journal des décisions prises sur une absence"""
+        absence = self.get_object()
+        historique = absence.historique.select_related('effectue_par')
+        return Response(HistoriqueAbsenceSerializer(historique, many=True).data)
 
 
 
@@ -1747,7 +1572,7 @@ class PlanningViewSet(viewsets.ViewSet):
                 personnes = Personne.objects.all()
                 scope_name = "Tous les services"
             elif user.role.startswith('chef_'):
-                service = Service.objects.get(chef_service=user)
+                service = get_service_du_chef(request)
                 personnes = service.employes.all()
                 scope_name = service.nom
             else:
@@ -1759,30 +1584,55 @@ class PlanningViewSet(viewsets.ViewSet):
             fin_mois = debut_mois.replace(day=last_day)
             
             # Récupérer les absences
-            absences = Absence.objects.filter(
+            absences = list(Absence.objects.filter(
                 personne__in=personnes,
                 date_debut__lte=fin_mois,
                 date_fin__gte=debut_mois,
                 statut='APPROUVÉ'
-            ).select_related('personne')
+            ).values(
+                'personne_id', 'personne__nom', 'personne__prenom', 'personne__service__nom',
+                'type_absence', 'date_debut', 'date_fin'
+            ))
             
             # Créer le planning calendaire
-            planning_data = self._generer_planning_calendaire(debut_mois, fin_mois, absences)
+            comptes_seuls = request.query_params.get('heatmap') == 'true'
+            planning_data = self._generer_planning_calendaire(debut_mois, fin_mois, absences, comptes_seuls)
+            
+            # Statistiques (jours ouvrés, absences tronquées aux bornes du mois)
+            total_employes = personnes.count()
+            jours_travailles = compter_jours_ouvres(debut_mois, fin_mois)
+            disponibilites = disponibilite_par_personne(
+                ((a['personne_id'], a['date_debut'], a['date_fin']) for a in absences), debut_mois, fin_mois
+            )
+            jours_perdus = sum(d['jours_absence'] for d in disponibilites.values())
+            taux_presence_moyen = taux_presence(total_employes, jours_perdus, jours_travailles)
             
-            # Statistiques
-            jours_travailles = self._calculer_jours_travailles(debut_mois, fin_mois)
-            taux_presence_moyen = self._calculer_taux_presence(personnes.count(), absences, jours_travailles)
+            # Disponibilité des agents absents dans le mois, les moins disponibles d'abord
+            agents = {
+                a['personne_id']: (f"{a['personne__prenom']} {a['personne__nom']}", a['personne__service__nom'])
+                for a in absences
+            }
+            disponibilite = sorted(
+                (
+                    {'personne_id': personne_id, 'nom': agents[personne_id][0],
+                     'service': agents[personne_id][1], **valeurs}
+                    for personne_id, valeurs in disponibilites.items()
+                ),
+                key=lambda ligne: (ligne['taux_disponibilite'], ligne['nom'])
+            )
             
             return Response({
                 'mois': mois,
                 'scope': scope_name,
                 'planning': planning_data,
                 'statistiques': {
-                    'total_employes': personnes.count(),
-                    'total_absences': absences.count(),
+                    'total_employes': total_employes,
+                    'total_absences': len(absences),
                     'jours_travailles': jours_travailles,
+                    'jours_ouvres_perdus': jours_perdus,
                     'taux_presence_moyen': taux_presence_moyen
-                }
+                },
+                'disponibilite': disponibilite
             })
             
         except Service.DoesNotExist:
@@ -1815,50 +1665,51 @@ class PlanningViewSet(viewsets.ViewSet):
                 personnes = Personne.objects.all()
                 scope_name = "Tous les services"
             elif user.role.startswith('chef_'):
-                service = Service.objects.get(chef_service=user)
+                service = get_service_du_chef(request)
                 personnes = service.employes.all()
                 scope_name = service.nom
             else:
                 return Response({'error': 'Permission refusée'}, status=403)
             
             # Récupérer les absences de la semaine
-            absences = Absence.objects.filter(
+            absences = list(Absence.objects.filter(
                 personne__in=personnes,
                 date_debut__lte=fin_semaine,
                 date_fin__gte=debut_semaine,
                 statut='APPROUVÉ'
-            ).select_related('personne')
+            ).values(
+                'personne__nom', 'personne__prenom', 'personne__service__nom',
+                'type_absence', 'date_debut', 'date_fin'
+            ))
             
             # Organiser par jour de la semaine
             planning_semaine = {}
             jours = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+            comptes_seuls = request.query_params.get('heatmap') == 'true'
+            
+            if comptes_seuls:
+                comptes = compter_par_jour(
+                    ((a['date_debut'], a['date_fin']) for a in absences), debut_semaine, fin_semaine
+                )
+            else:
+                absents_par_jour = repartir_par_jour(
+                    ((a['date_debut'], a['date_fin'], self._absent(a)) for a in absences),
+                    debut_semaine, fin_semaine
+                )
             
             for i in range(7):
                 jour_date = debut_semaine + timedelta(days=i)
-                day_key = jour_date.strftime('%Y-%m-%d')
+                day_key = jour_date.isoformat()
                 
                 planning_semaine[day_key] = {
                     'date': day_key,
                     'jour_semaine': jours[i],
-                    'est_weekend': i >= 5,
-                    'absents': []
+                    'est_weekend': jour_date.weekday() in get_weekend(),
                 }
-            
-            # Remplir avec les absences
-            for absence in absences:
-                start_date = max(absence.date_debut, debut_semaine)
-                end_date = min(absence.date_fin, fin_semaine)
-                
-                current = start_date
-                while current <= end_date:
-                    day_key = current.strftime('%Y-%m-%d')
-                    if day_key in planning_semaine:
-                        planning_semaine[day_key]['absents'].append({
-                            'nom': f"{absence.personne.prenom} {absence.personne.nom}",
-                            'type_absence': absence.type_absence,
-                            'service': absence.personne.service.nom if absence.personne.service else 'N/A'
-                        })
-                    current += timedelta(days=1)
+                if comptes_seuls:
+                    planning_semaine[day_key]['nombre_absents'] = comptes[i]
+                else:
+                    planning_semaine[day_key]['absents'] = absents_par_jour[i]
             
             return Response({
                 'semaine': semaine,
@@ -1871,66 +1722,21 @@ class PlanningViewSet(viewsets.ViewSet):
         except (ValueError, Service.DoesNotExist) as e:
             return Response({'error': str(e)}, status=400)
     
-    def _generer_planning_calendaire(self, debut, fin, absences):
-        """Génère un planning calendaire"""
-        planning = {}
-        current_date = debut
-        
-        # Initialiser tous les jours
-        while current_date <= fin:
-            day_key = current_date.strftime('%Y-%m-%d')
-            planning[day_key] = {
-                'date': day_key,
-                'jour_semaine': current_date.strftime('%A'),
-                'numero_jour': current_date.day,
-                'est_weekend': current_date.weekday() >= 5,
-                'absents': [],
-                'nombre_absents': 0
-            }
-            current_date += timedelta(days=1)
-        
-        # Remplir avec les absences
-        for absence in absences:
-            start_date = max(absence.date_debut, debut)
-            end_date = min(absence.date_fin, fin)
-            
-            current = start_date
-            while current <= end_date:
-                day_key = current.strftime('%Y-%m-%d')
-                if day_key in planning:
-                    planning[day_key]['absents'].append({
-                        'nom': f"{absence.personne.prenom} {absence.personne.nom}",
-                        'type_absence': absence.type_absence,
-                        'service': absence.personne.service.nom if absence.personne.service else 'N/A'
-                    })
-                current += timedelta(days=1)
-        
-        # Calculer le nombre d'absents par jour
-        for day_data in planning.values():
-            day_data['nombre_absents'] = len(day_data['absents'])
-        
-        return planning
-    
-    def _calculer_jours_travailles(self, debut, fin):
-        """Calcule le nombre de jours ouvrables"""
-        jours = 0
-        current = debut
-        while current <= fin:
-            if current.weekday() < 5:  # Lundi à Vendredi
-                jours += 1
-            current += timedelta(days=1)
-        return jours
+    def _absent(self, absence):
+        """Entrée d'un absent dans les vues planning (absence issue de .values())"""
+        return {
+            'nom': f"{absence['personne__prenom']} {absence['personne__nom']}",
+            'type_absence': absence['type_absence'],
+            'service': absence['personne__service__nom'] or 'N/A'
+        }
     
-    def _calculer_taux_presence(self, nb_employes, absences, jours_travailles):
-        """Calcule le taux de présence moyen"""
-        if nb_employes == 0 or jours_travailles == 0:
-            return 100
-        
-        total_jours_employes = nb_employes * jours_travailles
-        total_jours_absences = sum((min(abs.date_fin, timezone.now().date()) - abs.date_debut).days + 1 for abs in absences)
-        
-        taux = ((total_jours_employes - total_jours_absences) / total_jours_employes) * 100
-        return round(max(0, taux), 2)
+    def _generer_planning_calendaire(self, debut, fin, absences, comptes_seuls=False):
+        """Génère un planning calendaire (comptes_seuls : nombre d'absents par jour uniquement)"""
+        elements = (
+            (a['date_debut'], a['date_fin'], None if comptes_seuls else self._absent(a))
+            for a in absences
+        )
+        return construire_planning(debut, fin, elements, comptes_seuls=comptes_seuls)
     
 class StatistiquesViewSet(viewsets.ViewSet):
     """
@@ -1947,7 +1753,7 @@ class StatistiquesViewSet(viewsets.ViewSet):
             return Response({'error': 'Permission refusée'}, status=403)
         
         try:
-            service = Service.objects.get(chef_service=user)
+            service = get_service_du_chef(request)
             
             # Période par défaut : 3 derniers mois
             aujourd_hui = timezone.now().date()
@@ -1957,55 +1763,41 @@ class StatistiquesViewSet(viewsets.ViewSet):
             employes = service.employes.all()
             total_employes = employes.count()
             
-            # Absences récentes
-            absences_recentes = Absence.objects.filter(
-                personne__service=service,
-                date_debut__gte=debut_periode
-            )
-            
-            # Statistiques des absences
-            absences_par_mois = []
+            # Statistiques des absences (compteurs journaliers, une requête pour les 3 mois)
+            mois_analyses = []
             for i in range(3):
                 date_mois = aujourd_hui.replace(day=1) - timedelta(days=30*i)
-                debut_mois = date_mois.replace(day=1)
                 _, last_day = monthrange(date_mois.year, date_mois.month)
-                fin_mois = date_mois.replace(day=last_day)
-                
-                nb_absences = Absence.objects.filter(
-                    personne__service=service,
-                    date_debut__lte=fin_mois,
-                    date_fin__gte=debut_mois
-                ).count()
-                
-                absences_par_mois.append({
+                mois_analyses.append((date_mois, date_mois.replace(day=1), date_mois.replace(day=last_day)))
+            
+            nombres = absences_par_periodes(service, [(debut, fin) for _, debut, fin in mois_analyses])
+            absences_par_mois = [
+                {
                     'mois': date_mois.strftime('%Y-%m'),
                     'nom_mois': date_mois.strftime('%B %Y'),
                     'nombre_absences': nb_absences
-                })
-            
-            # Top 5 employés par absences
-            top_absences = []
-            for employe in employes:
-                nb_absences = Absence.objects.filter(
-                    personne=employe,
-                    date_debut__gte=debut_periode
-                ).count()
-                
-                if nb_absences > 0:
-                    top_absences.append({
-                        'nom': f"{employe.prenom} {employe.nom}",
-                        'fonction': employe.fonction,
-                        'nombre_absences': nb_absences
-                    })
+                }
+                for (date_mois, _, _), nb_absences in zip(mois_analyses, nombres)
+            ]
             
-            top_absences.sort(key=lambda x: x['nombre_absences'], reverse=True)
-            top_absences = top_absences[:5]
+            # Top 5 employés par absences (une requête)
+            top = (
+                employes.annotate(nb_absences=Count('absences', filter=Q(absences__date_debut__gte=debut_periode)))
+                .filter(nb_absences__gt=0)
+                .order_by('-nb_absences', 'id')
+                .values('nom', 'prenom', 'fonction', 'nb_absences')[:5]
+            )
+            top_absences = [
+                {
+                    'nom': f"{e['prenom']} {e['nom']}",
+                    'fonction': e['fonction'],
+                    'nombre_absences': e['nb_absences']
+                }
+                for e in top
+            ]
             
             # Absences en attente de validation
-            absences_attente = Absence.objects.filter(
-                personne__service=service,
-                statut='EN_ATTENTE'
-            ).count()
+            absences_attente = total_absences(service, ['EN_ATTENTE'])
             
             # Répartition par type d'employé
             if service.type_service == 'enseignant':
@@ -2070,7 +1862,7 @@ class StatistiquesViewSet(viewsets.ViewSet):
                 employes = Personne.objects.all()
                 scope_name = "Tous les services"
             else:
-                service = Service.objects.get(chef_service=user)
+                service = get_service_du_chef(request)
                 employes = service.employes.all()
                 scope_name = service.nom
             
@@ -2128,7 +1920,7 @@ class StatistiquesViewSet(viewsets.ViewSet):
         except (ValueError, Service.DoesNotExist) as e:
             return Response({'error': str(e)}, status=400)
         
-class PaieViewSet(viewsets.ModelViewSet):
+class PaieViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     queryset = Paie.objects.select_related('personne').prefetch_related('elements').all()
     serializer_class = PaieSerializer
     permission_classes = [IsAdminRHOrChefService]
@@ -2136,26 +1928,11 @@ class PaieViewSet(viewsets.ModelViewSet):
     filterset_fields = ['statut_paiement', 'mois_annee', 'personne']
     search_fields = ['personne__nom', 'personne__prenom']
     ordering_fields = ['date_paiement', 'mois_annee']
+    keyset_ordering = ('-mois_annee', '-id')
     
-    def get_queryset(self):
-        user = self.request.user
-        
-        if not user.is_authenticated:
-            return Paie.objects.none()
-            
-        if user.role == 'admin_rh':
-            return self.queryset
-        elif user.role.startswith('chef_'):
-            try:
-                service = Service.objects.get(chef_service=user)
-                return self.queryset.filter(personne__service=service)
-            except Service.DoesNotExist:
-                return Paie.objects.none()
-        else:
-            return self.queryset.filter(personne__user=user)
-    
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
-        """Créer la paie avec les éléments"""
+        """Créer la paie avec les éléments (livre de paie recalculé une fois, à la validation)"""
         # Créer une copie mutable de request.data
         data = request.data.copy() if hasattr(request.data, 'copy') else dict(request.data)
         elements_data = data.pop('elements', [])
@@ -2184,30 +1961,301 @@ class PaieViewSet(viewsets.ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
     
+    def _parametres_livre(self, request):
+        """
+        Service, filtres et axe de ventilation des résumés du livre de paie.
+        Le chef est limité à son service ; l'admin RH peut filtrer par ?service=.
+        Retourne (service, filtres, par) ou une Response d'erreur.
+        """
+        scope = self.get_scope()
+        if scope is not None and scope.is_admin_rh:
+            service = None
+            service_id = request.query_params.get('service')
+            if service_id:
+                if not service_id.isdigit():
+                    return Response({'error': 'Paramètre service invalide'},
+                                  status=status.HTTP_400_BAD_REQUEST)
+                service = Service(id=int(service_id))
+        elif scope is not None and scope.has_service:
+            service = scope.service()
+        else:
+            return Response({'error': 'Service non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+
+        par = request.query_params.get('par') or None
+        if par is not None and par not in livre_paie.AXES and par != livre_paie.AXE_CODE:
+            axes = ', '.join([*livre_paie.AXES, livre_paie.AXE_CODE])
+            return Response({'error': f'Paramètre par invalide (valeurs: {axes})'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        filtres = {
+            'type_employe': request.query_params.get('type_employe'),
+            'grade': request.query_params.get('grade'),
+            'statut_paiement': request.query_params.get('statut'),
+        }
+        return service, filtres, par
+
     @action(detail=False, methods=['get'])
     def resume_mensuel(self, request):
-        """Résumé des paies par mois selon permissions"""
+        """
+        Résumé des paies d'un mois, lu dans le livre de paie.
+        ?mois=YYYY-MM, ventilation optionnelle ?par=service|type_employe|grade|statut|code,
+        filtres ?type_employe=, ?grade=, ?statut= (et ?service= pour l'admin RH).
+        """
         mois = request.query_params.get('mois')
-        if not mois:
+        try:
+            datetime.strptime(mois or '', '%Y-%m')
+        except ValueError:
             return Response({'error': 'Paramètre mois requis (format: YYYY-MM)'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        queryset = self.get_queryset()
-        paies = queryset.filter(mois_annee=mois)
-        
-        total_brut = paies.aggregate(Sum('salaire_brut'))['salaire_brut__sum'] or 0
-        total_net = paies.aggregate(Sum('salaire_net'))['salaire_net__sum'] or 0
-        total_deductions = paies.aggregate(Sum('deductions'))['deductions__sum'] or 0
-        
-        return Response({
-            'mois': mois,
-            'nombre_employes': paies.count(),
-            'total_brut': total_brut,
-            'total_net': total_net,
-            'total_deductions': total_deductions
-        })
+        parametres = self._parametres_livre(request)
+        if isinstance(parametres, Response):
+            return parametres
+        service, filtres, par = parametres
+
+        resume = {'mois': mois, **livre_paie.ventilation([mois], service, filtres, par_mois=False)}
+        if par:
+            resume['par'] = par
+            resume['details'] = livre_paie.ventilation([mois], service, filtres, par, par_mois=False)
+        return Response(resume)
+
+    @action(detail=False, methods=['get'])
+    def resume_annuel(self, request):
+        """
+        Résumé des paies d'une année (totaux par mois et cumul), lu dans le livre de paie.
+        ?annee=YYYY ; mêmes paramètres de ventilation et de filtre que resume_mensuel,
+        la ventilation étant cumulée sur l'année.
+        """
+        annee = request.query_params.get('annee', '')
+        if not (annee.isdigit() and len(annee) == 4):
+            return Response({'error': 'Paramètre annee requis (format: YYYY)'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        parametres = self._parametres_livre(request)
+        if isinstance(parametres, Response):
+            return parametres
+        service, filtres, par = parametres
+
+        mois = [f'{annee}-{m:02d}' for m in range(1, 13)]
+        par_mois = livre_paie.ventilation(mois, service, filtres)
+        resume = {
+            'annee': int(annee),
+            'mois': [{'mois': m, **totaux} for m, totaux in par_mois.items()],
+        }
+        resume['total'] = {
+            cle: sum(totaux[cle] for totaux in par_mois.values()) for cle in resume['mois'][0] if cle != 'mois'
+        }
+        if par:
+            resume['par'] = par
+            resume['details'] = livre_paie.ventilation(mois, service, filtres, par, par_mois=False)
+        return Response(resume)
+
+    @action(detail=True, methods=['get'], url_path='bulletin.pdf', renderer_classes=BULLETIN_RENDERER_CLASSES)
+    def bulletin(self, request, pk=None):
+        """
+        Bulletin de salaire PDF de la paie. Le fichier est rendu une seule fois
+        par contenu (voir bulletins.py) ; l'ETag est l'empreinte de ce contenu.
+        """
+        paie = self.get_object()
+        hachage, chemin = bulletins.bulletin_pdf(paie)
+        etag = f'"{hachage}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = FileResponse(
+                default_storage.open(chemin, 'rb'),
+                content_type=PDFRenderer.media_type,
+                filename=f"bulletin_{paie.mois_annee}_{paie.personne.numero_employe}.pdf",
+            )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=False, methods=['get'], renderer_classes=BULLETIN_RENDERER_CLASSES)
+    def bulletins(self, request):
+        """
+        Bulletins PDF d'un mois dans une archive ZIP.
+        ?mois=YYYY-MM ; le chef reçoit ceux de son service, l'admin RH ceux du
+        ministère ou d'un ?service=. Avec ?async=true, l'archive est produite
+        par le worker (tâche bulletins_paie).
+        """
+        mois = request.query_params.get('mois')
+        try:
+            datetime.strptime(mois or '', '%Y-%m')
+        except ValueError:
+            return Response({'error': 'Paramètre mois requis (format: YYYY-MM)'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        parametres = self._parametres_livre(request)
+        if isinstance(parametres, Response):
+            return parametres
+        service = parametres[0]
+
+        if _demande_asynchrone(request):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+            tache = soumettre_tache('bulletins_paie', {
+                'mois': mois,
+                'service_id': service.id if service is not None else None,
+            }, request.user)
+            return _reponse_tache(tache)
+
+        paies = self.get_queryset().filter(mois_annee=mois)
+        if service is not None:
+            paies = paies.filter(personne__service=service)
+        fichier = tempfile.TemporaryFile()
+        bulletins.ecrire_zip(bulletins.paies_du_lot(paies), fichier)
+        fichier.seek(0)
+        suffixe = f"_{service.id}" if service is not None else ''
+        return FileResponse(fichier, content_type=ZIPRenderer.media_type,
+                            as_attachment=True, filename=f"bulletins_{mois}{suffixe}.zip")
+
+    @action(detail=False, methods=['post'])
+    def simulation(self, request):
+        """
+        Simulation de la paie mensuelle de l'effectif actif, sans écriture.
+        Corps : {scenario: {revalorisation_indice?, revalorisation_contractuel?,
+        <paramètre de paie>?...}, limite_personnes?: 100 (0 = toutes)}.
+        Le chef simule son service ; l'admin RH le ministère ou un ?service=.
+        """
+        parametres = self._parametres_livre(request)
+        if isinstance(parametres, Response):
+            return parametres
+        service = parametres[0]
+
+        scenario = request.data.get('scenario') or {}
+        limite = request.data.get('limite_personnes', simulation.LIMITE_PERSONNES)
+        if not isinstance(scenario, dict):
+            return Response({'error': 'scenario doit être un objet'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limite = int(limite)
+            if limite < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response({'error': 'limite_personnes doit être un entier positif'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            resultat = simulation.simuler(scenario, service, limite)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(resultat)
+
+    def _lancements_visibles(self):
+        """Lancements de paie visibles : tous pour l'admin RH, ceux de son service pour un chef"""
+        scope = self.get_scope()
+        lancements = LancementPaie.objects.select_related('service', 'lance_par')
+        if scope is not None and scope.is_admin_rh:
+            return lancements
+        if scope is None or not scope.has_service:
+            return lancements.none()
+        return lancements.filter(service_id=scope.service_id)
+
+    @action(detail=False, methods=['post'])
+    def lancer_mois(self, request):
+        """
+        Lancement de la paie d'un mois pour un service ou une sélection de personnes.
+
+        Corps : {mois_annee, service?, personnes?, date_paiement?, async?}
+        ou {lancement: id} pour reprendre un lancement interrompu.
+        L'admin RH peut lancer la paie de tout le ministère avec {tous: true}.
+        Un chef de service ne peut lancer que la paie de son service.
+        Avec async, le calcul est confié au worker et l'id de la tâche est renvoyé.
+        """
+        scope = self.get_scope()
+        if scope is None or not (scope.is_admin_rh or scope.is_chef and scope.has_service):
+            return Response({'error': 'Accès non autorisé'}, status=status.HTTP_403_FORBIDDEN)
 
-class DetachementViewSet(viewsets.ModelViewSet):
+        try:
+            taille_lot = int(request.data.get('taille_lot', 500))
+            if taille_lot < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response({'error': 'taille_lot doit être un entier positif'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        lancement_id = request.data.get('lancement')
+        if lancement_id:
+            lancement = get_object_or_404(self._lancements_visibles(), pk=lancement_id)
+            if lancement.statut == 'TERMINE':
+                return Response({'error': 'Ce lancement est déjà terminé'},
+                              status=status.HTTP_400_BAD_REQUEST)
+            if Tache.objects.filter(
+                type_tache='lancement_paie', statut__in=['EN_ATTENTE', 'EN_COURS'],
+                parametres__lancement_id=lancement.id
+            ).exists():
+                return Response({'error': 'Ce lancement est déjà en cours de traitement'},
+                              status=status.HTTP_400_BAD_REQUEST)
+            reponse_status = status.HTTP_200_OK
+        else:
+            mois_annee = request.data.get('mois_annee')
+            try:
+                datetime.strptime(mois_annee or '', '%Y-%m')
+            except ValueError:
+                return Response({'error': 'Paramètre mois_annee requis (format: YYYY-MM)'},
+                              status=status.HTTP_400_BAD_REQUEST)
+
+            date_paiement = request.data.get('date_paiement')
+            if date_paiement:
+                try:
+                    date_paiement = datetime.strptime(date_paiement, '%Y-%m-%d').date()
+                except ValueError:
+                    return Response({'error': 'Format de date_paiement invalide (YYYY-MM-DD)'},
+                                  status=status.HTTP_400_BAD_REQUEST)
+
+            personnes = request.data.get('personnes') or []
+            if not isinstance(personnes, list) or not all(str(p).isdigit() for p in personnes):
+                return Response({'error': 'personnes doit être une liste d\'identifiants'},
+                              status=status.HTTP_400_BAD_REQUEST)
+            personnes = [int(p) for p in personnes]
+
+            service_id = request.data.get('service')
+            if scope.is_chef:
+                if service_id and str(service_id) != str(scope.service_id):
+                    return Response({'error': 'Vous ne pouvez lancer que la paie de votre service'},
+                                  status=status.HTTP_403_FORBIDDEN)
+                service_id = scope.service_id
+
+            service = None
+            if service_id:
+                service = Service.objects.filter(pk=service_id).first()
+                if service is None:
+                    return Response({'error': 'Service non trouvé'}, status=status.HTTP_404_NOT_FOUND)
+            elif not personnes and not (scope.is_admin_rh and request.data.get('tous') is True):
+                return Response({'error': 'Indiquez un service, une liste de personnes ou tous'},
+                              status=status.HTTP_400_BAD_REQUEST)
+
+            lancement = preparer_lancement(
+                mois_annee, date_paiement, service=service, personnes=personnes, lance_par=request.user
+            )
+            reponse_status = status.HTTP_201_CREATED
+
+        if _demande_asynchrone(request):
+            return _reponse_tache(soumettre_tache('lancement_paie', {
+                'lancement_id': lancement.id, 'taille_lot': taille_lot
+            }, request.user))
+
+        executer_lancement(lancement, taille_lot=taille_lot)
+        serializer = LancementPaieSerializer(lancement)
+        if lancement.statut == 'ECHEC':
+            return Response({'error': lancement.erreur, 'lancement': serializer.data},
+                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(serializer.data, status=reponse_status)
+
+    @action(detail=False, methods=['get'])
+    def lancements(self, request):
+        """Suivi des lancements de paie (progression, point de reprise)"""
+        lancements = self._lancements_visibles()
+        mois = request.query_params.get('mois')
+        if mois:
+            lancements = lancements.filter(mois_annee=mois)
+
+        page = self.paginate_queryset(lancements)
+        if page is not None:
+            return self.get_paginated_response(LancementPaieSerializer(page, many=True).data)
+        return Response(LancementPaieSerializer(lancements, many=True).data)
+
+class DetachementViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     queryset = Detachement.objects.select_related('personne', 'structure_origine', 'structure_detachement').all()
     serializer_class = DetachementSerializer
     permission_classes = [IsAdminRHOrChefService]
@@ -2216,29 +2264,15 @@ class DetachementViewSet(viewsets.ModelViewSet):
     search_fields = ['personne__nom', 'personne__prenom']
     ordering_fields = ['date_debut_detachement', 'date_fin_detachement']
     
-    def get_queryset(self):
-        user = self.request.user
-        
-        if not user.is_authenticated:
-            return Detachement.objects.none()
-            
-        if user.role == 'admin_rh':
-            return self.queryset
-        elif user.role.startswith('chef_'):
-            try:
-                service = Service.objects.get(chef_service=user)
-                # Détachements concernant le service (sortants ou entrants)
-                return self.queryset.filter(
-                    Q(structure_origine__service=service) | 
-                    Q(structure_detachement__service=service) |
-                    Q(personne__service=service)
-                )
-            except Service.DoesNotExist:
-                return Detachement.objects.none()
-        else:
-            return self.queryset.filter(personne__user=user)
+    def get_scope_service_q(self, scope):
+        # Détachements concernant le service (sortants ou entrants)
+        return (
+            Q(structure_origine__service_id=scope.service_id) | 
+            Q(structure_detachement__service_id=scope.service_id) |
+            Q(personne__service_id=scope.service_id)
+        )
 
-class DocumentViewSet(viewsets.ModelViewSet):
+class DocumentViewSet(ChampsDemandesMixin, ScopeQuerysetMixin, viewsets.ModelViewSet):
     queryset = Document.objects.select_related('proprietaire').all()
     serializer_class = DocumentSerializer
     permission_classes = [IsAdminRHOrChefService]
@@ -2246,6 +2280,9 @@ class DocumentViewSet(viewsets.ModelViewSet):
     filterset_fields = ['type_document', 'proprietaire']
     search_fields = ['nom', 'proprietaire__nom', 'proprietaire__prenom']
     ordering_fields = ['date_upload', 'nom']
+    keyset_ordering = ('-date_upload', '-id')
+    scope_service_field = 'proprietaire__service'
+    scope_user_field = 'proprietaire__user'
     
     def get_permissions(self):
         """
@@ -2260,23 +2297,6 @@ class DocumentViewSet(viewsets.ModelViewSet):
         # Pour les autres actions (update, delete, etc.), utiliser les permissions normales
         return super().get_permissions()
     
-    def get_queryset(self):
-        user = self.request.user
-        
-        if not user.is_authenticated:
-            return Document.objects.none()
-            
-        if user.role == 'admin_rh':
-            return self.queryset
-        elif user.role.startswith('chef_'):
-            try:
-                service = Service.objects.get(chef_service=user)
-                return self.queryset.filter(proprietaire__service=service)
-            except Service.DoesNotExist:
-                return Document.objects.none()
-        else:
-            return self.queryset.filter(proprietaire__user=user)
-    
     @action(detail=False, methods=['get'])
     def mes_documents(self, request):
         """Documents de l'utilisateur connecté"""
@@ -2353,6 +2373,46 @@ class DocumentViewSet(viewsets.ModelViewSet):
 # VIEWSETS D'ÉNUMÉRATION (PERMISSIONS OUVERTES)
 # ========================================
 
+class TacheViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Suivi des tâches de fond (exports, rapports annuels, lancements de paie).
+    Chacun voit ses tâches ; l'admin RH voit toutes les tâches.
+    """
+    queryset = Tache.objects.select_related('cree_par')
+    serializer_class = TacheSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['statut', 'type_tache']
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(self.request.user, 'role', None) == 'admin_rh':
+            return queryset
+        return queryset.filter(cree_par=self.request.user)
+    
+    @action(detail=True, methods=['get'])
+    def resultat(self, request, pk=None):
+        """Résultat d'une tâche terminée : fichier à télécharger ou données JSON"""
+        tache = self.get_object()
+        if tache.statut != 'TERMINE':
+            return Response({'error': f"Résultat indisponible (statut: {tache.statut})"},
+                          status=status.HTTP_400_BAD_REQUEST)
+        if tache.fichier:
+            nom = tache.fichier.name.rsplit('/', 1)[-1].split('_', 1)[-1]
+            return FileResponse(tache.fichier.open('rb'), as_attachment=True, filename=nom)
+        return Response(tache.resultat)
+    
+    @action(detail=True, methods=['post'])
+    def annuler(self, request, pk=None):
+        """Annuler une tâche qui n'a pas encore démarré"""
+        tache = self.get_object()
+        if not annuler_tache(tache):
+            return Response({'error': 'Seule une tâche en attente peut être annulée'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        tache.refresh_from_db()
+        return Response(TacheSerializer(tache).data)
+
+
 class StatutOffreViewSet(viewsets.ModelViewSet):
     queryset = StatutOffre.objects.all()
     serializer_class = StatutOffreSerializer
@@ -2428,16 +2488,17 @@ class DashboardViewSet(viewsets.ViewSet):
         
         # Statistiques globales
         total_employes = Personne.objects.count()
-        total_services = Service.objects.count()
+        services = list(annoter_effectifs_services(Service.objects.all()))
+        total_services = len(services)
         
         # Par service
         stats_services = []
-        for service in Service.objects.all():
+        for service in services:
             stats_services.append({
                 'nom': service.nom,
                 'type': service.type_service,
                 'chef': service.chef_service.get_full_name() if service.chef_service else 'Non assigné',
-                'nombre_employes': service.employes.count()
+                'nombre_employes': service.nombre_employes
             })
         
         # Absences en attente
@@ -2469,21 +2530,27 @@ class DashboardViewSet(viewsets.ViewSet):
             return Response({'error': 'Permission refusée. Ce tableau de bord est réservé aux chefs de service.'}, status=403)
 
         try:
-            service = Service.objects.get(chef_service=user)
+            service = get_service_du_chef(request)
 
             # Statistiques du service
             employes = service.employes.all()
             total_employes = employes.count()
             
-            # Absences en attente dans son service
-            absences_attente = Absence.objects.filter(
-                personne__service=service,
-                statut='EN_ATTENTE'
-            ).count()
+            # Absences en attente dans son service (compteurs journaliers)
+            absences_attente = total_absences(service, ['EN_ATTENTE'])
             
             # Répartition par type d'employé
             repartition = employes.values('type_employe').annotate(count=Count('id'))
             
+            # Présence du mois en cours (jours ouvrés)
+            aujourd_hui = timezone.localdate()
+            debut_mois = aujourd_hui.replace(day=1)
+            fin_mois = debut_mois.replace(day=monthrange(debut_mois.year, debut_mois.month)[1])
+            presence = presence_periode(
+                Absence.objects.filter(personne__service=service, statut='APPROUVÉ'),
+                total_employes, debut_mois, fin_mois
+            )
+            
             # Contrats expirant (si service contractuel)
             contrats_expirant = 0
             if service.type_service == 'contractuel':
@@ -2504,7 +2571,8 @@ class DashboardViewSet(viewsets.ViewSet):
                     'total_employes': total_employes,
                     'absences_en_attente': absences_attente,
                     'contrats_expirant_bientot': contrats_expirant,
-                    'repartition_employes': list(repartition)
+                    'repartition_employes': list(repartition),
+                    'presence_mois': presence
                 },
                 'role': user.role
             })
@@ -2589,9 +2657,7 @@ class DashboardViewSet(viewsets.ViewSet):
                     'message': f'Le rôle "{user.role}" n\'est pas pris en charge'
                 }, status=400)
         except Exception as e:
-            print(f"❌ Erreur dans auto(): {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Erreur du tableau de bord automatique")
             return Response({
                 'error': 'Erreur interne',
                 'message': str(e)
@@ -2613,46 +2679,24 @@ class PermissionViewSet(viewsets.ViewSet):
         """Retourne les permissions de l'utilisateur connecté"""
         user = request.user
         
+        profil = profil_droits(request)
         permissions = {
             'user_id': user.id,
             'username': user.username,
-            'role': getattr(user, 'role', 'employe'),
-            'permissions': []
+            'role': profil['role'],
+            'permissions': profil['permissions']
         }
         
-        # Définir les permissions selon le rôle
-        if user.role == 'admin_rh':
-            permissions['permissions'] = [
-                'view_all', 'add_all', 'change_all', 'delete_all', 
-                'approve_all', 'manage_users', 'assign_roles'
-            ]
-        elif user.role.startswith('chef_'):
-            permissions['permissions'] = [
-                'view_service', 'add_employe_service', 'change_employe_service',
-                'approve_absence_service', 'view_paie_service'
-            ]
-        else:
-            permissions['permissions'] = [
-                'view_self', 'change_self', 'request_absence', 'view_own_paie'
-            ]
-        
         # Ajouter info sur le service si applicable
-        if hasattr(user, 'personne') and user.personne.service:
+        service = profil['service']
+        if service:
             permissions['service'] = {
-                'id': user.personne.service.id,
-                'nom': user.personne.service.nom,
-                'type': user.personne.service.type_service
+                'id': service['id'],
+                'nom': service['nom'],
+                'type': service['type_service']
             }
-        elif user.role.startswith('chef_'):
-            try:
-                service = Service.objects.get(chef_service=user)
-                permissions['service'] = {
-                    'id': service.id,
-                    'nom': service.nom,
-                    'type': service.type_service
-                }
-            except Service.DoesNotExist:
-                permissions['service'] = None
+        elif profil['is_chef']:
+            permissions['service'] = None
         
         return Response(permissions)
     
@@ -2668,15 +2712,15 @@ class PermissionViewSet(viewsets.ViewSet):
         }
         
         # Test accès aux personnes
-        personnes_count = PersonneViewSet().get_queryset().count()
+        personnes_count = PersonneViewSet(request=request).get_queryset().count()
         test_results['access_tests']['personnes_visibles'] = personnes_count
         
         # Test accès aux services
-        services_count = ServiceViewSet().get_queryset().count()
+        services_count = ServiceViewSet(request=request).get_queryset().count()
         test_results['access_tests']['services_visibles'] = services_count
         
         # Test accès aux absences
-        absences_count = AbsenceViewSet().get_queryset().count()
+        absences_count = AbsenceViewSet(request=request).get_queryset().count()
         test_results['access_tests']['absences_visibles'] = absences_count
         
         return Response(test_results)
\ No newline at end of file